@@ -0,0 +1,81 @@
+"""
+Academias - Separação dos dados por academia (multi-tenant)
+Cada usuário, cliente, pagamento e registro do histórico pertence a uma
+academia. A academia vem no token JWT e fica fixada durante a requisição;
+toda consulta ORM recebe o filtro 'academia_id = <academia>' e todo
+registro novo é gravado nela (ver SEPARAÇÃO POR ACADEMIA em models.py)
+Academias pequenas dividem o banco principal; as grandes podem ter um
+banco próprio, informado no cadastro da academia (campo 'banco')
+Configuração: ACADEMIAS_BANCOS=chave1=url1,chave2=url2
+"""
+
+from contextvars import ContextVar
+from contextlib import contextmanager
+import os
+
+# Academia dos dados existentes antes da separação e de tokens antigos
+PADRAO = 1
+
+BANCOS = dict(
+    item.strip().split('=', 1)
+    for item in os.environ.get('ACADEMIAS_BANCOS', '').split(',')
+    if '=' in item
+)
+
+# (academia_id, banco) da requisição atual; None = sem filtro (comandos
+# de manutenção e tarefas que atendem todas as academias do banco)
+_atual = ContextVar('academia_atual', default=None)
+
+# ==================== CONFIGURAÇÃO ====================
+
+def nome_bind(banco):
+    """
+    Nome do bind do Flask-SQLAlchemy de um banco próprio
+    """
+    return f'academia_{banco}'
+
+def configurar(app):
+    """
+    Registra os bancos próprios como binds adicionais (academia_<chave>)
+    Deve ser chamada antes de database.init_db
+    """
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for banco, url in BANCOS.items():
+        binds[nome_bind(banco)] = url
+
+# ==================== ACADEMIA ATUAL ====================
+
+def academia_atual():
+    """
+    Id da academia atual, ou None fora de um contexto de academia
+    """
+    atual = _atual.get()
+    return atual[0] if atual else None
+
+def banco_atual():
+    """
+    Chave do banco próprio da academia atual (None = banco principal)
+    """
+    atual = _atual.get()
+    return atual[1] if atual else None
+
+@contextmanager
+def academia(academia_id, banco=None):
+    """
+    Fixa a academia (e o banco dela) para as consultas do bloco
+    academia_id=None: sem filtro, todas as academias do banco
+    """
+    if banco and banco not in BANCOS:
+        raise ValueError(f"Banco da academia não configurado em ACADEMIAS_BANCOS: {banco}")
+    
+    token = _atual.set((academia_id, banco))
+    try:
+        yield
+    finally:
+        _atual.reset(token)
+
+def do_token(payload):
+    """
+    Academia e banco de um token JWT (tokens antigos: academia padrão)
+    """
+    return academia(payload.get('academia_id', PADRAO), payload.get('banco'))
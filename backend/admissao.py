@@ -0,0 +1,273 @@
+"""
+Admissão - Controle de admissão e descarte de carga
+Antes de cada rota da API:
+- baldes de tokens por usuário (ou IP) e por rota limitam a taxa (429)
+- cada classe de rota (auth, crítica, escrita, leitura, relatório) tem
+  um limite de requisições simultâneas, para que relatórios não ocupem
+  todas as conexões do pool
+- quando a espera por uma conexão do pool passa do limite, relatórios
+  e depois leituras são recusados na hora com 503 + Retry-After, em vez
+  de ficarem na fila até estourar o tempo
+Rotas críticas e baratas (registrar pagamento) nunca são descartadas
+"""
+
+from flask import g, request, jsonify
+from sqlalchemy.pool import QueuePool
+import auth
+import math
+import os
+import threading
+import time
+
+ATIVA = os.environ.get('ADMISSAO_ATIVA', '1') == '1'
+
+# Balde por usuário autenticado (ou por IP): requisições/s e rajada
+TAXA_USUARIO = float(os.environ.get('ADMISSAO_TAXA_USUARIO', 20))
+RAJADA_USUARIO = float(os.environ.get('ADMISSAO_RAJADA_USUARIO', 40))
+
+# Espera média por conexão do pool (segundos) a partir da qual relatórios
+# são recusados; com o dobro dela, leituras também
+ESPERA_POOL_MAXIMA = float(os.environ.get('ADMISSAO_ESPERA_POOL', 0.25))
+
+# Por classe de rota: requisições simultâneas, tempo máximo na fila do
+# limite de concorrência (s), taxa/rajada do balde da rota e se pode ser
+# descartada quando o pool está saturado (nível 1 = primeiro a sair)
+# A concorrência pode ser ajustada com ADMISSAO_CONCORRENCIA_<CLASSE>
+CLASSES = {
+    'auth': {'concorrencia': 2, 'fila': 2.0, 'taxa': 20, 'rajada': 40, 'descarte': None},
+    'critica': {'concorrencia': 4, 'fila': 5.0, 'taxa': 200, 'rajada': 400, 'descarte': None},
+    'escrita': {'concorrencia': 3, 'fila': 2.0, 'taxa': 100, 'rajada': 200, 'descarte': None},
+    'leitura': {'concorrencia': 4, 'fila': 0.5, 'taxa': 200, 'rajada': 400, 'descarte': 2},
+    'relatorio': {'concorrencia': 2, 'fila': 0.1, 'taxa': 20, 'rajada': 40, 'descarte': 1}
+}
+
+# Com os limites acima as classes não críticas usam no máximo ~15 conexões
+# (o dashboard completo e o lote de /api/batch usam até 3 por requisição);
+# o pool ganha vagas extras para as rotas críticas nunca ficarem sem conexão
+POOL_TAMANHO = int(os.environ.get('ADMISSAO_POOL_TAMANHO', 5))
+POOL_EXTRA = int(os.environ.get('ADMISSAO_POOL_EXTRA', 10))
+
+# Peso de cada nova medida na média móvel da espera pelo pool e tempo
+# (s) para a média cair pela metade quando não há novas medidas
+PESO_MEDIA = 0.2
+MEIA_VIDA_MEDIA = 2.0
+
+# ==================== BALDE DE TOKENS ====================
+
+class BaldeTokens:
+    """
+    Balde de tokens: enche 'taxa' tokens por segundo até 'capacidade'
+    """
+    
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.tokens = capacidade
+        self.atualizado_em = time.monotonic()
+    
+    def consumir(self):
+        """
+        Retira um token. Retorna 0 se havia token, ou os segundos até o
+        próximo token ficar disponível
+        """
+        agora = time.monotonic()
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado_em) * self.taxa)
+        self.atualizado_em = agora
+        
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.taxa
+
+_baldes = {}
+_lock_baldes = threading.Lock()
+
+def _consumir(chave, taxa, capacidade):
+    with _lock_baldes:
+        balde = _baldes.get(chave)
+        if balde is None:
+            # Evita crescer sem limite com muitos IPs diferentes
+            if len(_baldes) > 10000:
+                _baldes.clear()
+            balde = _baldes[chave] = BaldeTokens(taxa, capacidade)
+        return balde.consumir()
+
+# ==================== ESPERA PELO POOL ====================
+
+_espera = {'media': 0.0, 'medido_em': 0.0, 'aguardando': {}}
+_lock_espera = threading.Lock()
+
+class PoolMedido(QueuePool):
+    """
+    QueuePool que mede quanto tempo cada requisição espera por uma conexão
+    """
+    
+    def _do_get(self):
+        inicio = time.monotonic()
+        chave = (id(self), threading.get_ident())
+        with _lock_espera:
+            _espera['aguardando'][chave] = inicio
+        
+        try:
+            return super()._do_get()
+        finally:
+            agora = time.monotonic()
+            with _lock_espera:
+                _espera['aguardando'].pop(chave, None)
+                media = _media_atual(agora)
+                _espera['media'] = media + PESO_MEDIA * (agora - inicio - media)
+                _espera['medido_em'] = agora
+
+def _media_atual(agora):
+    # Sem novas medidas (por exemplo, com as leituras sendo descartadas)
+    # a média decai, para a carga voltar a ser admitida aos poucos
+    return _espera['media'] * 0.5 ** ((agora - _espera['medido_em']) / MEIA_VIDA_MEDIA)
+
+def espera_pool():
+    """
+    Maior valor entre a média recente da espera pelo pool e a espera
+    de quem ainda está na fila agora
+    """
+    agora = time.monotonic()
+    with _lock_espera:
+        aguardando = max((agora - inicio for inicio in _espera['aguardando'].values()), default=0)
+        return max(_media_atual(agora), aguardando)
+
+# ==================== CLASSIFICAÇÃO DAS ROTAS ====================
+
+def classe(nome):
+    """
+    Decorador que define a classe de admissão da rota
+    Sem ele: GET/HEAD = 'leitura', demais métodos = 'escrita'
+    """
+    def decorador(f):
+        f.classe_admissao = nome
+        return f
+    return decorador
+
+def isenta(f):
+    """
+    Decorador para rotas fora do controle de admissão (arquivos
+    estáticos, verificação de saúde)
+    """
+    f.classe_admissao = None
+    return f
+
+def _classe_da_requisicao(app):
+    funcao = app.view_functions.get(request.endpoint)
+    if funcao is None:
+        return None
+    
+    padrao = 'leitura' if request.method in ('GET', 'HEAD') else 'escrita'
+    return getattr(funcao, 'classe_admissao', padrao)
+
+def _identificar():
+    """
+    Usuário do token (sem validar permissões, isso é com os decoradores
+    de auth) ou o IP de quem fez a requisição
+    """
+    token = request.headers.get('Authorization', '')
+    if token.startswith('Bearer '):
+        resultado = auth.verificar_token(token[7:])
+        if resultado['success']:
+            payload = resultado['payload']
+            return f"usuario:{payload.get('academia_id')}:{payload['usuario_id']}"
+    return f"ip:{request.remote_addr}"
+
+# ==================== ADMISSÃO ====================
+
+_semaforos = {}
+
+# Contadores das requisições de todas as threads (alterados sob a trava)
+_estatisticas = {'admitidas': 0, 'limitadas': 0, 'descartadas': 0, 'sem_vaga': 0}
+_em_uso = {}
+_lock_estatisticas = threading.Lock()
+
+def _contar(estatistica):
+    with _lock_estatisticas:
+        _estatisticas[estatistica] += 1
+
+def _recusar(status, mensagem, segundos):
+    resposta = jsonify({"error": mensagem})
+    resposta.status_code = status
+    resposta.headers['Retry-After'] = str(max(1, math.ceil(segundos)))
+    return resposta
+
+def _admitir(app):
+    if request.method == 'OPTIONS':
+        return None
+    
+    nome = _classe_da_requisicao(app)
+    if nome is None:
+        return None
+    limites = CLASSES[nome]
+    
+    # 1. Taxa por usuário e por rota
+    espera = 0
+    if nome != 'critica':
+        espera = _consumir(_identificar(), TAXA_USUARIO, RAJADA_USUARIO)
+    espera = max(espera, _consumir(request.endpoint, limites['taxa'], limites['rajada']))
+    if espera:
+        _contar('limitadas')
+        return _recusar(429, "Muitas requisições. Aguarde um instante.", espera)
+    
+    # 2. Pool saturado: descarta primeiro relatórios, depois leituras
+    nivel = limites['descarte']
+    espera_atual = espera_pool()
+    if nivel is not None and espera_atual > ESPERA_POOL_MAXIMA * nivel:
+        _contar('descartadas')
+        return _recusar(503, "Servidor sobrecarregado. Tente novamente em instantes.", espera_atual * 2)
+    
+    # 3. Vaga entre as requisições simultâneas da classe
+    if not _semaforos[nome].acquire(timeout=limites['fila']):
+        _contar('sem_vaga')
+        return _recusar(503, "Servidor sobrecarregado. Tente novamente em instantes.", limites['fila'] + 1)
+    
+    g.classe_admissao = nome
+    with _lock_estatisticas:
+        _estatisticas['admitidas'] += 1
+        _em_uso[nome] += 1
+    return None
+
+def _liberar(excecao=None):
+    nome = g.pop('classe_admissao', None)
+    if nome:
+        with _lock_estatisticas:
+            _em_uso[nome] -= 1
+        _semaforos[nome].release()
+
+def estado():
+    """
+    Situação atual do controle de admissão (para monitoramento)
+    """
+    with _lock_estatisticas:
+        em_uso, estatisticas = dict(_em_uso), dict(_estatisticas)
+    
+    return {
+        "ativa": ATIVA,
+        "espera_pool": round(espera_pool(), 4),
+        "espera_pool_maxima": ESPERA_POOL_MAXIMA,
+        "em_uso": em_uso,
+        **estatisticas
+    }
+
+def configurar(app):
+    """
+    Instala o pool medido e o controle de admissão no app
+    Deve ser chamada antes de database.init_db
+    """
+    for nome, limites in CLASSES.items():
+        variavel = f'ADMISSAO_CONCORRENCIA_{nome.upper()}'
+        limites['concorrencia'] = int(os.environ.get(variavel, limites['concorrencia']))
+        _semaforos[nome] = threading.BoundedSemaphore(limites['concorrencia'])
+        _em_uso[nome] = 0
+    
+    if not ATIVA:
+        return
+    
+    opcoes = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    opcoes.setdefault('poolclass', PoolMedido)
+    opcoes.setdefault('pool_size', POOL_TAMANHO)
+    opcoes.setdefault('max_overflow', POOL_EXTRA + CLASSES['critica']['concorrencia'])
+    app.before_request(lambda: _admitir(app))
+    app.teardown_request(_liberar)
@@ -4,22 +4,37 @@ API REST usando Flask para gerenciamento de pagamentos
 Inclui sistema de autenticação e autorização
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor
 import database
+import replicas
+import academias
+import admissao
+import perfilador
+import eventos
 import models
 import auth
+import sincronizacao
+import receita
+import previsao
+import conciliacao
+import recibos
+import lote
+from periodos import Periodo
 
 # Inicializa o Flask
 app = Flask(__name__, static_folder='frontend', static_url_path='')
-CORS(app)  # Permite requisições do frontend
+CORS(app, expose_headers=[replicas.CABECALHO_ESCRITA, 'X-Proximo-Cursor', 'Retry-After'])  # Permite requisições do frontend
 
 @app.route('/')
+@admissao.isenta
 def serve_frontend():
     """Serve a página inicial do frontend"""
     return send_from_directory(app.static_folder, 'login.html')
 
 @app.route('/<path:path>')
+@admissao.isenta
 def serve_static_files(path):
     """Serve todos os arquivos estáticos (CSS, JS, imagens)"""
     return send_from_directory(app.static_folder, path)
@@ -52,27 +67,83 @@ def get_database_uri():
 app.config['SQLALCHEMY_DATABASE_URI'] = get_database_uri()
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Réplicas de leitura (opcional): DATABASE_REPLICA_URLS=url1,url2
+replicas.configurar(app)
+
+# Academias com banco próprio: ACADEMIAS_BANCOS=chave=url,...
+academias.configurar(app)
+
+# Perfilador sob demanda (desligado até um admin iniciar uma sessão)
+perfilador.configurar(app)
+
+# Controle de admissão: limites por usuário/rota e descarte de carga
+# quando o pool de conexões satura
+admissao.configurar(app)
+
 print(f"Database URL: {app.config['SQLALCHEMY_DATABASE_URI']}")
+if replicas.REPLICA_URLS:
+    print(f"Réplicas de leitura: {len(replicas.REPLICA_URLS)}")
 
 # Inicializa o banco de dados
 database.init_db(app)
 
+# ==================== CONSULTAS PARALELAS ====================
+
+# Threads para consultas independentes de uma mesma requisição
+executor_consultas = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('CONSULTAS_PARALELAS', 4)),
+    thread_name_prefix='consultas'
+)
+
+def executar_em_paralelo(**consultas):
+    """
+    Executa funções independentes ao mesmo tempo e devolve um dicionário
+    com os resultados. Cada função roda em seu próprio contexto de aplicação,
+    ou seja, com sua própria sessão e conexão do pool
+    """
+    # As threads não enxergam a requisição: a decisão de ler da réplica
+    # (método GET, escrita recente do usuário) e a academia do usuário
+    # são definidas aqui e repassadas
+    usar_replica = replicas.deve_usar_replica()
+    academia_id, banco = academias.academia_atual(), academias.banco_atual()
+    
+    def executar(funcao):
+        with app.app_context(), replicas.leitura(usar_replica), academias.academia(academia_id, banco):
+            return funcao()
+    
+    futuros = {nome: executor_consultas.submit(executar, funcao) for nome, funcao in consultas.items()}
+    return {nome: futuro.result() for nome, futuro in futuros.items()}
+
+# ==================== EVENTOS EM TEMPO REAL ====================
+
+def calcular_contadores(academia_id, banco=None):
+    """
+    Contadores do dashboard enviados às telas conectadas em /api/eventos
+    (calculados uma vez e compartilhados pelas conexões da academia)
+    """
+    with app.app_context(), academias.academia(academia_id, banco):
+        return models.obter_estatisticas()
+
+eventos.broker.iniciar(calcular_contadores)
+
 # ==================== ROTAS DE AUTENTICAÇÃO ====================
 
 @app.route('/api/auth/login', methods=['POST'])
+@admissao.classe('auth')
 def login():
     """
     POST /api/auth/login - Faz login no sistema
-    Body: {email, senha}
+    Body: {email, senha, academia (opcional: identificador da academia)}
     """
     data = request.json
-    resultado = auth.fazer_login(data['email'], data['senha'])
+    resultado = auth.fazer_login(data['email'], data['senha'], data.get('academia'))
     
     if resultado['success']:
         return jsonify(resultado), 200
     return jsonify(resultado), 401
 
 @app.route('/api/auth/verificar', methods=['GET'])
+@admissao.classe('auth')
 @auth.requer_autenticacao
 def verificar_sessao():
     """
@@ -178,12 +249,33 @@ def delete_usuario(usuario_id):
 def get_clientes():
     """
     GET /api/clientes - Lista todos os clientes
-    Query params: busca (opcional)
+    Query params: busca (opcional), ordenar (opcional: nome | saldo),
+    fields (opcional: resumo, completo e/ou nomes de campos; padrão completo)
     """
     busca = request.args.get('busca')
-    clientes = models.listar_clientes(busca)
+    ordenar = request.args.get('ordenar', 'nome')
+    
+    try:
+        campos = models.CAMPOS_CLIENTE.escolher(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    clientes = models.listar_clientes(busca, ordenar, campos)
     return jsonify(clientes)
 
+@app.route('/api/clientes/devedores', methods=['GET'])
+@admissao.classe('relatorio')
+@auth.requer_autenticacao
+def get_maiores_devedores():
+    """
+    GET /api/clientes/devedores - Lista os clientes com maior saldo em aberto
+    Query params: limite (opcional, padrão 10), vencidos (opcional, 1 = só com atraso)
+    """
+    limite = request.args.get('limite', 10, type=int)
+    somente_vencidos = request.args.get('vencidos') == '1'
+    devedores = models.obter_maiores_devedores(limite, somente_vencidos)
+    return jsonify(devedores)
+
 @app.route('/api/clientes', methods=['POST'])
 @auth.requer_autenticacao
 def create_cliente():
@@ -272,12 +364,20 @@ def delete_cliente(cliente_id):
 def get_pagamentos():
     """
     GET /api/pagamentos - Lista pagamentos
-    Query params: cliente_id (opcional), status (opcional), mes (opcional)
+    Query params: cliente_id, status e o período da data de pagamento:
+    mes (AAAA-MM), semana (AAAA-Wss) ou de/ate (AAAA-MM-DD) - todos opcionais
+    fields (opcional: resumo, completo e/ou nomes de campos; padrão completo)
     """
     cliente_id = request.args.get('cliente_id', type=int)
     status = request.args.get('status')
-    mes = request.args.get('mes')
-    pagamentos = models.listar_pagamentos(cliente_id, status, mes)
+    
+    try:
+        periodo = Periodo.do_pedido(request.args)
+        campos = models.CAMPOS_PAGAMENTO.escolher(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    pagamentos = models.listar_pagamentos(cliente_id, status, periodo, campos)
     return jsonify(pagamentos)
 
 @app.route('/api/pagamentos', methods=['POST'])
@@ -306,6 +406,7 @@ def create_pagamento():
     return jsonify(resultado)
 
 @app.route('/api/pagamentos/<int:pagamento_id>/pagar', methods=['POST'])
+@admissao.classe('critica')
 @auth.requer_autenticacao
 def pagar_pagamento(pagamento_id):
     """
@@ -361,6 +462,79 @@ def delete_pagamento(pagamento_id):
     
     return jsonify(resultado)
 
+# ==================== ROTAS DE CONCILIAÇÃO ====================
+
+@app.route('/api/conciliacao/importar', methods=['POST'])
+@admissao.classe('escrita')
+@auth.requer_admin
+def importar_extrato():
+    """
+    POST /api/conciliacao/importar - Concilia um extrato bancário
+    Form (multipart): arquivo (CSV, OFX ou CNAB 240), formato (opcional,
+    detectado pelo conteúdo) e metodo_pagamento (padrão: transferencia)
+    """
+    arquivo = request.files.get('arquivo')
+    if not arquivo:
+        return jsonify({"success": False, "error": "Envie o extrato no campo 'arquivo'"}), 400
+    
+    resultado = conciliacao.importar_extrato(
+        arquivo.stream,
+        request.form.get('formato') or None,
+        request.form.get('metodo_pagamento') or 'transferencia',
+        request.usuario['usuario_id']
+    )
+    if not resultado['success']:
+        return jsonify(resultado), 400
+    
+    auth.registrar_historico(
+        request.usuario['usuario_id'],
+        'CONCILIAR_EXTRATO',
+        f'Importou extrato {arquivo.filename}: {resultado["conciliados"]} baixado(s), '
+        f'{resultado["revisao"]} para revisão'
+    )
+    return jsonify(resultado)
+
+@app.route('/api/conciliacao/pendencias', methods=['GET'])
+@auth.requer_autenticacao
+def get_pendencias_conciliacao():
+    """
+    GET /api/conciliacao/pendencias - Créditos do extrato que esperam
+    revisão, com as cobranças candidatas
+    Query params: limite (padrão 100, máximo 500)
+    """
+    limite = min(request.args.get('limite', 100, type=int), 500)
+    if limite < 1:
+        return jsonify({"error": "O limite deve ser maior que zero"}), 400
+    
+    return jsonify(conciliacao.listar_pendencias(limite))
+
+@app.route('/api/conciliacao/pendencias/<int:lancamento_id>/resolver', methods=['POST'])
+@admissao.classe('critica')
+@auth.requer_autenticacao
+def resolver_pendencia_conciliacao(lancamento_id):
+    """
+    POST /api/conciliacao/pendencias/:id/resolver - Baixa a cobrança
+    escolhida com a data do crédito, ou descarta o crédito
+    Body: {pagamento_id} ou {ignorar: true}
+    """
+    data = request.json or {}
+    resultado = conciliacao.resolver_pendencia(
+        lancamento_id,
+        data.get('pagamento_id'),
+        bool(data.get('ignorar')),
+        request.usuario['usuario_id']
+    )
+    
+    if resultado['success']:
+        auth.registrar_historico(
+            request.usuario['usuario_id'],
+            'RESOLVER_CONCILIACAO',
+            f'Resolveu lançamento ID: {lancamento_id}' +
+            (' (ignorado)' if data.get('ignorar') else f' com pagamento ID: {data.get("pagamento_id")}')
+        )
+    
+    return jsonify(resultado)
+
 @app.route('/api/historico/<int:cliente_id>', methods=['GET'])
 @auth.requer_autenticacao
 def get_historico_cliente(cliente_id):
@@ -370,18 +544,112 @@ def get_historico_cliente(cliente_id):
     historico = models.obter_historico_pagamentos(cliente_id)
     return jsonify(historico)
 
+def _arquivo(documento):
+    return Response(documento['conteudo'], mimetype=documento['mimetype'], headers={
+        'Content-Disposition': f'attachment; filename={documento["nome_arquivo"]}'
+    })
+
+@app.route('/api/clientes/<int:cliente_id>/extrato', methods=['GET'])
+@admissao.classe('relatorio')
+@auth.requer_autenticacao
+def get_extrato_cliente(cliente_id):
+    """
+    GET /api/clientes/:id/extrato - Extrato de pagamentos do cliente (PDF ou HTML)
+    Query params: formato (pdf ou html; padrão pdf), período - ano (AAAA),
+    mes (AAAA-MM), semana (AAAA-Wss) ou de/ate (AAAA-MM-DD); padrão: ano atual
+    """
+    try:
+        periodo = Periodo.do_pedido(request.args)
+        extrato = recibos.gerar_extrato(cliente_id, periodo, request.args.get('formato', 'pdf'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if extrato is None:
+        return jsonify({"error": "Cliente não encontrado"}), 404
+    return _arquivo(extrato)
+
+@app.route('/api/pagamentos/<int:pagamento_id>/recibo', methods=['GET'])
+@admissao.classe('relatorio')
+@auth.requer_autenticacao
+def get_recibo_pagamento(pagamento_id):
+    """
+    GET /api/pagamentos/:id/recibo - Recibo de um pagamento pago (PDF ou HTML)
+    Query params: formato (pdf ou html; padrão pdf)
+    """
+    try:
+        recibo = recibos.gerar_recibo(pagamento_id, request.args.get('formato', 'pdf'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if recibo is None:
+        return jsonify({"error": "Pagamento não encontrado"}), 404
+    return _arquivo(recibo)
+
+# ==================== ROTA DE SINCRONIZAÇÃO ====================
+
+@app.route('/api/sync', methods=['GET'])
+@auth.requer_autenticacao
+def get_sincronizacao():
+    """
+    GET /api/sync - Clientes, pagamentos (e usuários, para admin) alterados
+    ou excluídos depois da posição 'since', para o cache do frontend
+    Query params: since (padrão 0 = tudo), limite (opcional, máx. 5000)
+    Continue com since = 'seq' da resposta enquanto 'mais' for verdadeiro
+    """
+    since = request.args.get('since', 0, type=int)
+    limite = min(request.args.get('limite', sincronizacao.LIMITE_PADRAO, type=int), sincronizacao.LIMITE_MAXIMO)
+    if since < 0 or limite < 1:
+        return jsonify({"error": "Parâmetros de sincronização inválidos"}), 400
+    
+    pagina = sincronizacao.obter_alteracoes(since, limite, sincronizacao.tabelas_do_usuario(request.usuario))
+    return jsonify(pagina)
+
 # ==================== ROTAS DE RELATÓRIOS ====================
 
 @app.route('/api/dashboard', methods=['GET'])
+@admissao.classe('relatorio')
 @auth.requer_autenticacao
 def get_dashboard():
     """
     GET /api/dashboard - Obtém estatísticas gerais
+    Query params: período dos valores recebidos - mes (AAAA-MM),
+    semana (AAAA-Wss) ou de/ate (AAAA-MM-DD); padrão: mês atual
     """
-    stats = models.obter_estatisticas()
+    try:
+        periodo = Periodo.do_pedido(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    stats = models.obter_estatisticas(periodo)
     return jsonify(stats)
 
+@app.route('/api/dashboard/completo', methods=['GET'])
+@admissao.classe('relatorio')
+@auth.requer_autenticacao
+def get_dashboard_completo():
+    """
+    GET /api/dashboard/completo - Estatísticas, clientes que pagaram no mês
+    e os inadimplentes de vencimento mais antigo em uma única requisição
+    (os mesmos valores e a mesma ordem de /api/inadimplentes)
+    Query params: limite_inadimplentes (opcional, padrão 5) e o período
+    dos valores recebidos, como em /api/dashboard
+    """
+    limite = request.args.get('limite_inadimplentes', 5, type=int)
+    
+    try:
+        periodo = Periodo.do_pedido(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    dados = executar_em_paralelo(
+        estatisticas=lambda: models.obter_estatisticas(periodo),
+        pagaram_mes=lambda: models.obter_clientes_pagaram_mes(periodo),
+        inadimplentes=lambda: models.obter_inadimplentes(limite)
+    )
+    return jsonify(dados)
+
 @app.route('/api/inadimplentes', methods=['GET'])
+@admissao.classe('relatorio')
 @auth.requer_autenticacao
 def get_inadimplentes():
     """
@@ -391,27 +659,148 @@ def get_inadimplentes():
     return jsonify(inadimplentes)
 
 @app.route('/api/pagamentos/mes-atual', methods=['GET'])
+@admissao.classe('relatorio')
 @auth.requer_autenticacao
 def get_pagamentos_mes_atual():
     """
     GET /api/pagamentos/mes-atual - Lista clientes que pagaram este mês
+    Query params: outro período no lugar do mês atual - mes (AAAA-MM),
+    semana (AAAA-Wss) ou de/ate (AAAA-MM-DD)
     """
-    clientes = models.obter_clientes_pagaram_mes()
+    try:
+        periodo = Periodo.do_pedido(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    clientes = models.obter_clientes_pagaram_mes(periodo)
     return jsonify(clientes)
 
+@app.route('/api/relatorios/receita', methods=['GET'])
+@admissao.classe('relatorio')
+@auth.requer_autenticacao
+def get_relatorio_receita():
+    """
+    GET /api/relatorios/receita - Recebido, faturado, cancelado e vencido
+    por dia, semana ou mês, com zero nos intervalos sem movimento
+    Query params: granularidade (dia, semana ou mes; padrão mes), período
+    - mes (AAAA-MM), semana (AAAA-Wss) ou de/ate (AAAA-MM-DD); padrão:
+    os 12 últimos intervalos - e por_metodo=1 (recebido por método)
+    """
+    por_metodo = request.args.get('por_metodo') in ('1', 'true')
+    
+    try:
+        periodo = Periodo.do_pedido(request.args)
+        serie = receita.obter_receita(periodo, request.args.get('granularidade', 'mes'), por_metodo)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(serie)
+
+@app.route('/api/relatorios/previsao', methods=['GET'])
+@admissao.classe('relatorio')
+@auth.requer_autenticacao
+def get_relatorio_previsao():
+    """
+    GET /api/relatorios/previsao - Recebimentos esperados por semana ou
+    mês, do intervalo atual (a partir de hoje) em diante, com a faixa de
+    confiança (minimo/maximo) e as taxas de pagamento da academia
+    Query params: granularidade (semana ou mes; padrão mes) e periodos
+    (intervalos da previsão; padrão 8 semanas ou 3 meses)
+    """
+    try:
+        resultado = previsao.obter_previsao(
+            request.args.get('granularidade', 'mes'),
+            request.args.get('periodos', type=int)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except previsao.ModeloEmPreparo as e:
+        # O modelo continua sendo montado em segundo plano
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '5'}
+    
+    return jsonify(resultado)
+
 @app.route('/api/historico', methods=['GET'])
+@admissao.classe('relatorio')
 @auth.requer_admin
 def get_historico_sistema():
     """
     GET /api/historico - Obtém histórico de ações do sistema (apenas admin)
+    Query params: limite (opcional, máx. 500), cursor, usuario_id, acao,
+    de, ate (AAAA-MM-DD) - todos opcionais
+    O cursor da próxima página vem no cabeçalho X-Proximo-Cursor
     """
-    limite = request.args.get('limite', 50, type=int)
-    historico = auth.obter_historico(limite)
-    return jsonify(historico)
+    limite = min(request.args.get('limite', 50, type=int), 500)
+    if limite < 1:
+        return jsonify({"error": "Parâmetros de paginação ou data inválidos"}), 400
+    
+    try:
+        pagina = auth.obter_historico_pagina(
+            limite,
+            request.args.get('cursor'),
+            request.args.get('usuario_id', type=int),
+            request.args.get('acao'),
+            request.args.get('de'),
+            request.args.get('ate')
+        )
+    except ValueError:
+        return jsonify({"error": "Parâmetros de paginação ou data inválidos"}), 400
+    
+    resposta = jsonify(pagina['itens'])
+    if pagina['proximo_cursor']:
+        resposta.headers['X-Proximo-Cursor'] = pagina['proximo_cursor']
+    return resposta
+
+@app.route('/api/eventos', methods=['GET'])
+@admissao.isenta
+def stream_eventos():
+    """
+    GET /api/eventos - Fluxo Server-Sent Events com as alterações em
+    pagamentos/clientes e os contadores do dashboard
+    O EventSource do navegador não envia cabeçalhos: o token pode vir
+    no parâmetro ?token=
+    No servidor ASGI esta rota é atendida pelo asgi.py; aqui cada conexão
+    ocupa uma thread, até EVENTOS_MAXIMO_THREADS por processo
+    """
+    token = request.args.get('token')
+    cabecalhos = {'Authorization': f'Bearer {token}'} if token else request.headers
+    payload, erro = auth.autenticar(cabecalhos)
+    if erro:
+        return jsonify(erro[0]), erro[1]
+    
+    if not eventos.aceita_conexao_em_thread():
+        return jsonify({"error": "Limite de conexões em tempo real atingido neste servidor"}), 503
+    
+    return Response(
+        stream_with_context(eventos.fluxo(payload.get('academia_id', academias.PADRAO), payload.get('banco'))),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# ==================== REQUISIÇÕES EM LOTE ====================
+
+@app.route('/api/batch', methods=['POST'])
+@admissao.classe('leitura')
+@auth.requer_autenticacao
+def batch():
+    """
+    POST /api/batch - Várias leituras (rotas GET) em uma só requisição
+    Body: {requisicoes: [{url: "/api/clientes/1", id (opcional)}, ...]}
+    Retorna {respostas: [{id, status, corpo}, ...]}, na ordem pedida
+    """
+    data = request.get_json(silent=True)
+    try:
+        # Corpo que não é um objeto: executar recusa com a mensagem do lote
+        respostas = lote.executar(app, data.get('requisicoes') if isinstance(data, dict) else None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"respostas": respostas}), 200
 
 # ==================== ROTA DE TESTE ====================
 
 @app.route('/api/status', methods=['GET'])
+@admissao.isenta
 def status():
     """
     GET /api/status - Verifica se a API está funcionando
@@ -421,6 +810,97 @@ def status():
         "mensagem": "API funcionando corretamente"
     })
 
+@app.route('/api/admissao', methods=['GET'])
+@admissao.isenta
+@auth.requer_admin
+def status_admissao():
+    """
+    GET /api/admissao - Situação do controle de admissão (apenas admin)
+    """
+    return jsonify(admissao.estado())
+
+# ==================== ROTAS DO PERFILADOR ====================
+# Isentas do controle de admissão: o perfilador é usado justamente
+# quando o servidor está lento
+
+@app.route('/api/perfilador', methods=['POST'])
+@admissao.isenta
+@auth.requer_admin
+def iniciar_perfilador():
+    """
+    POST /api/perfilador - Liga a amostragem das requisições (apenas admin)
+    Body: {rota (opcional: regra, endpoint ou caminho), percentual
+    (padrão 100), segundos (padrão 60, máximo 900)}
+    """
+    data = request.json or {}
+    try:
+        sessao = perfilador.iniciar_sessao(
+            data.get('rota'),
+            data.get('percentual', 100),
+            data.get('segundos', perfilador.DURACAO_PADRAO),
+            request.usuario['usuario_id']
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    auth.registrar_historico(
+        request.usuario['usuario_id'],
+        'INICIAR_PERFILADOR',
+        f'Amostragem de {data.get("rota") or "todas as rotas"} ({sessao["percentual"]:g}%) '
+        f'por {int(sessao["ate"] - sessao["inicio"])}s'
+    )
+    return jsonify({"success": True, "sessao": sessao})
+
+@app.route('/api/perfilador', methods=['GET'])
+@admissao.isenta
+@auth.requer_admin
+def status_perfilador():
+    """
+    GET /api/perfilador - Sessão de amostragem em andamento (apenas admin)
+    """
+    return jsonify({"sessao": perfilador.sessao_atual()})
+
+@app.route('/api/perfilador', methods=['DELETE'])
+@admissao.isenta
+@auth.requer_admin
+def encerrar_perfilador():
+    """
+    DELETE /api/perfilador - Encerra a amostragem antes do prazo (apenas admin)
+    """
+    sessao = perfilador.encerrar_sessao()
+    if not sessao:
+        return jsonify({"success": False, "error": "Nenhuma sessão em andamento"}), 404
+    return jsonify({"success": True, "sessao": sessao})
+
+@app.route('/api/perfilador/<sessao_id>', methods=['GET'])
+@admissao.isenta
+@auth.requer_admin
+def resumo_perfilador(sessao_id):
+    """
+    GET /api/perfilador/:sessao - Amostras e funções mais frequentes (apenas admin)
+    """
+    try:
+        return jsonify(perfilador.resumo(sessao_id))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/perfilador/<sessao_id>/collapsed', methods=['GET'])
+@admissao.isenta
+@auth.requer_admin
+def baixar_perfil(sessao_id):
+    """
+    GET /api/perfilador/:sessao/collapsed - Pilhas amostradas no formato
+    collapsed, para flamegraph.pl ou speedscope (apenas admin)
+    """
+    try:
+        texto = perfilador.collapsed(sessao_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return Response(texto, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=perfil-{sessao_id}.txt'
+    })
+
 # ==================== INICIALIZAÇÃO ====================
 
 if __name__ == '__main__':
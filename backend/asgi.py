@@ -0,0 +1,175 @@
+"""
+ASGI - Servidor assíncrono da API
+As rotas são as mesmas do app.py (validação, controle de admissão,
+leituras nas réplicas), executadas em um pool de threads; aqui fica só
+o transporte. O fluxo de eventos (SSE) roda no loop de eventos: uma
+conexão aberta esperando novidades não ocupa thread nenhuma
+Execução (na pasta backend): uvicorn asgi:aplicacao --workers 4
+"""
+
+from quart import Quart, Response, request, jsonify
+from asgiref.sync import async_to_sync, sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from werkzeug.exceptions import HTTPException
+from app import app as app_flask
+import replicas
+import academias
+import eventos
+import auth
+import sys
+import os
+
+# Threads que executam as rotas do Flask (por processo)
+THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+# Inicializa o Quart (só as rotas de transporte; o resto é do Flask)
+api = Quart(__name__, static_folder=None)
+
+@api.after_request
+async def cors(response):
+    """Permite requisições do frontend (equivalente ao Flask-CORS do app.py)"""
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Expose-Headers'] = f'{replicas.CABECALHO_ESCRITA}, X-Proximo-Cursor, Retry-After'
+    if request.method == 'OPTIONS':
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get(
+            'Access-Control-Request-Headers', 'Authorization, Content-Type'
+        )
+    return response
+
+# ==================== EVENTOS EM TEMPO REAL ====================
+
+@api.route('/api/eventos', methods=['GET'])
+async def stream_eventos():
+    """
+    GET /api/eventos - Fluxo Server-Sent Events com as alterações em
+    pagamentos/clientes e os contadores do dashboard
+    O token pode vir no parâmetro ?token= (EventSource não envia cabeçalhos)
+    """
+    token = request.args.get('token')
+    cabecalhos = {'Authorization': f'Bearer {token}'} if token else request.headers
+    payload, erro = auth.autenticar(cabecalhos)
+    if erro:
+        return jsonify(erro[0]), erro[1]
+    
+    resposta = Response(
+        eventos.fluxo_assincrono(payload.get('academia_id', academias.PADRAO), payload.get('banco')),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    resposta.timeout = None  # conexão longa: sem limite de tempo do Quart
+    return resposta
+
+# ==================== DESPACHO ENTRE QUART E FLASK ====================
+
+_threads = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='flask')
+
+def _environ(scope, corpo):
+    """
+    Monta o environ WSGI da requisição ASGI
+    """
+    raiz = scope.get('root_path', '').encode('utf-8').decode('latin1')
+    caminho = scope['path'].encode('utf-8').decode('latin1')
+    if caminho.startswith(raiz):
+        caminho = caminho[len(raiz):]
+    servidor = scope.get('server') or ('localhost', 80)
+    
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': raiz,
+        'PATH_INFO': caminho,
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': corpo,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    
+    for nome, valor in scope.get('headers', []):
+        nome = nome.decode('latin1').upper().replace('-', '_')
+        if nome not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            nome = f'HTTP_{nome}'
+        valor = valor.decode('latin1')
+        environ[nome] = f'{environ[nome]},{valor}' if nome in environ else valor
+    return environ
+
+def _executar_flask(scope, corpo, enviar):
+    """
+    Executa a requisição no app Flask (em uma thread do pool) e envia a
+    resposta em partes, à medida que o Flask as gera
+    """
+    inicio = {}
+    
+    def start_response(status, cabecalhos, exc_info=None):
+        if exc_info and inicio.get('enviado'):
+            raise exc_info[1].with_traceback(exc_info[2])
+        inicio.update(
+            status=int(status.split(' ', 1)[0]),
+            headers=[(nome.lower().encode('latin1'), valor.encode('latin1')) for nome, valor in cabecalhos]
+        )
+    
+    def enviar_inicio():
+        if not inicio.get('enviado'):
+            inicio['enviado'] = True
+            enviar({'type': 'http.response.start', 'status': inicio['status'], 'headers': inicio['headers']})
+    
+    resposta = app_flask(_environ(scope, corpo), start_response)
+    try:
+        for parte in resposta:
+            enviar_inicio()
+            if parte:
+                enviar({'type': 'http.response.body', 'body': parte, 'more_body': True})
+    finally:
+        if hasattr(resposta, 'close'):
+            resposta.close()
+    enviar_inicio()
+    enviar({'type': 'http.response.body'})
+
+# No pool próprio: o sync_to_async padrão executa todas as requisições
+# na mesma thread, uma de cada vez
+_executar_flask_no_pool = sync_to_async(_executar_flask, thread_sensitive=False, executor=_threads)
+
+async def _app_flask(scope, receive, send):
+    """
+    Adaptador ASGI -> WSGI do app Flask: lê o corpo da requisição e
+    executa o Flask no pool de threads
+    """
+    with SpooledTemporaryFile(max_size=65536) as corpo:
+        while True:
+            mensagem = await receive()
+            if mensagem['type'] == 'http.disconnect':
+                return
+            corpo.write(mensagem.get('body', b''))
+            if not mensagem.get('more_body'):
+                break
+        corpo.seek(0)
+        await _executar_flask_no_pool(scope, corpo, async_to_sync(send))
+
+def _rota_assincrona(scope):
+    """
+    Indica se o caminho/método da requisição tem rota no app Quart
+    """
+    try:
+        api.url_map.bind('').match(scope['path'], method=scope['method'])
+        return True
+    except HTTPException:
+        return False
+
+async def aplicacao(scope, receive, send):
+    """
+    Ponto de entrada ASGI: o fluxo de eventos vai para o Quart e as
+    demais rotas para o app Flask
+    """
+    if scope['type'] == 'http' and not _rota_assincrona(scope):
+        await _app_flask(scope, receive, send)
+    else:
+        await api(scope, receive, send)
@@ -5,7 +5,12 @@ Usando SQLAlchemy ORM para MySQL
 """
 
 from database import db
+from replicas import somente_leitura
 from models import Usuario, Historico
+from periodos import Periodo
+import academias
+import models
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import os
@@ -18,6 +23,18 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'chave-temporaria-desenvolvimento')
 
 # ==================== FUNÇÕES DE USUÁRIO ====================
 
+def email_em_uso(email, exceto_id=None):
+    """
+    Indica se o email já é de um usuário do banco, em qualquer academia:
+    o email é único no banco (o login sem academia procura o usuário
+    pelo email em todas as academias do banco principal)
+    """
+    with academias.academia(None, academias.banco_atual()):
+        query = db.select(Usuario.id).where(Usuario.email == email)
+        if exceto_id is not None:
+            query = query.where(Usuario.id != exceto_id)
+        return db.session.scalar(query.limit(1)) is not None
+
 def criar_usuario(nome, email, senha, tipo='operador'):
     """
     Cria um novo usuário no sistema
@@ -25,8 +42,7 @@ def criar_usuario(nome, email, senha, tipo='operador'):
     """
     try:
         # Verifica se email já existe
-        usuario_existente = Usuario.query.filter_by(email=email).first()
-        if usuario_existente:
+        if email_em_uso(email):
             return {"success": False, "error": "Email já cadastrado"}
         
         usuario = Usuario(
@@ -39,17 +55,19 @@ def criar_usuario(nome, email, senha, tipo='operador'):
         db.session.add(usuario)
         db.session.commit()
         return {"success": True, "id": usuario.id}
+    except IntegrityError:
+        # Cadastrado ao mesmo tempo por outra requisição
+        db.session.rollback()
+        return {"success": False, "error": "Email já cadastrado"}
     except Exception as e:
         db.session.rollback()
         return {"success": False, "error": str(e)}
 
-def listar_usuarios():
+def usuario_para_dict(u):
     """
-    Lista todos os usuários do sistema
+    Converte um usuário para dicionário (sem o hash da senha)
     """
-    usuarios = Usuario.query.filter_by(ativo=True).order_by(Usuario.nome).all()
-    
-    return [{
+    return {
         'id': u.id,
         'nome': u.nome,
         'email': u.email,
@@ -57,8 +75,24 @@ def listar_usuarios():
         'ativo': u.ativo,
         'data_criacao': u.data_criacao.isoformat() if u.data_criacao else None,
         'ultimo_acesso': u.ultimo_acesso.isoformat() if u.ultimo_acesso else None
-    } for u in usuarios]
+    }
+
+def consulta_usuarios():
+    """
+    Monta a consulta de listar_usuarios
+    """
+    return db.select(Usuario).where(Usuario.ativo == True).order_by(Usuario.nome)
 
+@somente_leitura
+def listar_usuarios():
+    """
+    Lista todos os usuários do sistema
+    """
+    usuarios = db.session.scalars(consulta_usuarios()).all()
+    
+    return [usuario_para_dict(u) for u in usuarios]
+
+@somente_leitura
 def obter_usuario(usuario_id):
     """
     Obtém dados de um usuário específico
@@ -68,15 +102,7 @@ def obter_usuario(usuario_id):
     if not usuario:
         return None
     
-    return {
-        'id': usuario.id,
-        'nome': usuario.nome,
-        'email': usuario.email,
-        'tipo': usuario.tipo,
-        'ativo': usuario.ativo,
-        'data_criacao': usuario.data_criacao.isoformat() if usuario.data_criacao else None,
-        'ultimo_acesso': usuario.ultimo_acesso.isoformat() if usuario.ultimo_acesso else None
-    }
+    return usuario_para_dict(usuario)
 
 def atualizar_usuario(usuario_id, nome, email, tipo, senha=None):
     """
@@ -88,11 +114,7 @@ def atualizar_usuario(usuario_id, nome, email, tipo, senha=None):
             return {"success": False, "error": "Usuário não encontrado"}
         
         # Verifica se email já existe para outro usuário
-        usuario_existente = Usuario.query.filter(
-            Usuario.email == email,
-            Usuario.id != usuario_id
-        ).first()
-        if usuario_existente:
+        if email_em_uso(email, usuario_id):
             return {"success": False, "error": "Email já cadastrado para outro usuário"}
         
         usuario.nome = nome
@@ -104,6 +126,9 @@ def atualizar_usuario(usuario_id, nome, email, tipo, senha=None):
         
         db.session.commit()
         return {"success": True}
+    except IntegrityError:
+        db.session.rollback()
+        return {"success": False, "error": "Email já cadastrado para outro usuário"}
     except Exception as e:
         db.session.rollback()
         return {"success": False, "error": str(e)}
@@ -121,34 +146,58 @@ def deletar_usuario(usuario_id):
 
 # ==================== AUTENTICAÇÃO ====================
 
-def fazer_login(email, senha):
+def consulta_login(email):
+    """
+    Monta a consulta do usuário ativo com o email informado (login)
+    """
+    return db.select(Usuario).where(Usuario.email == email, Usuario.ativo == True)
+
+def fazer_login(email, senha, academia=None):
     """
     Autentica um usuário e retorna token JWT
+    academia: identificador (slug) da academia; obrigatório apenas para
+    academias com banco próprio
     """
-    usuario = Usuario.query.filter_by(email=email, ativo=True).first()
-    
-    if not usuario:
-        return {"success": False, "error": "Usuário não encontrado"}
-    
-    # Verifica a senha
-    if not usuario.check_senha(senha):
-        return {"success": False, "error": "Senha incorreta"}
-    
-    # Atualiza último acesso
-    usuario.ultimo_acesso = datetime.datetime.utcnow()
-    
-    # Registra no histórico
-    historico = Historico(
-        usuario_id=usuario.id,
-        acao='LOGIN',
-        descricao=f'Usuário {usuario.nome} fez login'
-    )
-    
-    db.session.add(historico)
-    db.session.commit()
+    academia_id, banco = None, None
+    if academia:
+        cadastro = models.buscar_academia(academia)
+        if not cadastro:
+            return {"success": False, "error": "Academia não encontrada"}
+        academia_id, banco = cadastro.id, cadastro.banco
     
+    with academias.academia(academia_id, banco):
+        usuario = db.session.scalar(consulta_login(email))
+        
+        if not usuario:
+            return {"success": False, "error": "Usuário não encontrado"}
+        
+        # Verifica a senha
+        if not usuario.check_senha(senha):
+            return {"success": False, "error": "Senha incorreta"}
+        
+        # Atualiza último acesso
+        usuario.ultimo_acesso = datetime.datetime.utcnow()
+        
+        # Registra no histórico (na academia do usuário)
+        historico = Historico(
+            usuario_id=usuario.id,
+            acao='LOGIN',
+            descricao=f'Usuário {usuario.nome} fez login',
+            academia_id=usuario.academia_id
+        )
+        
+        db.session.add(historico)
+        db.session.commit()
+        
+        return resultado_login(usuario, banco)
+
+def resultado_login(usuario, banco=None):
+    """
+    Resposta de um login bem-sucedido, com o token JWT do usuário
+    banco: banco próprio da academia do usuário (None = banco principal)
+    """
     # Gera token JWT
-    token = gerar_token(usuario.id, usuario.email, usuario.tipo)
+    token = gerar_token(usuario.id, usuario.email, usuario.tipo, usuario.academia_id, banco)
     
     return {
         "success": True,
@@ -157,18 +206,23 @@ def fazer_login(email, senha):
             "id": usuario.id,
             "nome": usuario.nome,
             "email": usuario.email,
-            "tipo": usuario.tipo
+            "tipo": usuario.tipo,
+            "academia_id": usuario.academia_id
         }
     }
 
-def gerar_token(usuario_id, email, tipo):
+def gerar_token(usuario_id, email, tipo, academia_id=academias.PADRAO, banco=None):
     """
     Gera um token JWT para o usuário
+    A academia (e o banco dela) vão no token: cada requisição já sabe
+    quais dados pode ver e onde eles estão, sem consultar o cadastro
     """
     payload = {
         'usuario_id': usuario_id,
         'email': email,
         'tipo': tipo,
+        'academia_id': academia_id,
+        'banco': banco,
         'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=8)  # Token expira em 8 horas
     }
     return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
@@ -187,60 +241,60 @@ def verificar_token(token):
 
 # ==================== DECORADOR DE AUTENTICAÇÃO ====================
 
-def requer_autenticacao(f):
+def autenticar(headers, somente_admin=False):
     """
-    Decorador que verifica se o usuário está autenticado
+    Valida o token do cabeçalho Authorization
+    Retorna (payload, None) ou (None, (erro, status_http))
+    """
+    token = headers.get('Authorization')
+    
+    if not token:
+        return None, ({"error": "Token não fornecido"}, 401)
+    
+    # Remove 'Bearer ' do token se existir
+    if token.startswith('Bearer '):
+        token = token[7:]
+    
+    resultado = verificar_token(token)
+    
+    if not resultado['success']:
+        return None, ({"error": resultado['error']}, 401)
+    
+    if somente_admin and resultado['payload']['tipo'] != 'admin':
+        return None, ({"error": "Acesso negado. Apenas administradores."}, 403)
+    
+    return resultado['payload'], None
+
+def _decorador(f, somente_admin):
+    """
+    Envolve a rota com a verificação do token
     """
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        
-        if not token:
-            return jsonify({"error": "Token não fornecido"}), 401
-        
-        # Remove 'Bearer ' do token se existir
-        if token.startswith('Bearer '):
-            token = token[7:]
-        
-        resultado = verificar_token(token)
-        
-        if not resultado['success']:
-            return jsonify({"error": resultado['error']}), 401
+        payload, erro = autenticar(request.headers, somente_admin)
+        if erro:
+            return jsonify(erro[0]), erro[1]
         
         # Adiciona dados do usuário à requisição
-        request.usuario = resultado['payload']
+        request.usuario = payload
         
-        return f(*args, **kwargs)
+        # Consultas da rota restritas à academia do usuário
+        with academias.do_token(payload):
+            return f(*args, **kwargs)
     
     return decorated
 
+def requer_autenticacao(f):
+    """
+    Decorador que verifica se o usuário está autenticado
+    """
+    return _decorador(f, somente_admin=False)
+
 def requer_admin(f):
     """
     Decorador que verifica se o usuário é administrador
     """
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        
-        if not token:
-            return jsonify({"error": "Token não fornecido"}), 401
-        
-        if token.startswith('Bearer '):
-            token = token[7:]
-        
-        resultado = verificar_token(token)
-        
-        if not resultado['success']:
-            return jsonify({"error": resultado['error']}), 401
-        
-        if resultado['payload']['tipo'] != 'admin':
-            return jsonify({"error": "Acesso negado. Apenas administradores."}), 403
-        
-        request.usuario = resultado['payload']
-        
-        return f(*args, **kwargs)
-    
-    return decorated
+    return _decorador(f, somente_admin=True)
 
 # ==================== HISTÓRICO ====================
 
@@ -261,21 +315,80 @@ def registrar_historico(usuario_id, acao, descricao):
         db.session.rollback()
         print(f"Erro ao registrar histórico: {e}")
 
-def obter_historico(limite=50):
+def obter_historico(limite=50, cursor=None, usuario_id=None, acao=None, de=None, ate=None):
+    """
+    Obtém o histórico de ações do sistema, do mais recente para o mais antigo
+    """
+    return obter_historico_pagina(limite, cursor, usuario_id, acao, de, ate)['itens']
+
+def consulta_historico(limite=50, cursor=None, usuario_id=None, acao=None, de=None, ate=None):
+    """
+    Monta a consulta de obter_historico_pagina, já trazendo o usuário
+    de cada ação. Lança ValueError se o cursor ou as datas forem inválidos
+    """
+    query = db.select(Historico)\
+        .join(Historico.usuario)\
+        .options(db.contains_eager(Historico.usuario))
+    
+    if usuario_id:
+        query = query.where(Historico.usuario_id == usuario_id)
+    
+    if acao:
+        query = query.where(Historico.acao == acao)
+    
+    if de or ate:
+        query = query.where(Periodo.intervalo(de, ate).filtro(Historico.data_acao))
+    
+    if cursor:
+        data_cursor, id_cursor = decodificar_cursor(cursor)
+        query = query.where(
+            db.tuple_(Historico.data_acao, Historico.id) < db.tuple_(data_cursor, id_cursor)
+        )
+    
+    return query\
+        .order_by(Historico.data_acao.desc(), Historico.id.desc())\
+        .limit(limite)
+
+def pagina_historico(historico, limite):
+    """
+    Converte as ações de uma página do histórico e calcula o próximo cursor
+    """
+    proximo_cursor = None
+    if historico and len(historico) == limite:
+        ultimo = historico[-1]
+        proximo_cursor = f'{ultimo.data_acao.isoformat()}_{ultimo.id}'
+    
+    return {
+        'itens': [{
+            'id': h.id,
+            'usuario_id': h.usuario_id,
+            'usuario_nome': h.usuario.nome,
+            'acao': h.acao,
+            'descricao': h.descricao,
+            'data_acao': h.data_acao.isoformat() if h.data_acao else None
+        } for h in historico],
+        'proximo_cursor': proximo_cursor
+    }
+
+@somente_leitura
+def obter_historico_pagina(limite=50, cursor=None, usuario_id=None, acao=None, de=None, ate=None):
     """
-    Obtém o histórico de ações do sistema
+    Obtém uma página do histórico de ações com filtros opcionais
+    Paginação por cursor (keyset): para a próxima página envie o
+    'proximo_cursor' devolvido, que aponta para a última ação exibida.
+    Cada página é uma leitura curta no índice de data, qualquer que seja
+    o tamanho da tabela
+    de / ate: datas 'AAAA-MM-DD' (ate inclusive)
     """
-    historico = Historico.query\
-        .join(Usuario)\
-        .order_by(Historico.data_acao.desc())\
-        .limit(limite)\
-        .all()
+    consulta = consulta_historico(limite, cursor, usuario_id, acao, de, ate)
+    historico = db.session.scalars(consulta).all()
     
-    return [{
-        'id': h.id,
-        'usuario_id': h.usuario_id,
-        'usuario_nome': h.usuario.nome,
-        'acao': h.acao,
-        'descricao': h.descricao,
-        'data_acao': h.data_acao.isoformat() if h.data_acao else None
-    } for h in historico]
\ No newline at end of file
+    return pagina_historico(historico, limite)
+
+def decodificar_cursor(cursor):
+    """
+    Converte o cursor '<data_acao ISO>_<id>' em (datetime, id)
+    Lança ValueError se o cursor for inválido
+    """
+    data_acao, _, id_acao = cursor.rpartition('_')
+    return datetime.datetime.fromisoformat(data_acao), int(id_acao)
@@ -0,0 +1,165 @@
+"""
+Banco SQLite - Perfil ajustado para academias de uma unidade
+Sem DATABASE_URL o sistema usa SQLite; com o perfil 'ajustado' (padrão)
+cada conexão nova recebe:
+- journal_mode=WAL: leituras não bloqueiam a escrita nem são bloqueadas
+  por ela (a escrita vai para o arquivo -wal, copiado no checkpoint)
+- synchronous=NORMAL: o commit não espera o fsync; no WAL, o banco segue
+  íntegro após uma queda de energia (pode perder só os últimos commits)
+- busy_timeout: quem encontra o banco ocupado espera a vez em vez de
+  falhar com "database is locked"
+- cache_size, mmap_size e temp_store=MEMORY: menos leituras de disco
+Serialização das escritas: o pysqlite só abre a transação antes do
+primeiro INSERT/UPDATE/DELETE (as leituras anteriores não ficam presas a
+uma versão do banco); aqui essa abertura passa a ser BEGIN IMMEDIATE,
+que já reserva a escrita. Assim, escritores de vários workers e threads
+fazem fila no busy_timeout, ao contrário do BEGIN comum, que falha na
+hora se outra escrita terminar entre a leitura e a escrita dele
+O checkpoint automático do SQLite mantém o -wal pequeno; os comandos
+sqlite-checkpoint e sqlite-backup (manutencao.py) rodam com o sistema
+no ar
+Configuração: SQLITE_PERFIL=ajustado|padrao e as variáveis abaixo
+"""
+
+from sqlalchemy import event
+import os
+import sqlite3
+import time
+
+PERFIL = os.environ.get('SQLITE_PERFIL', 'ajustado')
+
+BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 10000))
+SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+CACHE_MB = int(os.environ.get('SQLITE_CACHE_MB', 64))
+MMAP_MB = int(os.environ.get('SQLITE_MMAP_MB', 256))
+
+# Tamanho máximo do -wal mantido em disco após cada checkpoint
+LIMITE_WAL_MB = 64
+
+# Páginas copiadas por etapa do backup (entre etapas, as escritas seguem)
+BACKUP_PAGINAS = 1024
+BACKUP_PAUSA = 0.05
+
+MODOS_CHECKPOINT = ('passive', 'full', 'restart', 'truncate')
+
+# ==================== CONFIGURAÇÃO DAS CONEXÕES ====================
+
+def pragmas():
+    """
+    PRAGMAs executados em cada conexão nova do perfil ajustado
+    """
+    return [
+        'PRAGMA journal_mode=WAL',
+        f'PRAGMA synchronous={SYNCHRONOUS}',
+        f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}',
+        f'PRAGMA cache_size=-{CACHE_MB * 1024}',
+        f'PRAGMA mmap_size={MMAP_MB * 1024 * 1024}',
+        'PRAGMA temp_store=MEMORY',
+        f'PRAGMA journal_size_limit={LIMITE_WAL_MB * 1024 * 1024}'
+    ]
+
+def _configurar_conexao(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+    
+    # Abertura implícita das transações de escrita (ver início do arquivo)
+    dbapi_connection.isolation_level = 'IMMEDIATE'
+
+def configurar_engine(engine):
+    """
+    Aplica o perfil ajustado às conexões novas de um engine SQLite;
+    outros bancos e o perfil 'padrao' ficam como estão
+    Deve ser chamada antes da primeira conexão do engine
+    """
+    if engine.dialect.name != 'sqlite' or PERFIL != 'ajustado' or engine.url.database in (None, '', ':memory:'):
+        return False
+    event.listen(engine, 'connect', _configurar_conexao)
+    return True
+
+# ==================== MANUTENÇÃO ====================
+
+def _exigir_sqlite(engine):
+    if engine.dialect.name != 'sqlite':
+        raise ValueError(f"Disponível apenas para SQLite (banco atual: {engine.dialect.name})")
+
+def estado(engine):
+    """
+    Modo do journal, sincronização e tamanho do banco e do -wal
+    """
+    _exigir_sqlite(engine)
+    arquivo = engine.url.database
+    with engine.connect() as conexao:
+        journal = conexao.exec_driver_sql('PRAGMA journal_mode').scalar()
+        synchronous = conexao.exec_driver_sql('PRAGMA synchronous').scalar()
+    
+    def tamanho(caminho):
+        return os.path.getsize(caminho) if os.path.exists(caminho) else 0
+    
+    return {
+        'arquivo': arquivo,
+        'journal_mode': journal,
+        'synchronous': ['OFF', 'NORMAL', 'FULL', 'EXTRA'][synchronous],
+        'tamanho': tamanho(arquivo),
+        'tamanho_wal': tamanho(arquivo + '-wal')
+    }
+
+def checkpoint(engine, modo='passive'):
+    """
+    Copia o -wal para o banco (PRAGMA wal_checkpoint) e atualiza as
+    estatísticas do planejador (PRAGMA optimize)
+    passive: não espera ninguém; full/restart: espera as escritas em
+    andamento; truncate: como restart, e zera o -wal no disco
+    Retorna {"ocupado", "paginas_wal", "paginas_copiadas"}
+    Lança ValueError se o banco não for SQLite ou o modo for inválido
+    """
+    _exigir_sqlite(engine)
+    if modo not in MODOS_CHECKPOINT:
+        raise ValueError(f"Modo inválido (use {', '.join(MODOS_CHECKPOINT)}): {modo}")
+    
+    with engine.connect() as conexao:
+        ocupado, paginas_wal, copiadas = conexao.exec_driver_sql(f'PRAGMA wal_checkpoint({modo.upper()})').one()
+        conexao.exec_driver_sql('PRAGMA optimize')
+    
+    return {'ocupado': bool(ocupado), 'paginas_wal': paginas_wal, 'paginas_copiadas': copiadas}
+
+def backup(engine, destino, log=print):
+    """
+    Cópia consistente do banco com o sistema no ar (API de backup do
+    SQLite, em etapas de BACKUP_PAGINAS: as escritas continuam entre
+    elas). A cópia sai em journal DELETE (um arquivo só) e é conferida
+    com PRAGMA quick_check antes de ocupar o lugar de 'destino'
+    Lança ValueError se o banco não for SQLite ou a cópia não passar
+    na conferência
+    """
+    _exigir_sqlite(engine)
+    temporario = destino + '.tmp'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+    
+    def progresso(status, restantes, total):
+        if total and restantes == 0:
+            log(f"{total} páginas copiadas")
+    
+    inicio = time.monotonic()
+    bruta = engine.raw_connection()
+    try:
+        copia = sqlite3.connect(temporario)
+        try:
+            bruta.driver_connection.backup(copia, pages=BACKUP_PAGINAS, progress=progresso, sleep=BACKUP_PAUSA)
+            copia.execute('PRAGMA journal_mode=DELETE')
+            verificacao = copia.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            copia.close()
+    finally:
+        bruta.close()
+    
+    if verificacao != 'ok':
+        os.remove(temporario)
+        raise ValueError(f"Cópia com problema (quick_check): {verificacao}")
+    
+    os.replace(temporario, destino)
+    return {'destino': destino, 'tamanho': os.path.getsize(destino), 'segundos': round(time.monotonic() - inicio, 2)}
@@ -0,0 +1,313 @@
+"""
+Caixa de Saída - Entrega das alterações a sistemas externos (outbox)
+Cada alteração em clientes, pagamentos e usuários grava um evento em
+eventos_saida na mesma transação dela (ver CAIXA DE SAÍDA em models.py):
+alteração confirmada tem evento, alteração desfeita não tem. Os sistemas
+de BI e contabilidade deixam de varrer a API atrás do que mudou e passam
+a receber os eventos
+O retransmissor (python manutencao.py saida-retransmitir) lê os eventos
+de cada consumidor em ordem de seq, em lotes, entrega ao destino dele e
+só então avança a posição do consumidor (tabela consumidores_saida). Se
+ele parar entre a entrega e a gravação da posição, o lote é entregue de
+novo: a entrega é "pelo menos uma vez", e o consumidor descarta os
+repetidos pelo id do evento. Um destino com falha é tentado de novo com
+espera crescente, sem pular eventos
+Destinos: webhook (POST JSON) e arquivo (linhas JSON, substituto local
+de uma fila). Configuração: SAIDA_CONSUMIDORES=nome=destino:alvo,...
+(ex.: bi=webhook:https://bi.exemplo/eventos,contabil=arquivo:saida/contabil.jsonl)
+Cada banco (o principal ou o próprio de uma academia) tem sua caixa de
+saída e suas posições; o retransmissor atende o banco do comando
+(--academia para um banco próprio)
+"""
+
+from database import db
+from models import EventoSaida, ConsumidorSaida, consulta_alteracoes_confirmadas
+from datetime import datetime, timedelta
+import academias
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+# Consumidores: nome -> (destino, alvo)
+CONSUMIDORES = {
+    nome.strip(): tuple(destino.split(':', 1))
+    for nome, _, destino in (
+        item.partition('=') for item in os.environ.get('SAIDA_CONSUMIDORES', '').split(',')
+    )
+    if nome.strip() and ':' in destino
+}
+
+# Eventos por entrega e espera quando não há eventos novos (s)
+LOTE = int(os.environ.get('SAIDA_LOTE', 100))
+INTERVALO = float(os.environ.get('SAIDA_INTERVALO', 1))
+
+# Espera máxima entre tentativas de um destino com falha (s)
+ESPERA_MAXIMA = 300
+
+WEBHOOK_TOKEN = os.environ.get('SAIDA_WEBHOOK_TOKEN', '')
+
+# Dias que os eventos já entregues a todos os consumidores ficam no banco
+RETENCAO_DIAS = int(os.environ.get('SAIDA_RETENCAO_DIAS', 7))
+
+# ==================== DESTINOS ====================
+
+class ErroEntrega(Exception):
+    """
+    O destino não confirmou o lote (a posição do consumidor não avança)
+    """
+
+class Destino:
+    """
+    Recebe os lotes de eventos de um consumidor; entregar() só retorna
+    depois que o lote está guardado do outro lado
+    """
+    tipo = None
+    
+    def __init__(self, consumidor, alvo):
+        self.consumidor = consumidor
+        self.alvo = alvo
+    
+    def entregar(self, eventos):
+        raise NotImplementedError
+    
+    def fechar(self):
+        pass
+
+class DestinoWebhook(Destino):
+    """
+    POST JSON {consumidor, eventos} na URL do consumidor, com
+    SAIDA_WEBHOOK_TOKEN no cabeçalho Authorization; qualquer resposta 2xx
+    confirma o lote
+    """
+    tipo = 'webhook'
+    
+    def entregar(self, eventos):
+        requisicao = urllib.request.Request(
+            self.alvo,
+            data=json.dumps({'consumidor': self.consumidor, 'eventos': eventos}, ensure_ascii=False).encode(),
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {WEBHOOK_TOKEN}'}
+        )
+        try:
+            with urllib.request.urlopen(requisicao, timeout=30):
+                pass
+        except urllib.error.HTTPError as e:
+            raise ErroEntrega(f"Webhook respondeu {e.code}") from e
+        except OSError as e:
+            raise ErroEntrega(str(e)) from e
+
+class DestinoArquivo(Destino):
+    """
+    Substituto local de uma fila: acrescenta cada evento como uma linha
+    JSON no arquivo do consumidor, gravado em disco (fsync) antes de
+    confirmar
+    """
+    tipo = 'arquivo'
+    
+    def entregar(self, eventos):
+        try:
+            os.makedirs(os.path.dirname(self.alvo) or '.', exist_ok=True)
+            with open(self.alvo, 'a', encoding='utf-8') as arquivo:
+                arquivo.writelines(json.dumps(evento, ensure_ascii=False) + '\n' for evento in eventos)
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+        except OSError as e:
+            raise ErroEntrega(str(e)) from e
+
+# Destinos disponíveis: novos destinos só precisam ser registrados aqui
+DESTINOS = {destino.tipo: destino for destino in (DestinoWebhook, DestinoArquivo)}
+
+def criar_destinos(nomes=None):
+    """
+    Destinos dos consumidores pedidos (padrão: todos os de SAIDA_CONSUMIDORES)
+    Lança ValueError se um consumidor ou destino não existir
+    """
+    nomes = nomes or list(CONSUMIDORES)
+    if not nomes:
+        raise ValueError("Nenhum consumidor configurado em SAIDA_CONSUMIDORES")
+    
+    destinos = {}
+    for nome in nomes:
+        if nome not in CONSUMIDORES:
+            raise ValueError(f"Consumidor não configurado em SAIDA_CONSUMIDORES: {nome}")
+        tipo, alvo = CONSUMIDORES[nome]
+        if tipo not in DESTINOS:
+            raise ValueError(f"Destino desconhecido do consumidor {nome}: {tipo} (use {', '.join(DESTINOS)})")
+        destinos[nome] = DESTINOS[tipo](nome, alvo)
+    return destinos
+
+# ==================== LEITURA ====================
+
+def consulta_eventos(posicao, limite=LOTE):
+    """
+    Próximos eventos depois da posição de um consumidor (pela chave seq),
+    até a última posição sem nenhuma anterior por confirmar: um evento
+    de número menor confirmado depois não fica para trás
+    """
+    confirmadas = consulta_alteracoes_confirmadas().scalar_subquery()
+    return db.select(EventoSaida)\
+        .where(EventoSaida.seq > posicao, EventoSaida.seq <= confirmadas)\
+        .order_by(EventoSaida.seq)\
+        .limit(limite)
+
+def evento_para_dict(evento, banco=None):
+    """
+    Evento entregue aos consumidores; 'id' identifica o evento entre os
+    bancos (para descartar repetidos)
+    """
+    return {
+        'id': f"{banco or 'principal'}:{evento.seq}",
+        'seq': evento.seq,
+        'banco': banco,
+        'academia_id': evento.academia_id,
+        'tipo': evento.tipo,
+        'tabela': evento.tabela,
+        'registro_id': evento.registro_id,
+        **json.loads(evento.dados),
+        'data': evento.data_criacao.isoformat() if evento.data_criacao else None
+    }
+
+def _consumidor(nome):
+    consumidor = db.session.get(ConsumidorSaida, nome)
+    if consumidor is None:
+        consumidor = ConsumidorSaida(nome=nome, posicao=0, entregues=0, falhas_seguidas=0)
+        db.session.add(consumidor)
+        db.session.commit()
+    return consumidor
+
+# ==================== RETRANSMISSÃO ====================
+
+def retransmitir_lote(nome, destino, banco=None):
+    """
+    Entrega o próximo lote de eventos de um consumidor e avança a posição
+    dele. Retorna quantos eventos foram entregues
+    Lança ErroEntrega se o destino falhar (a posição fica onde estava)
+    """
+    posicao = _consumidor(nome).posicao
+    eventos = [evento_para_dict(e, banco) for e in db.session.scalars(consulta_eventos(posicao))]
+    # Encerra a leitura: o banco não fica preso durante a entrega
+    db.session.commit()
+    if not eventos:
+        return 0
+    
+    try:
+        destino.entregar(eventos)
+    except ErroEntrega as e:
+        db.session.execute(
+            db.update(ConsumidorSaida).where(ConsumidorSaida.nome == nome).values(
+                falhas_seguidas=ConsumidorSaida.falhas_seguidas + 1,
+                ultimo_erro=str(e)[:500],
+                atualizado_em=datetime.utcnow()
+            )
+        )
+        db.session.commit()
+        raise
+    
+    # Só avança a partir da posição lida: se outro retransmissor do mesmo
+    # consumidor avançou antes, este lote conta como repetido
+    db.session.execute(
+        db.update(ConsumidorSaida)
+        .where(ConsumidorSaida.nome == nome, ConsumidorSaida.posicao == posicao)
+        .values(
+            posicao=eventos[-1]['seq'],
+            entregues=ConsumidorSaida.entregues + len(eventos),
+            falhas_seguidas=0,
+            ultimo_erro=None,
+            atualizado_em=datetime.utcnow()
+        )
+    )
+    db.session.commit()
+    return len(eventos)
+
+def retransmitir(nomes=None, continuo=True, log=print):
+    """
+    Entrega os eventos do banco atual aos consumidores, em ordem
+    continuo=False: entrega o que está pendente e termina (um consumidor
+    com falha é deixado para a próxima execução)
+    Retorna {consumidor: eventos entregues}
+    """
+    banco = academias.banco_atual()
+    destinos = criar_destinos(nomes)
+    entregues = dict.fromkeys(destinos, 0)
+    espera = dict.fromkeys(destinos, 0)
+    proxima = dict.fromkeys(destinos, 0)
+    
+    try:
+        with academias.academia(None, banco):
+            while True:
+                rodada = 0
+                for nome, destino in destinos.items():
+                    if time.monotonic() < proxima[nome]:
+                        continue
+                    try:
+                        quantidade = retransmitir_lote(nome, destino, banco)
+                    except ErroEntrega as e:
+                        if not continuo:
+                            log(f"{nome}: falha na entrega ({e})")
+                            proxima[nome] = float('inf')
+                            continue
+                        espera[nome] = min(max(espera[nome] * 2, 1), ESPERA_MAXIMA)
+                        proxima[nome] = time.monotonic() + espera[nome]
+                        log(f"{nome}: falha na entrega ({e}); nova tentativa em {espera[nome]}s")
+                        continue
+                    
+                    espera[nome] = 0
+                    entregues[nome] += quantidade
+                    rodada += quantidade
+                
+                if not rodada:
+                    if not continuo:
+                        break
+                    time.sleep(INTERVALO)
+    finally:
+        for destino in destinos.values():
+            destino.fechar()
+    
+    return entregues
+
+# ==================== ACOMPANHAMENTO E LIMPEZA ====================
+
+def estado():
+    """
+    Posição de cada consumidor no banco atual e eventos ainda não entregues
+    """
+    with academias.academia(None, academias.banco_atual()):
+        ultimo = db.session.scalar(db.select(db.func.max(EventoSaida.seq))) or 0
+        consumidores = {c.nome: c for c in db.session.scalars(db.select(ConsumidorSaida))}
+        
+        resultado = []
+        for nome in sorted(set(CONSUMIDORES) | set(consumidores)):
+            consumidor = consumidores.get(nome)
+            posicao = consumidor.posicao if consumidor else 0
+            resultado.append({
+                'consumidor': nome,
+                'destino': ':'.join(CONSUMIDORES[nome]) if nome in CONSUMIDORES else None,
+                'posicao': posicao,
+                'pendentes': db.session.scalar(
+                    db.select(db.func.count()).select_from(EventoSaida).where(EventoSaida.seq > posicao)
+                ),
+                'entregues': consumidor.entregues if consumidor else 0,
+                'falhas_seguidas': consumidor.falhas_seguidas if consumidor else 0,
+                'ultimo_erro': consumidor.ultimo_erro if consumidor else None,
+                'atualizado_em': consumidor.atualizado_em.isoformat() if consumidor and consumidor.atualizado_em else None
+            })
+    
+    return {'ultimo_seq': ultimo, 'consumidores': resultado}
+
+def limpar(dias=RETENCAO_DIAS):
+    """
+    Apaga os eventos com mais de 'dias' dias já entregues a todos os
+    consumidores configurados (sem consumidores: todos os antigos)
+    Retorna quantos eventos foram removidos
+    """
+    limite = datetime.utcnow() - timedelta(days=dias)
+    with academias.academia(None, academias.banco_atual()):
+        condicao = EventoSaida.data_criacao < limite
+        if CONSUMIDORES:
+            posicoes = [_consumidor(nome).posicao for nome in CONSUMIDORES]
+            condicao = db.and_(condicao, EventoSaida.seq <= min(posicoes))
+        
+        removidos = db.session.execute(db.delete(EventoSaida).where(condicao)).rowcount
+        db.session.commit()
+    return removidos
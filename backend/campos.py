@@ -0,0 +1,74 @@
+"""
+Campos - Escolha dos campos devolvidos pelas listagens (?fields=)
+Cada listagem declara os campos que pode devolver (nome -> coluna e
+conversão para JSON) e conjuntos nomeados: 'completo' (todos) e
+'resumo' (o que as telas de lista mostram). O parâmetro fields aceita
+conjuntos e campos separados por vírgula (fields=resumo,descricao) e só
+as colunas dos campos pedidos entram no SELECT: texto livre que a tela
+não mostra não é lido do banco nem enviado. O 'id' vem sempre
+"""
+
+def iso(valor):
+    """
+    Data/data e hora no formato ISO (ou None)
+    """
+    return valor.isoformat() if valor else None
+
+def decimal(valor):
+    return float(valor or 0)
+
+def inteiro(valor):
+    return valor or 0
+
+class Campos:
+    """
+    Campos de uma listagem: {nome: (coluna, conversão ou None)}, na ordem
+    em que aparecem na resposta, e os conjuntos nomeados além de 'completo'
+    """
+    
+    def __init__(self, campos, conjuntos, padrao='completo'):
+        self.campos = campos
+        self.conjuntos = {'completo': tuple(campos), **conjuntos}
+        self.padrao = padrao
+    
+    def escolher(self, fields=None):
+        """
+        Nomes dos campos pedidos em 'fields' (padrão: o conjunto padrão)
+        Lança ValueError se algum nome não for campo nem conjunto
+        """
+        itens = [item.strip() for item in (fields or self.padrao).split(',') if item.strip()]
+        escolhidos = {'id'}
+        for item in itens:
+            if item in self.conjuntos:
+                escolhidos.update(self.conjuntos[item])
+            elif item in self.campos:
+                escolhidos.add(item)
+            else:
+                raise ValueError(
+                    f"Campo desconhecido em fields: {item} "
+                    f"(use {', '.join(self.conjuntos)} ou {', '.join(self.campos)})"
+                )
+        return [nome for nome in self.campos if nome in escolhidos]
+    
+    def colunas(self, nomes):
+        """
+        Colunas do SELECT, rotuladas com o nome de cada campo
+        """
+        return [self.campos[nome][0].label(nome) for nome in nomes]
+    
+    def entidades(self, nomes):
+        """
+        Modelos de onde vêm as colunas (para decidir os JOINs)
+        """
+        return {self.campos[nome][0].class_ for nome in nomes}
+    
+    def para_dict(self, linha, nomes):
+        """
+        Converte uma linha da consulta para dicionário
+        """
+        resultado = {}
+        for nome in nomes:
+            valor = getattr(linha, nome)
+            conversao = self.campos[nome][1]
+            resultado[nome] = conversao(valor) if conversao else valor
+        return resultado
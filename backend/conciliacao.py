@@ -0,0 +1,602 @@
+"""
+Conciliação - Baixa automática de pagamentos a partir do extrato bancário
+Lê o extrato (CSV, OFX ou CNAB 240, segmento E) linha a linha e procura,
+para cada crédito, a cobrança pendente correspondente em índices em
+memória (dicionários) montados com uma única consulta:
+- valor + CPF do pagador: identifica o cliente com certeza
+- valor + palavras do nome do pagador: aceito quando todas as cobranças
+  mais parecidas são do mesmo cliente
+Em ambos os casos o vencimento precisa estar na janela em torno da data
+do crédito; entre cobranças do mesmo cliente, vale a mais antiga
+As cobranças encontradas são baixadas em uma única transação; os créditos
+com mais de um cliente possível ou sem cobrança ficam na fila de revisão
+(GET /api/conciliacao/pendencias). Cada lançamento é gravado uma única
+vez: importar o mesmo extrato de novo não baixa nada em dobro
+"""
+
+from database import db
+from models import Cliente, Pagamento, ConciliacaoLancamento
+from datetime import datetime, timedelta
+from itertools import chain
+from sqlalchemy.exc import IntegrityError
+import csv
+import hashlib
+import json
+import os
+import re
+import unicodedata
+import uuid
+import periodos
+
+# Dias aceitos entre o vencimento e a data do crédito (antes / depois)
+JANELA_ANTES = int(os.environ.get('CONCILIACAO_JANELA_ANTES', 15))
+JANELA_DEPOIS = int(os.environ.get('CONCILIACAO_JANELA_DEPOIS', 90))
+
+# Palavras do nome em comum exigidas para aceitar uma cobrança pelo nome
+# (ou todas as do cliente, se ele tiver menos)
+PALAVRAS_NOME = 2
+
+# Cobranças de mesmo valor a partir das quais uma palavra do nome é
+# comum demais para servir de busca
+PALAVRA_COMUM = 200
+
+# Cobranças sugeridas por lançamento na fila de revisão
+MAXIMO_CANDIDATOS = 10
+
+# Lançamentos baixados e gravados por vez (a transação é uma só)
+LOTE = 1000
+
+STATUS_REVISAO = ('ambiguo', 'nao_encontrado')
+
+# ==================== LEITURA DO EXTRATO ====================
+
+# Palavras ignoradas na comparação de nomes
+PALAVRAS_IGNORADAS = {'DE', 'DA', 'DO', 'DAS', 'DOS', 'E'}
+
+_cpf = re.compile(r'\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b')
+
+def palavras(texto):
+    """
+    'João da Silva' -> {'JOAO', 'SILVA'} (sem acentos e sem palavras curtas)
+    """
+    texto = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode().upper()
+    return {p for p in re.split(r'[^A-Z0-9]+', texto) if len(p) > 1 and p not in PALAVRAS_IGNORADAS}
+
+def somente_digitos(texto):
+    return re.sub(r'\D', '', texto or '')
+
+def encontrar_cpf(*textos):
+    """
+    Primeiro CPF (11 dígitos, com ou sem pontuação) encontrado nos textos
+    """
+    for texto in textos:
+        encontrado = _cpf.search(texto or '')
+        if encontrado:
+            return somente_digitos(encontrado.group())
+    return None
+
+def centavos(valor):
+    return int(round(valor * 100))
+
+def _numero(texto, linha):
+    """
+    '1.234,56', '1234.56' ou 'R$ -50,00' -> float
+    """
+    texto = (texto or '').replace('R$', '').replace(' ', '')
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        return float(texto)
+    except ValueError:
+        raise ValueError(f"Linha {linha}: valor inválido: {texto!r}")
+
+def _data(texto, linha):
+    """
+    'AAAA-MM-DD', 'DD/MM/AAAA' ou 'AAAAMMDD...' (OFX) -> date
+    """
+    texto = (texto or '').strip()
+    for formato, tamanho in (('%Y-%m-%d', 10), ('%d/%m/%Y', 10), ('%Y%m%d', 8)):
+        try:
+            return datetime.strptime(texto[:tamanho], formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Linha {linha}: data inválida: {texto!r}")
+
+def _identificador(*partes):
+    return hashlib.sha1('|'.join(str(p) for p in partes).encode()).hexdigest()
+
+def _lancamento(identificador, data, valor, documento=None, nome='', descricao='', linha=0):
+    return {
+        'identificador': identificador,
+        'data': data,
+        'valor': valor,
+        'documento': documento or encontrar_cpf(nome, descricao),
+        'nome': (nome or '').strip(),
+        'descricao': (descricao or '').strip(),
+        'linha': linha
+    }
+
+def _linhas_texto(arquivo):
+    """
+    Linhas de um arquivo binário, decodificadas uma a uma (UTF-8; se
+    falhar, Windows-1252, comum nos extratos dos bancos)
+    """
+    for linha in arquivo:
+        try:
+            yield linha.decode('utf-8')
+        except UnicodeDecodeError:
+            yield linha.decode('cp1252', errors='replace')
+
+# Colunas aceitas no CSV (cabeçalho sem acentos, minúsculo)
+COLUNAS_CSV = {
+    'data': ('data', 'data_lancamento', 'data_credito', 'date', 'dt'),
+    'valor': ('valor', 'valor_credito', 'credito', 'value', 'amount'),
+    'documento': ('cpf', 'documento', 'cpf_cnpj', 'cpf_pagador', 'doc'),
+    'nome': ('nome', 'pagador', 'nome_pagador', 'favorecido', 'name'),
+    'descricao': ('descricao', 'historico', 'memo', 'description'),
+    'identificador': ('id', 'identificador', 'fitid', 'end_to_end', 'e2e')
+}
+
+def _coluna(nome):
+    nome = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '_', nome.strip().lower()).strip('_')
+
+def ler_csv(linhas):
+    """
+    CSV com cabeçalho (separador ',' ou ';'); ver COLUNAS_CSV
+    """
+    linhas = iter(linhas)
+    cabecalho = next(linhas, '')
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    leitor = csv.reader(chain([cabecalho], linhas), delimiter=separador)
+    
+    nomes = [_coluna(c) for c in next(leitor, [])]
+    posicoes = {}
+    for campo, aceitos in COLUNAS_CSV.items():
+        for aceito in aceitos:
+            if aceito in nomes:
+                posicoes[campo] = nomes.index(aceito)
+                break
+    if 'data' not in posicoes or 'valor' not in posicoes:
+        raise ValueError("CSV sem as colunas de data e valor no cabeçalho")
+    
+    repetidas = {}
+    for numero, campos in enumerate(leitor, start=2):
+        if not any(c.strip() for c in campos):
+            continue
+        valores = {campo: campos[i] if i < len(campos) else '' for campo, i in posicoes.items()}
+        
+        # Sem coluna de identificador: a própria linha (e quantas vezes ela
+        # já apareceu no arquivo, para duas linhas iguais não virarem uma)
+        chave = valores.get('identificador') or separador.join(campos)
+        repetidas[chave] = repetidas.get(chave, 0) + 1
+        
+        yield _lancamento(
+            _identificador('csv', chave, repetidas[chave]),
+            _data(valores['data'], numero),
+            _numero(valores['valor'], numero),
+            somente_digitos(valores.get('documento')) or None,
+            valores.get('nome', ''),
+            valores.get('descricao', ''),
+            numero
+        )
+
+_tag_ofx = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+def ler_ofx(linhas):
+    """
+    OFX 1.x (SGML, tags sem fechamento) ou 2.x (XML): um lançamento por
+    bloco <STMTTRN>
+    """
+    transacao = None
+    for numero, linha in enumerate(linhas, start=1):
+        for fechamento, tag, valor in _tag_ofx.findall(linha):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not fechamento:
+                    transacao = {'linha': numero}
+                elif transacao is not None:
+                    if 'TRNAMT' not in transacao or 'DTPOSTED' not in transacao:
+                        raise ValueError(f"Linha {transacao['linha']}: transação sem TRNAMT ou DTPOSTED")
+                    yield _lancamento(
+                        _identificador('ofx', transacao.get('FITID') or transacao['linha']),
+                        _data(transacao['DTPOSTED'], transacao['linha']),
+                        _numero(transacao['TRNAMT'], transacao['linha']),
+                        None,
+                        transacao.get('NAME', ''),
+                        transacao.get('MEMO', ''),
+                        transacao['linha']
+                    )
+                    transacao = None
+            elif transacao is not None and not fechamento:
+                transacao[tag] = valor.strip()
+
+# CNAB 240 (FEBRABAN), extrato para conciliação, segmento E: posições
+# (início, fim) contadas a partir de 1, como no manual do layout
+LAYOUT_CNAB = {
+    'registro': (8, 8),
+    'segmento': (14, 14),
+    'data': (143, 150),
+    'valor': (151, 168),
+    'tipo': (169, 169),
+    'historico': (177, 201),
+    'documento': (202, 240)
+}
+
+def ler_cnab(linhas, layout=LAYOUT_CNAB):
+    """
+    CNAB 240 de extrato: lê apenas os detalhes (registro 3, segmento E);
+    valor com 2 casas implícitas, tipo 'D' = débito
+    """
+    def campo(linha, nome):
+        inicio, fim = layout[nome]
+        return linha[inicio - 1:fim]
+    
+    for numero, linha in enumerate(linhas, start=1):
+        linha = linha.rstrip('\r\n')
+        if len(linha) < 240 or campo(linha, 'registro') != '3' or campo(linha, 'segmento') != 'E':
+            continue
+        data = campo(linha, 'data')
+        try:
+            data = datetime.strptime(data, '%d%m%Y').date()
+            valor = int(campo(linha, 'valor')) / 100
+        except ValueError:
+            raise ValueError(f"Linha {numero}: data ou valor inválido no registro CNAB")
+        if campo(linha, 'tipo') == 'D':
+            valor = -valor
+        
+        yield _lancamento(
+            _identificador('cnab', linha),
+            data,
+            valor,
+            None,
+            campo(linha, 'historico'),
+            campo(linha, 'documento'),
+            numero
+        )
+
+LEITORES = {'csv': ler_csv, 'ofx': ler_ofx, 'cnab': ler_cnab}
+
+def detectar_formato(primeira_linha):
+    """
+    Formato pelo início do arquivo: OFX tem cabeçalho próprio e o CNAB 240
+    tem linhas de 240 posições começando pelo código do banco
+    """
+    linha = primeira_linha.lstrip('﻿').rstrip('\r\n')
+    if linha.strip().upper().startswith(('OFXHEADER', '<OFX', '<?XML')):
+        return 'ofx'
+    # O CNAB termina em brancos (campos reservados): conta a linha inteira
+    if len(linha) >= 240 and linha[:8].isdigit():
+        return 'cnab'
+    return 'csv'
+
+def ler_extrato(arquivo, formato=None):
+    """
+    Retorna (formato, gerador de lançamentos) de um arquivo binário aberto
+    Lança ValueError se o formato for desconhecido ou (durante a leitura)
+    se alguma linha for inválida
+    """
+    linhas = _linhas_texto(arquivo)
+    primeira = next(linhas, '')
+    formato = formato or detectar_formato(primeira)
+    if formato not in LEITORES:
+        raise ValueError(f"Formato de extrato inválido (use {', '.join(LEITORES)}): {formato}")
+    return formato, LEITORES[formato](chain([primeira], linhas))
+
+# ==================== ÍNDICES E BUSCA ====================
+
+def consulta_cobrancas_abertas(ate):
+    """
+    Cobranças pendentes com vencimento até 'ate', com nome e CPF do cliente
+    """
+    return db.select(
+        Pagamento.id,
+        Pagamento.cliente_id,
+        Pagamento.valor,
+        Pagamento.vencimento,
+        Cliente.nome,
+        Cliente.cpf
+    ).join(Cliente, Cliente.id == Pagamento.cliente_id).where(
+        Pagamento.status == 'pendente',
+        Pagamento.vencimento <= ate
+    )
+
+class Indices:
+    """
+    Cobranças abertas indexadas por (centavos, CPF) e (centavos, palavra
+    do nome); cada cobrança é (id, cliente_id, vencimento)
+    """
+    
+    def __init__(self, linhas):
+        self.por_documento = {}
+        self.por_nome = {}
+        self.palavras_cliente = {}
+        self.baixadas = set()
+        self.total = 0
+        self.antes = timedelta(days=JANELA_ANTES)
+        self.depois = timedelta(days=JANELA_DEPOIS)
+        
+        for row in linhas:
+            cobranca = (row.id, row.cliente_id, row.vencimento)
+            valor = centavos(row.valor)
+            self.total += 1
+            
+            documento = somente_digitos(row.cpf)
+            if documento:
+                self.por_documento.setdefault((valor, documento), []).append(cobranca)
+            
+            if row.cliente_id not in self.palavras_cliente:
+                self.palavras_cliente[row.cliente_id] = palavras(row.nome)
+            for palavra in self.palavras_cliente[row.cliente_id]:
+                self.por_nome.setdefault((valor, palavra), []).append(cobranca)
+    
+    def _na_janela(self, cobrancas, dia):
+        return [
+            c for c in cobrancas
+            if c[0] not in self.baixadas
+            and c[2] - self.antes <= dia <= c[2] + self.depois
+        ]
+    
+    def buscar(self, lancamento):
+        """
+        Retorna (status, cobrança escolhida ou None, candidatos, motivo)
+        status: 'conciliado', 'ambiguo' ou 'nao_encontrado'
+        """
+        valor = centavos(lancamento['valor'])
+        
+        if lancamento['documento']:
+            cobrancas = self._na_janela(self.por_documento.get((valor, lancamento['documento']), ()), lancamento['data'])
+            if cobrancas:
+                escolhida = min(cobrancas, key=lambda c: (c[2], c[0]))
+                return 'conciliado', escolhida, [escolhida], 'cpf'
+        
+        # Candidatas: as cobranças das palavras menos comuns do nome (uma
+        # palavra presente em muitas cobranças do mesmo valor, como um
+        # prenome comum, não identifica ninguém e só tornaria a busca lenta)
+        termos = palavras(f"{lancamento['nome']} {lancamento['descricao']}")
+        baldes = sorted((b for b in (self.por_nome.get((valor, p)) for p in termos) if b), key=len)
+        baldes = [b for b in baldes if len(b) <= PALAVRA_COMUM] or baldes[:1]
+        
+        pontos = {}
+        for balde in baldes:
+            for cobranca in self._na_janela(balde, lancamento['data']):
+                if cobranca not in pontos:
+                    pontos[cobranca] = len(termos & self.palavras_cliente[cobranca[1]])
+        if not pontos:
+            return 'nao_encontrado', None, [], 'nenhuma cobrança com este valor e nome'
+        
+        maior = max(pontos.values())
+        melhores = sorted((c for c, p in pontos.items() if p == maior), key=lambda c: (c[2], c[0]))
+        clientes = {c[1] for c in melhores}
+        candidatos = sorted(pontos, key=lambda c: (-pontos[c], c[2], c[0]))[:MAXIMO_CANDIDATOS]
+        
+        if len(clientes) > 1:
+            return 'ambiguo', None, candidatos, 'mais de um cliente possível'
+        cliente_id = melhores[0][1]
+        if maior < min(PALAVRAS_NOME, len(self.palavras_cliente[cliente_id])):
+            return 'ambiguo', None, candidatos, 'nome parecido, mas não confirmado'
+        return 'conciliado', melhores[0], candidatos, 'nome'
+
+# ==================== IMPORTAÇÃO ====================
+
+def _existentes(identificadores):
+    """
+    Identificadores de lançamentos já importados (extrato repetido)
+    """
+    return set(db.session.scalars(
+        db.select(ConciliacaoLancamento.identificador).where(
+            ConciliacaoLancamento.identificador.in_(identificadores)
+        )
+    ))
+
+def _baixar(lote, importacao, metodo_pagamento, usuario_id, resultado):
+    """
+    Grava os lançamentos do lote e baixa as cobranças escolhidas (pela ORM:
+    resumo dos clientes, sincronização, eventos e cache de receita são
+    atualizados no mesmo flush)
+    """
+    escolhidas = {item['cobranca'][0] for item in lote if item['cobranca']}
+    pagamentos = {}
+    if escolhidas:
+        pagamentos = {p.id: p for p in db.session.scalars(
+            db.select(Pagamento).where(Pagamento.id.in_(escolhidas)).with_for_update()
+        )}
+    
+    for item in lote:
+        lancamento = item['lancamento']
+        status, motivo = item['status'], item['motivo']
+        pagamento = pagamentos.get(item['cobranca'][0]) if item['cobranca'] else None
+        
+        if status == 'conciliado':
+            if pagamento is None or pagamento.status != 'pendente':
+                # Baixada por outra pessoa depois da montagem dos índices
+                status, motivo, pagamento = 'nao_encontrado', 'cobrança baixada durante a importação', None
+            else:
+                pagamento.status = 'pago'
+                pagamento.data_pagamento = lancamento['data']
+                pagamento.metodo_pagamento = lancamento['metodo'] or metodo_pagamento
+                pagamento.usuario_registro_id = usuario_id
+                resultado['valor_conciliado'] += lancamento['valor']
+        resultado['conciliados' if status == 'conciliado' else 'revisao'] += 1
+        
+        db.session.add(ConciliacaoLancamento(
+            importacao=importacao,
+            identificador=lancamento['identificador'],
+            data=lancamento['data'],
+            valor=lancamento['valor'],
+            documento=lancamento['documento'],
+            nome=lancamento['nome'][:100],
+            descricao=lancamento['descricao'][:200],
+            status=status,
+            motivo=motivo,
+            pagamento_id=pagamento.id if pagamento else None,
+            candidatos=json.dumps([c[0] for c in item['candidatos']]),
+            usuario_id=usuario_id
+        ))
+    
+    db.session.flush()
+
+def metodo_do_lancamento(lancamento):
+    """
+    Método de pagamento reconhecido na descrição do crédito (ou None)
+    """
+    texto = f"{lancamento['nome']} {lancamento['descricao']}".upper()
+    if 'PIX' in texto:
+        return 'pix'
+    if 'BOLETO' in texto:
+        return 'boleto'
+    if 'TED' in texto.split() or 'DOC' in texto.split():
+        return 'transferencia'
+    return None
+
+def importar_extrato(arquivo, formato=None, metodo_pagamento='transferencia', usuario_id=None):
+    """
+    Concilia um extrato bancário (arquivo binário aberto) com as cobranças
+    pendentes da academia atual: baixa as encontradas e manda as demais
+    para a fila de revisão, tudo em uma única transação
+    Débitos e lançamentos já importados antes são ignorados
+    """
+    importacao = uuid.uuid4().hex
+    resultado = {
+        "success": True,
+        "importacao": importacao,
+        "formato": None,
+        "creditos": 0,
+        "conciliados": 0,
+        "valor_conciliado": 0.0,
+        "revisao": 0,
+        "debitos": 0,
+        "repetidos": 0
+    }
+    
+    try:
+        resultado['formato'], lancamentos = ler_extrato(arquivo, formato)
+        
+        limite = periodos.hoje() + timedelta(days=JANELA_ANTES)
+        indices = Indices(db.session.execute(
+            consulta_cobrancas_abertas(limite).execution_options(yield_per=LOTE)
+        ))
+        resultado['cobrancas_abertas'] = indices.total
+        
+        vistos = set()
+        lote = []
+        
+        def processar(lote):
+            existentes = _existentes([item['lancamento']['identificador'] for item in lote])
+            novos = [item for item in lote if item['lancamento']['identificador'] not in existentes]
+            resultado['repetidos'] += len(lote) - len(novos)
+            
+            for item in novos:
+                item['status'], item['cobranca'], item['candidatos'], item['motivo'] = indices.buscar(item['lancamento'])
+                if item['cobranca']:
+                    indices.baixadas.add(item['cobranca'][0])
+            _baixar(novos, importacao, metodo_pagamento, usuario_id, resultado)
+        
+        for lancamento in lancamentos:
+            if lancamento['valor'] <= 0:
+                resultado['debitos'] += 1
+                continue
+            resultado['creditos'] += 1
+            if lancamento['identificador'] in vistos:
+                resultado['repetidos'] += 1
+                continue
+            vistos.add(lancamento['identificador'])
+            
+            lancamento['metodo'] = metodo_do_lancamento(lancamento)
+            lote.append({'lancamento': lancamento})
+            if len(lote) >= LOTE:
+                processar(lote)
+                lote = []
+        if lote:
+            processar(lote)
+        
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return {"success": False, "error": str(e)}
+    except IntegrityError:
+        # Mesmo extrato importado ao mesmo tempo por outra requisição
+        db.session.rollback()
+        return {"success": False, "error": "Extrato já está sendo importado; tente novamente"}
+    
+    resultado['valor_conciliado'] = round(resultado['valor_conciliado'], 2)
+    return resultado
+
+# ==================== FILA DE REVISÃO ====================
+
+def lancamento_para_dict(l):
+    return {
+        'id': l.id,
+        'importacao': l.importacao,
+        'data': l.data.isoformat() if l.data else None,
+        'valor': float(l.valor),
+        'documento': l.documento,
+        'nome': l.nome,
+        'descricao': l.descricao,
+        'status': l.status,
+        'motivo': l.motivo,
+        'pagamento_id': l.pagamento_id
+    }
+
+def listar_pendencias(limite=100):
+    """
+    Lançamentos que esperam revisão, com as cobranças candidatas
+    """
+    lancamentos = db.session.scalars(
+        db.select(ConciliacaoLancamento)
+        .where(ConciliacaoLancamento.status.in_(STATUS_REVISAO))
+        .order_by(ConciliacaoLancamento.data, ConciliacaoLancamento.id)
+        .limit(limite)
+    ).all()
+    
+    ids = {i for l in lancamentos for i in json.loads(l.candidatos or '[]')}
+    cobrancas = {}
+    if ids:
+        for row in db.session.execute(
+            db.select(Pagamento.id, Pagamento.valor, Pagamento.vencimento, Pagamento.status,
+                      Cliente.id.label('cliente_id'), Cliente.nome)
+            .join(Cliente, Cliente.id == Pagamento.cliente_id)
+            .where(Pagamento.id.in_(ids))
+        ):
+            cobrancas[row.id] = {
+                'pagamento_id': row.id,
+                'cliente_id': row.cliente_id,
+                'nome': row.nome,
+                'valor': float(row.valor),
+                'vencimento': row.vencimento.isoformat(),
+                'status': row.status
+            }
+    
+    pendencias = []
+    for l in lancamentos:
+        item = lancamento_para_dict(l)
+        item['candidatos'] = [cobrancas[i] for i in json.loads(l.candidatos or '[]') if i in cobrancas]
+        pendencias.append(item)
+    return pendencias
+
+def resolver_pendencia(lancamento_id, pagamento_id=None, ignorar=False, usuario_id=None):
+    """
+    Resolve um lançamento da fila de revisão: baixa a cobrança escolhida
+    (com a data do crédito) ou marca o lançamento como ignorado
+    """
+    lancamento = db.session.get(ConciliacaoLancamento, lancamento_id)
+    if not lancamento or lancamento.status not in STATUS_REVISAO:
+        return {"success": False, "error": "Lançamento não encontrado na fila de revisão"}
+    
+    if ignorar:
+        lancamento.status = 'ignorado'
+    else:
+        pagamento = db.session.get(Pagamento, pagamento_id) if pagamento_id else None
+        if not pagamento or pagamento.status != 'pendente':
+            return {"success": False, "error": "Cobrança pendente não encontrada"}
+        
+        pagamento.status = 'pago'
+        pagamento.data_pagamento = lancamento.data
+        pagamento.metodo_pagamento = metodo_do_lancamento(lancamento_para_dict(lancamento)) or 'transferencia'
+        pagamento.usuario_registro_id = usuario_id
+        lancamento.status = 'resolvido'
+        lancamento.pagamento_id = pagamento.id
+    
+    lancamento.usuario_id = usuario_id
+    db.session.commit()
+    return {"success": True}
@@ -1,9 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash
+from replicas import SessaoRoteada
 import os
 
-# Inicializa o SQLAlchemy
-db = SQLAlchemy()
+# Inicializa o SQLAlchemy (sessão que pode ler das réplicas, ver replicas.py)
+db = SQLAlchemy(session_options={'class_': SessaoRoteada})
 
 def init_db(app):
     """
@@ -13,10 +14,40 @@ def init_db(app):
     db.init_app(app)
     
     with app.app_context():
+        # SQLite: perfil ajustado (WAL, busy_timeout...) em cada conexão
+        import banco_sqlite
+        for engine in db.engines.values():
+            banco_sqlite.configurar_engine(engine)
+        
         try:
             # Cria todas as tabelas
             db.create_all()
             
+            # Adiciona colunas/índices novos em bancos já existentes
+            colunas_novas = migrar_colunas()
+            if colunas_novas:
+                print(f"✅ Colunas adicionadas: {', '.join(colunas_novas)}")
+            
+            if 'clientes.saldo_aberto' in colunas_novas:
+                from models import verificar_resumo_clientes
+                verificar_resumo_clientes(reparar=True)
+                print("✅ Resumo financeiro dos clientes calculado")
+            
+            # Academia padrão e tabelas dos bancos próprios de academias
+            from models import iniciar_academias
+            iniciar_academias()
+            
+            # Contadores da sincronização incremental (GET /api/sync)
+            from models import iniciar_sequencias
+            numerados = iniciar_sequencias()
+            if numerados:
+                print(f"✅ {numerados} registros numerados para a sincronização")
+            
+            # Partições futuras das tabelas particionadas (apenas PostgreSQL)
+            import particionamento
+            particionamento.criar_particoes_futuras('historico', 'data_acao', 'mes')
+            particionamento.criar_particoes_futuras('pagamentos', 'vencimento', 'ano', 2)
+            
             # ============================================
             # Cria usuário administrador padrão
             # ============================================
@@ -50,6 +81,41 @@ def init_db(app):
             db.session.rollback()
             raise
 
+def migrar_colunas():
+    """
+    Adiciona às tabelas existentes as colunas e índices declarados nos
+    modelos que ainda não existem no banco (db.create_all só cria tabelas novas)
+    Retorna a lista de colunas adicionadas no formato 'tabela.coluna'
+    """
+    inspetor = db.inspect(db.engine)
+    adicionadas = []
+    
+    with db.engine.begin() as conexao:
+        for tabela in db.metadata.sorted_tables:
+            if not inspetor.has_table(tabela.name):
+                continue
+            
+            existentes = {c['name'] for c in inspetor.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name in existentes:
+                    continue
+                
+                tipo = coluna.type.compile(dialect=conexao.dialect)
+                ddl = f'ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}'
+                if coluna.server_default is not None:
+                    ddl += f' DEFAULT {coluna.server_default.arg.text}'
+                    if not coluna.nullable:
+                        ddl += ' NOT NULL'
+                
+                conexao.execute(db.text(ddl))
+                adicionadas.append(f'{tabela.name}.{coluna.name}')
+        
+        for tabela in db.metadata.sorted_tables:
+            for indice in tabela.indexes:
+                indice.create(bind=conexao, checkfirst=True)
+    
+    return adicionadas
+
 def get_connection():
     """
     Retorna uma conexão com o banco de dados
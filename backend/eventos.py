@@ -0,0 +1,451 @@
+"""
+Eventos - Atualizações em tempo real (Server-Sent Events)
+Cada alteração confirmada (commit) em pagamentos e clientes vira um
+evento pequeno, entregue pelo broker do processo a todas as telas
+conectadas em GET /api/eventos da mesma academia. Junto vão os contadores
+do dashboard, recalculados no máximo uma vez por intervalo e compartilhados
+por todas as conexões da academia no processo (em vez de uma consulta por tela)
+Entre processos/workers, os eventos são repassados por um arquivo
+compartilhado (substituto simples de um Redis/NOTIFY)
+As conexões ficam abertas: o servidor ASGI (asgi.py) as atende no loop
+de eventos; no servidor de threads (python app.py) cada uma ocupa uma
+thread, por isso lá o número delas é limitado
+"""
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Cliente, Pagamento, tipo_alteracao
+from itertools import chain
+import asyncio
+import json
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+import os
+import periodos
+import queue
+import threading
+import time
+
+# Intervalo mínimo entre dois recálculos dos contadores (segundos)
+INTERVALO_CONTADORES = float(os.environ.get('EVENTOS_INTERVALO_CONTADORES', 1))
+
+# Comentário enviado periodicamente para manter a conexão aberta
+INTERVALO_PING = 15
+
+# Intervalo (segundos) em que a thread dos contadores confere a virada do
+# dia: os contadores dependem de hoje (vencidos, recebido no mês)
+INTERVALO_VIRADA = 60
+
+# Repasse entre workers: 'arquivo' (padrão) ou 'nenhum' (um só processo)
+FANOUT = os.environ.get('EVENTOS_FANOUT', 'arquivo')
+ARQUIVO_FANOUT = os.environ.get('EVENTOS_ARQUIVO', os.path.join('instance', 'eventos.log'))
+TAMANHO_MAXIMO_ARQUIVO = 1024 * 1024
+
+# Conexões abertas por processo no servidor de threads (uma thread cada)
+MAXIMO_CONEXOES_THREADS = int(os.environ.get('EVENTOS_MAXIMO_THREADS', 8))
+
+# Eventos guardados por conexão antes de ela ser considerada lenta
+TAMANHO_FILA = 100
+
+# ==================== ASSINANTES ====================
+
+class Assinante:
+    """
+    Conexão aberta em /api/eventos (servidor síncrono: uma thread por conexão)
+    Recebe apenas os eventos da academia do usuário
+    """
+    
+    def __init__(self, academia_id, banco=None):
+        self.academia_id = academia_id
+        self.banco = banco
+        self.fila = queue.Queue(maxsize=TAMANHO_FILA)
+    
+    def entregar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except queue.Full:
+            # Conexão lenta: descarta o atraso e pede para a tela recarregar
+            with self.fila.mutex:
+                self.fila.queue.clear()
+            self.fila.put_nowait({'evento': 'recarregar', 'dados': {}})
+    
+    def proximo(self, timeout):
+        try:
+            return self.fila.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class AssinanteAssincrono(Assinante):
+    """
+    Conexão aberta no servidor ASGI: entrega pelo loop de eventos
+    """
+    
+    def __init__(self, academia_id, banco=None):
+        self.academia_id = academia_id
+        self.banco = banco
+        self.fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+        self.loop = asyncio.get_running_loop()
+    
+    def entregar(self, evento):
+        self.loop.call_soon_threadsafe(self._entregar, evento)
+    
+    def _entregar(self, evento):
+        if self.fila.full():
+            while not self.fila.empty():
+                self.fila.get_nowait()
+            evento = {'evento': 'recarregar', 'dados': {}}
+        self.fila.put_nowait(evento)
+    
+    async def proximo(self, timeout):
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+# ==================== BROKER ====================
+
+class Broker:
+    """
+    Distribui os eventos do processo para as conexões abertas
+    """
+    
+    def __init__(self):
+        self._assinantes = set()
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._academias_pendentes = set()
+        self._contadores_pendentes = threading.Event()
+        self._calcular_contadores = None
+    
+    def assinar(self, assinante):
+        with self._lock:
+            self._assinantes.add(assinante)
+        return assinante
+    
+    def cancelar(self, assinante):
+        with self._lock:
+            self._assinantes.discard(assinante)
+    
+    def conexoes(self, tipo=None):
+        """
+        Conexões abertas no processo (só as da classe tipo, se informada)
+        """
+        with self._lock:
+            if tipo is None:
+                return len(self._assinantes)
+            return sum(1 for assinante in self._assinantes if type(assinante) is tipo)
+    
+    def _assinantes_da_academia(self, academia_id):
+        with self._lock:
+            return [a for a in self._assinantes if a.academia_id == academia_id]
+    
+    def entregar(self, evento, academia_id):
+        for assinante in self._assinantes_da_academia(academia_id):
+            assinante.entregar(evento)
+    
+    def publicar(self, alteracoes):
+        """
+        Publica alterações deste processo: entrega local, repasse aos
+        outros workers e recálculo dos contadores
+        """
+        self.receber_de_outro_worker(alteracoes)
+        _fanout.enviar(alteracoes)
+    
+    def receber_de_outro_worker(self, alteracoes):
+        for alteracao in alteracoes:
+            self.entregar({'evento': 'alteracao', 'dados': alteracao}, alteracao['academia_id'])
+        self.contadores_desatualizados({alteracao['academia_id'] for alteracao in alteracoes})
+    
+    # ---------- contadores do dashboard ----------
+    
+    def contadores_desatualizados(self, academias_alteradas):
+        with self._lock:
+            for academia_id in academias_alteradas:
+                self._contadores.pop(academia_id, None)
+            self._academias_pendentes.update(academias_alteradas)
+        self._contadores_pendentes.set()
+    
+    def contadores(self, academia_id, banco=None):
+        """
+        Últimos contadores calculados hoje para a academia (calcula se
+        ainda não houver)
+        """
+        dia = periodos.hoje()
+        calculados = self._contadores.get(academia_id)
+        if calculados and calculados[0] == dia:
+            return calculados[1]
+        if not self._calcular_contadores:
+            return None
+        
+        contadores = self._calcular_contadores(academia_id, banco)
+        self._contadores[academia_id] = (dia, contadores)
+        return contadores
+    
+    def _virada_do_dia(self):
+        """
+        Na virada do dia os contadores de ontem deixam de valer: todas as
+        academias com conexões abertas são recalculadas
+        """
+        with self._lock:
+            self._contadores.clear()
+            self._academias_pendentes.update(a.academia_id for a in self._assinantes)
+    
+    def _recalcular_contadores(self):
+        """
+        Thread única: depois de uma rajada de alterações espera o intervalo
+        e recalcula uma vez por academia para todas as conexões abertas
+        dela; na virada do dia, recalcula sem esperar por alterações
+        """
+        dia = periodos.hoje()
+        while True:
+            if self._contadores_pendentes.wait(INTERVALO_VIRADA):
+                time.sleep(INTERVALO_CONTADORES)
+                self._contadores_pendentes.clear()
+            if periodos.hoje() != dia:
+                dia = periodos.hoje()
+                self._virada_do_dia()
+            with self._lock:
+                pendentes, self._academias_pendentes = self._academias_pendentes, set()
+            
+            for academia_id in pendentes:
+                assinantes = self._assinantes_da_academia(academia_id)
+                if not assinantes:
+                    continue
+                
+                try:
+                    contadores = self._calcular_contadores(academia_id, assinantes[0].banco)
+                    self._contadores[academia_id] = (dia, contadores)
+                    self.entregar({'evento': 'contadores', 'dados': contadores}, academia_id)
+                except Exception as e:
+                    print(f"Erro ao recalcular contadores: {e}")
+    
+    def iniciar(self, calcular_contadores):
+        """
+        calcular_contadores(academia_id, banco): contadores do dashboard
+        """
+        self._calcular_contadores = calcular_contadores
+        threading.Thread(target=self._recalcular_contadores, name='eventos-contadores', daemon=True).start()
+        _fanout.iniciar(self.receber_de_outro_worker)
+
+broker = Broker()
+
+# ==================== REPASSE ENTRE WORKERS ====================
+
+class FanoutArquivo:
+    """
+    Repasse entre processos por um arquivo de linhas JSON: cada worker
+    acrescenta suas alterações e acompanha as linhas dos outros
+    Passando do tamanho máximo, o arquivo é renomeado (.anterior) e um
+    novo começa: quem ainda lê o antigo termina de lê-lo pelo descritor
+    aberto, sem perder linhas nem voltar ao início de um arquivo cortado
+    """
+    
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.trava = caminho + '.trava'
+    
+    def _travar(self, modo):
+        """
+        Trava entre processos: escritas compartilhadas, rotação exclusiva
+        """
+        descritor = os.open(self.trava, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(descritor, modo)
+        return descritor
+    
+    def _rotacionar(self):
+        descritor = self._travar(fcntl.LOCK_EX if fcntl else None)
+        try:
+            # Outro worker pode ter rotacionado enquanto esta esperava a trava
+            if os.path.exists(self.caminho) and os.path.getsize(self.caminho) > TAMANHO_MAXIMO_ARQUIVO:
+                os.replace(self.caminho, self.caminho + '.anterior')
+        finally:
+            os.close(descritor)
+    
+    def enviar(self, alteracoes):
+        if not alteracoes:
+            return
+        linha = json.dumps({'pid': os.getpid(), 'alteracoes': alteracoes}) + '\n'
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        
+        if os.path.exists(self.caminho) and os.path.getsize(self.caminho) > TAMANHO_MAXIMO_ARQUIVO:
+            self._rotacionar()
+        
+        # Uma escrita com O_APPEND por linha: linhas de workers diferentes
+        # não se misturam. A trava compartilhada garante que nenhuma linha
+        # chega ao arquivo antigo depois da rotação
+        trava = self._travar(fcntl.LOCK_SH if fcntl else None)
+        try:
+            descritor = os.open(self.caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(descritor, linha.encode())
+            finally:
+                os.close(descritor)
+        finally:
+            os.close(trava)
+    
+    def _ler_linhas(self, arquivo, receber):
+        """
+        Entrega as linhas completas ainda não lidas do arquivo aberto
+        """
+        while True:
+            posicao = arquivo.tell()
+            linha = arquivo.readline()
+            if not linha.endswith('\n'):
+                arquivo.seek(posicao)  # linha incompleta: lida na próxima volta
+                return
+            try:
+                mensagem = json.loads(linha)
+            except ValueError:
+                continue
+            if mensagem.get('pid') != os.getpid():
+                receber(mensagem['alteracoes'])
+    
+    def _acompanhar(self, receber):
+        arquivo, do_inicio = None, False
+        while True:
+            time.sleep(0.2)
+            if arquivo is None:
+                if not os.path.exists(self.caminho):
+                    continue
+                arquivo = open(self.caminho, encoding='utf-8')
+                if not do_inicio:
+                    arquivo.seek(0, os.SEEK_END)  # só as linhas escritas depois que o processo começou
+            
+            try:
+                rotacionado = os.stat(self.caminho).st_ino != os.fstat(arquivo.fileno()).st_ino
+            except FileNotFoundError:
+                rotacionado = True
+            
+            # Depois da rotação o arquivo antigo não recebe mais linhas:
+            # lido até o fim, segue para o novo desde o início
+            self._ler_linhas(arquivo, receber)
+            if rotacionado:
+                arquivo.close()
+                arquivo, do_inicio = None, True
+    
+    def iniciar(self, receber):
+        threading.Thread(target=self._acompanhar, args=(receber,), name='eventos-fanout', daemon=True).start()
+
+class FanoutNenhum:
+    def enviar(self, alteracoes):
+        pass
+    
+    def iniciar(self, receber):
+        pass
+
+_fanout = FanoutArquivo(ARQUIVO_FANOUT) if FANOUT == 'arquivo' else FanoutNenhum()
+
+# ==================== CAPTURA DAS ALTERAÇÕES ====================
+
+def _descrever_pagamento(pagamento, tipo):
+    return {
+        'tipo': tipo,
+        'academia_id': pagamento.academia_id,
+        'pagamento_id': pagamento.id,
+        'cliente_id': pagamento.cliente_id,
+        'status': pagamento.status,
+        'valor': float(pagamento.valor) if pagamento.valor is not None else None,
+        'vencimento': pagamento.vencimento.isoformat() if pagamento.vencimento else None
+    }
+
+@event.listens_for(Session, 'before_flush')
+def _coletar_alteracoes(session, flush_context, instances):
+    """
+    Anota os pagamentos e clientes alterados neste flush; o tipo do
+    evento é decidido aqui, enquanto o histórico dos campos existe
+    """
+    pendentes = session.info.setdefault('eventos_pendentes', [])
+    # session.new/deleted montam um conjunto novo a cada acesso
+    novos, excluidos = session.new, session.deleted
+    
+    for obj in chain(novos, session.dirty, excluidos):
+        if isinstance(obj, (Pagamento, Cliente)):
+            tipo = tipo_alteracao(obj, novos, excluidos)
+            if tipo:
+                pendentes.append((obj, tipo))
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _descrever_alteracoes(session, flush_context):
+    """
+    Converte as alterações para dicionário depois do flush (os pagamentos
+    novos já têm id)
+    """
+    pendentes = session.info.pop('eventos_pendentes', [])
+    descritas = session.info.setdefault('eventos_descritos', [])
+    
+    for obj, tipo in pendentes:
+        if isinstance(obj, Pagamento):
+            descritas.append(_descrever_pagamento(obj, tipo))
+        else:
+            descritas.append({
+                'tipo': tipo,
+                'academia_id': obj.academia_id,
+                'cliente_id': obj.id,
+                'nome': obj.nome
+            })
+
+@event.listens_for(Session, 'after_commit')
+def _publicar_alteracoes(session):
+    alteracoes = session.info.pop('eventos_descritos', None)
+    if alteracoes:
+        broker.publicar(alteracoes)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar_alteracoes(session, previous_transaction):
+    session.info.pop('eventos_pendentes', None)
+    session.info.pop('eventos_descritos', None)
+
+# ==================== FORMATO SSE ====================
+
+def formatar(evento):
+    """
+    Converte um evento para o formato text/event-stream
+    """
+    return f"event: {evento['evento']}\ndata: {json.dumps(evento['dados'], ensure_ascii=False)}\n\n"
+
+def aceita_conexao_em_thread():
+    """
+    Servidor de threads: cada conexão aberta ocupa uma thread inteira,
+    então acima de MAXIMO_CONEXOES_THREADS o fluxo é recusado (a tela
+    continua funcionando, só sem atualização em tempo real)
+    """
+    return broker.conexoes(Assinante) < MAXIMO_CONEXOES_THREADS
+
+def fluxo(academia_id, banco=None):
+    """
+    Gerador da resposta SSE (servidor síncrono)
+    """
+    assinante = broker.assinar(Assinante(academia_id, banco))
+    try:
+        yield "retry: 3000\n\n"
+        contadores = broker.contadores(academia_id, banco)
+        if contadores is not None:
+            yield formatar({'evento': 'contadores', 'dados': contadores})
+        
+        while True:
+            evento = assinante.proximo(INTERVALO_PING)
+            yield formatar(evento) if evento else ": ping\n\n"
+    finally:
+        broker.cancelar(assinante)
+
+async def fluxo_assincrono(academia_id, banco=None):
+    """
+    Gerador da resposta SSE (servidor ASGI): uma conexão aberta não
+    ocupa thread nenhuma enquanto espera
+    """
+    assinante = broker.assinar(AssinanteAssincrono(academia_id, banco))
+    try:
+        yield "retry: 3000\n\n"
+        # O cálculo dos contadores é síncrono: fora do loop de eventos
+        contadores = await asyncio.to_thread(broker.contadores, academia_id, banco)
+        if contadores is not None:
+            yield formatar({'evento': 'contadores', 'dados': contadores})
+        
+        while True:
+            evento = await assinante.proximo(INTERVALO_PING)
+            yield formatar(evento) if evento else ": ping\n\n"
+    finally:
+        broker.cancelar(assinante)
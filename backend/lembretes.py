@@ -0,0 +1,472 @@
+"""
+Lembretes - Envio em lote de lembretes de vencimento
+Seleciona em uma única consulta as cobranças pendentes que vencem ou
+venceram nos dias da régua de cobrança, monta as mensagens a partir de
+modelos e as envia por canais plugáveis (e-mail via SMTP, SMS/WhatsApp
+via gateway HTTP, ou arquivo local para testes), com um pool de threads,
+limite de envios por canal, novas tentativas e no máximo um lembrete por
+cobrança, por dia e por canal (tabela lembretes_enviados)
+Roda fora do servidor: python manutencao.py lembretes-enviar
+"""
+
+from database import db
+from models import Cliente, Pagamento, LembreteEnviado
+from admissao import BaldeTokens
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from string import Template
+import json
+import os
+import periodos
+import smtplib
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from email.message import EmailMessage
+
+# Régua de cobrança: dias em relação ao vencimento (negativo = antes)
+DIAS = [int(d) for d in os.environ.get('LEMBRETES_DIAS', '-3,0,1,7,15,30').split(',')]
+
+# Canais usados e modo de envio ('arquivo' grava em disco em vez de enviar)
+CANAIS_ATIVOS = [c.strip() for c in os.environ.get('LEMBRETES_CANAIS', 'email').split(',') if c.strip()]
+MODO = os.environ.get('LEMBRETES_MODO', 'arquivo')
+DIRETORIO_SAIDA = os.environ.get('LEMBRETES_DIR', 'lembretes')
+
+# Pasta opcional com modelos próprios (<tipo>.txt, primeira linha = assunto)
+DIRETORIO_MODELOS = os.environ.get('LEMBRETES_MODELOS_DIR')
+
+THREADS = int(os.environ.get('LEMBRETES_THREADS', 8))
+TENTATIVAS = int(os.environ.get('LEMBRETES_TENTATIVAS', 3))
+LOTE = 500
+
+# Reserva 'enviando' de outra execução mais antiga que isto é de uma
+# execução interrompida (processo encerrado no meio do lote) e é retomada
+RESERVA_EXPIRA = int(os.environ.get('LEMBRETES_RESERVA_MINUTOS', 30))
+
+# ==================== MODELOS DE MENSAGEM ====================
+
+MODELOS = {
+    'a_vencer': (
+        'Lembrete: mensalidade vence em $vencimento',
+        'Olá, $nome! Sua cobrança "$descricao" de $valor vence em $vencimento '
+        '(daqui a $dias dia(s)). Se já pagou, desconsidere esta mensagem.'
+    ),
+    'vence_hoje': (
+        'Sua mensalidade vence hoje',
+        'Olá, $nome! Sua cobrança "$descricao" de $valor vence hoje ($vencimento).'
+    ),
+    'vencido': (
+        'Mensalidade em atraso',
+        'Olá, $nome! Sua cobrança "$descricao" de $valor venceu em $vencimento '
+        '($dias dia(s) de atraso). Procure a recepção para regularizar.'
+    )
+}
+
+def carregar_modelos():
+    """
+    Modelos padrão, substituídos pelos arquivos de LEMBRETES_MODELOS_DIR
+    """
+    modelos = {tipo: (Template(assunto), Template(texto)) for tipo, (assunto, texto) in MODELOS.items()}
+    if not DIRETORIO_MODELOS:
+        return modelos
+    
+    for tipo in MODELOS:
+        caminho = os.path.join(DIRETORIO_MODELOS, f'{tipo}.txt')
+        if os.path.exists(caminho):
+            with open(caminho, encoding='utf-8') as arquivo:
+                assunto, _, texto = arquivo.read().partition('\n')
+            modelos[tipo] = (Template(assunto.strip()), Template(texto.strip()))
+    
+    return modelos
+
+def formatar_valor(valor):
+    """
+    1234.5 -> 'R$ 1.234,50'
+    """
+    return 'R$ ' + f'{valor:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')
+
+def montar_mensagem(modelos, row, hoje):
+    """
+    Retorna (assunto, texto) do lembrete de uma cobrança
+    """
+    dias = (row.vencimento - hoje).days
+    tipo = 'a_vencer' if dias > 0 else 'vence_hoje' if dias == 0 else 'vencido'
+    
+    valores = {
+        'nome': row.nome,
+        'valor': formatar_valor(row.valor),
+        'vencimento': row.vencimento.strftime('%d/%m/%Y'),
+        'descricao': row.descricao or 'mensalidade',
+        'dias': abs(dias)
+    }
+    assunto, texto = modelos[tipo]
+    return assunto.safe_substitute(valores), texto.safe_substitute(valores)
+
+# ==================== CANAIS ====================
+
+class ErroEnvio(Exception):
+    """
+    Falha definitiva (destinatário inválido, recusado pelo provedor...)
+    """
+
+class ErroTemporario(ErroEnvio):
+    """
+    Falha que pode dar certo em uma nova tentativa (rede, limite, 5xx)
+    """
+
+class Canal:
+    """
+    Interface dos canais de envio
+    Subclasses definem 'nome', 'campo' (coluna do cliente com o contato)
+    e enviar(); 'taxa' limita os envios por segundo do canal
+    """
+    nome = None
+    campo = None
+    taxa = 10
+    
+    def __init__(self):
+        self._balde = BaldeTokens(self.taxa, self.taxa)
+        self._lock = threading.Lock()
+    
+    def destinatario(self, row):
+        return getattr(row, self.campo) or None
+    
+    def aguardar_vez(self):
+        """
+        Bloqueia a thread até o limite de envios do canal permitir
+        """
+        while True:
+            with self._lock:
+                espera = self._balde.consumir()
+            if not espera:
+                return
+            time.sleep(espera)
+    
+    def enviar(self, destinatario, assunto, mensagem):
+        raise NotImplementedError
+    
+    def fechar(self):
+        """
+        Libera conexões abertas pelo canal (fim da execução)
+        """
+
+class CanalSMTP(Canal):
+    """
+    E-mail via servidor SMTP (uma conexão reaproveitada por thread)
+    Para testes locais: python -m aiosmtpd -n -l localhost:1025
+    """
+    nome = 'email'
+    campo = 'email'
+    taxa = float(os.environ.get('LEMBRETES_SMTP_TAXA', 10))
+    
+    def __init__(self):
+        super().__init__()
+        self.host = os.environ.get('SMTP_HOST', 'localhost')
+        self.porta = int(os.environ.get('SMTP_PORTA', 1025))
+        self.usuario = os.environ.get('SMTP_USUARIO')
+        self.senha = os.environ.get('SMTP_SENHA')
+        self.remetente = os.environ.get('SMTP_REMETENTE', 'nao-responda@flowfit.local')
+        self._conexoes = threading.local()
+        self._abertas = []
+    
+    def _conexao(self):
+        conexao = getattr(self._conexoes, 'smtp', None)
+        if conexao is None:
+            conexao = smtplib.SMTP(self.host, self.porta, timeout=30)
+            if self.usuario:
+                conexao.starttls()
+                conexao.login(self.usuario, self.senha)
+            self._conexoes.smtp = conexao
+            with self._lock:
+                self._abertas.append(conexao)
+        return conexao
+    
+    def fechar(self):
+        for conexao in self._abertas:
+            try:
+                conexao.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._abertas = []
+    
+    def enviar(self, destinatario, assunto, mensagem):
+        email = EmailMessage()
+        email['From'] = self.remetente
+        email['To'] = destinatario
+        email['Subject'] = assunto
+        email.set_content(mensagem)
+        
+        try:
+            self._conexao().send_message(email)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise ErroEnvio(f"Destinatário recusado: {destinatario}") from e
+        except (smtplib.SMTPException, OSError) as e:
+            # Conexão pode ter caído: a próxima tentativa abre outra
+            self._conexoes.smtp = None
+            raise ErroTemporario(str(e)) from e
+
+class CanalGatewayHTTP(Canal):
+    """
+    SMS/WhatsApp via gateway HTTP: POST JSON {para, mensagem} na URL
+    configurada, com o token no cabeçalho Authorization
+    """
+    nome = 'sms'
+    campo = 'telefone'
+    taxa = float(os.environ.get('LEMBRETES_GATEWAY_TAXA', 5))
+    
+    def __init__(self):
+        super().__init__()
+        self.url = os.environ.get('LEMBRETES_GATEWAY_URL')
+        self.token = os.environ.get('LEMBRETES_GATEWAY_TOKEN', '')
+    
+    def enviar(self, destinatario, assunto, mensagem):
+        if not self.url:
+            raise ErroEnvio("LEMBRETES_GATEWAY_URL não configurada")
+        
+        requisicao = urllib.request.Request(
+            self.url,
+            data=json.dumps({'para': destinatario, 'mensagem': mensagem}).encode(),
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'}
+        )
+        try:
+            with urllib.request.urlopen(requisicao, timeout=30):
+                pass
+        except urllib.error.HTTPError as e:
+            if e.code == 429 or e.code >= 500:
+                raise ErroTemporario(f"Gateway respondeu {e.code}") from e
+            raise ErroEnvio(f"Gateway respondeu {e.code}") from e
+        except OSError as e:
+            raise ErroTemporario(str(e)) from e
+
+class CanalWhatsApp(CanalGatewayHTTP):
+    nome = 'whatsapp'
+
+class CanalArquivo(Canal):
+    """
+    Substituto para testes: grava cada lembrete como uma linha JSON em
+    <LEMBRETES_DIR>/<canal>-AAAA-MM-DD.jsonl em vez de enviar
+    """
+    taxa = 1000
+    
+    def __init__(self, original):
+        self.nome = original.nome
+        self.campo = original.campo
+        super().__init__()
+        os.makedirs(DIRETORIO_SAIDA, exist_ok=True)
+        self.caminho = os.path.join(DIRETORIO_SAIDA, f'{self.nome}-{date.today().isoformat()}.jsonl')
+    
+    def enviar(self, destinatario, assunto, mensagem):
+        linha = json.dumps({
+            'para': destinatario,
+            'assunto': assunto,
+            'mensagem': mensagem,
+            'enviado_em': datetime.now().isoformat()
+        }, ensure_ascii=False)
+        with self._lock, open(self.caminho, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(linha + '\n')
+
+# Canais disponíveis: novos canais só precisam ser registrados aqui
+CANAIS = {canal.nome: canal for canal in (CanalSMTP, CanalGatewayHTTP, CanalWhatsApp)}
+
+def criar_canais(nomes=None, modo=None):
+    """
+    Instancia os canais pedidos (padrão: LEMBRETES_CANAIS); no modo
+    'arquivo' cada um é trocado pelo substituto que grava em disco
+    """
+    nomes = nomes or CANAIS_ATIVOS
+    modo = modo or MODO
+    
+    canais = []
+    for nome in nomes:
+        if nome not in CANAIS:
+            raise ValueError(f"Canal desconhecido: {nome}")
+        canal = CANAIS[nome]()
+        canais.append(CanalArquivo(canal) if modo == 'arquivo' else canal)
+    return canais
+
+# ==================== SELEÇÃO ====================
+
+def reserva_abandonada(execucao, agora):
+    """
+    Condição dos lembretes reservados ('enviando') por outra execução há
+    mais de RESERVA_EXPIRA minutos, que não vai mais concluí-los
+    """
+    return db.and_(
+        LembreteEnviado.status == 'enviando',
+        LembreteEnviado.execucao != execucao,
+        db.or_(
+            LembreteEnviado.data_reserva == None,
+            LembreteEnviado.data_reserva < agora - timedelta(minutes=RESERVA_EXPIRA)
+        )
+    )
+
+def consulta_cobrancas(hoje, canal, apos_id=0, dias=None, execucao='', agora=None):
+    """
+    Cobranças pendentes de clientes ativos que vencem/venceram nos dias
+    da régua e que ainda não receberam lembrete hoje por este canal
+    Lembretes que falharam contam como o lembrete do dia (as falhas
+    temporárias já foram repetidas); os abandonados por uma execução
+    interrompida (reserva_abandonada) voltam para a fila
+    Paginada por id (keyset): cada lote começa após o último id lido
+    """
+    datas = [hoje - timedelta(days=d) for d in (dias or DIAS)]
+    ja_enviado = db.select(LembreteEnviado.id).where(
+        LembreteEnviado.pagamento_id == Pagamento.id,
+        LembreteEnviado.dia == hoje,
+        LembreteEnviado.canal == canal.nome,
+        ~reserva_abandonada(execucao, agora or datetime.utcnow())
+    ).exists()
+    
+    return db.select(
+        Pagamento.id,
+        Pagamento.valor,
+        Pagamento.vencimento,
+        Pagamento.descricao,
+        Cliente.nome,
+        Cliente.email,
+        Cliente.telefone
+    ).join(Cliente, Cliente.id == Pagamento.cliente_id).where(
+        Pagamento.status == 'pendente',
+        Pagamento.vencimento.in_(datas),
+        Cliente.ativo == True,
+        getattr(Cliente, canal.campo) != None,
+        getattr(Cliente, canal.campo) != '',
+        Pagamento.id > apos_id,
+        ~ja_enviado
+    ).order_by(Pagamento.id).limit(LOTE)
+
+def _reservar(linhas, hoje, canal, execucao, agora):
+    """
+    Grava o lembrete de cada cobrança como 'enviando' antes do envio.
+    A restrição única (pagamento, dia, canal) garante que duas execuções
+    simultâneas não enviem o mesmo lembrete: as linhas que já existiam
+    são ignoradas e ficam de fora deste lote, a não ser as abandonadas,
+    que passam para esta execução (a condição do UPDATE deixa só uma
+    execução ficar com cada uma)
+    Retorna ([(lembrete_id, row)], quantidade retomada)
+    """
+    valores = [{
+        'pagamento_id': row.id,
+        'dia': hoje,
+        'canal': canal.nome,
+        'destinatario': canal.destinatario(row),
+        'status': 'enviando',
+        'tentativas': 0,
+        'execucao': execucao,
+        'data_reserva': agora
+    } for row in linhas]
+    
+    tabela = LembreteEnviado.__table__
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto in ('postgresql', 'sqlite'):
+        from sqlalchemy.dialects import postgresql, sqlite
+        modulo = postgresql if dialeto == 'postgresql' else sqlite
+        instrucao = modulo.insert(tabela).on_conflict_do_nothing(
+            index_elements=['pagamento_id', 'dia', 'canal']
+        )
+    else:
+        instrucao = tabela.insert().prefix_with('IGNORE')
+    
+    db.session.execute(instrucao, valores)
+    retomados = db.session.execute(
+        db.update(LembreteEnviado).where(
+            LembreteEnviado.pagamento_id.in_([row.id for row in linhas]),
+            LembreteEnviado.dia == hoje,
+            LembreteEnviado.canal == canal.nome,
+            reserva_abandonada(execucao, agora)
+        ).values(execucao=execucao, data_reserva=agora, tentativas=0),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    
+    reservados = dict(db.session.execute(
+        db.select(LembreteEnviado.pagamento_id, LembreteEnviado.id).where(
+            LembreteEnviado.execucao == execucao,
+            LembreteEnviado.canal == canal.nome,
+            LembreteEnviado.pagamento_id.in_([row.id for row in linhas])
+        )
+    ).all())
+    return [(reservados[row.id], row) for row in linhas if row.id in reservados], retomados
+
+# ==================== ENVIO ====================
+
+def _enviar_com_tentativas(canal, destinatario, assunto, mensagem):
+    """
+    Envia respeitando o limite do canal; falhas temporárias são repetidas
+    com espera crescente. Retorna (status, tentativas, erro)
+    """
+    for tentativa in range(1, TENTATIVAS + 1):
+        canal.aguardar_vez()
+        try:
+            canal.enviar(destinatario, assunto, mensagem)
+            return 'enviado', tentativa, None
+        except ErroTemporario as e:
+            if tentativa == TENTATIVAS:
+                return 'falhou', tentativa, str(e)
+            time.sleep(2 ** (tentativa - 1))
+        except ErroEnvio as e:
+            return 'falhou', tentativa, str(e)
+        except Exception as e:
+            return 'falhou', tentativa, f"Erro inesperado: {e}"
+
+def enviar_lembretes(hoje=None, canais=None, modo=None, log=print):
+    """
+    Envia os lembretes do dia por todos os canais ativos
+    Cada lote de cobranças é reservado, enviado em paralelo pelo pool de
+    threads e tem o resultado gravado antes do próximo lote, então a
+    memória usada não depende do total de lembretes
+    """
+    hoje = hoje or periodos.hoje()
+    execucao = uuid.uuid4().hex
+    modelos = carregar_modelos()
+    resultado = {"success": True, "execucao": execucao, "enviados": 0, "falhas": 0, "retomados": 0, "por_canal": {}}
+    
+    with ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='lembretes') as executor:
+        for canal in criar_canais(canais, modo):
+            contagem = {'enviados': 0, 'falhas': 0, 'retomados': 0}
+            ultimo_id = 0
+            
+            while True:
+                agora = datetime.utcnow()
+                linhas = db.session.execute(consulta_cobrancas(hoje, canal, ultimo_id, execucao=execucao, agora=agora)).all()
+                if not linhas:
+                    break
+                ultimo_id = linhas[-1].id
+                
+                reservados, retomados = _reservar(linhas, hoje, canal, execucao, agora)
+                contagem['retomados'] += retomados
+                
+                tarefas = []
+                for lembrete_id, row in reservados:
+                    assunto, mensagem = montar_mensagem(modelos, row, hoje)
+                    futuro = executor.submit(
+                        _enviar_com_tentativas, canal, canal.destinatario(row), assunto, mensagem
+                    )
+                    tarefas.append((lembrete_id, futuro))
+                
+                atualizacoes = []
+                for lembrete_id, futuro in tarefas:
+                    status, tentativas, erro = futuro.result()
+                    atualizacoes.append({
+                        'id': lembrete_id,
+                        'status': status,
+                        'tentativas': tentativas,
+                        'erro': erro,
+                        'data_envio': datetime.utcnow()
+                    })
+                    contagem['enviados' if status == 'enviado' else 'falhas'] += 1
+                
+                if atualizacoes:
+                    db.session.execute(db.update(LembreteEnviado), atualizacoes)
+                    db.session.commit()
+            
+            canal.fechar()
+            log(f"{canal.nome}: {contagem['enviados']} enviado(s), {contagem['falhas']} falha(s)"
+                + (f", {contagem['retomados']} retomado(s) de execução interrompida" if contagem['retomados'] else ''))
+            resultado['por_canal'][canal.nome] = contagem
+            for chave in ('enviados', 'falhas', 'retomados'):
+                resultado[chave] += contagem[chave]
+    
+    return resultado
@@ -0,0 +1,160 @@
+"""
+Lote - Várias leituras da API em uma só requisição (POST /api/batch)
+Telas que montam a página com várias chamadas GET (o cliente e seus
+pagamentos, o cliente e o histórico) pagam uma ida e volta de rede por
+chamada, que em conexões móveis é a maior parte do tempo de carga.
+O lote recebe os caminhos das rotas GET, confere o token uma vez na
+entrada e executa as próprias rotas do app, devolvendo o status e o
+corpo de cada uma, na ordem pedida
+As sub-requisições são divididas em até LOTE_PARALELO grupos que rodam
+ao mesmo tempo (o primeiro na thread da requisição); as de um mesmo
+grupo rodam em sequência no mesmo contexto de aplicação, ou seja, com a
+mesma sessão e conexão do banco
+O lote passa uma vez pelo controle de admissão, como leitura, e por isso
+só aceita rotas da classe 'leitura': relatórios e rotas isentas (arquivos
+estáticos, fluxo de eventos) ficam de fora. Cada rota mantém suas
+permissões (rotas de admin respondem 403 a operadores) e a academia do
+token
+"""
+
+from flask import request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from werkzeug.exceptions import HTTPException
+import io
+import os
+
+# Sub-requisições por lote
+MAXIMO = int(os.environ.get('LOTE_MAXIMO', 20))
+
+# Grupos executados ao mesmo tempo em um lote (cada um usa uma conexão)
+PARALELO = int(os.environ.get('LOTE_PARALELO', 3))
+
+# Threads dos grupos além do primeiro (separadas das consultas paralelas
+# do app: uma rota do lote pode usar executar_em_paralelo sem esperar
+# por uma vaga ocupada pelo próprio lote)
+executor_lote = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('LOTE_THREADS', 8)),
+    thread_name_prefix='lote'
+)
+
+# ==================== PREPARAÇÃO ====================
+
+def _erro(identificador, status, mensagem):
+    return {'id': identificador, 'status': status, 'corpo': {'error': mensagem}}
+
+def _preparar(app, adaptador, indice, item):
+    """
+    Confere uma sub-requisição e encontra a rota dela
+    Retorna (tarefa, None) ou (None, resposta de erro do item)
+    """
+    if isinstance(item, dict):
+        identificador, url = item.get('id', indice), item.get('url')
+    else:
+        identificador, url = indice, None
+    if not isinstance(url, str) or not url:
+        return None, _erro(identificador, 400, "Informe a url da sub-requisição")
+    
+    partes = urlsplit(url)
+    if not partes.path.startswith('/api/'):
+        return None, _erro(identificador, 400, f"Caminho fora da API: {partes.path}")
+    
+    # Os arquivos estáticos respondem a qualquer caminho: só valem rotas /api/
+    try:
+        regra, argumentos = adaptador.match(partes.path, method='GET', return_rule=True)
+    except HTTPException:
+        regra = None
+    if regra is None or not regra.rule.startswith('/api/'):
+        return None, _erro(identificador, 404, f"Rota não encontrada: GET {partes.path}")
+    
+    endpoint = regra.endpoint
+    if getattr(app.view_functions[endpoint], 'classe_admissao', 'leitura') != 'leitura':
+        return None, _erro(identificador, 400, f"Rota não disponível em lote: GET {partes.path}")
+    
+    return {
+        'indice': indice,
+        'id': identificador,
+        'endpoint': endpoint,
+        'argumentos': argumentos,
+        'caminho': partes.path,
+        'query': partes.query
+    }, None
+
+# ==================== EXECUÇÃO ====================
+
+def _ambiente(base, tarefa):
+    """
+    Ambiente WSGI da sub-requisição: os cabeçalhos da requisição do lote
+    (token, última escrita) com o método, caminho e query da sub-requisição
+    """
+    ambiente = {chave: valor for chave, valor in base.items() if not chave.startswith('werkzeug.')}
+    ambiente.update({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': tarefa['caminho'],
+        'QUERY_STRING': tarefa['query'],
+        'CONTENT_TYPE': '',
+        'CONTENT_LENGTH': '0',
+        'wsgi.input': io.BytesIO()
+    })
+    return ambiente
+
+def _executar(app, tarefa, base):
+    with app.request_context(_ambiente(base, tarefa)):
+        try:
+            resposta = app.make_response(app.view_functions[tarefa['endpoint']](**tarefa['argumentos']))
+        except HTTPException as e:
+            resposta = app.make_response(({"error": e.description}, e.code))
+        except Exception:
+            app.logger.exception("Erro na sub-requisição GET %s do lote", tarefa['caminho'])
+            resposta = app.make_response(({"error": "Erro interno do servidor"}, 500))
+        
+        return {
+            'id': tarefa['id'],
+            'status': resposta.status_code,
+            'corpo': resposta.get_json() if resposta.is_json else resposta.get_data(as_text=True)
+        }
+
+def _executar_grupo(app, tarefas, base):
+    # Um contexto de aplicação próprio por grupo: sessão (e conexão)
+    # compartilhada pelas sub-requisições do grupo e separada da
+    # requisição do lote
+    with app.app_context():
+        return [(tarefa['indice'], _executar(app, tarefa, base)) for tarefa in tarefas]
+
+def executar(app, requisicoes):
+    """
+    Executa as sub-requisições GET de um lote na requisição atual
+    requisicoes: [{url: '/api/clientes/1', id (opcional)}, ...]
+    Retorna [{id, status, corpo}, ...] na ordem pedida
+    Lança ValueError se o lote for inválido (itens inválidos só recebem
+    status de erro)
+    """
+    if not isinstance(requisicoes, list) or not requisicoes:
+        raise ValueError("Informe a lista de requisições")
+    if len(requisicoes) > MAXIMO:
+        raise ValueError(f"Máximo de {MAXIMO} requisições por lote")
+    
+    adaptador = app.create_url_adapter(request)
+    respostas = [None] * len(requisicoes)
+    tarefas = []
+    for indice, item in enumerate(requisicoes):
+        tarefa, erro = _preparar(app, adaptador, indice, item)
+        if erro:
+            respostas[indice] = erro
+        else:
+            tarefas.append(tarefa)
+    
+    if tarefas:
+        base = request.environ
+        quantidade = min(PARALELO, len(tarefas))
+        grupos = [tarefas[i::quantidade] for i in range(quantidade)]
+        
+        futuros = [executor_lote.submit(_executar_grupo, app, grupo, base) for grupo in grupos[1:]]
+        resultados = _executar_grupo(app, grupos[0], base)
+        for futuro in futuros:
+            resultados += futuro.result()
+        
+        for indice, resposta in resultados:
+            respostas[indice] = resposta
+    
+    return respostas
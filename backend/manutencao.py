@@ -0,0 +1,341 @@
+"""
+Manutenção - Comandos administrativos executados fora do servidor
+Uso: python manutencao.py <comando> [opções]
+"""
+
+import argparse
+from app import app
+from contextlib import nullcontext
+from database import db
+from datetime import date
+from periodos import Periodo
+import academias
+import banco_sqlite
+import caixa_saida
+import conciliacao
+import models
+import lembretes
+import particionamento
+import planos
+import receita
+import recibos
+import retencao
+import sincronizacao
+
+# ==================== COMANDOS ====================
+
+def verificar_resumo(args):
+    """
+    Confere o resumo financeiro dos clientes com os pagamentos
+    """
+    resultado = models.verificar_resumo_clientes(args.reparar)
+    
+    print(f"Clientes verificados: {resultado['clientes_verificados']}")
+    print(f"Clientes divergentes: {len(resultado['divergentes'])}")
+    if resultado['divergentes']:
+        print(f"IDs: {', '.join(str(i) for i in resultado['divergentes'])}")
+    if args.reparar:
+        print(f"Clientes reparados: {resultado['reparados']}")
+
+def historico_particionar(args):
+    """
+    Converte o histórico em tabela particionada por mês (PostgreSQL)
+    """
+    resultado = particionamento.converter_para_particionada('historico', 'data_acao', 'mes')
+    if not resultado['success']:
+        print(f"Erro: {resultado['error']}")
+
+def historico_particoes(args):
+    """
+    Cria as partições mensais do histórico para os próximos meses
+    """
+    criadas = particionamento.criar_particoes_futuras('historico', 'data_acao', 'mes', args.futuras)
+    print(f"Partições criadas: {', '.join(criadas) if criadas else 'nenhuma'}")
+
+def historico_arquivar(args):
+    """
+    Arquiva em .jsonl.gz e remove do banco o histórico fora da retenção
+    """
+    antes_de = date.fromisoformat(args.antes_de) if args.antes_de else None
+    resultado = retencao.arquivar_historico(antes_de, args.diretorio)
+    print(f"Ações arquivadas: {resultado['linhas']} em {len(resultado['arquivos'])} arquivo(s)")
+
+def pagamentos_particionar(args):
+    """
+    Converte os pagamentos em tabela particionada por ano de vencimento (PostgreSQL)
+    """
+    resultado = particionamento.converter_para_particionada('pagamentos', 'vencimento', 'ano', futuras=2)
+    if not resultado['success']:
+        print(f"Erro: {resultado['error']}")
+
+def pagamentos_particoes(args):
+    """
+    Cria as partições anuais dos pagamentos para os próximos anos
+    """
+    criadas = particionamento.criar_particoes_futuras('pagamentos', 'vencimento', 'ano', args.futuras)
+    print(f"Partições criadas: {', '.join(criadas) if criadas else 'nenhuma'}")
+
+def lembretes_enviar(args):
+    """
+    Envia os lembretes de vencimento do dia
+    """
+    hoje = date.fromisoformat(args.data) if args.data else None
+    resultado = lembretes.enviar_lembretes(hoje, args.canal, args.modo)
+    print(f"Lembretes enviados: {resultado['enviados']} | falhas: {resultado['falhas']}"
+          f" | retomados de execução interrompida: {resultado['retomados']}")
+
+def sync_limpar_exclusoes(args):
+    """
+    Apaga os registros de exclusão antigos da sincronização incremental
+    """
+    removidas = sincronizacao.limpar_exclusoes(args.dias)
+    print(f"Registros de exclusão removidos: {removidas}")
+
+def receita_limpar_cache(args):
+    """
+    Apaga o cache da série de receita (recalculado na próxima consulta)
+    """
+    removidos = receita.limpar_cache()
+    print(f"Intervalos removidos do cache: {removidos}")
+
+def conciliacao_importar(args):
+    """
+    Concilia um extrato bancário com as cobranças pendentes da academia
+    """
+    # O extrato é de uma academia só: sem --academia, a academia padrão
+    padrao = academias.academia(academias.PADRAO) if academias.academia_atual() is None else nullcontext()
+    with padrao, open(args.arquivo, 'rb') as arquivo:
+        resultado = conciliacao.importar_extrato(arquivo, args.formato, args.metodo)
+    if not resultado['success']:
+        raise SystemExit(resultado['error'])
+    
+    print(f"Formato: {resultado['formato']} | créditos: {resultado['creditos']} | "
+          f"débitos ignorados: {resultado['debitos']} | já importados: {resultado['repetidos']}")
+    print(f"Baixados: {resultado['conciliados']} (R$ {resultado['valor_conciliado']:.2f}) | "
+          f"para revisão: {resultado['revisao']}")
+
+def recibos_extratos(args):
+    """
+    Gera os extratos de todos os clientes com lançamentos no período em um zip
+    """
+    try:
+        if args.de or args.ate:
+            periodo = Periodo.intervalo(args.de, args.ate)
+            destino = args.saida or f"extratos-{args.de or 'inicio'}-a-{args.ate or 'hoje'}.zip"
+        else:
+            periodo = Periodo.ano(args.ano)
+            destino = args.saida or f'extratos-{periodo.inicio.year}.zip'
+        resultado = recibos.gerar_extratos(periodo, destino, args.formato, args.processos, args.recomecar)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"Extratos gerados: {resultado['gerados']} em {destino}")
+
+def verificar_planos(args):
+    """
+    Confere os planos de execução das consultas com a referência
+    """
+    resultado = planos.verificar_planos(args.url, args.gravar, args.clientes, args.tolerancia)
+    
+    print(f"Banco: {resultado['banco']} | linhas: " +
+          ', '.join(f'{tabela} {n}' for tabela, n in resultado['linhas'].items() if n))
+    for nome, item in resultado['consultas'].items():
+        situacao = 'REGRESSÃO' if item['problemas'] else 'ok'
+        print(f"{situacao:9} {nome:32} custo {item['plano']['custo']:>10}  {', '.join(item['plano']['acessos'])}")
+        for problema in item['problemas']:
+            print(f"          - {problema}")
+    
+    if args.gravar:
+        print(f"Referência gravada em {planos.ARQUIVO_REFERENCIA}")
+    elif resultado['regressoes']:
+        raise SystemExit(f"Consultas com regressão: {resultado['regressoes']}")
+
+def _engine_atual():
+    # Banco da academia de --academia (banco próprio) ou o principal
+    banco = academias.banco_atual()
+    return db.engines[academias.nome_bind(banco)] if banco else db.engine
+
+def sqlite_checkpoint(args):
+    """
+    Copia o -wal do SQLite para o banco e atualiza as estatísticas
+    """
+    try:
+        resultado = banco_sqlite.checkpoint(_engine_atual(), args.modo)
+        situacao = banco_sqlite.estado(_engine_atual())
+    except ValueError as e:
+        raise SystemExit(str(e))
+    
+    print(f"Páginas no -wal: {resultado['paginas_wal']} | copiadas: {resultado['paginas_copiadas']}" +
+          (" | banco ocupado: rode de novo ou use --modo full" if resultado['ocupado'] else ""))
+    print(f"{situacao['arquivo']}: {situacao['tamanho'] / 2**20:.1f} MB, -wal {situacao['tamanho_wal'] / 2**20:.1f} MB "
+          f"(journal {situacao['journal_mode']}, synchronous {situacao['synchronous']})")
+
+def sqlite_backup(args):
+    """
+    Cópia consistente do banco SQLite com o sistema no ar
+    """
+    try:
+        resultado = banco_sqlite.backup(_engine_atual(), args.destino)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"Backup gravado em {resultado['destino']} ({resultado['tamanho'] / 2**20:.1f} MB, {resultado['segundos']}s)")
+
+def saida_retransmitir(args):
+    """
+    Entrega os eventos da caixa de saída aos consumidores (fica no ar
+    até ser interrompido, a menos que --uma-vez)
+    """
+    try:
+        entregues = caixa_saida.retransmitir(args.consumidor, continuo=not args.uma_vez)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    except KeyboardInterrupt:
+        return
+    for nome, quantidade in entregues.items():
+        print(f"{nome}: {quantidade} evento(s) entregue(s)")
+
+def saida_estado(args):
+    """
+    Posição dos consumidores da caixa de saída e eventos pendentes
+    """
+    resultado = caixa_saida.estado()
+    print(f"Último evento: {resultado['ultimo_seq']}")
+    for consumidor in resultado['consumidores']:
+        print(f"{consumidor['consumidor']}: posição {consumidor['posicao']} | "
+              f"pendentes {consumidor['pendentes']} | entregues {consumidor['entregues']}"
+              + (f" | {consumidor['falhas_seguidas']} falha(s): {consumidor['ultimo_erro']}"
+                 if consumidor['falhas_seguidas'] else ''))
+
+def saida_limpar(args):
+    """
+    Apaga os eventos antigos já entregues a todos os consumidores
+    """
+    removidos = caixa_saida.limpar(args.dias)
+    print(f"Eventos removidos: {removidos}")
+
+def academia_criar(args):
+    """
+    Cadastra uma academia e o primeiro administrador dela
+    """
+    resultado = models.criar_academia(args.nome, args.slug, args.banco, args.admin_email, args.admin_senha)
+    if not resultado['success']:
+        raise SystemExit(resultado['error'])
+    print(f"Academia criada: id {resultado['id']} ({args.slug})")
+
+def contexto_academia(slug):
+    """
+    Restringe o comando a uma academia (e ao banco dela); sem slug o
+    comando atende todas as academias do banco principal
+    """
+    if not slug:
+        return nullcontext()
+    
+    academia = models.buscar_academia(slug)
+    if not academia:
+        raise SystemExit(f"Academia não encontrada: {slug}")
+    return academias.academia(academia.id, academia.banco)
+
+# ==================== INICIALIZAÇÃO ====================
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description='Comandos de manutenção do FlowFit')
+    parser.add_argument('--academia', help='Executa apenas para esta academia (identificador); '
+                        'obrigatório para academias com banco próprio')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    
+    cmd = comandos.add_parser('verificar-resumo', help='Confere o resumo financeiro dos clientes')
+    cmd.add_argument('--reparar', action='store_true', help='Corrige os clientes com resumo divergente')
+    cmd.set_defaults(executar=verificar_resumo)
+    
+    cmd = comandos.add_parser('historico-particionar', help='Particiona o histórico por mês (PostgreSQL)')
+    cmd.set_defaults(executar=historico_particionar)
+    
+    cmd = comandos.add_parser('historico-particoes', help='Cria partições futuras do histórico')
+    cmd.add_argument('--futuras', type=int, default=3, help='Quantidade de meses à frente')
+    cmd.set_defaults(executar=historico_particoes)
+    
+    cmd = comandos.add_parser('historico-arquivar', help='Arquiva e remove o histórico antigo')
+    cmd.add_argument('--antes-de', help='Arquiva os meses anteriores a esta data (AAAA-MM-DD)')
+    cmd.add_argument('--diretorio', help='Pasta dos arquivos (padrão: HISTORICO_ARQUIVO_DIR)')
+    cmd.set_defaults(executar=historico_arquivar)
+    
+    cmd = comandos.add_parser('pagamentos-particionar', help='Particiona os pagamentos por ano de vencimento (PostgreSQL)')
+    cmd.set_defaults(executar=pagamentos_particionar)
+    
+    cmd = comandos.add_parser('pagamentos-particoes', help='Cria partições futuras dos pagamentos')
+    cmd.add_argument('--futuras', type=int, default=2, help='Quantidade de anos à frente')
+    cmd.set_defaults(executar=pagamentos_particoes)
+    
+    cmd = comandos.add_parser('lembretes-enviar', help='Envia os lembretes de vencimento do dia')
+    cmd.add_argument('--data', help='Dia de referência (AAAA-MM-DD, padrão: hoje)')
+    cmd.add_argument('--canal', action='append', help='Canal a usar (repetível; padrão: LEMBRETES_CANAIS)')
+    cmd.add_argument('--modo', choices=['arquivo', 'envio'], help='arquivo = grava em disco (padrão: LEMBRETES_MODO)')
+    cmd.set_defaults(executar=lembretes_enviar)
+    
+    cmd = comandos.add_parser('sync-limpar-exclusoes', help='Apaga os registros de exclusão antigos da sincronização')
+    cmd.add_argument('--dias', type=int, default=90, help='Mantém os registros dos últimos N dias')
+    cmd.set_defaults(executar=sync_limpar_exclusoes)
+    
+    cmd = comandos.add_parser('receita-limpar-cache', help='Apaga o cache da série de receita')
+    cmd.set_defaults(executar=receita_limpar_cache)
+    
+    cmd = comandos.add_parser('conciliacao-importar', help='Concilia um extrato bancário (CSV, OFX ou CNAB 240)')
+    cmd.add_argument('arquivo', help='Arquivo do extrato')
+    cmd.add_argument('--formato', choices=sorted(conciliacao.LEITORES), help='Padrão: detectado pelo conteúdo')
+    cmd.add_argument('--metodo', default='transferencia', help='Método dos pagamentos baixados (quando o extrato não indica)')
+    cmd.set_defaults(executar=conciliacao_importar)
+    
+    cmd = comandos.add_parser('recibos-extratos', help='Gera os extratos de pagamentos de todos os clientes (zip)')
+    cmd.add_argument('--ano', help='Ano dos extratos (AAAA, padrão: ano atual)')
+    cmd.add_argument('--de', help='Início do período (AAAA-MM-DD), em vez do ano')
+    cmd.add_argument('--ate', help='Fim do período (AAAA-MM-DD, inclusive), em vez do ano')
+    cmd.add_argument('--formato', choices=sorted(recibos.FORMATOS), default='pdf')
+    cmd.add_argument('--saida', help='Arquivo zip (padrão: extratos-<ano>.zip)')
+    cmd.add_argument('--processos', type=int, help='Processos de geração (padrão: RECIBOS_PROCESSOS ou nº de CPUs)')
+    cmd.add_argument('--recomecar', action='store_true', help='Descarta o zip e o progresso de uma execução anterior')
+    cmd.set_defaults(executar=recibos_extratos)
+    
+    cmd = comandos.add_parser('verificar-planos', help='Confere os planos de execução das consultas')
+    cmd.add_argument('--url', help='Banco de teste vazio (padrão: SQLite temporário)')
+    cmd.add_argument('--gravar', action='store_true', help='Grava os planos atuais como referência')
+    cmd.add_argument('--clientes', type=int, default=10000, help='Clientes da academia semeada (padrão 10000)')
+    cmd.add_argument('--tolerancia', type=float, default=planos.TOLERANCIA_CUSTO,
+                     help='Aumento de custo aceito (1.5 = até 50%%)')
+    cmd.set_defaults(executar=verificar_planos)
+    
+    cmd = comandos.add_parser('sqlite-checkpoint', help='Copia o -wal do SQLite para o banco (com o sistema no ar)')
+    cmd.add_argument('--modo', choices=banco_sqlite.MODOS_CHECKPOINT, default='passive',
+                     help='passive não espera as escritas; truncate também zera o -wal (padrão passive)')
+    cmd.set_defaults(executar=sqlite_checkpoint)
+    
+    cmd = comandos.add_parser('sqlite-backup', help='Cópia consistente do banco SQLite (com o sistema no ar)')
+    cmd.add_argument('destino', help='Arquivo da cópia')
+    cmd.set_defaults(executar=sqlite_backup)
+    
+    cmd = comandos.add_parser('saida-retransmitir', help='Entrega os eventos da caixa de saída aos consumidores')
+    cmd.add_argument('--consumidor', action='append', help='Consumidor a atender (repetível; padrão: SAIDA_CONSUMIDORES)')
+    cmd.add_argument('--uma-vez', action='store_true', help='Entrega o que está pendente e termina')
+    cmd.set_defaults(executar=saida_retransmitir)
+    
+    cmd = comandos.add_parser('saida-estado', help='Mostra a posição dos consumidores da caixa de saída')
+    cmd.set_defaults(executar=saida_estado)
+    
+    cmd = comandos.add_parser('saida-limpar', help='Apaga os eventos antigos já entregues')
+    cmd.add_argument('--dias', type=int, default=caixa_saida.RETENCAO_DIAS,
+                     help='Mantém os eventos dos últimos N dias (padrão: SAIDA_RETENCAO_DIAS)')
+    cmd.set_defaults(executar=saida_limpar)
+    
+    cmd = comandos.add_parser('academia-criar', help='Cadastra uma academia e o administrador dela')
+    cmd.add_argument('--nome', required=True, help='Nome da academia')
+    cmd.add_argument('--slug', required=True, help='Identificador usado no login (ex.: centro)')
+    cmd.add_argument('--banco', help='Chave em ACADEMIAS_BANCOS para um banco próprio')
+    cmd.add_argument('--admin-email', required=True, help='Email do administrador')
+    cmd.add_argument('--admin-senha', required=True, help='Senha do administrador')
+    cmd.set_defaults(executar=academia_criar)
+    
+    return parser
+
+if __name__ == '__main__':
+    args = criar_parser().parse_args()
+    with app.app_context():
+        with contexto_academia(args.academia):
+            args.executar(args)
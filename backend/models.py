@@ -5,12 +5,47 @@ Usando SQLAlchemy ORM para MySQL
 """
 
 from database import db
-from datetime import datetime, date
+from replicas import somente_leitura
+from periodos import Periodo
+from campos import Campos, iso, decimal, inteiro
+import academias
+import particionamento
+import periodos
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import chain
+from sqlalchemy import event, create_engine
+from sqlalchemy.orm import Session
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # ==================== MODELOS (TABELAS) ====================
 
-class Usuario(db.Model):
+class Academia(db.Model):
+    __tablename__ = 'academias'
+    
+    # Cadastro das academias (fica sempre no banco principal)
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), nullable=False)
+    slug = db.Column(db.String(50), unique=True, nullable=False)
+    # Chave em ACADEMIAS_BANCOS do banco próprio (vazio = banco principal)
+    banco = db.Column(db.String(50))
+    ativa = db.Column(db.Boolean, default=True)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PorAcademia:
+    """
+    Dados separados por academia: consultas filtradas e registros novos
+    gravados na academia atual (ver SEPARAÇÃO POR ACADEMIA)
+    """
+    # Sem chave estrangeira: academias com banco próprio não têm o
+    # cadastro de academias no banco delas
+    academia_id = db.Column(db.Integer, nullable=False, default=academias.PADRAO,
+                            server_default=db.text(str(academias.PADRAO)))
+
+class Usuario(PorAcademia, db.Model):
     __tablename__ = 'usuarios'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -22,6 +57,10 @@ class Usuario(db.Model):
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
     ultimo_acesso = db.Column(db.DateTime)
     
+    # Posição na sequência de alterações (sincronização incremental, ver
+    # CONTROLE DE ALTERAÇÕES)
+    seq_alteracao = db.Column(db.BigInteger, nullable=False, default=0, server_default=db.text('0'))
+    
     # Relacionamentos
     historico_acoes = db.relationship('Historico', backref='usuario', lazy=True)
     pagamentos_registrados = db.relationship('Pagamento', backref='usuario_registro', lazy=True)
@@ -31,24 +70,48 @@ class Usuario(db.Model):
     
     def check_senha(self, senha):
         return check_password_hash(self.senha_hash, senha)
+    
+    __table_args__ = (
+        db.Index('ix_usuarios_academia_seq', 'academia_id', 'seq_alteracao'),
+    )
 
-class Cliente(db.Model):
+class Cliente(PorAcademia, db.Model):
     __tablename__ = 'clientes'
     
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120))
     telefone = db.Column(db.String(20))
-    cpf = db.Column(db.String(14), unique=True)
+    cpf = db.Column(db.String(14))
     endereco = db.Column(db.Text)
     observacoes = db.Column(db.Text)
     data_cadastro = db.Column(db.DateTime, default=datetime.utcnow)
     ativo = db.Column(db.Boolean, default=True)
     
+    # Resumo financeiro mantido a cada alteração de pagamento
+    # (ver atualizar_resumo_clientes)
+    saldo_aberto = db.Column(db.Float, nullable=False, default=0, server_default=db.text('0'))
+    qtd_pendentes = db.Column(db.Integer, nullable=False, default=0, server_default=db.text('0'))
+    vencimento_mais_antigo = db.Column(db.Date)
+    ultimo_pagamento = db.Column(db.Date)
+    
+    # Posição na sequência de alterações (sincronização incremental, ver
+    # CONTROLE DE ALTERAÇÕES)
+    seq_alteracao = db.Column(db.BigInteger, nullable=False, default=0, server_default=db.text('0'))
+    
     # Relacionamentos
     pagamentos = db.relationship('Pagamento', backref='cliente', lazy=True)
+    
+    # Índices começando pela academia: toda consulta filtra por ela
+    __table_args__ = (
+        db.Index('uq_clientes_academia_cpf', 'academia_id', 'cpf', unique=True),
+        db.Index('ix_clientes_academia_ativo_saldo', 'academia_id', 'ativo', 'saldo_aberto'),
+        db.Index('ix_clientes_academia_vencimento', 'academia_id', 'vencimento_mais_antigo'),
+        db.Index('ix_clientes_academia_nome', 'academia_id', 'nome'),
+        db.Index('ix_clientes_academia_seq', 'academia_id', 'seq_alteracao'),
+    )
 
-class Pagamento(db.Model):
+class Pagamento(PorAcademia, db.Model):
     __tablename__ = 'pagamentos'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -62,8 +125,19 @@ class Pagamento(db.Model):
     observacoes = db.Column(db.Text)
     usuario_registro_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Posição na sequência de alterações (sincronização incremental, ver
+    # CONTROLE DE ALTERAÇÕES)
+    seq_alteracao = db.Column(db.BigInteger, nullable=False, default=0, server_default=db.text('0'))
+    
+    __table_args__ = (
+        db.Index('ix_pagamentos_academia_cliente_status', 'academia_id', 'cliente_id', 'status'),
+        db.Index('ix_pagamentos_academia_status_vencimento', 'academia_id', 'status', 'vencimento'),
+        db.Index('ix_pagamentos_academia_status_pagamento', 'academia_id', 'status', 'data_pagamento'),
+        db.Index('ix_pagamentos_academia_seq', 'academia_id', 'seq_alteracao'),
+    )
 
-class Historico(db.Model):
+class Historico(PorAcademia, db.Model):
     __tablename__ = 'historico'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -71,6 +145,141 @@ class Historico(db.Model):
     acao = db.Column(db.String(100), nullable=False)
     descricao = db.Column(db.Text)
     data_acao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Índices para paginação por (data_acao, id) dentro da academia,
+    # com ou sem filtro
+    __table_args__ = (
+        db.Index('ix_historico_academia_data', 'academia_id', 'data_acao', 'id'),
+        db.Index('ix_historico_academia_usuario_data', 'academia_id', 'usuario_id', 'data_acao', 'id'),
+        db.Index('ix_historico_academia_acao_data', 'academia_id', 'acao', 'data_acao', 'id'),
+    )
+
+class LembreteEnviado(db.Model):
+    __tablename__ = 'lembretes_enviados'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Sem chave estrangeira: com pagamentos particionados (PostgreSQL) a
+    # chave primária é (id, vencimento) e id sozinho não pode ser referenciado
+    pagamento_id = db.Column(db.Integer, nullable=False)
+    dia = db.Column(db.Date, nullable=False)
+    canal = db.Column(db.String(20), nullable=False)
+    destinatario = db.Column(db.String(120))
+    status = db.Column(db.String(20), default='enviando')  # enviando, enviado, falhou
+    tentativas = db.Column(db.Integer, default=0)
+    erro = db.Column(db.Text)
+    execucao = db.Column(db.String(32), nullable=False)
+    data_reserva = db.Column(db.DateTime)
+    data_envio = db.Column(db.DateTime)
+    
+    # Um lembrete por cobrança, por dia e por canal (ver lembretes.py)
+    __table_args__ = (
+        db.UniqueConstraint('pagamento_id', 'dia', 'canal', name='uq_lembretes_pagamento_dia_canal'),
+        db.Index('ix_lembretes_execucao', 'execucao'),
+    )
+
+class CacheReceita(PorAcademia, db.Model):
+    __tablename__ = 'cache_receita'
+    
+    # Totais de um intervalo encerrado da série de receita (ver receita.py),
+    # apagados quando muda um pagamento com data dentro do intervalo
+    id = db.Column(db.Integer, primary_key=True)
+    granularidade = db.Column(db.String(10), nullable=False)
+    inicio = db.Column(db.Date, nullable=False)
+    fim = db.Column(db.Date, nullable=False)
+    dados = db.Column(db.Text, nullable=False)
+    data_calculo = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('academia_id', 'granularidade', 'inicio', name='uq_cache_receita_intervalo'),
+    )
+
+class ConciliacaoLancamento(PorAcademia, db.Model):
+    __tablename__ = 'conciliacao_lancamentos'
+    
+    # Crédito de um extrato importado (ver conciliacao.py): baixado
+    # automaticamente, na fila de revisão ou resolvido por um usuário
+    id = db.Column(db.Integer, primary_key=True)
+    importacao = db.Column(db.String(32), nullable=False)
+    identificador = db.Column(db.String(40), nullable=False)
+    data = db.Column(db.Date, nullable=False)
+    valor = db.Column(db.Float, nullable=False)
+    documento = db.Column(db.String(14))
+    nome = db.Column(db.String(100))
+    descricao = db.Column(db.String(200))
+    status = db.Column(db.String(20), nullable=False)
+    motivo = db.Column(db.String(100))
+    # Sem chave estrangeira, como em LembreteEnviado: com pagamentos
+    # particionados a chave primária é (id, vencimento)
+    pagamento_id = db.Column(db.Integer)
+    # Ids das cobranças sugeridas para a revisão (JSON)
+    candidatos = db.Column(db.Text)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    data_importacao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('academia_id', 'identificador', name='uq_conciliacao_lancamento'),
+        db.Index('ix_conciliacao_academia_status_data', 'academia_id', 'status', 'data'),
+        db.Index('ix_conciliacao_pagamento', 'pagamento_id'),
+    )
+
+class Sequencia(db.Model):
+    __tablename__ = 'sequencias'
+    
+    # Contadores nomeados ('alteracoes', 'exclusoes_removidas_ate')
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.BigInteger, nullable=False, default=0)
+
+class ReservaSequencia(db.Model):
+    __tablename__ = 'reservas_sequencia'
+    
+    # Posições da sequência de alterações já reservadas por transações
+    # ainda não confirmadas (PostgreSQL/MySQL, ver CONTROLE DE ALTERAÇÕES):
+    # quem lê a sequência não passa da primeira delas
+    inicio = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    data_reserva = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class Exclusao(PorAcademia, db.Model):
+    __tablename__ = 'exclusoes'
+    
+    # Registro de exclusão definitiva (tombstone) para a sincronização:
+    # o registro some da tabela, mas os clientes precisam saber que sumiu
+    id = db.Column(db.Integer, primary_key=True)
+    tabela = db.Column(db.String(30), nullable=False)
+    registro_id = db.Column(db.Integer, nullable=False)
+    seq_alteracao = db.Column(db.BigInteger, nullable=False)
+    data_exclusao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_exclusoes_academia_seq', 'academia_id', 'seq_alteracao'),
+    )
+
+class EventoSaida(PorAcademia, db.Model):
+    __tablename__ = 'eventos_saida'
+    
+    # Caixa de saída (outbox) para sistemas externos: cada alteração em
+    # clientes, pagamentos e usuários, gravada na mesma transação dela
+    # (ver CAIXA DE SAÍDA). seq é a posição da alteração na sequência de
+    # alterações (a mesma da sincronização): as transações confirmam na
+    # ordem dela
+    seq = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    tipo = db.Column(db.String(40), nullable=False)
+    tabela = db.Column(db.String(30), nullable=False)
+    registro_id = db.Column(db.Integer, nullable=False)
+    # JSON: {"registro": {coluna: valor}, "campos": [colunas alteradas]}
+    dados = db.Column(db.Text, nullable=False)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ConsumidorSaida(db.Model):
+    __tablename__ = 'consumidores_saida'
+    
+    # Posição de cada consumidor da caixa de saída no banco: último seq
+    # entregue (e confirmado pelo destino)
+    nome = db.Column(db.String(50), primary_key=True)
+    posicao = db.Column(db.BigInteger, nullable=False, default=0)
+    entregues = db.Column(db.BigInteger, nullable=False, default=0)
+    falhas_seguidas = db.Column(db.Integer, nullable=False, default=0)
+    ultimo_erro = db.Column(db.Text)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
 
 # ==================== OPERAÇÕES DE CLIENTES ====================
 
@@ -95,22 +304,49 @@ def criar_cliente(nome, email, telefone, cpf, endereco='', observacoes=''):
         db.session.rollback()
         return {"success": False, "error": "CPF já cadastrado"}
 
-def listar_clientes(busca=None):
+# Campos de GET /api/clientes (?fields=, ver campos.py)
+CAMPOS_CLIENTE = Campos({
+    'id': (Cliente.id, None),
+    'nome': (Cliente.nome, None),
+    'email': (Cliente.email, None),
+    'telefone': (Cliente.telefone, None),
+    'cpf': (Cliente.cpf, None),
+    'endereco': (Cliente.endereco, None),
+    'observacoes': (Cliente.observacoes, None),
+    'data_cadastro': (Cliente.data_cadastro, iso),
+    'saldo_aberto': (Cliente.saldo_aberto, decimal),
+    'qtd_pendentes': (Cliente.qtd_pendentes, inteiro),
+    'vencimento_mais_antigo': (Cliente.vencimento_mais_antigo, iso),
+    'ultimo_pagamento': (Cliente.ultimo_pagamento, iso)
+}, {
+    'resumo': ('nome', 'cpf', 'telefone', 'email', 'saldo_aberto', 'qtd_pendentes')
+})
+
+def consulta_clientes(busca=None, ordenar='nome', campos=None):
     """
-    Lista todos os clientes ou filtra por nome/CPF
+    Monta a consulta de listar_clientes
+    A consulta fica separada da execução para ser conferida também
+    pela verificação de planos (planos.py)
+    campos: nomes de CAMPOS_CLIENTE (só essas colunas); None = o modelo
     """
-    query = Cliente.query.filter_by(ativo=True)
+    query = db.select(*CAMPOS_CLIENTE.colunas(campos)) if campos else db.select(Cliente)
+    query = query.where(Cliente.ativo == True)
     
     if busca:
-        query = query.filter(
+        query = query.where(
             (Cliente.nome.like(f'%{busca}%')) | 
             (Cliente.cpf.like(f'%{busca}%'))
         )
     
-    clientes = query.order_by(Cliente.nome).all()
-    
-    # Converter para dicionário
-    return [{
+    if ordenar == 'saldo':
+        return query.order_by(Cliente.saldo_aberto.desc(), Cliente.nome)
+    return query.order_by(Cliente.nome)
+
+def cliente_para_dict(c):
+    """
+    Converte um cliente para dicionário
+    """
+    return {
         'id': c.id,
         'nome': c.nome,
         'email': c.email,
@@ -118,30 +354,45 @@ def listar_clientes(busca=None):
         'cpf': c.cpf,
         'endereco': c.endereco,
         'observacoes': c.observacoes,
-        'data_cadastro': c.data_cadastro.isoformat() if c.data_cadastro else None
-    } for c in clientes]
+        'data_cadastro': c.data_cadastro.isoformat() if c.data_cadastro else None,
+        'saldo_aberto': float(c.saldo_aberto or 0),
+        'qtd_pendentes': c.qtd_pendentes or 0,
+        'vencimento_mais_antigo': c.vencimento_mais_antigo.isoformat() if c.vencimento_mais_antigo else None,
+        'ultimo_pagamento': c.ultimo_pagamento.isoformat() if c.ultimo_pagamento else None
+    }
 
-def obter_cliente(cliente_id):
+@somente_leitura
+def listar_clientes(busca=None, ordenar='nome', campos=None):
     """
-    Obtém um cliente específico por ID com estatísticas
+    Lista todos os clientes ou filtra por nome/CPF
+    ordenar: 'nome' (padrão) ou 'saldo' (maior saldo em aberto primeiro)
+    campos: nomes de CAMPOS_CLIENTE (padrão: todos)
     """
-    cliente = Cliente.query.get(cliente_id)
-    
-    if not cliente:
-        return None
+    campos = campos or CAMPOS_CLIENTE.escolher()
+    linhas = db.session.execute(consulta_clientes(busca, ordenar, campos))
     
-    # Estatísticas de pagamentos
-    total_pagamentos = Pagamento.query.filter_by(cliente_id=cliente_id).count()
-    pagamentos_pagos = Pagamento.query.filter_by(cliente_id=cliente_id, status='pago').count()
-    pagamentos_pendentes = Pagamento.query.filter_by(cliente_id=cliente_id, status='pendente').count()
-    
-    valor_pendente_result = db.session.query(db.func.sum(Pagamento.valor)).filter(
-        Pagamento.cliente_id == cliente_id,
-        Pagamento.status == 'pendente'
-    ).first()
-    valor_pendente = valor_pendente_result[0] or 0
+    return [CAMPOS_CLIENTE.para_dict(linha, campos) for linha in linhas]
+
+def consulta_cliente(cliente_id):
+    """
+    Monta a consulta de obter_cliente: o cliente e as contagens de
+    pagamentos (subconsultas escalares) em uma única instrução
+    """
+    def contagem(*filtros):
+        return db.select(db.func.count(Pagamento.id))\
+            .where(Pagamento.cliente_id == cliente_id, *filtros).scalar_subquery()
     
-    cliente_dict = {
+    return db.select(
+        Cliente,
+        contagem().label('total_pagamentos'),
+        contagem(Pagamento.status == 'pago').label('pagamentos_pagos')
+    ).where(Cliente.id == cliente_id)
+
+def cliente_detalhado_para_dict(cliente, total_pagamentos, pagamentos_pagos):
+    """
+    Converte um cliente para dicionário com as estatísticas de pagamentos
+    """
+    return {
         'id': cliente.id,
         'nome': cliente.nome,
         'email': cliente.email,
@@ -151,14 +402,26 @@ def obter_cliente(cliente_id):
         'observacoes': cliente.observacoes,
         'data_cadastro': cliente.data_cadastro.isoformat() if cliente.data_cadastro else None,
         'estatisticas': {
-            'total_pagamentos': total_pagamentos,
-            'pagamentos_pagos': pagamentos_pagos,
-            'pagamentos_pendentes': pagamentos_pendentes,
-            'valor_pendente': float(valor_pendente)
+            'total_pagamentos': total_pagamentos or 0,
+            'pagamentos_pagos': pagamentos_pagos or 0,
+            'pagamentos_pendentes': cliente.qtd_pendentes or 0,
+            'valor_pendente': float(cliente.saldo_aberto or 0),
+            'vencimento_mais_antigo': cliente.vencimento_mais_antigo.isoformat() if cliente.vencimento_mais_antigo else None,
+            'ultimo_pagamento': cliente.ultimo_pagamento.isoformat() if cliente.ultimo_pagamento else None
         }
     }
+
+@somente_leitura
+def obter_cliente(cliente_id):
+    """
+    Obtém um cliente específico por ID com estatísticas
+    """
+    linha = db.session.execute(consulta_cliente(cliente_id)).first()
+    
+    if not linha:
+        return None
     
-    return cliente_dict
+    return cliente_detalhado_para_dict(*linha)
 
 def atualizar_cliente(cliente_id, nome, email, telefone, cpf, endereco='', observacoes=''):
     """
@@ -203,6 +466,10 @@ def criar_pagamento(cliente_id, valor, vencimento, descricao, usuario_id=None):
     if valor <= 0:
         return {"success": False, "error": "O valor do pagamento deve ser maior que zero"}
     
+    # Só clientes da academia atual (a consulta passa pelo filtro da academia)
+    if db.session.get(Cliente, cliente_id) is None:
+        return {"success": False, "error": "Cliente não encontrado"}
+    
     try:
         pagamento = Pagamento(
             cliente_id=cliente_id,
@@ -219,24 +486,62 @@ def criar_pagamento(cliente_id, valor, vencimento, descricao, usuario_id=None):
         db.session.rollback()
         return {"success": False, "error": str(e)}
 
-def listar_pagamentos(cliente_id=None, status=None, mes=None):
+# Campos de GET /api/pagamentos (?fields=, ver campos.py)
+CAMPOS_PAGAMENTO = Campos({
+    'id': (Pagamento.id, None),
+    'cliente_id': (Pagamento.cliente_id, None),
+    'cliente_nome': (Cliente.nome, None),
+    'cliente_cpf': (Cliente.cpf, None),
+    'cliente_telefone': (Cliente.telefone, None),
+    'valor': (Pagamento.valor, None),
+    'vencimento': (Pagamento.vencimento, iso),
+    'data_pagamento': (Pagamento.data_pagamento, iso),
+    'status': (Pagamento.status, None),
+    'descricao': (Pagamento.descricao, None),
+    'metodo_pagamento': (Pagamento.metodo_pagamento, None),
+    'observacoes': (Pagamento.observacoes, None),
+    'data_criacao': (Pagamento.data_criacao, iso)
+}, {
+    'resumo': ('cliente_id', 'cliente_nome', 'valor', 'vencimento', 'data_pagamento', 'status', 'metodo_pagamento')
+})
+
+def consulta_pagamentos(cliente_id=None, status=None, periodo=None, limite_pendentes=None, campos=None):
     """
-    Lista pagamentos com filtros opcionais
+    Monta a consulta de listar_pagamentos, já trazendo o cliente
+    de cada pagamento no mesmo JOIN
+    periodo: Periodo da data de pagamento (ver periodos.py)
+    limite_pendentes: ver filtrar_vencimento_pendentes
+    campos: nomes de CAMPOS_PAGAMENTO (só essas colunas; o JOIN com o
+    cliente só entra se algum campo dele for pedido); None = o modelo
     """
-    query = Pagamento.query.join(Cliente)
+    if campos:
+        query = db.select(*CAMPOS_PAGAMENTO.colunas(campos))
+        if Cliente in CAMPOS_PAGAMENTO.entidades(campos):
+            query = query.join(Pagamento.cliente)
+    else:
+        query = db.select(Pagamento)\
+            .join(Pagamento.cliente)\
+            .options(db.contains_eager(Pagamento.cliente))
     
     if cliente_id:
-        query = query.filter(Pagamento.cliente_id == cliente_id)
+        query = query.where(Pagamento.cliente_id == cliente_id)
     
     if status:
-        query = query.filter(Pagamento.status == status)
+        query = query.where(Pagamento.status == status)
     
-    if mes:
-        query = query.filter(db.func.to_char(Pagamento.data_pagamento, 'YYYY-MM') == mes)
+    if status == 'pendente':
+        query = filtrar_vencimento_pendentes(query, limite_pendentes)
     
-    pagamentos = query.order_by(Pagamento.vencimento.desc()).all()
+    if periodo:
+        query = query.where(periodo.filtro(Pagamento.data_pagamento))
     
-    return [{
+    return query.order_by(Pagamento.vencimento.desc())
+
+def pagamento_para_dict(p):
+    """
+    Converte um pagamento (com o cliente carregado) para dicionário
+    """
+    return {
         'id': p.id,
         'cliente_id': p.cliente_id,
         'cliente_nome': p.cliente.nome,
@@ -250,19 +555,37 @@ def listar_pagamentos(cliente_id=None, status=None, mes=None):
         'metodo_pagamento': p.metodo_pagamento,
         'observacoes': p.observacoes,
         'data_criacao': p.data_criacao.isoformat() if p.data_criacao else None
-    } for p in pagamentos]
+    }
 
-def obter_historico_pagamentos(cliente_id):
+@somente_leitura
+def listar_pagamentos(cliente_id=None, status=None, periodo=None, campos=None):
     """
-    Obtém o histórico completo de pagamentos de um cliente
+    Lista pagamentos com filtros opcionais
+    periodo: Periodo da data de pagamento
+    campos: nomes de CAMPOS_PAGAMENTO (padrão: todos)
     """
-    pagamentos = Pagamento.query\
-        .filter_by(cliente_id=cliente_id)\
-        .outerjoin(Usuario)\
-        .order_by(Pagamento.vencimento.desc())\
-        .all()
+    campos = campos or CAMPOS_PAGAMENTO.escolher()
+    limite = limite_vencimento_pendentes(cliente_id) if status == 'pendente' else None
+    linhas = db.session.execute(consulta_pagamentos(cliente_id, status, periodo, limite, campos))
     
-    return [{
+    return [CAMPOS_PAGAMENTO.para_dict(linha, campos) for linha in linhas]
+
+def consulta_historico_pagamentos(cliente_id):
+    """
+    Monta a consulta de obter_historico_pagamentos, já trazendo o
+    usuário que registrou cada pagamento
+    """
+    return db.select(Pagamento)\
+        .outerjoin(Pagamento.usuario_registro)\
+        .options(db.contains_eager(Pagamento.usuario_registro))\
+        .where(Pagamento.cliente_id == cliente_id)\
+        .order_by(Pagamento.vencimento.desc())
+
+def historico_pagamento_para_dict(p):
+    """
+    Converte um pagamento do histórico do cliente para dicionário
+    """
+    return {
         'id': p.id,
         'valor': p.valor,
         'vencimento': p.vencimento.isoformat() if p.vencimento else None,
@@ -272,7 +595,16 @@ def obter_historico_pagamentos(cliente_id):
         'metodo_pagamento': p.metodo_pagamento,
         'usuario_nome': p.usuario_registro.nome if p.usuario_registro else None,
         'data_criacao': p.data_criacao.isoformat() if p.data_criacao else None
-    } for p in pagamentos]
+    }
+
+@somente_leitura
+def obter_historico_pagamentos(cliente_id):
+    """
+    Obtém o histórico completo de pagamentos de um cliente
+    """
+    pagamentos = db.session.scalars(consulta_historico_pagamentos(cliente_id)).all()
+    
+    return [historico_pagamento_para_dict(p) for p in pagamentos]
 
 def registrar_pagamento(pagamento_id, metodo_pagamento):
     """
@@ -281,7 +613,7 @@ def registrar_pagamento(pagamento_id, metodo_pagamento):
     pagamento = Pagamento.query.get(pagamento_id)
     if pagamento:
         pagamento.status = 'pago'
-        pagamento.data_pagamento = date.today()
+        pagamento.data_pagamento = periodos.hoje()
         pagamento.metodo_pagamento = metodo_pagamento
         db.session.commit()
     
@@ -309,62 +641,622 @@ def deletar_pagamento(pagamento_id):
     
     return {"success": True}
 
+# ==================== RESUMO FINANCEIRO DOS CLIENTES ====================
+
+CAMPOS_RESUMO = ('saldo_aberto', 'qtd_pendentes', 'vencimento_mais_antigo', 'ultimo_pagamento')
+
+def _subconsultas_resumo():
+    """
+    Subconsultas correlacionadas que calculam o resumo financeiro
+    de cada cliente a partir da tabela de pagamentos
+    """
+    clientes = Cliente.__table__
+    pagamentos = Pagamento.__table__
+    # A academia entra na correlação para o banco usar o índice
+    # academia + cliente + status (o cliente já define a academia)
+    do_cliente = db.and_(
+        pagamentos.c.academia_id == clientes.c.academia_id,
+        pagamentos.c.cliente_id == clientes.c.id
+    )
+    pendentes = db.and_(do_cliente, pagamentos.c.status == 'pendente')
+    
+    # Datas com min/max de um CASE sobre todos os pagamentos do cliente:
+    # com min/max direto na coluna, o SQLite sem estatísticas prefere o
+    # índice status + data e percorre os pagamentos de todos os clientes
+    def data_do_status(status, coluna):
+        return db.case((pagamentos.c.status == status, coluna))
+    
+    return {
+        'saldo_aberto': db.select(db.func.coalesce(db.func.sum(pagamentos.c.valor), 0))
+            .where(pendentes).scalar_subquery(),
+        'qtd_pendentes': db.select(db.func.count(pagamentos.c.id))
+            .where(pendentes).scalar_subquery(),
+        'vencimento_mais_antigo': db.select(db.func.min(data_do_status('pendente', pagamentos.c.vencimento)))
+            .where(do_cliente).scalar_subquery(),
+        'ultimo_pagamento': db.select(db.func.max(data_do_status('pago', pagamentos.c.data_pagamento)))
+            .where(do_cliente).scalar_subquery()
+    }
+
+def atualizar_resumo_clientes(cliente_ids, sessao=None):
+    """
+    Recalcula o resumo financeiro dos clientes informados em um único UPDATE
+    Chamado automaticamente a cada flush que altera pagamentos (com a
+    sessão do flush; sem ela, na sessão atual, ver reservar_sequencia)
+    """
+    cliente_ids = [cid for cid in cliente_ids if cid is not None]
+    if not cliente_ids:
+        return
+    
+    conexao = (sessao or db.session).connection()
+    clientes = Cliente.__table__
+    
+    # O resumo mudou: cada cliente ganha nova posição na sequência de alterações
+    cliente_ids = sorted(set(cliente_ids))
+    inicio = reservar_sequencia(conexao, len(cliente_ids), sessao)
+    seq = db.case(
+        {cid: inicio + i for i, cid in enumerate(cliente_ids)},
+        value=clientes.c.id
+    )
+    
+    conexao.execute(
+        clientes.update()
+        .where(clientes.c.id.in_(cliente_ids))
+        .values(seq_alteracao=seq, **_subconsultas_resumo())
+    )
+
+@event.listens_for(Session, 'before_flush')
+def _coletar_clientes_afetados(session, flush_context, instances):
+    """
+    Guarda os pagamentos alterados neste flush (e o cliente anterior,
+    caso o pagamento tenha trocado de cliente) para atualizar o resumo
+    """
+    pagamentos = session.info.setdefault('resumo_pagamentos', set())
+    clientes_anteriores = session.info.setdefault('resumo_clientes', set())
+    
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, Pagamento):
+            continue
+        pagamentos.add(obj)
+        historico_cliente = db.inspect(obj).attrs.cliente_id.history
+        clientes_anteriores.update(historico_cliente.deleted)
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _atualizar_resumo_apos_flush(session, flush_context):
+    """
+    Atualiza o resumo dos clientes afetados na mesma transação do flush
+    """
+    pagamentos = session.info.pop('resumo_pagamentos', set())
+    cliente_ids = session.info.pop('resumo_clientes', set())
+    cliente_ids.update(p.cliente_id for p in pagamentos)
+    cliente_ids.discard(None)
+    if not cliente_ids:
+        return
+    
+    atualizar_resumo_clientes(cliente_ids, session)
+    
+    # Descarta os valores antigos dos clientes já carregados na sessão
+    for cliente_id in cliente_ids:
+        cliente = session.identity_map.get(session.identity_key(Cliente, cliente_id))
+        if cliente is not None:
+            session.expire(cliente, CAMPOS_RESUMO + ('seq_alteracao',))
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _limpar_resumo_pendente(session, previous_transaction):
+    session.info.pop('resumo_pagamentos', None)
+    session.info.pop('resumo_clientes', None)
+
+def verificar_resumo_clientes(reparar=False):
+    """
+    Compara o resumo gravado em cada cliente com o valor calculado
+    a partir dos pagamentos. Com reparar=True corrige as divergências
+    """
+    clientes = Cliente.__table__
+    calculado = _subconsultas_resumo()
+    
+    linhas = db.session.execute(
+        db.select(
+            clientes.c.id,
+            clientes.c.saldo_aberto,
+            clientes.c.qtd_pendentes,
+            clientes.c.vencimento_mais_antigo,
+            clientes.c.ultimo_pagamento,
+            *[sub.label(f'calc_{nome}') for nome, sub in calculado.items()]
+        )
+    ).all()
+    
+    divergentes = [
+        row.id for row in linhas
+        if abs((row.saldo_aberto or 0) - float(row.calc_saldo_aberto or 0)) > 0.005
+        or (row.qtd_pendentes or 0) != (row.calc_qtd_pendentes or 0)
+        or row.vencimento_mais_antigo != row.calc_vencimento_mais_antigo
+        or row.ultimo_pagamento != row.calc_ultimo_pagamento
+    ]
+    
+    if reparar and divergentes:
+        atualizar_resumo_clientes(divergentes)
+        db.session.commit()
+    
+    return {
+        "success": True,
+        "clientes_verificados": len(linhas),
+        "divergentes": divergentes,
+        "reparados": len(divergentes) if reparar else 0
+    }
+
+def consulta_limite_pendentes(cliente_id=None):
+    """
+    Vencimento mais antigo entre os pagamentos pendentes (de um cliente
+    ou de todos), lido dos próprios pagamentos: o primeiro item do índice
+    academia + status + vencimento (ou academia + cliente + status)
+    """
+    query = db.select(db.func.min(Pagamento.vencimento)).where(Pagamento.status == 'pendente')
+    if cliente_id:
+        query = query.where(Pagamento.cliente_id == cliente_id)
+    return query
+
+def pagamentos_particionados(sessao):
+    """
+    Indica se a tabela pagamentos do banco da sessão é particionada
+    (só então as listagens de pendentes calculam o limite de vencimento)
+    """
+    return particionamento.particionada(sessao.get_bind(mapper=Pagamento.__mapper__), 'pagamentos')
+
+def limite_vencimento_pendentes(cliente_id=None):
+    """
+    Executa consulta_limite_pendentes na sessão atual, se os pagamentos
+    forem particionados (senão None: a consulta extra não ajudaria)
+    """
+    if not pagamentos_particionados(db.session):
+        return None
+    return db.session.scalar(consulta_limite_pendentes(cliente_id))
+
+def filtrar_vencimento_pendentes(query, limite):
+    """
+    Acrescenta 'vencimento >= <pendência mais antiga>' a uma consulta de
+    pagamentos pendentes (limite: ver limite_vencimento_pendentes).
+    O resultado é o mesmo, mas com o valor constante na coluna de partição
+    o PostgreSQL descarta as partições (anos) sem pendências em vez de
+    visitá-las
+    """
+    if limite is None:
+        return query
+    return query.where(Pagamento.vencimento >= limite)
+
+# ==================== SEPARAÇÃO POR ACADEMIA ====================
+
+@event.listens_for(Session, 'do_orm_execute')
+def _filtrar_academia(estado):
+    """
+    Restringe toda consulta ORM (inclusive JOINs, subconsultas, carga de
+    relacionamentos e UPDATE/DELETE em massa) aos registros da academia atual
+    """
+    academia_id = academias.academia_atual()
+    if academia_id is None or estado.is_column_load:
+        return
+    
+    if estado.is_select or estado.is_update or estado.is_delete:
+        estado.statement = estado.statement.options(db.with_loader_criteria(
+            PorAcademia,
+            lambda cls: cls.academia_id == academia_id,
+            include_aliases=True
+        ))
+
+@event.listens_for(Session, 'before_flush')
+def _gravar_academia(session, flush_context, instances):
+    """
+    Registros novos pertencem à academia atual, qualquer que seja o
+    valor informado
+    """
+    academia_id = academias.academia_atual()
+    if academia_id is None:
+        return
+    
+    for obj in session.new:
+        if isinstance(obj, PorAcademia):
+            obj.academia_id = academia_id
+
+def iniciar_academias():
+    """
+    Cria a academia padrão (dona dos dados anteriores à separação) e as
+    tabelas nos bancos próprios configurados em ACADEMIAS_BANCOS
+    """
+    if db.session.get(Academia, academias.PADRAO) is None:
+        db.session.add(Academia(id=academias.PADRAO, nome='Academia principal', slug='principal'))
+        db.session.commit()
+    
+    for banco in academias.BANCOS:
+        db.metadata.create_all(db.engines[academias.nome_bind(banco)])
+        with academias.academia(None, banco):
+            iniciar_sequencias()
+
+def criar_academia(nome, slug, banco=None, admin_email=None, admin_senha=None):
+    """
+    Cadastra uma academia e, opcionalmente, o primeiro administrador dela
+    banco: chave em ACADEMIAS_BANCOS para usar um banco próprio
+    """
+    if banco and banco not in academias.BANCOS:
+        return {"success": False, "error": f"Banco não configurado em ACADEMIAS_BANCOS: {banco}"}
+    
+    if Academia.query.filter_by(slug=slug).first():
+        return {"success": False, "error": "Academia já cadastrada"}
+    
+    # O email é único no banco da academia, qualquer que seja a academia
+    if admin_email:
+        with academias.academia(None, banco):
+            if db.session.scalar(db.select(Usuario.id).where(Usuario.email == admin_email).limit(1)):
+                return {"success": False, "error": "Email já cadastrado"}
+    
+    academia = Academia(nome=nome, slug=slug, banco=banco)
+    db.session.add(academia)
+    db.session.commit()
+    
+    if admin_email:
+        with academias.academia(academia.id, banco):
+            admin = Usuario(nome='Administrador', email=admin_email, tipo='admin', ativo=True)
+            admin.set_senha(admin_senha)
+            db.session.add(admin)
+            db.session.commit()
+    
+    return {"success": True, "id": academia.id}
+
+def buscar_academia(slug):
+    """
+    Academia ativa pelo identificador usado no login (ou None)
+    """
+    return Academia.query.filter_by(slug=slug, ativa=True).first()
+
+# ==================== CONTROLE DE ALTERAÇÕES ====================
+
+# Modelos acompanhados pela sincronização incremental (GET /api/sync)
+MODELOS_SINCRONIZADOS = {'clientes': Cliente, 'pagamentos': Pagamento, 'usuarios': Usuario}
+
+# Reserva sem confirmação há mais tempo que isto (s) é de uma transação
+# abandonada (processo encerrado no meio) e deixa de segurar a leitura;
+# a transação que chega à metade desse tempo sem confirmar é recusada
+EXPIRACAO_RESERVA = int(os.environ.get('SEQUENCIA_EXPIRACAO_RESERVA', 600))
+
+_motores_reserva = {}
+_motores_reserva_lock = threading.Lock()
+
+def _motor_reserva(engine):
+    """
+    Engine com pool próprio (mesmas configurações de conexão) para as
+    transações curtas de reserva: quem reserva já ocupa uma conexão do
+    pool principal e não pode esperar por outra dele
+    """
+    with _motores_reserva_lock:
+        motor = _motores_reserva.get(engine)
+        if motor is None:
+            motor = _motores_reserva[engine] = create_engine(engine.url, pool=engine.pool.recreate())
+        return motor
+
+def reservar_sequencia(conexao, quantidade=1, sessao=None):
+    """
+    Reserva 'quantidade' valores consecutivos da sequência de alterações
+    e retorna o primeiro
+    Com a sessão, o número é tirado em uma transação curta e separada
+    (a linha do contador não fica presa até o commit, e as escritas das
+    academias não esperam umas pelas outras); a reserva fica registrada
+    até a transação da sessão confirmar, e os leitores não passam dela
+    (consulta_alteracoes_confirmadas). Sem a sessão, ou no SQLite (que já
+    faz uma escrita por vez), o contador fica bloqueado até o fim da
+    transação da conexão
+    """
+    sequencias = Sequencia.__table__
+    incremento = sequencias.update()\
+        .where(sequencias.c.nome == 'alteracoes')\
+        .values(valor=sequencias.c.valor + quantidade)
+    leitura = db.select(sequencias.c.valor).where(sequencias.c.nome == 'alteracoes')
+    
+    if sessao is None or conexao.dialect.name == 'sqlite':
+        conexao.execute(incremento)
+        return conexao.execute(leitura).scalar_one() - quantidade + 1
+    
+    with _motor_reserva(conexao.engine).begin() as curta:
+        curta.execute(incremento)
+        inicio = curta.execute(leitura).scalar_one() - quantidade + 1
+        curta.execute(db.insert(ReservaSequencia.__table__).values(inicio=inicio, data_reserva=datetime.utcnow()))
+    
+    # A reserva sai na mesma transação dos dados: some quando eles aparecem
+    reservas = ReservaSequencia.__table__
+    conexao.execute(reservas.delete().where(reservas.c.inicio == inicio))
+    sessao.info.setdefault('reservas_sequencia', []).append((conexao.engine, inicio, time.monotonic()))
+    return inicio
+
+def consulta_alteracoes_confirmadas():
+    """
+    Última posição da sequência de alterações sem nenhuma anterior por
+    confirmar: a véspera da reserva pendente mais antiga ou, sem reservas,
+    o contador. Tudo até ela já está visível (ou foi desfeito)
+    """
+    pendente = db.select(db.func.min(ReservaSequencia.inicio) - 1)\
+        .where(ReservaSequencia.data_reserva > datetime.utcnow() - timedelta(seconds=EXPIRACAO_RESERVA))\
+        .scalar_subquery()
+    return db.select(db.func.coalesce(pendente, Sequencia.valor)).where(Sequencia.nome == 'alteracoes')
+
+def _conferir_reservas(session):
+    """
+    Recusa confirmar uma transação cuja reserva está perto de expirar:
+    os leitores já podem ter passado dela
+    """
+    limite = time.monotonic() - EXPIRACAO_RESERVA / 2
+    if any(instante < limite for _, _, instante in session.info.get('reservas_sequencia', ())):
+        raise RuntimeError("Transação aberta por tempo demais para a sequência de alterações; refaça a operação")
+
+@event.listens_for(Session, 'before_commit')
+def _conferir_reservas_antes_do_commit(session):
+    _conferir_reservas(session)
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _conferir_reservas_apos_flush(session, flush_context):
+    # O flush final do commit acontece depois do before_commit
+    _conferir_reservas(session)
+
+@event.listens_for(Session, 'after_commit')
+def _encerrar_reservas(session):
+    session.info.pop('reservas_sequencia', None)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _liberar_reservas(session, previous_transaction):
+    """
+    Transação desfeita: apaga as reservas dela em uma transação curta,
+    para os leitores não esperarem a expiração
+    """
+    if previous_transaction.nested:
+        return
+    reservas = session.info.pop('reservas_sequencia', None)
+    if not reservas:
+        return
+    
+    tabela = ReservaSequencia.__table__
+    try:
+        for engine, inicio, _ in reservas:
+            with _motor_reserva(engine).begin() as curta:
+                curta.execute(tabela.delete().where(tabela.c.inicio == inicio))
+    except Exception as e:
+        print(f"Erro ao liberar reservas da sequência: {e}")
+
+@event.listens_for(Session, 'before_flush')
+def _numerar_alteracoes(session, flush_context, instances):
+    """
+    Dá a cada cliente/pagamento/usuário criado ou alterado neste flush
+    uma nova posição na sequência, e registra as exclusões definitivas
+    """
+    modelos = tuple(MODELOS_SINCRONIZADOS.values())
+    alterados = [
+        obj for obj in chain(session.new, session.dirty)
+        if isinstance(obj, modelos) and obj not in session.deleted
+        and (obj in session.new or session.is_modified(obj))
+    ]
+    excluidos = [obj for obj in session.deleted if isinstance(obj, modelos)]
+    if not alterados and not excluidos:
+        return
+    
+    seq = reservar_sequencia(session.connection(), len(alterados) + len(excluidos), session)
+    for obj in alterados:
+        obj.seq_alteracao = seq
+        seq += 1
+    for obj in excluidos:
+        session.add(Exclusao(
+            tabela=obj.__tablename__,
+            registro_id=obj.id,
+            seq_alteracao=seq,
+            academia_id=obj.academia_id
+        ))
+        seq += 1
+
+def iniciar_sequencias():
+    """
+    Cria os contadores que ainda não existem e numera os registros sem
+    posição na sequência (bancos anteriores ao controle de alterações)
+    Retorna quantos registros foram numerados
+    """
+    for nome in ('alteracoes', 'exclusoes_removidas_ate'):
+        if db.session.get(Sequencia, nome) is None:
+            db.session.add(Sequencia(nome=nome, valor=0))
+    db.session.flush()
+    
+    numerados = 0
+    conexao = db.session.connection()
+    for modelo in MODELOS_SINCRONIZADOS.values():
+        tabela = modelo.__table__
+        sem_numero = tabela.c.seq_alteracao == 0
+        menor, maior, quantidade = conexao.execute(
+            db.select(db.func.min(tabela.c.id), db.func.max(tabela.c.id), db.func.count())
+            .where(sem_numero)
+        ).one()
+        if not quantidade:
+            continue
+        
+        # Um valor por id do intervalo (com buracos onde não há registro)
+        deslocamento = reservar_sequencia(conexao, maior - menor + 1) - menor
+        conexao.execute(
+            tabela.update().where(sem_numero).values(seq_alteracao=tabela.c.id + deslocamento)
+        )
+        numerados += quantidade
+    
+    db.session.commit()
+    return numerados
+
+# ==================== CAIXA DE SAÍDA (OUTBOX) ====================
+
+# Nome de cada modelo nos tipos de evento ('pagamento_pago', 'cliente_criado')
+ENTIDADES_EVENTOS = {Pagamento: 'pagamento', Cliente: 'cliente', Usuario: 'usuario'}
+
+# Colunas fora dos eventos: a senha, a posição na sequência e os campos
+# derivados (o resumo vem dos pagamentos, que têm os próprios eventos;
+# o último acesso muda a cada login)
+COLUNAS_FORA_DOS_EVENTOS = {'senha_hash', 'seq_alteracao', 'ultimo_acesso'} | set(CAMPOS_RESUMO)
+
+def _novo_valor(obj, campo):
+    return list(db.inspect(obj).attrs[campo].history.added)
+
+def campos_alterados(obj):
+    """
+    Colunas alteradas de um registro no flush em andamento (sem as
+    colunas fora dos eventos)
+    """
+    estado = db.inspect(obj)
+    return [
+        coluna.key for coluna in estado.mapper.column_attrs
+        if coluna.key not in COLUNAS_FORA_DOS_EVENTOS and estado.attrs[coluna.key].history.has_changes()
+    ]
+
+def tipo_alteracao(obj, novos, excluidos):
+    """
+    Tipo do evento de um cliente/pagamento/usuário no flush em andamento,
+    ou None se nada que interessa mudou. Deve ser chamada no before_flush,
+    enquanto o histórico dos campos existe (novos/excluidos: session.new
+    e session.deleted)
+    """
+    entidade = ENTIDADES_EVENTOS.get(type(obj))
+    if entidade is None:
+        return None
+    if obj in novos:
+        return f'{entidade}_criado'
+    if obj in excluidos:
+        return f'{entidade}_excluido'
+    if not campos_alterados(obj):
+        return None
+    
+    if hasattr(obj, 'ativo') and _novo_valor(obj, 'ativo') == [False]:
+        return f'{entidade}_desativado'
+    if isinstance(obj, Pagamento) and _novo_valor(obj, 'status') in (['pago'], ['cancelado']):
+        return f'pagamento_{obj.status}'
+    return f'{entidade}_alterado'
+
+def _valor_evento(valor):
+    return valor.isoformat() if hasattr(valor, 'isoformat') else valor
+
+@event.listens_for(Session, 'before_flush')
+def _coletar_eventos_saida(session, flush_context, instances):
+    """
+    Anota o tipo, as colunas alteradas e a posição na sequência de cada
+    cliente/pagamento/usuário deste flush (o registro é lido depois,
+    quando os novos já têm id). Registrado depois de _numerar_alteracoes:
+    os alterados já têm seq_alteracao e os excluídos, o registro de exclusão
+    """
+    pendentes = session.info.setdefault('saida_pendentes', [])
+    # session.new/deleted montam um conjunto novo a cada acesso
+    novos, excluidos = session.new, session.deleted
+    seq_exclusoes = {
+        (obj.tabela, obj.registro_id): obj.seq_alteracao
+        for obj in novos if isinstance(obj, Exclusao)
+    }
+    
+    for obj in chain(novos, session.dirty, excluidos):
+        tipo = tipo_alteracao(obj, novos, excluidos)
+        if not tipo:
+            continue
+        if obj in excluidos:
+            pendentes.append((obj, tipo, [], seq_exclusoes[(obj.__tablename__, obj.id)]))
+        else:
+            campos = [] if obj in novos else campos_alterados(obj)
+            pendentes.append((obj, tipo, campos, obj.seq_alteracao))
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _gravar_eventos_saida(session, flush_context):
+    """
+    Grava os eventos do flush na caixa de saída, na mesma transação
+    """
+    pendentes = session.info.pop('saida_pendentes', [])
+    if not pendentes:
+        return
+    
+    linhas = []
+    for obj, tipo, campos, seq in pendentes:
+        # Valores já carregados (sem consultas; os excluídos também)
+        estado = db.inspect(obj)
+        registro = {
+            coluna.key: _valor_evento(estado.dict.get(coluna.key))
+            for coluna in estado.mapper.column_attrs
+            if coluna.key not in COLUNAS_FORA_DOS_EVENTOS
+        }
+        linhas.append({
+            'seq': seq,
+            'academia_id': obj.academia_id,
+            'tipo': tipo,
+            'tabela': obj.__tablename__,
+            'registro_id': obj.id,
+            'dados': json.dumps({'registro': registro, 'campos': campos}, ensure_ascii=False),
+            'data_criacao': datetime.utcnow()
+        })
+    
+    session.connection().execute(db.insert(EventoSaida.__table__), linhas)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar_eventos_saida(session, previous_transaction):
+    session.info.pop('saida_pendentes', None)
+
 # ==================== RELATÓRIOS E DASHBOARD ====================
 
-def obter_estatisticas():
+def consulta_total_clientes():
     """
-    Obtém estatísticas gerais do sistema
+    Total de clientes ativos
     """
-    # Total de clientes ativos
-    total_clientes = Cliente.query.filter_by(ativo=True).count()
+    return db.select(db.func.count(Cliente.id)).where(Cliente.ativo == True)
+
+def consulta_estatisticas(incluir_clientes=True, periodo=None):
+    """
+    Monta a consulta de obter_estatisticas: os totais de pagamentos são
+    agregações condicionais (CASE) sobre uma só varredura da tabela
+    incluir_clientes: acrescenta o total de clientes como subconsulta
+    escalar na mesma instrução
+    periodo: Periodo dos valores recebidos (padrão: mês atual)
+    """
+    periodo = periodo or Periodo.mes()
     
-    # Pagamentos pendentes
-    pagamentos_pendentes = Pagamento.query.filter_by(status='pendente').count()
+    pendente = Pagamento.status == 'pendente'
+    vencido = db.and_(pendente, Pagamento.vencimento < periodos.hoje())
+    pago_no_mes = db.and_(
+        Pagamento.status == 'pago',
+        periodo.filtro(Pagamento.data_pagamento)
+    )
     
-    # Valor total em aberto
-    valor_em_aberto_result = db.session.query(db.func.sum(Pagamento.valor))\
-        .filter(Pagamento.status == 'pendente').first()
-    valor_em_aberto = valor_em_aberto_result[0] or 0
+    colunas = [
+        db.func.count(db.case((pendente, Pagamento.id))).label('pagamentos_pendentes'),
+        db.func.sum(db.case((pendente, Pagamento.valor), else_=0)).label('valor_em_aberto'),
+        db.func.count(db.case((vencido, Pagamento.id))).label('pagamentos_vencidos'),
+        db.func.sum(db.case((pago_no_mes, Pagamento.valor), else_=0)).label('valor_recebido_mes'),
+        db.func.count(db.distinct(db.case((pago_no_mes, Pagamento.cliente_id)))).label('clientes_pagaram_mes')
+    ]
     
-    # Pagamentos vencidos (data de vencimento já passou)
-    pagamentos_vencidos = Pagamento.query.filter(
-        Pagamento.status == 'pendente',
-        Pagamento.vencimento < date.today()
-    ).count()
-    
-    # Valor recebido no mês atual
-    mes_atual = datetime.now().strftime('%Y-%m')
-    valor_recebido_mes_result = db.session.query(db.func.sum(Pagamento.valor))\
-        .filter(
-            Pagamento.status == 'pago',
-            db.func.to_char(Pagamento.data_pagamento, 'YYYY-MM') == mes_atual
-        ).first()
-    valor_recebido_mes = valor_recebido_mes_result[0] or 0
-    
-    # Clientes que pagaram este mês
-    clientes_pagaram_mes = db.session.query(db.func.count(db.func.distinct(Pagamento.cliente_id)))\
-        .filter(
-            Pagamento.status == 'pago',
-            db.func.to_char(Pagamento.data_pagamento, 'YYYY-MM') == mes_atual
-        ).first()[0] or 0
+    if incluir_clientes:
+        colunas.insert(0, consulta_total_clientes().scalar_subquery().label('total_clientes'))
     
+    return db.select(*colunas).select_from(Pagamento)
+
+def estatisticas_para_dict(resultado, total_clientes):
+    """
+    Converte o resultado de consulta_estatisticas para dicionário
+    """
     return {
-        "total_clientes": total_clientes,
-        "pagamentos_pendentes": pagamentos_pendentes,
-        "valor_em_aberto": float(valor_em_aberto),
-        "pagamentos_vencidos": pagamentos_vencidos,
-        "valor_recebido_mes": float(valor_recebido_mes),
-        "clientes_pagaram_mes": clientes_pagaram_mes
+        "total_clientes": total_clientes or 0,
+        "pagamentos_pendentes": resultado.pagamentos_pendentes or 0,
+        "valor_em_aberto": float(resultado.valor_em_aberto or 0),
+        "pagamentos_vencidos": resultado.pagamentos_vencidos or 0,
+        "valor_recebido_mes": float(resultado.valor_recebido_mes or 0),
+        "clientes_pagaram_mes": resultado.clientes_pagaram_mes or 0
     }
 
-def obter_inadimplentes():
+@somente_leitura
+def obter_estatisticas(periodo=None):
     """
-    Lista clientes com pagamentos vencidos
+    Obtém estatísticas gerais do sistema
+    Todas as métricas saem de uma única consulta
+    periodo: Periodo dos valores recebidos (padrão: mês atual)
     """
-    data_hoje = date.today()
+    resultado = db.session.execute(consulta_estatisticas(periodo=periodo)).one()
     
-    # Subquery para clientes inadimplentes
-    inadimplentes = db.session.query(
+    return estatisticas_para_dict(resultado, resultado.total_clientes)
+
+def consulta_inadimplentes(limite_pendentes=None, limite=None):
+    """
+    Monta a consulta de obter_inadimplentes
+    limite_pendentes: ver filtrar_vencimento_pendentes
+    limite: só os 'limite' clientes com o vencimento mais antigo
+    """
+    query = db.select(
         Cliente.id,
         Cliente.nome,
         Cliente.telefone,
@@ -372,12 +1264,19 @@ def obter_inadimplentes():
         db.func.count(Pagamento.id).label('qtd_pendencias'),
         db.func.sum(Pagamento.valor).label('valor_total'),
         db.func.min(Pagamento.vencimento).label('vencimento_mais_antigo')
-    ).join(Pagamento).filter(
+    ).join(Pagamento).where(
         Pagamento.status == 'pendente',
-        Pagamento.vencimento < data_hoje
-    ).group_by(Cliente.id).order_by('vencimento_mais_antigo').all()
+        Pagamento.vencimento < periodos.hoje()
+    )
     
-    return [{
+    return filtrar_vencimento_pendentes(query, limite_pendentes)\
+        .group_by(Cliente.id).order_by('vencimento_mais_antigo', Cliente.id).limit(limite)
+
+def devedor_para_dict(row):
+    """
+    Converte uma linha de inadimplente/devedor para dicionário
+    """
+    return {
         'id': row.id,
         'nome': row.nome,
         'telefone': row.telefone,
@@ -385,31 +1284,85 @@ def obter_inadimplentes():
         'qtd_pendencias': row.qtd_pendencias,
         'valor_total': float(row.valor_total) if row.valor_total else 0,
         'vencimento_mais_antigo': row.vencimento_mais_antigo.isoformat() if row.vencimento_mais_antigo else None
-    } for row in inadimplentes]
+    }
 
-def obter_clientes_pagaram_mes():
+@somente_leitura
+def obter_inadimplentes(limite=None):
     """
-    Lista clientes que pagaram no mês atual
+    Lista clientes com pagamentos vencidos, do vencimento mais antigo ao
+    mais recente (limite: só os primeiros)
     """
-    mes_atual = datetime.now().strftime('%Y-%m')
+    consulta = consulta_inadimplentes(limite_vencimento_pendentes(), limite)
     
-    clientes = db.session.query(
+    return [devedor_para_dict(row) for row in db.session.execute(consulta)]
+
+def consulta_pagaram_mes(periodo=None):
+    """
+    Monta a consulta de obter_clientes_pagaram_mes
+    periodo: Periodo da data de pagamento (padrão: mês atual)
+    """
+    periodo = periodo or Periodo.mes()
+    
+    return db.select(
         Cliente.id,
         Cliente.nome,
         Cliente.telefone,
         db.func.count(Pagamento.id).label('qtd_pagamentos'),
         db.func.sum(Pagamento.valor).label('valor_total'),
         db.func.max(Pagamento.data_pagamento).label('ultimo_pagamento')
-    ).join(Pagamento).filter(
+    ).join(Pagamento).where(
         Pagamento.status == 'pago',
-        db.func.to_char(Pagamento.data_pagamento, 'YYYY-MM') == mes_atual
-    ).group_by(Cliente.id).order_by(Cliente.nome).all()
-    
-    return [{
+        periodo.filtro(Pagamento.data_pagamento)
+    ).group_by(Cliente.id).order_by(Cliente.nome)
+
+def pagou_mes_para_dict(row):
+    """
+    Converte uma linha de consulta_pagaram_mes para dicionário
+    """
+    return {
         'id': row.id,
         'nome': row.nome,
         'telefone': row.telefone,
         'qtd_pagamentos': row.qtd_pagamentos,
         'valor_total': float(row.valor_total) if row.valor_total else 0,
         'ultimo_pagamento': row.ultimo_pagamento.isoformat() if row.ultimo_pagamento else None
-    } for row in clientes]
\ No newline at end of file
+    }
+
+@somente_leitura
+def obter_clientes_pagaram_mes(periodo=None):
+    """
+    Lista clientes que pagaram no período (padrão: mês atual)
+    """
+    return [pagou_mes_para_dict(row) for row in db.session.execute(consulta_pagaram_mes(periodo))]
+
+def consulta_maiores_devedores(limite=10, somente_vencidos=False):
+    """
+    Monta a consulta de obter_maiores_devedores
+    Usa o resumo mantido em clientes (índice ativo + saldo_aberto)
+    """
+    query = db.select(
+        Cliente.id,
+        Cliente.nome,
+        Cliente.telefone,
+        Cliente.email,
+        Cliente.qtd_pendentes.label('qtd_pendencias'),
+        Cliente.saldo_aberto.label('valor_total'),
+        Cliente.vencimento_mais_antigo
+    ).where(
+        Cliente.ativo == True,
+        Cliente.saldo_aberto > 0
+    )
+    
+    if somente_vencidos:
+        query = query.where(Cliente.vencimento_mais_antigo < periodos.hoje())
+    
+    return query.order_by(Cliente.saldo_aberto.desc()).limit(limite)
+
+@somente_leitura
+def obter_maiores_devedores(limite=10, somente_vencidos=False):
+    """
+    Lista os clientes com maior saldo em aberto
+    """
+    consulta = consulta_maiores_devedores(limite, somente_vencidos)
+    
+    return [devedor_para_dict(row) for row in db.session.execute(consulta)]
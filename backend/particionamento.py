@@ -0,0 +1,310 @@
+"""
+Particionamento - Particionamento declarativo por intervalo de datas (PostgreSQL)
+Converte tabelas existentes em tabelas particionadas sem parar o sistema,
+cria partições futuras e remove partições antigas
+Em outros bancos as tabelas continuam comuns e as funções apenas informam isso
+"""
+
+from database import db
+from datetime import date, datetime
+import re
+import time
+
+LOTE_COPIA = 5000
+
+# Segundos em que o resultado de particionada() vale sem nova consulta
+VALIDADE_VERIFICACAO = 300
+
+# (url do banco, tabela) -> (particionada, instante da verificação)
+_verificadas = {}
+
+# ==================== PERÍODOS ====================
+
+def inicio_periodo(dia, granularidade):
+    """
+    Primeiro dia do mês ('mes') ou do ano ('ano') que contém a data
+    """
+    if isinstance(dia, datetime):
+        dia = dia.date()
+    if granularidade == 'ano':
+        return date(dia.year, 1, 1)
+    return date(dia.year, dia.month, 1)
+
+def proximo_periodo(inicio, granularidade, quantidade=1):
+    """
+    Início do período seguinte (ou 'quantidade' períodos à frente / atrás)
+    """
+    if granularidade == 'ano':
+        return date(inicio.year + quantidade, 1, 1)
+    meses = inicio.year * 12 + inicio.month - 1 + quantidade
+    return date(meses // 12, meses % 12 + 1, 1)
+
+def nome_particao(tabela, inicio, granularidade):
+    """
+    historico_p2024_05 (mensal) ou pagamentos_p2024 (anual)
+    """
+    sufixo = inicio.strftime('%Y') if granularidade == 'ano' else inicio.strftime('%Y_%m')
+    return f'{tabela}_p{sufixo}'
+
+# ==================== CONSULTA DE PARTIÇÕES ====================
+
+def eh_postgresql(conexao):
+    return conexao.dialect.name == 'postgresql'
+
+def tabela_particionada(conexao, tabela):
+    """
+    Indica se a tabela já é particionada (sempre False fora do PostgreSQL)
+    """
+    if not eh_postgresql(conexao):
+        return False
+    
+    return bool(conexao.execute(
+        db.text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:tabela))"),
+        {'tabela': tabela}
+    ).scalar())
+
+def particionada(engine, tabela):
+    """
+    tabela_particionada com o resultado guardado por VALIDADE_VERIFICACAO
+    segundos (para as consultas das rotas, que não podem pagar uma ida ao
+    catálogo a cada requisição). Fora do PostgreSQL não consulta nada
+    """
+    if engine.dialect.name != 'postgresql':
+        return False
+    
+    chave = (str(engine.url), tabela)
+    guardado = _verificadas.get(chave)
+    if guardado is None or time.monotonic() - guardado[1] > VALIDADE_VERIFICACAO:
+        with engine.connect() as conexao:
+            guardado = (tabela_particionada(conexao, tabela), time.monotonic())
+        _verificadas[chave] = guardado
+    return guardado[0]
+
+def listar_particoes(conexao, tabela):
+    """
+    Lista as partições da tabela com seus limites [inicio, fim)
+    A partição DEFAULT aparece com inicio e fim None
+    """
+    if not tabela_particionada(conexao, tabela):
+        return []
+    
+    linhas = conexao.execute(db.text("""
+        SELECT c.relname AS nome, pg_get_expr(c.relpartbound, c.oid) AS limites
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:tabela)
+        ORDER BY c.relname
+    """), {'tabela': tabela}).all()
+    
+    particoes = []
+    for linha in linhas:
+        datas = re.findall(r"'(\d{4}-\d{2}-\d{2})", linha.limites)
+        particoes.append({
+            'nome': linha.nome,
+            'inicio': date.fromisoformat(datas[0]) if len(datas) == 2 else None,
+            'fim': date.fromisoformat(datas[1]) if len(datas) == 2 else None
+        })
+    
+    return particoes
+
+# ==================== CRIAÇÃO E REMOÇÃO ====================
+
+def criar_particoes(conexao, tabela, coluna, inicio, fim, granularidade, base=None):
+    """
+    Cria as partições que faltam para cobrir [inicio, fim)
+    Linhas que estavam na partição DEFAULT para esse intervalo são movidas
+    para a nova partição. Retorna os nomes das partições criadas
+    base: nome usado nas partições, quando diferente do nome atual da tabela
+    """
+    base = base or tabela
+    existentes = {p['nome']: p for p in listar_particoes(conexao, tabela)}
+    padrao = f'{base}_padrao'
+    criadas = []
+    
+    periodo = inicio_periodo(inicio, granularidade)
+    while periodo < fim:
+        seguinte = proximo_periodo(periodo, granularidade)
+        nome = nome_particao(base, periodo, granularidade)
+        
+        if nome not in existentes:
+            limites = f"FOR VALUES FROM ('{periodo.isoformat()}') TO ('{seguinte.isoformat()}')"
+            
+            if padrao in existentes:
+                # Não é possível criar a partição enquanto a DEFAULT tiver linhas do
+                # intervalo: cria a tabela solta, move as linhas e anexa
+                conexao.execute(db.text(
+                    f'CREATE TABLE {nome} (LIKE {tabela} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+                ))
+                conexao.execute(db.text(f"""
+                    WITH movidas AS (
+                        DELETE FROM {padrao}
+                        WHERE {coluna} >= :inicio AND {coluna} < :fim
+                        RETURNING *
+                    )
+                    INSERT INTO {nome} SELECT * FROM movidas
+                """), {'inicio': periodo, 'fim': seguinte})
+                conexao.execute(db.text(f'ALTER TABLE {tabela} ATTACH PARTITION {nome} {limites}'))
+            else:
+                conexao.execute(db.text(f'CREATE TABLE {nome} PARTITION OF {tabela} {limites}'))
+            
+            criadas.append(nome)
+        
+        periodo = seguinte
+    
+    return criadas
+
+def criar_particoes_futuras(tabela, coluna, granularidade, quantidade=3):
+    """
+    Garante partições do período atual até 'quantidade' períodos à frente
+    """
+    with db.engine.begin() as conexao:
+        if not tabela_particionada(conexao, tabela):
+            return []
+        
+        inicio = inicio_periodo(date.today(), granularidade)
+        fim = proximo_periodo(inicio, granularidade, quantidade + 1)
+        return criar_particoes(conexao, tabela, coluna, inicio, fim, granularidade)
+
+def remover_particao(conexao, tabela, nome):
+    """
+    Desanexa e apaga uma partição inteira (operação instantânea,
+    ao contrário de um DELETE linha a linha)
+    """
+    conexao.execute(db.text(f'ALTER TABLE {tabela} DETACH PARTITION {nome}'))
+    conexao.execute(db.text(f'DROP TABLE {nome}'))
+
+# ==================== CONVERSÃO ONLINE ====================
+
+def converter_para_particionada(tabela, coluna, granularidade, futuras=3, log=print):
+    """
+    Converte uma tabela comum em particionada por intervalo de 'coluna'
+    sem bloquear o sistema durante a cópia:
+    
+    1. cria <tabela>_novo particionada, com as partições necessárias
+    2. um gatilho espelha na nova tabela toda alteração feita na antiga
+    3. as linhas existentes são copiadas em lotes pequenos (uma transação cada)
+    4. uma transação curta troca os nomes; a antiga fica como <tabela>_antigo
+    
+    A chave primária passa a ser (id, coluna), como o PostgreSQL exige
+    """
+    engine = db.engine
+    if engine.dialect.name != 'postgresql':
+        return {"success": False, "error": "Particionamento disponível apenas no PostgreSQL"}
+    
+    nova = f'{tabela}_novo'
+    antiga = f'{tabela}_antigo'
+    metadados = db.metadata.tables[tabela]
+    
+    with engine.begin() as conexao:
+        if tabela_particionada(conexao, tabela):
+            return {"success": False, "error": f"A tabela {tabela} já é particionada"}
+        
+        # A coluna de partição entra na chave primária e não pode ser nula
+        conexao.execute(db.text(
+            f'UPDATE {tabela} SET {coluna} = CURRENT_TIMESTAMP WHERE {coluna} IS NULL'
+        ))
+        minimo, maximo_id = conexao.execute(
+            db.text(f'SELECT min({coluna}), max(id) FROM {tabela}')
+        ).one()
+        sequencia = conexao.execute(
+            db.text("SELECT pg_get_serial_sequence(:tabela, 'id')"), {'tabela': tabela}
+        ).scalar()
+        
+        # 1. Tabela nova com partições do dado mais antigo até o futuro
+        conexao.execute(db.text(f"""
+            CREATE TABLE {nova} (LIKE {tabela} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE ({coluna})
+        """))
+        conexao.execute(db.text(
+            f'ALTER TABLE {nova} ADD CONSTRAINT {nova}_pkey PRIMARY KEY (id, {coluna})'
+        ))
+        for chave in metadados.foreign_key_constraints:
+            colunas = ', '.join(c.name for c in chave.columns)
+            referencias = ', '.join(e.column.name for e in chave.elements)
+            conexao.execute(db.text(
+                f'ALTER TABLE {nova} ADD FOREIGN KEY ({colunas}) '
+                f'REFERENCES {chave.referred_table.name} ({referencias})'
+            ))
+        for indice in metadados.indexes:
+            colunas = ', '.join(c.name for c in indice.columns)
+            conexao.execute(db.text(f'CREATE INDEX {indice.name}_novo ON {nova} ({colunas})'))
+        
+        conexao.execute(db.text(f'CREATE TABLE {tabela}_padrao PARTITION OF {nova} DEFAULT'))
+        hoje = inicio_periodo(date.today(), granularidade)
+        fim = proximo_periodo(hoje, granularidade, futuras + 1)
+        criar_particoes(conexao, nova, coluna, minimo or hoje, fim, granularidade, base=tabela)
+        
+        # 2. Gatilho que espelha as alterações feitas durante a cópia
+        conexao.execute(db.text(f"""
+            CREATE FUNCTION {tabela}_espelhar() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {nova} WHERE id = OLD.id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {nova} SELECT NEW.* ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """))
+        conexao.execute(db.text(f"""
+            CREATE TRIGGER {tabela}_espelhar
+            AFTER INSERT OR UPDATE OR DELETE ON {tabela}
+            FOR EACH ROW EXECUTE FUNCTION {tabela}_espelhar()
+        """))
+    
+    log(f"Tabela {nova} criada, copiando linhas até o id {maximo_id or 0}...")
+    
+    # 3. Cópia em lotes; FOR SHARE impede que uma linha seja alterada entre
+    # a leitura e a gravação do lote (a alteração espera e é espelhada depois)
+    copiadas = 0
+    ultimo = 0
+    while ultimo < (maximo_id or 0):
+        with engine.begin() as conexao:
+            faixa = {'de': ultimo, 'ate': ultimo + LOTE_COPIA}
+            conexao.execute(db.text(
+                f'SELECT id FROM {tabela} WHERE id > :de AND id <= :ate FOR SHARE'
+            ), faixa).all()
+            copiadas += conexao.execute(db.text(
+                f'INSERT INTO {nova} SELECT * FROM {tabela} '
+                f'WHERE id > :de AND id <= :ate ON CONFLICT DO NOTHING'
+            ), faixa).rowcount
+        ultimo += LOTE_COPIA
+        log(f"  {copiadas} linhas copiadas")
+    
+    # 4. Troca rápida dos nomes
+    with engine.begin() as conexao:
+        conexao.execute(db.text("SET LOCAL lock_timeout = '10s'"))
+        conexao.execute(db.text(f'LOCK TABLE {tabela} IN ACCESS EXCLUSIVE MODE'))
+        conexao.execute(db.text(f'DROP TRIGGER {tabela}_espelhar ON {tabela}'))
+        conexao.execute(db.text(f'DROP FUNCTION {tabela}_espelhar()'))
+        
+        # Chaves estrangeiras de outras tabelas para esta (pelo id sozinho)
+        # não podem apontar para a particionada e seguiriam a antiga: saem
+        referencias = conexao.execute(db.text("""
+            SELECT conname, conrelid::regclass::text FROM pg_constraint
+            WHERE contype = 'f' AND confrelid = CAST(:tabela AS regclass)
+        """), {'tabela': tabela}).all()
+        for restricao, origem in referencias:
+            conexao.execute(db.text(f'ALTER TABLE {origem} DROP CONSTRAINT {restricao}'))
+        
+        conexao.execute(db.text(f'ALTER TABLE {tabela} RENAME TO {antiga}'))
+        conexao.execute(db.text(f'ALTER TABLE {antiga} RENAME CONSTRAINT {tabela}_pkey TO {antiga}_pkey'))
+        for indice in metadados.indexes:
+            conexao.execute(db.text(f'ALTER INDEX IF EXISTS {indice.name} RENAME TO {indice.name}_antigo'))
+        
+        conexao.execute(db.text(f'ALTER TABLE {nova} RENAME TO {tabela}'))
+        conexao.execute(db.text(f'ALTER TABLE {tabela} RENAME CONSTRAINT {nova}_pkey TO {tabela}_pkey'))
+        for indice in metadados.indexes:
+            conexao.execute(db.text(f'ALTER INDEX {indice.name}_novo RENAME TO {indice.name}'))
+        
+        # A sequência do id passa a pertencer à nova tabela, para não ser
+        # apagada junto com a antiga
+        if sequencia:
+            conexao.execute(db.text(f'ALTER SEQUENCE {sequencia} OWNED BY {tabela}.id'))
+    
+    log(f"Tabela {tabela} particionada. A versão anterior ficou em {antiga}; "
+        f"confira os dados e apague-a com DROP TABLE {antiga}")
+    
+    return {"success": True, "linhas_copiadas": copiadas, "tabela_antiga": antiga}
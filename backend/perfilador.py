@@ -0,0 +1,290 @@
+"""
+Perfilador - Amostragem da pilha de chamadas das requisições, sob demanda
+Um administrador liga a amostragem (POST /api/perfilador) para uma rota
+ou uma porcentagem das requisições, por tempo limitado. Enquanto ela
+dura, uma thread de cada worker lê, a cada PERFILADOR_INTERVALO_MS, a
+pilha das threads que atendem requisições sorteadas e conta quantas vezes
+cada pilha apareceu. As contagens de cada worker vão para um arquivo da
+sessão e são somadas no download, no formato "collapsed" (uma linha por
+pilha: 'quadro;quadro;... contagem'), aceito por flamegraph.pl,
+speedscope e similares
+Desligado, não há thread de amostragem: cada requisição só compara a
+sessão guardada em memória, relida do arquivo de controle no máximo uma
+vez por segundo
+Apenas as rotas do app Flask são amostradas (no servidor ASGI, as rotas
+que seguem para o Flask)
+"""
+
+from flask import request
+from collections import Counter
+from functools import lru_cache
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+# Pasta compartilhada pelos workers: sessão ativa e contagens de cada worker
+DIRETORIO = os.environ.get('PERFILADOR_DIR', os.path.join('instance', 'perfis'))
+ARQUIVO_CONTROLE = os.path.join(DIRETORIO, 'sessao.json')
+
+# Intervalo entre duas amostras (ms)
+INTERVALO = float(os.environ.get('PERFILADOR_INTERVALO_MS', 10)) / 1000
+
+# Limites de uma sessão
+DURACAO_PADRAO = 60
+DURACAO_MAXIMA = 900
+
+# Quadros guardados por pilha (os mais próximos da raiz)
+PROFUNDIDADE_MAXIMA = 128
+
+# Segundos entre gravações das contagens do worker e entre releituras
+# do arquivo de controle
+GRAVACAO = 5
+RELEITURA = 1
+
+_id_sessao = re.compile(r'^[0-9a-f]{32}$')
+
+# ==================== SESSÃO (COMPARTILHADA ENTRE WORKERS) ====================
+
+def _gravar_json(caminho, dados):
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(dados, arquivo)
+    os.replace(temporario, caminho)
+
+def _ler_controle():
+    try:
+        with open(ARQUIVO_CONTROLE, encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+_lida = {'em': None, 'sessao': None}
+
+def sessao_atual():
+    """
+    Sessão de amostragem em andamento, ou None
+    """
+    agora = time.monotonic()
+    if _lida['em'] is None or agora - _lida['em'] >= RELEITURA:
+        _lida['sessao'] = _ler_controle()
+        _lida['em'] = agora
+    
+    sessao = _lida['sessao']
+    return sessao if sessao and time.time() < sessao['ate'] else None
+
+def iniciar_sessao(rota=None, percentual=100, segundos=DURACAO_PADRAO, usuario_id=None):
+    """
+    Liga a amostragem em todos os workers (substitui a sessão anterior)
+    rota: regra ('/api/clientes/<int:cliente_id>'), endpoint ou caminho;
+    None = todas. percentual: parte das requisições amostradas
+    Lança ValueError se os parâmetros forem inválidos
+    """
+    try:
+        percentual = float(percentual)
+        segundos = int(segundos)
+    except (TypeError, ValueError):
+        raise ValueError("percentual e segundos devem ser números")
+    if not 0 < percentual <= 100:
+        raise ValueError("percentual deve estar entre 0 (exclusive) e 100")
+    if not 0 < segundos <= DURACAO_MAXIMA:
+        raise ValueError(f"segundos deve estar entre 1 e {DURACAO_MAXIMA}")
+    
+    agora = time.time()
+    sessao = {
+        'id': uuid.uuid4().hex,
+        'rota': rota or None,
+        'percentual': percentual,
+        'inicio': agora,
+        'ate': agora + segundos,
+        'intervalo_ms': INTERVALO * 1000,
+        'usuario_id': usuario_id
+    }
+    _gravar_json(ARQUIVO_CONTROLE, sessao)
+    _lida['em'] = None
+    return sessao
+
+def encerrar_sessao():
+    """
+    Encerra a sessão em andamento antes do prazo (os workers gravam o que
+    já contaram)
+    """
+    sessao = _ler_controle()
+    if not sessao or time.time() >= sessao['ate']:
+        return None
+    sessao['ate'] = time.time()
+    _gravar_json(ARQUIVO_CONTROLE, sessao)
+    _lida['em'] = None
+    return sessao
+
+# ==================== AMOSTRAGEM ====================
+
+@lru_cache(maxsize=4096)
+def _modulo(arquivo):
+    """
+    Caminho do módulo a partir da pasta do sys.path que o contém
+    ('app' para o app.py daqui, 'flask/app' para o do Flask)
+    """
+    arquivo = os.path.abspath(arquivo)
+    pastas = [os.path.abspath(p or '.') for p in sys.path]
+    base = max((p for p in pastas if arquivo.startswith(p + os.sep)), key=len, default=os.path.dirname(arquivo))
+    return os.path.splitext(os.path.relpath(arquivo, base))[0].replace(os.sep, '/')
+
+def _quadro(codigo):
+    return f'{_modulo(codigo.co_filename)}:{codigo.co_name}'
+
+def pilha(frame, raiz):
+    """
+    Pilha de um frame no formato collapsed: 'raiz;externa;...;interna'
+    """
+    quadros = []
+    while frame is not None:
+        quadros.append(_quadro(frame.f_code))
+        frame = frame.f_back
+    quadros.reverse()
+    return ';'.join([raiz] + quadros[:PROFUNDIDADE_MAXIMA])
+
+class Amostrador:
+    """
+    Amostrador do processo: threads marcadas (requisições sorteadas) e
+    contagem das pilhas da sessão atual. A thread de amostragem só existe
+    enquanto há sessão ativa ou requisição marcada
+    """
+    
+    def __init__(self):
+        self._marcadas = {}
+        self._contagens = Counter()
+        self._sessao = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def marcar(self, sessao, raiz):
+        with self._lock:
+            if sessao['id'] != self._sessao:
+                self._gravar()
+                self._contagens = Counter()
+                self._sessao = sessao['id']
+            self._marcadas[threading.get_ident()] = raiz
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name='perfilador', daemon=True)
+                self._thread.start()
+    
+    def desmarcar(self):
+        self._marcadas.pop(threading.get_ident(), None)
+    
+    def _gravar(self):
+        if self._sessao and self._contagens:
+            caminho = os.path.join(DIRETORIO, f'{self._sessao}-{os.getpid()}.json')
+            _gravar_json(caminho, dict(self._contagens))
+    
+    def _executar(self):
+        gravado = time.monotonic()
+        while True:
+            time.sleep(INTERVALO)
+            marcadas = list(self._marcadas.items())
+            if marcadas:
+                frames = sys._current_frames()
+                for ident, raiz in marcadas:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self._contagens[pilha(frame, raiz)] += 1
+                del frames
+            
+            with self._lock:
+                if not marcadas and sessao_atual() is None:
+                    self._gravar()
+                    self._thread = None
+                    return
+                if time.monotonic() - gravado >= GRAVACAO:
+                    self._gravar()
+                    gravado = time.monotonic()
+
+amostrador = Amostrador()
+
+# ==================== INTEGRAÇÃO COM O FLASK ====================
+
+def _antes():
+    sessao = sessao_atual()
+    if sessao is None:
+        return
+    
+    regra = request.url_rule.rule if request.url_rule else request.path
+    if sessao['rota'] and sessao['rota'] not in (regra, request.endpoint, request.path):
+        return
+    if random.random() * 100 >= sessao['percentual']:
+        return
+    amostrador.marcar(sessao, f'{request.method} {regra}')
+
+def _depois(erro=None):
+    amostrador.desmarcar()
+
+def configurar(app):
+    """
+    Instala a marcação das requisições no app
+    Deve ser chamada antes de admissao.configurar (a espera na fila de
+    admissão também aparece nas amostras)
+    """
+    app.before_request(_antes)
+    app.teardown_request(_depois)
+
+# ==================== RESULTADOS ====================
+
+def _arquivos(sessao_id):
+    if not os.path.isdir(DIRETORIO):
+        return []
+    return [
+        os.path.join(DIRETORIO, nome) for nome in os.listdir(DIRETORIO)
+        if nome.startswith(f'{sessao_id}-') and nome.endswith('.json')
+    ]
+
+def contagens(sessao_id):
+    """
+    Contagens da sessão somadas entre os workers: Counter {pilha: amostras}
+    Lança ValueError se o id for inválido
+    """
+    if not _id_sessao.match(sessao_id or ''):
+        raise ValueError(f"Sessão inválida: {sessao_id}")
+    
+    total = Counter()
+    for caminho in _arquivos(sessao_id):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                total.update(json.load(arquivo))
+        except (OSError, ValueError):
+            continue  # worker gravando neste instante: entra no próximo download
+    return total
+
+def collapsed(sessao_id):
+    """
+    Texto no formato collapsed (flamegraph.pl, speedscope): uma linha
+    'pilha amostras' por pilha, em ordem alfabética
+    """
+    return ''.join(f'{p} {n}\n' for p, n in sorted(contagens(sessao_id).items()))
+
+def resumo(sessao_id, limite=20):
+    """
+    Amostras, workers e as funções com mais amostras no topo da pilha
+    (tempo próprio) e em qualquer ponto dela (tempo total)
+    """
+    total = contagens(sessao_id)
+    proprio, acumulado = Counter(), Counter()
+    for p, n in total.items():
+        quadros = p.split(';')[1:]
+        if quadros:
+            proprio[quadros[-1]] += n
+        for quadro in set(quadros):
+            acumulado[quadro] += n
+    
+    return {
+        'sessao': sessao_id,
+        'amostras': sum(total.values()),
+        'workers': len(_arquivos(sessao_id)),
+        'pilhas': len(total),
+        'proprio': proprio.most_common(limite),
+        'total': acumulado.most_common(limite)
+    }
@@ -0,0 +1,180 @@
+"""
+Períodos - Filtros de data por mês, semana ou intervalo
+Todo filtro de data dos relatórios vira 'coluna >= início AND coluna < fim'
+(intervalo semiaberto): funciona igual em qualquer banco e usa os índices
+da coluna, ao contrário de comparar a data formatada (to_char) com o mês
+"Hoje" e o início de cada dia seguem o fuso da academia (FUSO_HORARIO,
+ex.: America/Sao_Paulo; vazio = fuso do servidor). Colunas de data e hora
+gravadas em UTC (data_acao, data_criacao) são comparadas com o início do
+dia local convertido para UTC
+"""
+
+from database import db
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+import os
+import particionamento
+
+FUSO_HORARIO = os.environ.get('FUSO_HORARIO', '')
+_fuso = ZoneInfo(FUSO_HORARIO) if FUSO_HORARIO else None
+
+def hoje():
+    """
+    Data de hoje no fuso da academia
+    """
+    return datetime.now(_fuso).date()
+
+# Tamanhos de intervalo das séries (relatório de receita)
+GRANULARIDADES = ('dia', 'semana', 'mes')
+
+def inicio_intervalo(dia, granularidade):
+    """
+    Primeiro dia do dia/semana (segunda-feira)/mês que contém a data
+    """
+    if granularidade == 'mes':
+        return particionamento.inicio_periodo(dia, 'mes')
+    if granularidade == 'semana':
+        return dia - timedelta(days=dia.weekday())
+    return dia
+
+def proximo_intervalo(inicio, granularidade, quantidade=1):
+    """
+    Início do intervalo seguinte (ou 'quantidade' intervalos à frente / atrás)
+    """
+    if granularidade == 'mes':
+        return particionamento.proximo_periodo(inicio, 'mes', quantidade)
+    return inicio + timedelta(days=(7 if granularidade == 'semana' else 1) * quantidade)
+
+def _data(texto, parametro):
+    try:
+        return date.fromisoformat(texto)
+    except (TypeError, ValueError):
+        raise ValueError(f"Data inválida em '{parametro}' (use AAAA-MM-DD): {texto}")
+
+class Periodo:
+    """
+    Intervalo de datas [inicio, fim): 'inicio' entra, 'fim' não
+    Qualquer um dos lados pode ser None (período aberto daquele lado)
+    """
+    
+    def __init__(self, inicio=None, fim=None):
+        if inicio and fim and fim <= inicio:
+            raise ValueError("Período inválido: a data final não pode ser anterior à inicial")
+        self.inicio = inicio
+        self.fim = fim
+    
+    @classmethod
+    def mes(cls, mes=None):
+        """
+        Mês 'AAAA-MM' (padrão: mês atual)
+        """
+        if mes is None:
+            inicio = particionamento.inicio_periodo(hoje(), 'mes')
+        else:
+            try:
+                inicio = datetime.strptime(mes, '%Y-%m').date()
+            except ValueError:
+                raise ValueError(f"Mês inválido (use AAAA-MM): {mes}")
+        return cls(inicio, particionamento.proximo_periodo(inicio, 'mes'))
+    
+    @classmethod
+    def ano(cls, ano=None):
+        """
+        Ano 'AAAA' (padrão: ano atual)
+        """
+        if ano is None:
+            inicio = particionamento.inicio_periodo(hoje(), 'ano')
+        else:
+            try:
+                inicio = date(int(ano), 1, 1)
+            except (TypeError, ValueError):
+                raise ValueError(f"Ano inválido (use AAAA): {ano}")
+        return cls(inicio, particionamento.proximo_periodo(inicio, 'ano'))
+    
+    @classmethod
+    def semana(cls, semana=None):
+        """
+        Semana ISO 'AAAA-Wss', de segunda a domingo (padrão: semana atual)
+        """
+        if semana is None:
+            dia = hoje()
+            inicio = dia - timedelta(days=dia.weekday())
+        else:
+            try:
+                inicio = datetime.strptime(semana + '-1', '%G-W%V-%u').date()
+            except ValueError:
+                raise ValueError(f"Semana inválida (use AAAA-Wss): {semana}")
+        return cls(inicio, inicio + timedelta(days=7))
+    
+    @classmethod
+    def intervalo(cls, de=None, ate=None):
+        """
+        Intervalo entre as datas 'AAAA-MM-DD' informadas, 'ate' inclusive
+        """
+        inicio = _data(de, 'de') if de else None
+        fim = _data(ate, 'ate') + timedelta(days=1) if ate else None
+        return cls(inicio, fim)
+    
+    @classmethod
+    def do_pedido(cls, args, padrao=None):
+        """
+        Período dos parâmetros de uma requisição: ano (AAAA), mes (AAAA-MM),
+        semana (AAAA-Wss) ou de/ate (AAAA-MM-DD). Sem nenhum deles: 'padrao'
+        Lança ValueError se os parâmetros forem inválidos ou combinados
+        """
+        informados = [nome for nome in ('ano', 'mes', 'semana', 'de', 'ate') if args.get(nome)]
+        if not informados:
+            return padrao
+        if len({'de' if nome == 'ate' else nome for nome in informados}) > 1:
+            raise ValueError("Informe apenas um tipo de período: ano, mes, semana ou de/ate")
+        
+        if 'ano' in informados:
+            return cls.ano(args.get('ano'))
+        if 'mes' in informados:
+            return cls.mes(args.get('mes'))
+        if 'semana' in informados:
+            return cls.semana(args.get('semana'))
+        return cls.intervalo(args.get('de'), args.get('ate'))
+    
+    def intervalos(self, granularidade, padrao=12, maximo=None):
+        """
+        Divide o período em dias, semanas ou meses inteiros, do primeiro
+        ao último intervalo que tocam o período (inclusive os sem dados)
+        Lado aberto: 'padrao' intervalos antes do fim, ou até o intervalo
+        atual. Retorna [(inicio, fim), ...]
+        Lança ValueError se passar de 'maximo' intervalos
+        """
+        atual = inicio_intervalo(hoje(), granularidade)
+        fim = proximo_intervalo(inicio_intervalo(self.fim - timedelta(days=1), granularidade), granularidade) \
+            if self.fim else proximo_intervalo(atual, granularidade)
+        inicio = inicio_intervalo(self.inicio, granularidade) if self.inicio \
+            else proximo_intervalo(fim, granularidade, -padrao)
+        
+        intervalos = []
+        while inicio < fim:
+            seguinte = proximo_intervalo(inicio, granularidade)
+            intervalos.append((inicio, seguinte))
+            inicio = seguinte
+            if maximo and len(intervalos) > maximo:
+                raise ValueError(f"Período longo demais: mais de {maximo} intervalos ({granularidade})")
+        return intervalos
+    
+    def _limite(self, dia, coluna):
+        # Colunas de data e hora estão em UTC (datetime.utcnow)
+        if not isinstance(coluna.type, db.DateTime):
+            return dia
+        return datetime.combine(dia, time(), tzinfo=_fuso).astimezone(timezone.utc).replace(tzinfo=None)
+    
+    def filtro(self, coluna):
+        """
+        Condição 'coluna >= inicio AND coluna < fim' para a coluna informada
+        """
+        condicoes = []
+        if self.inicio:
+            condicoes.append(coluna >= self._limite(self.inicio, coluna))
+        if self.fim:
+            condicoes.append(coluna < self._limite(self.fim, coluna))
+        return db.and_(db.true(), *condicoes)
+    
+    def __repr__(self):
+        return f'Periodo({self.inicio}, {self.fim})'
@@ -0,0 +1,441 @@
+"""
+Planos - Regressão dos planos de execução das consultas
+Semeia um banco descartável com um volume realista de dados, obtém o
+plano (EXPLAIN) de cada consulta de models.py e auth.py e compara com a
+referência gravada em planos_referencia.json (uma por banco):
+- tabelas grandes (mais de LIMITE_LINHAS linhas) não podem ser varridas
+  por inteiro, a não ser nas consultas que precisam ler a tabela toda
+- uma tabela lida por índice na referência não pode passar a ser varrida
+- o custo não pode crescer mais que a tolerância em relação à referência
+Custo: no PostgreSQL, o 'Total Cost' estimado pelo EXPLAIN; no SQLite,
+que não estima custo, as instruções da máquina virtual executadas
+Uso: python manutencao.py verificar-planos [--url URL] [--gravar]
+"""
+
+from database import db
+from periodos import Periodo
+from models import Academia, Usuario, Cliente, Pagamento, Historico, Exclusao, Sequencia, PorAcademia
+from sqlalchemy import create_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from datetime import datetime, date, timedelta
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import models
+import auth
+import sincronizacao
+import receita
+import conciliacao
+import recibos
+import caixa_saida
+import previsao
+
+ARQUIVO_REFERENCIA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'planos_referencia.json')
+
+# Tabelas com mais linhas que isto não podem ser varridas por inteiro
+LIMITE_LINHAS = 1000
+
+# Custo aceito em relação à referência (1.5 = até 50% maior) e diferença
+# mínima para contar como regressão (evita ruído em consultas pequenas)
+TOLERANCIA_CUSTO = 1.5
+FOLGA_CUSTO = {'sqlite': 2000, 'postgresql': 50}
+
+# Academia das consultas (as demais só existem para o filtro fazer diferença)
+ACADEMIA = 1
+ACADEMIAS_EXTRAS = 2
+
+# SQLite: instruções executadas entre duas chamadas do contador
+PASSO_INSTRUCOES = 100
+
+# ==================== EXPLAIN ====================
+
+class Explicar(Executable, ClauseElement):
+    """
+    EXPLAIN de uma consulta, com os mesmos parâmetros dela
+    """
+    inherit_cache = False
+    
+    def __init__(self, consulta):
+        self.consulta = consulta
+
+def _consulta_explicada(elemento, compilador, kw):
+    sql = compilador.process(elemento.consulta, **kw)
+    # As linhas do EXPLAIN não são as colunas da consulta: sem isto, uma
+    # consulta com o mesmo número de colunas teria os tipos dela (datas,
+    # números) aplicados, por posição, às linhas do plano
+    compilador._result_columns = []
+    return sql
+
+@compiles(Explicar, 'sqlite')
+def _explicar_sqlite(elemento, compilador, **kw):
+    return 'EXPLAIN QUERY PLAN ' + _consulta_explicada(elemento, compilador, kw)
+
+@compiles(Explicar, 'postgresql')
+def _explicar_postgresql(elemento, compilador, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + _consulta_explicada(elemento, compilador, kw)
+
+def _acessos_sqlite(linhas):
+    """
+    Acessos às tabelas no plano do SQLite: 'SEARCH' usa índice ou chave,
+    'SCAN' lê a tabela (ou um índice) inteira
+    """
+    acessos = set()
+    for linha in linhas:
+        encontrado = re.match(
+            r'(SCAN|SEARCH) (\w+)(?: AS \w+)?(?: USING (?:COVERING )?(INDEX (\w+)|INTEGER PRIMARY KEY|PRIMARY KEY))?',
+            linha.detail
+        )
+        if not encontrado:
+            continue
+        operacao, tabela, uso, indice = encontrado.groups()
+        tipo = 'busca' if operacao == 'SEARCH' else 'varredura'
+        acessos.add(f"{tipo} {tabela} {indice or ('chave' if uso else '-')}")
+    return acessos
+
+def _acessos_postgresql(no, acessos=None):
+    """
+    Acessos às tabelas no plano do PostgreSQL: índices com condição são
+    buscas; 'Seq Scan' e índices sem condição leem a tabela inteira
+    """
+    acessos = set() if acessos is None else acessos
+    tipo_no = no.get('Node Type', '')
+    
+    if tipo_no == 'Seq Scan':
+        acessos.add(f"varredura {no['Relation Name']} -")
+    elif tipo_no in ('Index Scan', 'Index Only Scan'):
+        tipo = 'busca' if 'Index Cond' in no else 'varredura'
+        acessos.add(f"{tipo} {no['Relation Name']} {no['Index Name']}")
+    elif tipo_no == 'Bitmap Heap Scan':
+        for filho in no.get('Plans', []):
+            if filho.get('Index Name'):
+                acessos.add(f"busca {no['Relation Name']} {filho['Index Name']}")
+        return acessos
+    
+    for filho in no.get('Plans', []):
+        _acessos_postgresql(filho, acessos)
+    return acessos
+
+def _custo_sqlite(conexao, consulta):
+    """
+    Executa a consulta contando as instruções da máquina virtual do SQLite
+    """
+    contador = [0]
+    
+    def contar():
+        contador[0] += 1
+        return 0
+    
+    bruta = conexao.connection.driver_connection
+    bruta.set_progress_handler(contar, PASSO_INSTRUCOES)
+    try:
+        conexao.execute(consulta).all()
+    finally:
+        bruta.set_progress_handler(None, 0)
+    return contador[0] * PASSO_INSTRUCOES
+
+def analisar(conexao, consulta):
+    """
+    Plano de uma consulta: {'acessos': [...], 'custo': n}
+    Cada acesso é '<busca|varredura> <tabela> <índice|chave|->'
+    """
+    dialeto = conexao.dialect.name
+    if dialeto == 'sqlite':
+        acessos = _acessos_sqlite(conexao.execute(Explicar(consulta)).all())
+        custo = _custo_sqlite(conexao, consulta)
+    elif dialeto == 'postgresql':
+        plano = conexao.execute(Explicar(consulta)).scalar()[0]['Plan']
+        acessos = _acessos_postgresql(plano)
+        custo = round(plano['Total Cost'])
+    else:
+        raise ValueError(f"Banco não suportado: {dialeto}")
+    
+    return {'acessos': sorted(acessos), 'custo': custo}
+
+# ==================== DADOS DE TESTE ====================
+
+def criar_banco(url=None):
+    """
+    Engine do banco descartável (padrão: arquivo SQLite temporário)
+    O banco precisa estar vazio: as tabelas são criadas e, ao final, apagadas
+    """
+    if not url:
+        url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='planos-'), 'planos.db')
+    
+    engine = create_engine(url)
+    if db.inspect(engine).get_table_names():
+        engine.dispose()
+        raise ValueError("O banco de teste deve estar vazio (as tabelas são apagadas ao final)")
+    return engine
+
+def semear(conexao, clientes=10000, pagamentos_por_cliente=12, acoes=50000):
+    """
+    Preenche o banco com dados parecidos com os de uma academia em uso:
+    um ano de mensalidades por cliente (pagas, pendentes e canceladas),
+    histórico de ações e outras academias menores no mesmo banco
+    Os dados são sempre os mesmos (semente fixa), com datas relativas a hoje
+    Retorna valores de exemplo para os parâmetros das consultas
+    """
+    sorteio = random.Random(37)
+    hoje = date.today()
+    agora = datetime.now()
+    seq = 0
+    
+    conexao.execute(db.insert(Academia.__table__), [
+        {'id': ACADEMIA + i, 'nome': f'Academia {i}', 'slug': f'academia-{i}', 'ativa': True}
+        for i in range(ACADEMIAS_EXTRAS + 1)
+    ])
+    
+    linhas_usuarios, linhas_clientes, linhas_pagamentos, linhas_historico = [], [], [], []
+    for indice_academia in range(ACADEMIAS_EXTRAS + 1):
+        academia_id = ACADEMIA + indice_academia
+        # A academia das consultas é a maior
+        qtd_clientes = clientes if indice_academia == 0 else max(clientes // 10, 1)
+        qtd_acoes = acoes if indice_academia == 0 else max(acoes // 10, 1)
+        
+        usuario_ids = []
+        for i in range(10):
+            seq += 1
+            usuario_ids.append(len(linhas_usuarios) + 1)
+            linhas_usuarios.append({
+                'id': len(linhas_usuarios) + 1, 'academia_id': academia_id,
+                'nome': f'Usuário {academia_id}-{i}', 'email': f'usuario{i}@academia{academia_id}.com',
+                'senha_hash': '-', 'tipo': 'admin' if i == 0 else 'operador', 'ativo': i < 8,
+                'data_criacao': agora, 'seq_alteracao': seq
+            })
+        
+        for i in range(qtd_clientes):
+            cliente_id = len(linhas_clientes) + 1
+            pendentes = []
+            ultimo_pago = None
+            for mes in range(pagamentos_por_cliente):
+                vencimento = hoje - timedelta(days=30 * (pagamentos_por_cliente - mes - 2) + sorteio.randint(0, 27))
+                status = sorteio.choices(['pago', 'pendente', 'cancelado'], [85, 12, 3])[0]
+                if vencimento > hoje:
+                    status = 'pendente'
+                pago_em = vencimento + timedelta(days=sorteio.randint(-5, 10)) if status == 'pago' else None
+                valor = sorteio.choice([89.9, 99.9, 119.9, 149.9])
+                if status == 'pendente':
+                    pendentes.append((valor, vencimento))
+                if pago_em and (ultimo_pago is None or pago_em > ultimo_pago):
+                    ultimo_pago = pago_em
+                seq += 1
+                linhas_pagamentos.append({
+                    'id': len(linhas_pagamentos) + 1, 'academia_id': academia_id,
+                    'cliente_id': cliente_id, 'valor': valor, 'vencimento': vencimento,
+                    'data_pagamento': pago_em, 'status': status, 'descricao': 'Mensalidade',
+                    'metodo_pagamento': 'pix' if pago_em else None,
+                    'usuario_registro_id': sorteio.choice(usuario_ids) if pago_em else None,
+                    'data_criacao': agora, 'seq_alteracao': seq
+                })
+            
+            seq += 1
+            linhas_clientes.append({
+                'id': cliente_id, 'academia_id': academia_id,
+                'nome': f'Cliente {sorteio.choice("ABCDEFGHIJLMNOPRSTV")}{cliente_id:06d}',
+                'email': f'cliente{cliente_id}@exemplo.com', 'telefone': f'81 9{cliente_id:08d}',
+                'cpf': f'{cliente_id:011d}', 'ativo': sorteio.random() < 0.9, 'data_cadastro': agora,
+                'saldo_aberto': round(sum(v for v, _ in pendentes), 2), 'qtd_pendentes': len(pendentes),
+                'vencimento_mais_antigo': min((d for _, d in pendentes), default=None),
+                'ultimo_pagamento': ultimo_pago, 'seq_alteracao': seq
+            })
+        
+        for i in range(qtd_acoes):
+            linhas_historico.append({
+                'id': len(linhas_historico) + 1, 'academia_id': academia_id,
+                'usuario_id': sorteio.choice(usuario_ids),
+                'acao': sorteio.choices(['LOGIN', 'CRIAR_CLIENTE', 'REGISTRAR_PAGAMENTO', 'EDITAR_CLIENTE'], [40, 10, 40, 10])[0],
+                'descricao': '-', 'data_acao': agora - timedelta(minutes=sorteio.randint(0, 60 * 24 * 365))
+            })
+    
+    exclusoes = [
+        {'academia_id': ACADEMIA, 'tabela': 'clientes', 'registro_id': 10 ** 7 + i,
+         'seq_alteracao': sorteio.randint(1, seq), 'data_exclusao': agora}
+        for i in range(max(clientes // 50, 1))
+    ]
+    
+    for modelo, linhas in ((Usuario, linhas_usuarios), (Cliente, linhas_clientes),
+                           (Pagamento, linhas_pagamentos), (Historico, linhas_historico),
+                           (Exclusao, exclusoes)):
+        conexao.execute(db.insert(modelo.__table__), linhas)
+    conexao.execute(db.insert(Sequencia.__table__), [
+        {'nome': 'alteracoes', 'valor': seq}, {'nome': 'exclusoes_removidas_ate', 'valor': 0}
+    ])
+    conexao.execute(db.text('ANALYZE'))
+    
+    acao = linhas_historico[len(linhas_historico) // 2]
+    return {
+        'cliente_id': clientes // 2,
+        'usuario_id': 2,
+        'email': linhas_usuarios[1]['email'],
+        'mes': (hoje.replace(day=1) - timedelta(days=1)).strftime('%Y-%m'),
+        'cursor': f"{acao['data_acao'].isoformat()}_{acao['id']}",
+        'de': (hoje - timedelta(days=30)).isoformat(),
+        'ate': hoje.isoformat(),
+        'seq': seq - seq // 20,
+        'ultima_seq': seq,
+        'limite_pendentes': min((
+            p['vencimento'] for p in linhas_pagamentos
+            if p['status'] == 'pendente' and p['academia_id'] == ACADEMIA
+        ), default=hoje)
+    }
+
+def contar_linhas(conexao):
+    """
+    Linhas de cada tabela do banco de teste
+    """
+    return {
+        tabela.name: conexao.execute(db.select(db.func.count()).select_from(tabela)).scalar()
+        for tabela in db.metadata.sorted_tables
+    }
+
+# ==================== CONSULTAS VERIFICADAS ====================
+
+def consultas(ex):
+    """
+    Consultas de models.py e auth.py (as mesmas funções usadas pelas
+    rotas), com os parâmetros de exemplo de semear
+    Cada item: nome -> (consulta, tabelas que a consulta precisa ler
+    inteiras, dispensadas da regra das varreduras)
+    """
+    resumo = models._subconsultas_resumo()
+    
+    itens = {
+        'clientes_por_nome': (models.consulta_clientes(), ()),
+        'clientes_por_saldo': (models.consulta_clientes(ordenar='saldo'), ()),
+        'clientes_resumo': (models.consulta_clientes(campos=models.CAMPOS_CLIENTE.escolher('resumo')), ()),
+        'clientes_busca': (models.consulta_clientes(busca='Silva'), ()),
+        'cliente': (models.consulta_cliente(ex['cliente_id']), ()),
+        'pagamentos': (models.consulta_pagamentos(), ('pagamentos', 'clientes')),
+        'pagamentos_cliente': (models.consulta_pagamentos(cliente_id=ex['cliente_id']), ()),
+        'pagamentos_pendentes': (models.consulta_pagamentos(status='pendente', limite_pendentes=ex['limite_pendentes']), ()),
+        'pagamentos_pendentes_resumo': (models.consulta_pagamentos(status='pendente', limite_pendentes=ex['limite_pendentes'],
+                                                                   campos=models.CAMPOS_PAGAMENTO.escolher('resumo')), ()),
+        'pagamentos_pagos_mes': (models.consulta_pagamentos(status='pago', periodo=Periodo.mes(ex['mes'])), ()),
+        'historico_pagamentos_cliente': (models.consulta_historico_pagamentos(ex['cliente_id']), ()),
+        'limite_pendentes': (models.consulta_limite_pendentes(), ()),
+        'limite_pendentes_cliente': (models.consulta_limite_pendentes(ex['cliente_id']), ()),
+        'total_clientes': (models.consulta_total_clientes(), ()),
+        'estatisticas': (models.consulta_estatisticas(), ('pagamentos',)),
+        'estatisticas_periodo': (models.consulta_estatisticas(periodo=Periodo.intervalo(ex['de'], ex['ate'])), ('pagamentos',)),
+        'inadimplentes': (models.consulta_inadimplentes(ex['limite_pendentes']), ()),
+        'inadimplentes_dashboard': (models.consulta_inadimplentes(ex['limite_pendentes'], 5), ()),
+        'pagaram_mes': (models.consulta_pagaram_mes(Periodo.mes(ex['mes'])), ()),
+        'pagaram_semana': (models.consulta_pagaram_mes(Periodo.semana()), ()),
+        'maiores_devedores': (models.consulta_maiores_devedores(10), ()),
+        'maiores_devedores_vencidos': (models.consulta_maiores_devedores(10, somente_vencidos=True), ()),
+        'verificar_resumo': (db.select(Cliente.__table__.c.id, *resumo.values()), ('clientes',)),
+        'academia_por_slug': (db.select(Academia).where(Academia.slug == 'academia-0', Academia.ativa == True), ()),
+        'usuarios': (auth.consulta_usuarios(), ()),
+        'login': (auth.consulta_login(ex['email']), ()),
+        'historico': (auth.consulta_historico(), ()),
+        'historico_cursor': (auth.consulta_historico(cursor=ex['cursor']), ()),
+        'historico_usuario': (auth.consulta_historico(usuario_id=ex['usuario_id']), ()),
+        'historico_acao': (auth.consulta_historico(acao='LOGIN'), ()),
+        'historico_periodo': (auth.consulta_historico(de=ex['de'], ate=ex['ate']), ()),
+        'receita': (receita.consulta_receita(Periodo.intervalo(ex['de'], ex['ate'])), ()),
+        'receita_cache': (receita.consulta_cache('mes', date.fromisoformat(ex['de']), date.fromisoformat(ex['ate'])), ()),
+        'conciliacao_cobrancas_abertas': (conciliacao.consulta_cobrancas_abertas(date.fromisoformat(ex['ate'])), ('pagamentos', 'clientes')),
+        'recibos_historicos': (recibos.consulta_historicos([Cliente(id=i, academia_id=ACADEMIA) for i in range(1, 201)]), ()),
+        'saida_eventos': (caixa_saida.consulta_eventos(ex['seq']), ()),
+        'sync_contadores': (sincronizacao.consulta_contadores(), ()),
+        'previsao_historico': (previsao.consulta_historico(date.fromisoformat(ex['de'])), ()),
+        'previsao_clientes_ativos': (previsao.consulta_clientes_ativos(), ()),
+    }
+    
+    tabelas = list(models.MODELOS_SINCRONIZADOS)
+    for nome, consulta in sincronizacao.consultas_alteracoes(ex['seq'], ex['ultima_seq'], sincronizacao.LIMITE_PADRAO, tabelas).items():
+        itens[f'sync_{nome}'] = (consulta, ())
+    for nome, consulta in previsao.consultas_alteracoes(ex['seq'], ex['ultima_seq']).items():
+        itens[f'previsao_alteracoes_{nome}'] = (consulta, ())
+    
+    # Mesmo filtro de academia que as rotas recebem (ver SEPARAÇÃO POR ACADEMIA)
+    return {
+        nome: (consulta.options(db.with_loader_criteria(
+            PorAcademia, lambda cls: cls.academia_id == ACADEMIA, include_aliases=True
+        )), inteiras)
+        for nome, (consulta, inteiras) in itens.items()
+    }
+
+# ==================== VERIFICAÇÃO ====================
+
+def comparar(plano, referencia, inteiras, grandes, tolerancia=TOLERANCIA_CUSTO, folga=0):
+    """
+    Lista os problemas do plano de uma consulta (vazia = ok)
+    """
+    problemas = []
+    
+    for acesso in plano['acessos']:
+        tipo, tabela, indice = acesso.split(' ')
+        if tipo == 'varredura' and tabela in grandes and tabela not in inteiras:
+            problemas.append(f"varredura completa de {tabela} ({grandes[tabela]} linhas)")
+    
+    if referencia is None:
+        return problemas
+    
+    buscas_antes = {a.split(' ')[1] for a in referencia['acessos'] if a.startswith('busca ')}
+    varridas_agora = {a.split(' ')[1] for a in plano['acessos'] if a.startswith('varredura ')}
+    for tabela in sorted(buscas_antes & varridas_agora):
+        problemas.append(f"{tabela} era lida por índice e passou a ser varrida")
+    
+    limite = referencia['custo'] * tolerancia
+    if plano['custo'] > limite and plano['custo'] - referencia['custo'] > folga:
+        problemas.append(f"custo {plano['custo']} (referência {referencia['custo']})")
+    
+    return problemas
+
+def carregar_referencia():
+    if not os.path.exists(ARQUIVO_REFERENCIA):
+        return {}
+    with open(ARQUIVO_REFERENCIA, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+def verificar_planos(url=None, gravar=False, clientes=10000, tolerancia=TOLERANCIA_CUSTO):
+    """
+    Semeia o banco de teste, analisa cada consulta e compara com a referência
+    gravar=True: substitui a referência deste banco pelos planos atuais
+    Retorna {'banco', 'linhas', 'consultas': {nome: {plano, problemas}}, 'regressoes'}
+    """
+    engine = criar_banco(url)
+    dialeto = engine.dialect.name
+    todas_referencias = carregar_referencia()
+    referencias = todas_referencias.get(dialeto, {})
+    
+    try:
+        db.metadata.create_all(engine)
+        with engine.begin() as conexao:
+            exemplos = semear(conexao, clientes=clientes, acoes=clientes * 5)
+        
+        with engine.connect() as conexao:
+            linhas = contar_linhas(conexao)
+            grandes = {tabela: n for tabela, n in linhas.items() if n > LIMITE_LINHAS}
+            
+            resultado = {}
+            for nome, (consulta, inteiras) in consultas(exemplos).items():
+                plano = analisar(conexao, consulta)
+                problemas = [] if gravar else comparar(
+                    plano, referencias.get(nome), inteiras, grandes,
+                    tolerancia, FOLGA_CUSTO.get(dialeto, 0)
+                )
+                resultado[nome] = {'plano': plano, 'problemas': problemas}
+    finally:
+        db.metadata.drop_all(engine)
+        engine.dispose()
+        if not url:
+            shutil.rmtree(os.path.dirname(engine.url.database), ignore_errors=True)
+    
+    if gravar:
+        todas_referencias[dialeto] = {nome: item['plano'] for nome, item in resultado.items()}
+        with open(ARQUIVO_REFERENCIA, 'w', encoding='utf-8') as arquivo:
+            json.dump(todas_referencias, arquivo, indent=2, ensure_ascii=False, sort_keys=True)
+            arquivo.write('\n')
+    
+    return {
+        'banco': dialeto,
+        'linhas': linhas,
+        'consultas': resultado,
+        'regressoes': sum(1 for item in resultado.values() if item['problemas'])
+    }
@@ -0,0 +1,559 @@
+"""
+Previsão - Recebimentos esperados nas próximas semanas ou meses
+(GET /api/relatorios/previsao)
+Além do valor em aberto (obter_estatisticas), quanto deve entrar em cada
+intervalo à frente, com uma faixa de confiança. Entram na previsão:
+- as cobranças pendentes: as que vencem a partir de hoje e as vencidas há
+  menos de PRAZO_INADIMPLENCIA dias (as mais antigas contam como perdidas)
+- as próximas mensalidades de cada cliente ativo: a última cobrança dele,
+  se for recente, repetida todo mês no mesmo dia e com o mesmo valor
+Cada cobrança é paga em dia, paga com atraso ou não é paga, com as taxas
+do cliente nos últimos HISTORICO_MESES meses. Clientes com poucas
+cobranças ficam perto das taxas da academia (PESO_ACADEMIA cobranças
+"emprestadas" da média). A parte em dia entra no vencimento; a parte com
+atraso, no vencimento mais o atraso médio do cliente. A faixa (minimo e
+maximo) é a aproximação normal da soma, com as cobranças independentes
+entre si
+O histórico é lido em uma consulta e guardado em colunas (arrays NumPy);
+as taxas de todos os clientes e a projeção saem de operações vetorizadas,
+sem laço por cliente. As taxas ficam em memória até o fim do dia, por
+academia (e por processo), e são montadas em segundo plano: o primeiro
+pedido do dia usa as do dia anterior enquanto isso. As cobranças recentes
+(pendentes e base das recorrências) guardadas com elas são atualizadas a
+cada pedido pela sequência de alterações (ver sincronizacao.py), lendo só
+o que mudou desde a última posição aplicada
+"""
+
+from database import db
+from flask import current_app
+from models import Cliente, Pagamento, Exclusao
+from periodos import inicio_intervalo, proximo_intervalo
+from replicas import somente_leitura
+from datetime import date, datetime
+from statistics import NormalDist
+import academias
+import models
+import numpy as np
+import os
+import periodos
+import threading
+
+# Meses de histórico usados nas taxas dos clientes
+HISTORICO_MESES = int(os.environ.get('PREVISAO_HISTORICO_MESES', 12))
+
+# Dias de atraso a partir dos quais uma cobrança pendente conta como perdida
+PRAZO_INADIMPLENCIA = int(os.environ.get('PREVISAO_PRAZO_INADIMPLENCIA', 60))
+
+# Peso das taxas da academia nas taxas de cada cliente (em cobranças)
+PESO_ACADEMIA = float(os.environ.get('PREVISAO_PESO_ACADEMIA', 4))
+
+# Nível de confiança da faixa minimo/maximo
+CONFIANCA = float(os.environ.get('PREVISAO_CONFIANCA', 0.9))
+_Z = NormalDist().inv_cdf(0.5 + CONFIANCA / 2)
+
+# Segundos que um pedido espera o primeiro modelo da academia no processo
+# (sem modelo anterior para usar); depois disso recebe 503
+ESPERA_MODELO = float(os.environ.get('PREVISAO_ESPERA_MODELO', 2))
+
+# Clientes cuja última cobrança venceu há mais dias que isto não têm
+# mensalidade corrente (não entram nas recorrências)
+JANELA_RECORRENCIA = 45
+
+# Cobranças recentes: as que venceram há até tantos dias (as pendentes e
+# a base das recorrências saem delas)
+DIAS_RECENTES = max(PRAZO_INADIMPLENCIA, JANELA_RECORRENCIA)
+
+GRANULARIDADES = ('semana', 'mes')
+PERIODOS_PADRAO = {'semana': 8, 'mes': 3}
+MAXIMO_PERIODOS = {'semana': 26, 'mes': 12}
+
+_EPOCA = date(1970, 1, 1).toordinal()
+
+# Modelo por (banco, academia) e montagens em andamento
+_modelos = {}
+_montando = {}
+_trava = threading.Lock()
+
+class ModeloEmPreparo(Exception):
+    """
+    A academia ainda não tem modelo neste processo (montagem em andamento)
+    """
+
+# ==================== CONSULTAS ====================
+
+def consulta_historico(desde):
+    """
+    Cobranças pagas e pendentes com vencimento a partir de 'desde'
+    """
+    return db.select(
+        Pagamento.id,
+        Pagamento.cliente_id,
+        Pagamento.valor,
+        Pagamento.vencimento,
+        Pagamento.data_pagamento,
+        Pagamento.status
+    ).where(
+        Pagamento.status.in_(('pago', 'pendente')),
+        Pagamento.vencimento >= desde
+    )
+
+def consulta_clientes_ativos():
+    return db.select(Cliente.id).where(Cliente.ativo == True)
+
+def consultas_alteracoes(since, ate):
+    """
+    Pagamentos e clientes alterados e exclusões entre as posições 'since'
+    e 'ate' da sequência de alterações
+    """
+    return {
+        'pagamentos': db.select(
+            Pagamento.id, Pagamento.cliente_id, Pagamento.valor, Pagamento.vencimento, Pagamento.status
+        ).where(Pagamento.seq_alteracao > since, Pagamento.seq_alteracao <= ate),
+        'clientes': db.select(Cliente.id, Cliente.ativo)
+            .where(Cliente.seq_alteracao > since, Cliente.seq_alteracao <= ate),
+        'exclusoes': db.select(Exclusao.tabela, Exclusao.registro_id)
+            .where(Exclusao.seq_alteracao > since, Exclusao.seq_alteracao <= ate,
+                   Exclusao.tabela.in_(('clientes', 'pagamentos')))
+    }
+
+# ==================== MODELO ====================
+
+def _datas(valores):
+    """
+    Coluna de datas em array datetime64[D] (None vira NaT), pelos ordinais:
+    bem mais rápido que o np.array direto dos objetos date
+    """
+    ordinais = np.fromiter((d.toordinal() if d else 0 for d in valores), dtype=np.int64, count=len(valores))
+    datas = (ordinais - _EPOCA).astype('datetime64[D]')
+    datas[ordinais == 0] = np.datetime64('NaT')
+    return datas
+
+def _status(valores):
+    """
+    Colunas 'pago' e 'valida' (paga ou pendente) de uma coluna de status
+    """
+    pago = np.fromiter((status == 'pago' for status in valores), dtype=bool, count=len(valores))
+    pendente = np.fromiter((status == 'pendente' for status in valores), dtype=bool, count=len(valores))
+    return pago, pago | pendente
+
+def carregar_historico(hoje):
+    """
+    Histórico de cobranças em colunas: {coluna: array}, mais os ids dos
+    clientes ativos
+    """
+    desde = proximo_intervalo(inicio_intervalo(hoje, 'mes'), 'mes', -HISTORICO_MESES)
+    colunas = list(zip(*db.session.execute(consulta_historico(desde)))) or [()] * 6
+    
+    return {
+        'id': np.array(colunas[0], dtype=np.int64),
+        'cliente_id': np.array(colunas[1], dtype=np.int64),
+        'valor': np.array(colunas[2], dtype=np.float64),
+        'vencimento': _datas(colunas[3]),
+        'data_pagamento': _datas(colunas[4]),
+        'pago': _status(colunas[5])[0],
+        'ativos': np.unique(np.fromiter(db.session.scalars(consulta_clientes_ativos()), dtype=np.int64))
+    }
+
+def _suavizar(contagem, total, taxa_academia):
+    return (contagem + PESO_ACADEMIA * taxa_academia) / (total + PESO_ACADEMIA)
+
+def montar_taxas(historico, hoje):
+    """
+    Taxas de cada cliente (em dia, com atraso, perdida) e atraso médio, na
+    ordem dos ids em 'clientes'. A última posição tem as da academia, para
+    clientes sem histórico (ver _posicoes)
+    """
+    dia = np.datetime64(hoje, 'D')
+    clientes, cliente = np.unique(historico['cliente_id'], return_inverse=True)
+    quantidade = len(clientes)
+    vencimento = historico['vencimento']
+    pago = historico['pago']
+    
+    # Desfecho das cobranças vencidas (pagamento sem data conta como em dia)
+    pagamento = historico['data_pagamento']
+    atraso = np.where(pago & ~np.isnat(pagamento), (pagamento - vencimento).astype(np.int64), 0)
+    vencida = vencimento < dia
+    com_atraso = vencida & pago & (atraso > 0)
+    em_dia = vencida & pago & ~com_atraso
+    perdida = ~pago & (vencimento < dia - PRAZO_INADIMPLENCIA)
+    
+    def por_cliente(pesos):
+        return np.bincount(cliente, weights=pesos, minlength=quantidade)
+    
+    desfechos = {'em_dia': em_dia, 'com_atraso': com_atraso, 'perdida': perdida}
+    total_academia = sum(int(d.sum()) for d in desfechos.values())
+    # Academia sem histórico: tudo em dia até haver cobranças vencidas
+    taxas_academia = {
+        nome: (int(d.sum()) / total_academia if total_academia else float(nome == 'em_dia'))
+        for nome, d in desfechos.items()
+    }
+    atraso_academia = float(atraso[com_atraso].mean()) if com_atraso.any() else 0.0
+    
+    total = por_cliente(em_dia | com_atraso | perdida)
+    taxas = {
+        nome: np.append(_suavizar(por_cliente(d), total, taxas_academia[nome]), taxas_academia[nome])
+        for nome, d in desfechos.items()
+    }
+    atraso_cliente = np.rint(np.append(_suavizar(
+        por_cliente(np.where(com_atraso, atraso, 0)), por_cliente(com_atraso), atraso_academia
+    ), atraso_academia)).astype(np.int64)
+    
+    return {
+        'dia': hoje,
+        'gerado_em': datetime.utcnow(),
+        'clientes': clientes,
+        'taxas_academia': taxas_academia,
+        'atraso_academia': atraso_academia,
+        'taxas': taxas,
+        'atraso': atraso_cliente
+    }
+
+def cobrancas_recentes(historico, hoje, seq):
+    """
+    Cobranças do histórico vencidas há até DIAS_RECENTES dias (e as a
+    vencer), com os clientes ativos, na posição 'seq' da sequência
+    """
+    desde = np.datetime64(hoje, 'D') - DIAS_RECENTES
+    recente = historico['vencimento'] >= desde
+    
+    return {
+        'seq': seq,
+        'desde': desde,
+        **{coluna: historico[coluna][recente] for coluna in ('id', 'cliente_id', 'valor', 'vencimento', 'pago')},
+        'ativos': historico['ativos']
+    }
+
+def aplicar_alteracoes(recentes, alteracoes, seq):
+    """
+    Cobranças recentes com as alterações (resultados de
+    consultas_alteracoes) aplicadas, na posição 'seq'. Um pagamento
+    alterado substitui a versão anterior e só fica se ainda for recente e
+    estiver pago ou pendente; excluídos saem
+    """
+    colunas = list(zip(*alteracoes['pagamentos'])) or [()] * 5
+    ids = np.array(colunas[0], dtype=np.int64)
+    vencimento = _datas(colunas[3])
+    pago, valida = _status(colunas[4])
+    excluidos = {'clientes': [], 'pagamentos': []}
+    for tabela, registro_id in alteracoes['exclusoes']:
+        excluidos[tabela].append(registro_id)
+    
+    fica = ~np.isin(recentes['id'], np.concatenate([ids, np.array(excluidos['pagamentos'], dtype=np.int64)]))
+    entra = valida & (vencimento >= recentes['desde'])
+    novas = {
+        'id': ids,
+        'cliente_id': np.array(colunas[1], dtype=np.int64),
+        'valor': np.array(colunas[2], dtype=np.float64),
+        'vencimento': vencimento,
+        'pago': pago
+    }
+    
+    clientes = list(zip(*alteracoes['clientes'])) or [(), ()]
+    alterados = np.array(clientes[0], dtype=np.int64)
+    ativos = np.union1d(
+        np.setdiff1d(recentes['ativos'], np.concatenate([alterados, np.array(excluidos['clientes'], dtype=np.int64)])),
+        alterados[np.array(clientes[1], dtype=bool)]
+    )
+    
+    return {
+        'seq': seq,
+        'desde': recentes['desde'],
+        **{coluna: np.concatenate([recentes[coluna][fica], novas[coluna][entra]]) for coluna in novas},
+        'ativos': ativos
+    }
+
+def cobrancas_a_projetar(recentes, hoje):
+    """
+    As cobranças pendentes ainda não perdidas e a base das recorrências (a
+    última cobrança de cada cliente ativo, se recente), por id de cliente
+    """
+    dia = np.datetime64(hoje, 'D')
+    cliente = recentes['cliente_id']
+    valor = recentes['valor']
+    vencimento = recentes['vencimento']
+    
+    aberta = ~recentes['pago'] & (vencimento >= dia - PRAZO_INADIMPLENCIA)
+    
+    ordem = np.lexsort((vencimento, cliente))
+    ultima = ordem[np.r_[cliente[ordem][1:] != cliente[ordem][:-1], True]] if len(ordem) else ordem
+    ultima = ultima[
+        np.isin(cliente[ultima], recentes['ativos'])
+        & (vencimento[ultima] >= dia - JANELA_RECORRENCIA)
+    ]
+    
+    return {
+        'abertas': {'cliente': cliente[aberta], 'valor': valor[aberta], 'vencimento': vencimento[aberta]},
+        'recorrencias': {'cliente': cliente[ultima], 'valor': valor[ultima], 'base': vencimento[ultima]}
+    }
+
+@somente_leitura
+def montar_modelo(hoje):
+    """
+    Modelo do dia da academia atual: as taxas e as cobranças recentes
+    A posição da sequência é lida antes do histórico: o que for alterado
+    entre as duas leituras é aplicado de novo no próximo pedido
+    """
+    seq = db.session.execute(models.consulta_alteracoes_confirmadas()).scalar()
+    historico = carregar_historico(hoje)
+    return {**montar_taxas(historico, hoje), 'recentes': cobrancas_recentes(historico, hoje, seq)}
+
+def _montar_em_segundo_plano(app, chave, hoje, pronto):
+    banco, academia_id = chave
+    try:
+        with app.app_context(), academias.academia(academia_id, banco):
+            _modelos[chave] = montar_modelo(hoje)
+    except Exception:
+        app.logger.exception("Erro ao montar o modelo da previsão (academia %s)", academia_id)
+    finally:
+        with _trava:
+            del _montando[chave]
+        pronto.set()
+
+def montar_em_segundo_plano(hoje):
+    """
+    Começa a montar o modelo do dia da academia atual em uma thread (se
+    já não estiver sendo montado). Retorna o Event marcado no fim
+    """
+    chave = (academias.banco_atual(), academias.academia_atual())
+    with _trava:
+        pronto = _montando.get(chave)
+        if pronto is None:
+            pronto = _montando[chave] = threading.Event()
+            threading.Thread(
+                target=_montar_em_segundo_plano,
+                args=(current_app._get_current_object(), chave, hoje, pronto),
+                name='previsao-modelo',
+                daemon=True
+            ).start()
+    return pronto
+
+def obter_modelo(hoje):
+    """
+    Modelo da academia atual: o do dia ou, enquanto ele é montado em
+    segundo plano, o do dia anterior. Sem nenhum (primeiro pedido da
+    academia no processo), espera a montagem até ESPERA_MODELO segundos
+    Lança ModeloEmPreparo se a montagem não terminar a tempo
+    """
+    chave = (academias.banco_atual(), academias.academia_atual())
+    modelo = _modelos.get(chave)
+    if modelo is not None and modelo['dia'] == hoje:
+        return modelo
+    
+    pronto = montar_em_segundo_plano(hoje)
+    if modelo is None:
+        pronto.wait(ESPERA_MODELO)
+        modelo = _modelos.get(chave)
+        if modelo is None:
+            raise ModeloEmPreparo("Previsão em preparação. Tente novamente em instantes.")
+    return modelo
+
+def atualizar_recentes(modelo):
+    """
+    Cobranças recentes do modelo com as alterações confirmadas desde a
+    última posição aplicada (guardadas no modelo para os próximos pedidos)
+    """
+    recentes = modelo['recentes']
+    ate = db.session.execute(models.consulta_alteracoes_confirmadas()).scalar()
+    if ate <= recentes['seq']:
+        return recentes
+    
+    alteracoes = {
+        nome: db.session.execute(consulta).all()
+        for nome, consulta in consultas_alteracoes(recentes['seq'], ate).items()
+    }
+    recentes = aplicar_alteracoes(recentes, alteracoes, ate)
+    # Pedidos simultâneos podem aplicar as mesmas alterações: fica a mais nova
+    if recentes['seq'] > modelo['recentes']['seq']:
+        modelo['recentes'] = recentes
+    return recentes
+
+def limpar_cache():
+    """
+    Descarta os modelos em memória (montados de novo no próximo pedido)
+    """
+    _modelos.clear()
+
+# ==================== PROJEÇÃO ====================
+
+def _expandir_recorrencias(recorrencias, hoje, ate):
+    """
+    Próximas mensalidades de cada base até 'ate': mês a mês a partir da
+    última cobrança, no mesmo dia (ou no último dia dos meses mais curtos)
+    """
+    base = recorrencias['base']
+    if not len(base):
+        return recorrencias['cliente'], recorrencias['valor'], base
+    
+    mes = base.astype('datetime64[M]')
+    dia_do_mes = base - mes.astype('datetime64[D]')
+    meses = int((np.datetime64(ate, 'M') - mes.min()).astype(np.int64)) + 1
+    alvo = mes[:, None] + np.arange(1, meses + 1)
+    vencimento = np.minimum(
+        alvo.astype('datetime64[D]') + dia_do_mes[:, None],
+        (alvo + 1).astype('datetime64[D]') - 1
+    )
+    
+    dentro = (vencimento >= np.datetime64(hoje, 'D')) & (vencimento < np.datetime64(ate, 'D'))
+    linhas = np.nonzero(dentro)[0]
+    return recorrencias['cliente'][linhas], recorrencias['valor'][linhas], vencimento[dentro]
+
+def _posicoes(modelo, cliente_ids):
+    """
+    Posição de cada cliente nas taxas do modelo; os que não estão nele
+    (sem cobranças no histórico quando foi montado) ficam com a última, a
+    das taxas da academia
+    """
+    clientes = modelo['clientes']
+    posicao = np.searchsorted(clientes, cliente_ids)
+    conhecido = posicao < len(clientes)
+    conhecido[conhecido] = clientes[posicao[conhecido]] == cliente_ids[conhecido]
+    return np.where(conhecido, posicao, len(clientes))
+
+def _parcelas(modelo, cliente, vencimento, dia):
+    """
+    Probabilidade e data da parte em dia e da parte com atraso de cada
+    cobrança. Vencidas: a parte em dia já passou, e a chance de pagamento
+    é a dos atrasos entre os atrasos e as perdas do cliente
+    """
+    taxas = modelo['taxas']
+    em_dia = taxas['em_dia'][cliente]
+    com_atraso = taxas['com_atraso'][cliente]
+    perdida = taxas['perdida'][cliente]
+    
+    vencida = vencimento < dia
+    chance_atraso = np.divide(com_atraso, com_atraso + perdida, out=np.zeros_like(com_atraso), where=(com_atraso + perdida) > 0)
+    prob_dia = np.where(vencida, 0.0, em_dia)
+    prob_atraso = np.where(vencida, chance_atraso, com_atraso)
+    data_atraso = np.maximum(vencimento + modelo['atraso'][cliente], dia)
+    return prob_dia, vencimento, prob_atraso, data_atraso
+
+def _indices(datas, inicio, granularidade, quantidade):
+    """
+    Intervalo de cada data (-1 fora da previsão)
+    """
+    if granularidade == 'mes':
+        indice = (datas.astype('datetime64[M]') - np.datetime64(inicio, 'M')).astype(np.int64)
+    else:
+        indice = (datas - np.datetime64(inicio, 'D')).astype(np.int64) // 7
+    return np.where((indice >= 0) & (indice < quantidade), indice, -1)
+
+def projetar(modelo, cobrancas, intervalos, granularidade, hoje):
+    """
+    Esperado e variância por intervalo das cobranças (ver
+    cobrancas_a_projetar) com as taxas do modelo, separando cobranças em
+    aberto e recorrências: {'abertas': array, 'recorrencias': array,
+    'variancia': array, 'variancia_total': float}
+    """
+    dia = np.datetime64(hoje, 'D')
+    quantidade = len(intervalos)
+    abertas = cobrancas['abertas']
+    grupos = {
+        'abertas': (abertas['cliente'], abertas['valor'], abertas['vencimento']),
+        'recorrencias': _expandir_recorrencias(cobrancas['recorrencias'], hoje, intervalos[-1][1])
+    }
+    
+    resultado = {'variancia': np.zeros(quantidade), 'variancia_total': 0.0}
+    for nome, (cliente_ids, valor, vencimento) in grupos.items():
+        cliente = _posicoes(modelo, cliente_ids)
+        prob_dia, data_dia, prob_atraso, data_atraso = _parcelas(modelo, cliente, vencimento, dia)
+        indice_dia = _indices(data_dia, intervalos[0][0], granularidade, quantidade)
+        indice_atraso = _indices(data_atraso, intervalos[0][0], granularidade, quantidade)
+        quadrado = valor * valor
+        
+        esperado = np.zeros(quantidade)
+        for indice, prob in ((indice_dia, prob_dia), (indice_atraso, prob_atraso)):
+            dentro = indice >= 0
+            esperado += np.bincount(indice[dentro], weights=(valor * prob)[dentro], minlength=quantidade)
+            resultado['variancia'] += np.bincount(
+                indice[dentro], weights=(quadrado * prob * (1 - prob))[dentro], minlength=quantidade
+            )
+        
+        # As duas partes de uma cobrança se excluem: no mesmo intervalo, a
+        # variância é a da soma delas
+        mesmo = (indice_dia >= 0) & (indice_dia == indice_atraso)
+        resultado['variancia'] -= np.bincount(
+            indice_dia[mesmo], weights=(2 * quadrado * prob_dia * prob_atraso)[mesmo], minlength=quantidade
+        )
+        
+        prob_total = prob_dia * (indice_dia >= 0) + prob_atraso * (indice_atraso >= 0)
+        resultado['variancia_total'] += float(np.sum(quadrado * prob_total * (1 - prob_total)))
+        resultado[nome] = esperado
+    
+    return resultado
+
+def _faixa(esperado, variancia):
+    desvio = _Z * max(variancia, 0.0) ** 0.5
+    return {
+        'previsto': round(esperado, 2),
+        'minimo': round(max(esperado - desvio, 0.0), 2),
+        'maximo': round(esperado + desvio, 2)
+    }
+
+def intervalos_previsao(granularidade, quantidade, hoje):
+    """
+    Intervalos da previsão: o atual (a partir de hoje) e os seguintes
+    Lança ValueError se a granularidade ou a quantidade forem inválidas
+    """
+    if granularidade not in GRANULARIDADES:
+        raise ValueError(f"Granularidade inválida (use {', '.join(GRANULARIDADES)}): {granularidade}")
+    if quantidade is None:
+        quantidade = PERIODOS_PADRAO[granularidade]
+    if not 1 <= quantidade <= MAXIMO_PERIODOS[granularidade]:
+        raise ValueError(f"Informe de 1 a {MAXIMO_PERIODOS[granularidade]} períodos ({granularidade})")
+    
+    inicio = inicio_intervalo(hoje, granularidade)
+    return [
+        (proximo_intervalo(inicio, granularidade, i), proximo_intervalo(inicio, granularidade, i + 1))
+        for i in range(quantidade)
+    ]
+
+@somente_leitura
+def obter_previsao(granularidade='mes', quantidade=None):
+    """
+    Recebimentos esperados por semana ou mês, do intervalo atual (a partir
+    de hoje) aos 'quantidade' intervalos seguintes (ver início do arquivo)
+    Lança ValueError se a granularidade ou a quantidade forem inválidas e
+    ModeloEmPreparo se a academia ainda não tiver modelo (ver obter_modelo)
+    """
+    hoje = periodos.hoje()
+    intervalos = intervalos_previsao(granularidade, quantidade, hoje)
+    modelo = obter_modelo(hoje)
+    cobrancas = cobrancas_a_projetar(atualizar_recentes(modelo), hoje)
+    projecao = projetar(modelo, cobrancas, intervalos, granularidade, hoje)
+    
+    serie = []
+    for i, (inicio, fim) in enumerate(intervalos):
+        abertas = float(projecao['abertas'][i])
+        recorrencias = float(projecao['recorrencias'][i])
+        serie.append({
+            'inicio': max(inicio, hoje).isoformat(),
+            'fim': fim.isoformat(),
+            **_faixa(abertas + recorrencias, float(projecao['variancia'][i])),
+            'cobrancas_abertas': round(abertas, 2),
+            'recorrencias': round(recorrencias, 2)
+        })
+    
+    abertas = float(projecao['abertas'].sum())
+    recorrencias = float(projecao['recorrencias'].sum())
+    taxas = modelo['taxas_academia']
+    
+    return {
+        'granularidade': granularidade,
+        'inicio': hoje.isoformat(),
+        'fim': intervalos[-1][1].isoformat(),
+        'confianca': CONFIANCA,
+        'serie': serie,
+        'totais': {
+            **_faixa(abertas + recorrencias, projecao['variancia_total']),
+            'cobrancas_abertas': round(abertas, 2),
+            'recorrencias': round(recorrencias, 2)
+        },
+        'taxas': {
+            'em_dia': round(taxas['em_dia'], 4),
+            'com_atraso': round(taxas['com_atraso'], 4),
+            'perdida': round(taxas['perdida'], 4),
+            'atraso_medio_dias': round(modelo['atraso_academia'], 1)
+        },
+        'clientes': len(modelo['clientes']),
+        'modelo_gerado_em': modelo['gerado_em'].isoformat()
+    }
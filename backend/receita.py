@@ -0,0 +1,279 @@
+"""
+Receita - Série temporal da receita (GET /api/relatorios/receita)
+Para cada dia, semana ou mês do período:
+- recebido: pagamentos pagos, pela data de pagamento (com a divisão por
+  método de pagamento, opcional)
+- faturado: cobranças não canceladas, pelo vencimento
+- cancelado: cobranças canceladas, pelo vencimento
+- vencido: cobranças pendentes com vencimento antes de hoje
+Os totais saem de uma única consulta agrupada por dia (UNION ALL das duas
+datas) e são somados por intervalo aqui, com zero nos intervalos sem
+movimento. Os intervalos encerrados ficam em cache_receita: um gráfico
+de vários anos lê o cache e calcula só o que falta (em geral, o
+intervalo atual). Cada alteração de pagamento apaga do cache os
+intervalos que contêm as datas dele, antes e depois da alteração
+"""
+
+from database import db
+from models import Pagamento, CacheReceita, Sequencia, consulta_alteracoes_confirmadas
+from periodos import Periodo, GRANULARIDADES, inicio_intervalo
+from replicas import somente_leitura, leitura
+from itertools import chain
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import json
+import periodos
+
+METRICAS = ('recebido', 'faturado', 'cancelado', 'vencido')
+
+# Status das cobranças somadas pelo vencimento (a lista permite ao banco
+# usar o índice academia + status + vencimento)
+STATUS_COBRANCA = ('pendente', 'pago', 'cancelado')
+
+# Intervalos por consulta (ex.: 1000 dias, quase 3 anos por dia)
+MAXIMO_INTERVALOS = 1000
+
+# Alterações com mais datas que isto apagam todo o cache da academia
+MAXIMO_DATAS_INVALIDACAO = 200
+
+# ==================== CONSULTAS ====================
+
+def consulta_receita(periodo):
+    """
+    Totais por dia do período: linhas (dia, tipo, metodo, valor), com
+    tipo 'recebido' (por data de pagamento e método) ou o status da
+    cobrança (por vencimento)
+    """
+    recebido = db.select(
+        Pagamento.data_pagamento.label('dia'),
+        db.literal('recebido').label('tipo'),
+        Pagamento.metodo_pagamento.label('metodo'),
+        db.func.sum(Pagamento.valor).label('valor')
+    ).where(
+        Pagamento.status == 'pago',
+        periodo.filtro(Pagamento.data_pagamento)
+    ).group_by(Pagamento.data_pagamento, Pagamento.metodo_pagamento)
+    
+    por_vencimento = db.select(
+        Pagamento.vencimento,
+        Pagamento.status,
+        db.null(),
+        db.func.sum(Pagamento.valor)
+    ).where(
+        Pagamento.status.in_(STATUS_COBRANCA),
+        periodo.filtro(Pagamento.vencimento)
+    ).group_by(Pagamento.vencimento, Pagamento.status)
+    
+    return db.union_all(recebido, por_vencimento)
+
+def consulta_cache(granularidade, inicio, fim):
+    """
+    Intervalos guardados no cache entre 'inicio' e 'fim'
+    """
+    return db.select(CacheReceita).where(
+        CacheReceita.granularidade == granularidade,
+        CacheReceita.inicio >= inicio,
+        CacheReceita.inicio < fim
+    )
+
+def consulta_versao():
+    """
+    Contador de alterações (muda a cada pagamento alterado, ver
+    CONTROLE DE ALTERAÇÕES em models.py)
+    """
+    return db.select(Sequencia.valor).where(Sequencia.nome == 'alteracoes')
+
+# ==================== MONTAGEM DA SÉRIE ====================
+
+def intervalos_receita(periodo, granularidade):
+    """
+    Intervalos da série (padrão: os 12 últimos, até o atual)
+    Lança ValueError se a granularidade ou o período forem inválidos
+    """
+    if granularidade not in GRANULARIDADES:
+        raise ValueError(f"Granularidade inválida (use {', '.join(GRANULARIDADES)}): {granularidade}")
+    return (periodo or Periodo()).intervalos(granularidade, maximo=MAXIMO_INTERVALOS)
+
+def _vazio():
+    return {**{metrica: 0.0 for metrica in METRICAS}, 'por_metodo': {}}
+
+def totalizar(linhas, intervalos, granularidade, hoje):
+    """
+    Soma as linhas de consulta_receita por intervalo: {inicio: totais}
+    """
+    totais = {inicio: _vazio() for inicio, _ in intervalos}
+    
+    for linha in linhas:
+        item = totais.get(inicio_intervalo(linha.dia, granularidade))
+        if item is None:
+            continue
+        valor = float(linha.valor or 0)
+        
+        if linha.tipo == 'recebido':
+            item['recebido'] += valor
+            metodo = linha.metodo or 'nao_informado'
+            item['por_metodo'][metodo] = item['por_metodo'].get(metodo, 0) + valor
+        elif linha.tipo == 'cancelado':
+            item['cancelado'] += valor
+        else:
+            item['faturado'] += valor
+            if linha.tipo == 'pendente' and linha.dia < hoje:
+                item['vencido'] += valor
+    
+    return totais
+
+def do_cache(guardados):
+    """
+    Totais dos intervalos lidos de consulta_cache: {inicio: totais}
+    """
+    return {c.inicio: json.loads(c.dados) for c in guardados}
+
+def para_cache(totais, encerrados, granularidade):
+    """
+    Registros de cache dos intervalos encerrados calculados agora
+    """
+    return [
+        CacheReceita(granularidade=granularidade, inicio=inicio, fim=fim, dados=json.dumps(totais[inicio]))
+        for inicio, fim in encerrados
+    ]
+
+def montar_serie(intervalos, totais, granularidade, por_metodo=False):
+    """
+    Resposta do relatório: a série (um item por intervalo, 'fim' fora do
+    intervalo) e os totais do período
+    """
+    soma = _vazio()
+    serie = []
+    
+    for inicio, fim in intervalos:
+        item = totais[inicio]
+        linha = {'inicio': inicio.isoformat(), 'fim': fim.isoformat()}
+        for metrica in METRICAS:
+            linha[metrica] = round(item[metrica], 2)
+            soma[metrica] += item[metrica]
+        if por_metodo:
+            linha['por_metodo'] = {metodo: round(valor, 2) for metodo, valor in item['por_metodo'].items()}
+            for metodo, valor in item['por_metodo'].items():
+                soma['por_metodo'][metodo] = soma['por_metodo'].get(metodo, 0) + valor
+        serie.append(linha)
+    
+    resumo = {metrica: round(soma[metrica], 2) for metrica in METRICAS}
+    if por_metodo:
+        resumo['por_metodo'] = {metodo: round(valor, 2) for metodo, valor in soma['por_metodo'].items()}
+    
+    return {
+        'granularidade': granularidade,
+        'inicio': intervalos[0][0].isoformat(),
+        'fim': intervalos[-1][1].isoformat(),
+        'serie': serie,
+        'totais': resumo
+    }
+
+# ==================== OPERAÇÕES ====================
+
+def _calcular(faltando, granularidade, hoje):
+    """
+    Calcula os intervalos que não estão no cache e guarda os encerrados
+    """
+    periodo = Periodo(faltando[0][0], faltando[-1][1])
+    encerrados = [(inicio, fim) for inicio, fim in faltando if fim <= hoje]
+    if not encerrados:
+        return totalizar(db.session.execute(consulta_receita(periodo)), faltando, granularidade, hoje)
+    
+    # O que vai para o cache é calculado no banco principal (uma réplica
+    # atrasada guardaria valores antigos)
+    with leitura(False):
+        # Posição sem nenhuma alteração anterior por confirmar: se alguma
+        # transação ainda tinha número reservado, ela fica abaixo do
+        # contador e o resultado não é guardado
+        versao = db.session.scalar(consulta_alteracoes_confirmadas())
+        totais = totalizar(db.session.execute(consulta_receita(periodo)), faltando, granularidade, hoje)
+        
+        db.session.add_all(para_cache(totais, encerrados, granularidade))
+        try:
+            db.session.flush()
+            # Trava o contador até o commit: quem alterar um pagamento agora
+            # espera e, em seguida, apaga do cache o intervalo afetado. Se algum
+            # pagamento mudou durante o cálculo, o resultado não é guardado
+            if db.session.scalar(consulta_versao().with_for_update()) == versao:
+                db.session.commit()
+            else:
+                db.session.rollback()
+        except IntegrityError:
+            # Outra requisição guardou os mesmos intervalos
+            db.session.rollback()
+    
+    return totais
+
+@somente_leitura
+def obter_receita(periodo=None, granularidade='mes', por_metodo=False):
+    """
+    Série de receita por dia, semana ou mês (ver início do arquivo)
+    periodo: Periodo da série (padrão: os 12 últimos intervalos)
+    por_metodo: divide o recebido por método de pagamento
+    Lança ValueError se a granularidade ou o período forem inválidos
+    """
+    intervalos = intervalos_receita(periodo, granularidade)
+    inicio, fim = intervalos[0][0], intervalos[-1][1]
+    
+    totais = do_cache(db.session.scalars(consulta_cache(granularidade, inicio, fim)))
+    faltando = [(i, f) for i, f in intervalos if i not in totais]
+    if faltando:
+        totais.update(_calcular(faltando, granularidade, periodos.hoje()))
+    
+    return montar_serie(intervalos, totais, granularidade, por_metodo)
+
+def limpar_cache():
+    """
+    Apaga todo o cache de receita (da academia atual, ou de todas)
+    """
+    removidos = db.session.execute(db.delete(CacheReceita)).rowcount
+    db.session.commit()
+    return removidos
+
+# ==================== INVALIDAÇÃO DO CACHE ====================
+
+@event.listens_for(Session, 'before_flush')
+def _coletar_datas_anteriores(session, flush_context, instances):
+    """
+    Guarda as datas anteriores dos pagamentos alterados neste flush
+    (depois do flush só restam as novas)
+    """
+    pagamentos = session.info.setdefault('receita_pagamentos', {})
+    
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, Pagamento):
+            continue
+        datas = pagamentos.setdefault(obj, set())
+        for campo in ('vencimento', 'data_pagamento'):
+            datas.update(inspect(obj).attrs[campo].history.deleted)
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _invalidar_cache(session, flush_context):
+    """
+    Apaga do cache os intervalos que contêm as datas (anteriores e novas)
+    dos pagamentos alterados, na mesma transação da alteração
+    """
+    pagamentos = session.info.pop('receita_pagamentos', {})
+    if not pagamentos:
+        return
+    
+    por_academia = {}
+    for obj, datas in pagamentos.items():
+        datas.update((obj.vencimento, obj.data_pagamento))
+        por_academia.setdefault(obj.academia_id, set()).update(d for d in datas if d)
+    
+    cache = CacheReceita.__table__
+    conexao = session.connection()
+    for academia_id, datas in por_academia.items():
+        condicao = cache.c.academia_id == academia_id
+        if len(datas) <= MAXIMO_DATAS_INVALIDACAO:
+            condicao = db.and_(condicao, db.or_(*(
+                db.and_(cache.c.inicio <= dia, cache.c.fim > dia) for dia in datas
+            )))
+        conexao.execute(cache.delete().where(condicao))
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar_datas(session, previous_transaction):
+    session.info.pop('receita_pagamentos', None)
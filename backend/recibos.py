@@ -0,0 +1,569 @@
+"""
+Recibos - Recibos de pagamento e extratos de pagamentos dos clientes
+Recibo: um pagamento pago. Extrato: os pagamentos feitos no período (pela
+data de pagamento) e as cobranças em aberto que vencem nele, com totais;
+o padrão é o ano atual (extrato anual). Ambos saem em PDF ou HTML, a
+partir do histórico do cliente (obter_historico_pagamentos)
+Os extratos de todos os clientes de um período são gerados fora do
+servidor (python manutencao.py recibos-extratos): um pool de processos
+monta os arquivos enquanto o processo principal lê o lote seguinte do
+banco e grava os prontos no zip. O progresso fica em
+'<zip>.progresso.json'; uma execução interrompida continua de onde parou
+O PDF é gerado aqui mesmo (texto em Helvetica/Courier, sem dependências)
+"""
+
+from database import db
+from models import Academia, Cliente, Pagamento
+from lembretes import formatar_valor
+from replicas import somente_leitura
+from periodos import Periodo
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from html import escape
+from string import Template
+import academias
+import json
+import models
+import os
+import periodos
+import re
+import struct
+import unicodedata
+import zipfile
+import zlib
+
+FORMATOS = {'pdf': 'application/pdf', 'html': 'text/html'}
+
+# Nome exibido quando a academia não é encontrada
+EMITENTE = os.environ.get('RECIBOS_EMITENTE', 'FlowFit')
+
+# Processos do pool e clientes lidos do banco por vez na geração em lote
+PROCESSOS = int(os.environ.get('RECIBOS_PROCESSOS', 0)) or os.cpu_count() or 1
+LOTE = 200
+
+# Cabeçalho local de cada entrada do zip (especificação APPNOTE, 4.3.7)
+CABECALHO_ZIP = struct.Struct('<4s2B4HL2L2H')
+ASSINATURA_ZIP = b'PK\x03\x04'
+
+# ==================== DOCUMENTOS ====================
+
+def _data(texto):
+    return date.fromisoformat(texto).strftime('%d/%m/%Y') if texto else '-'
+
+def _linha_tabela(p, data):
+    return [_data(p[data]), p['descricao'] or 'Mensalidade', p['metodo_pagamento'] or '-', formatar_valor(p['valor'])]
+
+def documento_recibo(dados):
+    """
+    Conteúdo do recibo, no formato comum aos dois renderizadores
+    """
+    p = dados['pagamento']
+    return {
+        'titulo': f"Recibo nº {p['id']:08d}",
+        'emitente': dados['emitente'],
+        'campos': [
+            ('Cliente', dados['cliente']['nome']),
+            ('CPF', dados['cliente']['cpf'] or '-'),
+            ('Referente a', p['descricao'] or 'Mensalidade'),
+            ('Vencimento', _data(p['vencimento'])),
+            ('Pago em', _data(p['data_pagamento'])),
+            ('Forma de pagamento', p['metodo_pagamento'] or '-'),
+            ('Valor', formatar_valor(p['valor']))
+        ],
+        'tabelas': [],
+        'rodape': f"Recebemos de {dados['cliente']['nome']} a importância de {formatar_valor(p['valor'])}. "
+                  f"Emitido em {_data(dados['emitido_em'])}."
+    }
+
+def documento_extrato(dados):
+    """
+    Conteúdo do extrato, no formato comum aos dois renderizadores
+    """
+    colunas = [('Data', 10, 'l'), ('Descrição', 30, 'l'), ('Forma', 14, 'l'), ('Valor', 16, 'r')]
+    periodo = f"{_data(dados['periodo']['inicio'])} a {_data(dados['periodo']['fim'])}"
+    return {
+        'titulo': 'Extrato de pagamentos',
+        'emitente': dados['emitente'],
+        'campos': [
+            ('Cliente', dados['cliente']['nome']),
+            ('CPF', dados['cliente']['cpf'] or '-'),
+            ('Período', periodo)
+        ],
+        'tabelas': [
+            {
+                'titulo': 'Pagamentos realizados',
+                'colunas': colunas,
+                'linhas': [_linha_tabela(p, 'data_pagamento') for p in dados['pagos']],
+                'total': formatar_valor(dados['total_pago'])
+            },
+            {
+                'titulo': 'Em aberto (por vencimento)',
+                'colunas': colunas,
+                'linhas': [_linha_tabela(p, 'vencimento') for p in dados['em_aberto']],
+                'total': formatar_valor(dados['total_em_aberto'])
+            }
+        ],
+        'rodape': f"Emitido em {_data(dados['emitido_em'])}."
+    }
+
+DOCUMENTOS = {'recibo': documento_recibo, 'extrato': documento_extrato}
+
+# ==================== HTML ====================
+
+PAGINA_HTML = Template('''<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>$titulo</title>
+<style>
+body { font-family: Helvetica, Arial, sans-serif; color: #222; max-width: 760px; margin: 32px auto; }
+h1 { font-size: 20px; margin-bottom: 0; }
+.emitente { color: #666; margin-top: 4px; }
+dl { display: grid; grid-template-columns: 180px 1fr; gap: 4px 12px; }
+dt { font-weight: bold; }
+dd { margin: 0; }
+table { width: 100%; border-collapse: collapse; margin-bottom: 16px; }
+th, td { text-align: left; padding: 4px 6px; border-bottom: 1px solid #ddd; }
+.r { text-align: right; }
+tfoot td { font-weight: bold; border-bottom: none; }
+footer { margin-top: 24px; color: #444; }
+</style>
+</head>
+<body>
+<h1>$titulo</h1>
+<p class="emitente">$emitente</p>
+<dl>$campos</dl>
+$tabelas
+<footer>$rodape</footer>
+</body>
+</html>
+''')
+
+def _tabela_html(tabela):
+    classes = ['r' if alinhamento == 'r' else '' for _, _, alinhamento in tabela['colunas']]
+    cabecalho = ''.join(f'<th class="{c}">{escape(nome)}</th>' for (nome, _, _), c in zip(tabela['colunas'], classes))
+    linhas = ''.join(
+        '<tr>' + ''.join(f'<td class="{c}">{escape(valor)}</td>' for valor, c in zip(linha, classes)) + '</tr>'
+        for linha in tabela['linhas']
+    ) or f'<tr><td colspan="{len(classes)}">Nenhum lançamento</td></tr>'
+    return (
+        f'<h2>{escape(tabela["titulo"])}</h2><table><thead><tr>{cabecalho}</tr></thead>'
+        f'<tbody>{linhas}</tbody><tfoot><tr><td colspan="{len(classes) - 1}">Total</td>'
+        f'<td class="r">{escape(tabela["total"])}</td></tr></tfoot></table>'
+    )
+
+def html(documento):
+    """
+    Página HTML completa (com estilo embutido) do documento
+    """
+    return PAGINA_HTML.substitute(
+        titulo=escape(documento['titulo']),
+        emitente=escape(documento['emitente']),
+        campos=''.join(f'<dt>{escape(r)}</dt><dd>{escape(v)}</dd>' for r, v in documento['campos']),
+        tabelas='\n'.join(_tabela_html(t) for t in documento['tabelas']),
+        rodape=escape(documento['rodape'])
+    ).encode('utf-8')
+
+# ==================== PDF ====================
+
+# Fontes padrão do PDF (não precisam ser embutidas): (recurso, tamanho, altura da linha)
+FONTES_PDF = {
+    'titulo': ('F2', 16, 24),
+    'negrito': ('F2', 10, 15),
+    'normal': ('F1', 10, 15),
+    'tabela': ('F3', 9, 12)
+}
+PAGINA_PDF = (595, 842)  # A4 em pontos
+MARGEM_PDF = 50
+
+def _texto_pdf(texto):
+    # WinAnsiEncoding (cp1252) cobre os acentos do português
+    bruto = texto.encode('cp1252', errors='replace')
+    return bruto.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+def _celula(valor, largura, alinhamento):
+    valor = valor if len(valor) <= largura else valor[:largura - 1] + '…'
+    return valor.rjust(largura) if alinhamento == 'r' else valor.ljust(largura)
+
+def _linhas_pdf(documento):
+    """
+    Documento em linhas (estilo, texto); as tabelas usam fonte de largura
+    fixa para alinhar as colunas
+    """
+    linhas = [('titulo', documento['titulo']), ('normal', documento['emitente']), ('normal', '')]
+    linhas += [('normal', f'{rotulo}: {valor}') for rotulo, valor in documento['campos']]
+    
+    for tabela in documento['tabelas']:
+        colunas = tabela['colunas']
+        largura = sum(l for _, l, _ in colunas) + len(colunas) - 1
+        linhas += [('normal', ''), ('negrito', tabela['titulo'])]
+        linhas.append(('tabela', ' '.join(_celula(nome, l, a) for nome, l, a in colunas)))
+        linhas.append(('tabela', '-' * largura))
+        linhas += [('tabela', ' '.join(_celula(v, l, a) for v, (_, l, a) in zip(linha, colunas)))
+                   for linha in tabela['linhas']] or [('tabela', 'Nenhum lançamento')]
+        linhas.append(('tabela', '-' * largura))
+        linhas.append(('tabela', 'Total'.ljust(largura - len(tabela['total'])) + tabela['total']))
+    
+    linhas += [('normal', ''), ('normal', documento['rodape'])]
+    return linhas
+
+def pdf(documento):
+    """
+    PDF (1.4) do documento, com quantas páginas A4 forem necessárias
+    """
+    largura, altura = PAGINA_PDF
+    paginas, atual, y = [], [], altura - MARGEM_PDF
+    for estilo, texto in _linhas_pdf(documento):
+        fonte, tamanho, entrelinha = FONTES_PDF[estilo]
+        if y - entrelinha < MARGEM_PDF:
+            paginas.append(atual)
+            atual, y = [], altura - MARGEM_PDF
+        y -= entrelinha
+        if texto:
+            atual.append(b'BT /%s %d Tf %d %d Td (%s) Tj ET' % (fonte.encode(), tamanho, MARGEM_PDF, y, _texto_pdf(texto)))
+    paginas.append(atual)
+    
+    # Objetos: 1 catálogo, 2 páginas, 3-5 fontes, depois página e conteúdo de cada página
+    fontes = b''.join(b'/F%d %d 0 R ' % (i, i + 2) for i in (1, 2, 3))
+    objetos = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % (6 + 2 * i) for i in range(len(paginas))), len(paginas)),
+    ] + [
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % nome
+        for nome in (b'Helvetica', b'Helvetica-Bold', b'Courier')
+    ]
+    for i, comandos in enumerate(paginas):
+        conteudo = b'\n'.join(comandos)
+        objetos.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s>> >> '
+                       b'/Contents %d 0 R >>' % (largura, altura, fontes, 7 + 2 * i))
+        objetos.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(conteudo), conteudo))
+    
+    saida = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    posicoes = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posicoes.append(len(saida))
+        saida += b'%d 0 obj\n%s\nendobj\n' % (numero, objeto)
+    inicio_xref = len(saida)
+    saida += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1)
+    saida += b''.join(b'%010d 00000 n \n' % posicao for posicao in posicoes)
+    saida += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objetos) + 1, inicio_xref)
+    return bytes(saida)
+
+RENDERIZADORES = {'pdf': pdf, 'html': html}
+
+def renderizar(tipo, dados, formato):
+    """
+    Conteúdo (bytes) do recibo ou extrato no formato pedido
+    """
+    return RENDERIZADORES[formato](DOCUMENTOS[tipo](dados))
+
+def _renderizar_item(item):
+    # Executada nos processos do pool: só recebe e devolve dados simples
+    nome, tipo, dados, formato = item
+    return nome, renderizar(tipo, dados, formato)
+
+# ==================== DADOS ====================
+
+def _validar_formato(formato):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido (use {', '.join(FORMATOS)}): {formato}")
+
+def _no_periodo(texto, periodo):
+    if not texto:
+        return False
+    dia = date.fromisoformat(texto)
+    return (not periodo.inicio or dia >= periodo.inicio) and (not periodo.fim or dia < periodo.fim)
+
+def nome_academia(academia_id, cache=None):
+    """
+    Nome da academia (o cadastro fica sempre no banco principal)
+    """
+    if cache is not None and academia_id in cache:
+        return cache[academia_id]
+    with academias.academia(None):
+        nome = db.session.scalar(db.select(Academia.nome).where(Academia.id == academia_id)) or EMITENTE
+    if cache is not None:
+        cache[academia_id] = nome
+    return nome
+
+def _cliente_para_dict(cliente):
+    return {'id': cliente.id, 'nome': cliente.nome, 'cpf': cliente.cpf, 'email': cliente.email}
+
+def dados_extrato(cliente, historico, periodo, emitente):
+    """
+    Dados do extrato a partir do histórico do cliente (dicionários de
+    historico_pagamento_para_dict): pagos no período pela data de
+    pagamento, pendentes pelo vencimento, em ordem de data
+    """
+    pagos = sorted((p for p in historico if p['status'] == 'pago' and _no_periodo(p['data_pagamento'], periodo)),
+                   key=lambda p: p['data_pagamento'])
+    em_aberto = sorted((p for p in historico if p['status'] == 'pendente' and _no_periodo(p['vencimento'], periodo)),
+                       key=lambda p: p['vencimento'])
+    
+    # Período aberto de um lado: começa no primeiro / termina no último lançamento
+    datas = [p['data_pagamento'] for p in pagos] + [p['vencimento'] for p in em_aberto]
+    inicio = periodo.inicio.isoformat() if periodo.inicio else min(datas, default=None)
+    fim = (date.fromordinal(periodo.fim.toordinal() - 1).isoformat() if periodo.fim
+           else max(datas, default=periodos.hoje().isoformat()))
+    
+    return {
+        'emitente': emitente,
+        'cliente': _cliente_para_dict(cliente),
+        'periodo': {'inicio': inicio, 'fim': fim},
+        'pagos': pagos,
+        'em_aberto': em_aberto,
+        'total_pago': round(sum(p['valor'] for p in pagos), 2),
+        'total_em_aberto': round(sum(p['valor'] for p in em_aberto), 2),
+        'emitido_em': periodos.hoje().isoformat()
+    }
+
+def _slug(texto):
+    texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '-', texto.lower()).strip('-') or 'cliente'
+
+def nome_arquivo_extrato(cliente, periodo, formato):
+    """
+    extrato-2025-000123-ana-souza.pdf (ano) ou extrato-2025-01-01-...-000123-...
+    """
+    if periodo.inicio and periodo.fim == date(periodo.inicio.year + 1, 1, 1) and periodo.inicio.month == periodo.inicio.day == 1:
+        rotulo = str(periodo.inicio.year)
+    else:
+        rotulo = f"{periodo.inicio or 'inicio'}-a-{periodo.fim or 'hoje'}"
+    return f'extrato-{rotulo}-{cliente.id:06d}-{_slug(cliente.nome)}.{formato}'
+
+# ==================== RECIBO E EXTRATO DE UM CLIENTE ====================
+
+@somente_leitura
+def gerar_recibo(pagamento_id, formato='pdf'):
+    """
+    Recibo de um pagamento pago: {"conteudo", "nome_arquivo", "mimetype"}
+    Retorna None se o pagamento não existir
+    Lança ValueError se o formato for inválido ou o pagamento não estiver pago
+    """
+    _validar_formato(formato)
+    pagamento = db.session.scalars(
+        db.select(Pagamento).join(Pagamento.cliente).options(db.contains_eager(Pagamento.cliente))
+        .where(Pagamento.id == pagamento_id)
+    ).first()
+    if pagamento is None:
+        return None
+    if pagamento.status != 'pago':
+        raise ValueError("Só pagamentos pagos têm recibo")
+    
+    dados = {
+        'emitente': nome_academia(pagamento.academia_id),
+        'cliente': _cliente_para_dict(pagamento.cliente),
+        'pagamento': models.historico_pagamento_para_dict(pagamento),
+        'emitido_em': periodos.hoje().isoformat()
+    }
+    return {
+        'conteudo': renderizar('recibo', dados, formato),
+        'nome_arquivo': f'recibo-{pagamento.id:08d}.{formato}',
+        'mimetype': FORMATOS[formato]
+    }
+
+@somente_leitura
+def gerar_extrato(cliente_id, periodo=None, formato='pdf'):
+    """
+    Extrato de pagamentos do cliente no período (padrão: ano atual):
+    {"conteudo", "nome_arquivo", "mimetype"}
+    Retorna None se o cliente não existir
+    Lança ValueError se o formato for inválido
+    """
+    _validar_formato(formato)
+    periodo = periodo or Periodo.ano()
+    cliente = db.session.scalars(db.select(Cliente).where(Cliente.id == cliente_id)).first()
+    if cliente is None:
+        return None
+    
+    historico = models.obter_historico_pagamentos(cliente_id)
+    dados = dados_extrato(cliente, historico, periodo, nome_academia(cliente.academia_id))
+    return {
+        'conteudo': renderizar('extrato', dados, formato),
+        'nome_arquivo': nome_arquivo_extrato(cliente, periodo, formato),
+        'mimetype': FORMATOS[formato]
+    }
+
+# ==================== EXTRATOS EM LOTE ====================
+
+def filtro_extrato(periodo):
+    """
+    Pagamentos que entram no extrato: pagos no período ou pendentes com
+    vencimento nele
+    """
+    return db.or_(
+        db.and_(Pagamento.status == 'pago', periodo.filtro(Pagamento.data_pagamento)),
+        db.and_(Pagamento.status == 'pendente', periodo.filtro(Pagamento.vencimento))
+    )
+
+def consulta_clientes(apos_id=0, limite=LOTE):
+    """
+    Próximos clientes em ordem de id, a partir do último lido (keyset)
+    """
+    return db.select(Cliente).where(Cliente.id > apos_id).order_by(Cliente.id).limit(limite)
+
+def consulta_historicos(clientes):
+    """
+    Como consulta_historico_pagamentos, para vários clientes de uma vez
+    (a academia de cada um entra no filtro para usar o índice
+    academia + cliente mesmo sem uma academia fixada)
+    """
+    return db.select(Pagamento)\
+        .outerjoin(Pagamento.usuario_registro)\
+        .options(db.contains_eager(Pagamento.usuario_registro))\
+        .where(
+            Pagamento.academia_id.in_({c.academia_id for c in clientes}),
+            Pagamento.cliente_id.in_([c.id for c in clientes])
+        )
+
+def _ler_lote(periodo, formato, apos_id, emitentes):
+    """
+    Próximo lote de clientes: (id do último cliente lido, itens do pool
+    [(nome, tipo, dados, formato)] dos clientes com lançamentos no período)
+    Retorna (None, []) quando não há mais clientes
+    """
+    clientes = db.session.scalars(consulta_clientes(apos_id)).all()
+    if not clientes:
+        return None, []
+    
+    historicos = {}
+    for p in db.session.scalars(consulta_historicos(clientes)):
+        historicos.setdefault(p.cliente_id, []).append(models.historico_pagamento_para_dict(p))
+    
+    itens = []
+    for cliente in clientes:
+        dados = dados_extrato(cliente, historicos.get(cliente.id, []), periodo, nome_academia(cliente.academia_id, emitentes))
+        if dados['pagos'] or dados['em_aberto']:
+            itens.append((nome_arquivo_extrato(cliente, periodo, formato), 'extrato', dados, formato))
+    ultimo_id = clientes[-1].id
+    
+    # Só dados simples seguem adiante: a sessão não acumula os lotes lidos
+    db.session.expunge_all()
+    return ultimo_id, itens
+
+def _ler_progresso(caminho):
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+def _gravar_progresso(caminho, progresso):
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(progresso, arquivo, indent=2)
+    os.replace(temporario, caminho)
+
+def _recuperar_zip(destino, log):
+    """
+    Zip sem o diretório central (processo encerrado enquanto gravava um
+    lote): passa para um zip novo as entradas completas, lidas pelos
+    cabeçalhos locais em sequência, até a primeira incompleta
+    Retorna os nomes recuperados
+    """
+    danificado = destino + '.danificado'
+    os.replace(destino, danificado)
+    nomes = set()
+    
+    with open(danificado, 'rb') as origem, \
+            zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        while True:
+            cabecalho = origem.read(CABECALHO_ZIP.size)
+            if len(cabecalho) < CABECALHO_ZIP.size or cabecalho[:4] != ASSINATURA_ZIP:
+                break
+            _, _, _, flags, metodo, _, _, crc, tamanho, _, tamanho_nome, tamanho_extra = CABECALHO_ZIP.unpack(cabecalho)
+            nome = origem.read(tamanho_nome).decode('utf-8' if flags & 0x800 else 'cp437')
+            origem.seek(tamanho_extra, os.SEEK_CUR)
+            dados = origem.read(tamanho)
+            try:
+                conteudo = zlib.decompress(dados, -15) if metodo == zipfile.ZIP_DEFLATED else dados
+            except zlib.error:
+                break
+            # Entrada pela metade: dados cortados, ou cabeçalho ainda sem
+            # tamanho e CRC (o zipfile os grava depois dos dados)
+            if not conteudo or len(dados) < tamanho or zlib.crc32(conteudo) != crc:
+                break
+            arquivo_zip.writestr(nome, conteudo)
+            nomes.add(nome)
+    
+    os.remove(danificado)
+    log(f"{destino} estava danificado (execução interrompida): {len(nomes)} extrato(s) recuperado(s)")
+    return nomes
+
+def gerar_extratos(periodo, destino, formato='pdf', processos=None, recomecar=False, log=print):
+    """
+    Gera o extrato de cada cliente com lançamentos no período no zip 'destino'
+    Os clientes são lidos em lotes, com o histórico completo de cada um
+    (pelo índice academia + cliente). Enquanto o pool de processos monta
+    os arquivos de um lote, o lote seguinte é lido do banco; os prontos vão para o zip e o progresso
+    (último cliente gravado) para '<destino>.progresso.json' ao fim de
+    cada lote. Se a execução for interrompida, a próxima com o mesmo
+    período e formato continua após o último cliente gravado (se o
+    processo foi encerrado durante a gravação, o zip sem diretório central
+    é recuperado por _recuperar_zip)
+    recomecar: apaga o zip e o progresso anteriores
+    Lança ValueError se o formato for inválido ou o progresso encontrado
+    for de outro período/formato
+    """
+    _validar_formato(formato)
+    arquivo_progresso = destino + '.progresso.json'
+    chave = {'inicio': periodo.inicio and periodo.inicio.isoformat(),
+             'fim': periodo.fim and periodo.fim.isoformat(), 'formato': formato}
+    
+    if recomecar:
+        for caminho in (destino, arquivo_progresso):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+    
+    progresso = _ler_progresso(arquivo_progresso)
+    if progresso and progresso['chave'] != chave:
+        raise ValueError(f"{arquivo_progresso} é de outro período ou formato: use recomecar")
+    if progresso and progresso['concluido']:
+        log(f"Já concluído: {progresso['gerados']} extrato(s) em {destino}")
+        return {"success": True, **progresso}
+    if not progresso:
+        if os.path.exists(destino):
+            raise ValueError(f"{destino} já existe e não tem progresso salvo: use recomecar")
+        total = db.session.scalar(db.select(db.func.count(db.distinct(Pagamento.cliente_id))).where(filtro_extrato(periodo)))
+        progresso = {'chave': chave, 'total': total, 'gerados': 0, 'ultimo_cliente_id': 0,
+                     'concluido': False, 'iniciado_em': datetime.now().isoformat()}
+    elif progresso['gerados']:
+        log(f"Continuando após o cliente {progresso['ultimo_cliente_id']} "
+            f"({progresso['gerados']}/{progresso['total']} já gerados)")
+    
+    # Arquivos gravados depois do último progresso salvo (interrupção
+    # entre o zip e o progresso) não são repetidos
+    existentes = set()
+    if os.path.exists(destino):
+        try:
+            with zipfile.ZipFile(destino) as arquivo_zip:
+                existentes = set(arquivo_zip.namelist())
+        except zipfile.BadZipFile:
+            existentes = _recuperar_zip(destino, log)
+    
+    emitentes = {}
+    with ProcessPoolExecutor(max_workers=processos or PROCESSOS) as pool:
+        ultimo_id, itens = _ler_lote(periodo, formato, progresso['ultimo_cliente_id'], emitentes)
+        while ultimo_id is not None:
+            prontos = pool.map(_renderizar_item, itens, chunksize=8)
+            seguinte = _ler_lote(periodo, formato, ultimo_id, emitentes)
+            # O lote inteiro fica pronto antes de abrir o zip: ele fica sem
+            # diretório central só enquanto grava, não enquanto o pool trabalha
+            prontos = list(prontos)
+            
+            with zipfile.ZipFile(destino, 'a', compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+                for nome, conteudo in prontos:
+                    if nome not in existentes:
+                        arquivo_zip.writestr(nome, conteudo)
+                    progresso['gerados'] += 1
+            
+            progresso['ultimo_cliente_id'] = ultimo_id
+            progresso['atualizado_em'] = datetime.now().isoformat()
+            _gravar_progresso(arquivo_progresso, progresso)
+            log(f"{progresso['gerados']}/{progresso['total']} extrato(s)")
+            ultimo_id, itens = seguinte
+    
+    progresso['concluido'] = True
+    _gravar_progresso(arquivo_progresso, progresso)
+    return {"success": True, **progresso}
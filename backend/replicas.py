@@ -0,0 +1,241 @@
+"""
+Réplicas - Roteamento de leituras para réplicas do banco de dados
+Leituras (rotas GET e funções de relatório) vão para uma réplica saudável;
+escritas, e as leituras de um usuário logo após uma escrita dele,
+continuam no banco principal. Réplica com falha ou atrasada demais é
+deixada de lado e a leitura volta para o principal
+Configuração: DATABASE_REPLICA_URLS=url1,url2 (vazio = sem réplicas)
+"""
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+from contextvars import ContextVar
+from contextlib import contextmanager
+from functools import wraps
+import academias
+import database
+import itertools
+import os
+import threading
+import time
+
+REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+# Janela em que as leituras do usuário seguem no principal após uma escrita
+STICKY_SEGUNDOS = float(os.environ.get('REPLICA_STICKY_SEGUNDOS', 5))
+
+# Atraso máximo de replicação aceito (segundos, apenas PostgreSQL)
+ATRASO_MAXIMO = float(os.environ.get('REPLICA_ATRASO_MAXIMO', 10))
+
+# Intervalo entre verificações de saúde de cada réplica
+INTERVALO_VERIFICACAO = float(os.environ.get('REPLICA_VERIFICACAO_SEGUNDOS', 5))
+
+# Cabeçalho com o horário da última escrita, devolvido pelo servidor e
+# reenviado pelo frontend (vale entre processos/workers diferentes)
+CABECALHO_ESCRITA = 'X-Ultima-Escrita'
+
+_leitura = ContextVar('leitura_replica', default=None)
+_estado = {}
+_ultima_escrita = {}
+_lock = threading.Lock()
+_rodizio = itertools.count()
+
+# ==================== CONFIGURAÇÃO ====================
+
+def configurar(app):
+    """
+    Registra as réplicas como binds adicionais (replica_0, replica_1, ...)
+    Deve ser chamada antes de database.init_db
+    """
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for i, url in enumerate(REPLICA_URLS):
+        binds[f'replica_{i}'] = url
+    
+    app.after_request(_informar_escrita)
+
+def _informar_escrita(response):
+    if g.get('ultima_escrita'):
+        response.headers[CABECALHO_ESCRITA] = f"{g.ultima_escrita:.3f}"
+    return response
+
+# ==================== DECISÃO DE ROTEAMENTO ====================
+
+def _escrita_recente():
+    """
+    Indica se o usuário da requisição escreveu há menos de STICKY_SEGUNDOS
+    """
+    try:
+        informada = float(request.headers.get(CABECALHO_ESCRITA, 0))
+    except ValueError:
+        informada = 0
+    
+    usuario = getattr(request, 'usuario', None)
+    local = _ultima_escrita.get(_chave_usuario(usuario), 0) if usuario else 0
+    
+    return time.time() - max(informada, local) < STICKY_SEGUNDOS
+
+def deve_usar_replica():
+    """
+    Decide se as leituras atuais podem ir para uma réplica
+    """
+    if not REPLICA_URLS:
+        return False
+    
+    decisao = _leitura.get()
+    if decisao is not None:
+        return decisao
+    
+    if has_request_context():
+        return request.method in ('GET', 'HEAD') and not _escrita_recente()
+    
+    return False
+
+@contextmanager
+def leitura(usar_replica):
+    """
+    Fixa a decisão de roteamento (usado em threads, que não têm a requisição)
+    """
+    token = _leitura.set(usar_replica)
+    try:
+        yield
+    finally:
+        _leitura.reset(token)
+
+# ==================== SAÚDE DAS RÉPLICAS ====================
+
+def _verificar(engine):
+    """
+    Confere se a réplica responde e, no PostgreSQL, se o atraso de
+    replicação está dentro do limite
+    """
+    try:
+        with engine.connect() as conexao:
+            if engine.dialect.name != 'postgresql':
+                conexao.execute(database.db.text('SELECT 1'))
+                return True
+            
+            atraso = conexao.execute(database.db.text("""
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() THEN 0
+                    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                END
+            """)).scalar()
+            return (atraso or 0) <= ATRASO_MAXIMO
+    except Exception as e:
+        print(f"Réplica indisponível: {e}")
+        return False
+
+def _saudavel(db, nome):
+    agora = time.monotonic()
+    with _lock:
+        estado = _estado.get(nome)
+        if estado and agora - estado['verificado_em'] < INTERVALO_VERIFICACAO:
+            return estado['saudavel']
+    
+    saudavel = _verificar(db.engines[nome])
+    with _lock:
+        _estado[nome] = {'saudavel': saudavel, 'verificado_em': agora}
+    return saudavel
+
+def marcar_falha(nome):
+    """
+    Retira a réplica do rodízio até a próxima verificação
+    """
+    with _lock:
+        _estado[nome] = {'saudavel': False, 'verificado_em': time.monotonic()}
+
+def escolher_replica(db):
+    """
+    Escolhe, em rodízio, uma réplica saudável (ou None)
+    """
+    nomes = [nome for nome in db.engines if nome and nome.startswith('replica_')]
+    saudaveis = [nome for nome in nomes if _saudavel(db, nome)]
+    if not saudaveis:
+        return None
+    return saudaveis[next(_rodizio) % len(saudaveis)]
+
+# ==================== SESSÃO ====================
+
+class SessaoRoteada(Session):
+    """
+    Sessão que envia as leituras para uma réplica quando permitido
+    A réplica é escolhida uma vez por sessão (isto é, por requisição)
+    Academias com banco próprio usam sempre o banco delas (sem réplicas)
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        banco = academias.banco_atual()
+        if bind is None and banco:
+            return self._db.engines[academias.nome_bind(banco)]
+        
+        if bind is None and not self._flushing and deve_usar_replica():
+            replica = self.info.get('replica')
+            if replica is None:
+                replica = self.info['replica'] = escolher_replica(self._db) or False
+            if replica:
+                return self._db.engines[replica]
+        
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(SessaoRoteada, 'after_flush')
+def _registrar_flush(session, flush_context):
+    session.info['escreveu'] = True
+
+@event.listens_for(SessaoRoteada, 'after_commit')
+def _registrar_escrita(session):
+    """
+    Guarda o horário da escrita para manter as próximas leituras do
+    usuário no banco principal
+    """
+    if not session.info.pop('escreveu', False) or not has_request_context():
+        return
+    
+    agora = time.time()
+    g.ultima_escrita = agora
+    usuario = getattr(request, 'usuario', None)
+    if usuario:
+        _ultima_escrita[_chave_usuario(usuario)] = agora
+
+def _chave_usuario(usuario):
+    # Ids de usuário se repetem entre bancos de academias diferentes
+    return (usuario.get('academia_id'), usuario['usuario_id'])
+
+@event.listens_for(SessaoRoteada, 'after_rollback')
+def _descartar_flush(session):
+    session.info.pop('escreveu', None)
+
+# ==================== DECORADOR ====================
+
+def somente_leitura(f):
+    """
+    Marca uma função de consulta: fora de requisições (comandos, tarefas)
+    ela também lê da réplica, e se a réplica falhar a consulta é repetida
+    no banco principal
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = None
+        if _leitura.get() is None and not has_request_context():
+            token = _leitura.set(True)
+        
+        try:
+            try:
+                return f(*args, **kwargs)
+            except exc.DBAPIError:
+                sessao = database.db.session()
+                replica = sessao.info.get('replica')
+                if not replica:
+                    raise
+                
+                print(f"Falha na réplica {replica}, repetindo no banco principal")
+                marcar_falha(replica)
+                sessao.rollback()
+                sessao.info['replica'] = False
+                return f(*args, **kwargs)
+        finally:
+            if token is not None:
+                _leitura.reset(token)
+    
+    return decorated
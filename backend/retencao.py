@@ -0,0 +1,175 @@
+"""
+Retenção - Arquivamento e limpeza do histórico de ações
+Meses antigos do histórico são gravados em arquivos JSONL compactados (gzip),
+um por academia e mês, e depois removidos do banco: com o histórico particionado (PostgreSQL) a
+partição do mês é descartada inteira; nos demais casos as linhas são
+apagadas em lotes pequenos pelo índice de data
+"""
+
+from database import db
+from models import Historico
+from datetime import date, datetime, time
+import academias
+import particionamento
+import gzip
+import json
+import os
+
+# Meses mantidos no banco (o mês atual conta como um deles)
+RETENCAO_MESES = int(os.environ.get('HISTORICO_RETENCAO_MESES', 12))
+
+# Pasta onde os arquivos .jsonl.gz são gravados
+DIRETORIO_ARQUIVO = os.environ.get('HISTORICO_ARQUIVO_DIR', 'arquivo')
+
+LOTE = 5000
+
+def limite_retencao(hoje=None):
+    """
+    Data a partir da qual o histórico é mantido no banco
+    (primeiro dia do mês mais antigo dentro da retenção)
+    """
+    inicio_mes = particionamento.inicio_periodo(hoje or date.today(), 'mes')
+    return particionamento.proximo_periodo(inicio_mes, 'mes', -(RETENCAO_MESES - 1))
+
+def _abrir_arquivo(diretorio, mes, academia_id):
+    """
+    Arquivo temporário de <diretorio>/historico-AAAA-MM-academia-N.jsonl.gz
+    Retorna (arquivo aberto, caminho temporário, destino final)
+    """
+    nome = f'historico-{mes.strftime("%Y-%m")}-academia-{academia_id}'
+    destino = os.path.join(diretorio, f'{nome}.jsonl.gz')
+    if os.path.exists(destino):
+        # Execução anterior interrompida depois de gravar: não sobrescreve
+        destino = os.path.join(diretorio, f'{nome}-{os.getpid()}.jsonl.gz')
+    temporario = destino + '.tmp'
+    return gzip.open(temporario, 'wt', encoding='utf-8'), temporario, destino
+
+def _gravar_arquivos(inicio, fim, diretorio):
+    """
+    Grava as ações de [inicio, fim) em um arquivo por academia (só a
+    academia atual, se houver), com o id da academia em cada linha
+    Cada arquivo é escrito com outro nome e renomeado no final, para
+    nunca existir um arquivo incompleto com o nome definitivo
+    Retorna [(destino, linhas)]
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    
+    tabela = Historico.__table__
+    consulta = db.select(tabela).where(
+        tabela.c.data_acao >= datetime.combine(inicio, time()),
+        tabela.c.data_acao < datetime.combine(fim, time())
+    )
+    # Consulta na tabela (Core): o filtro automático da academia não se aplica
+    academia_id = academias.academia_atual()
+    if academia_id is not None:
+        consulta = consulta.where(tabela.c.academia_id == academia_id)
+    consulta = consulta.order_by(tabela.c.academia_id, tabela.c.data_acao, tabela.c.id)\
+        .execution_options(yield_per=LOTE)
+    
+    gravados = []
+    atual = None  # (academia_id, arquivo, temporario, destino, linhas)
+    
+    def concluir():
+        _, arquivo, temporario, destino, linhas = atual
+        arquivo.close()
+        os.replace(temporario, destino)
+        gravados.append((destino, linhas))
+    
+    for row in db.session.execute(consulta):
+        if atual is None or atual[0] != row.academia_id:
+            if atual:
+                concluir()
+            atual = [row.academia_id, *_abrir_arquivo(diretorio, inicio, row.academia_id), 0]
+        
+        atual[1].write(json.dumps({
+            'id': row.id,
+            'academia_id': row.academia_id,
+            'usuario_id': row.usuario_id,
+            'acao': row.acao,
+            'descricao': row.descricao,
+            'data_acao': row.data_acao.isoformat() if row.data_acao else None
+        }, ensure_ascii=False) + '\n')
+        atual[4] += 1
+    
+    if atual:
+        concluir()
+    return gravados
+
+def _apagar_intervalo(inicio, fim):
+    """
+    Remove do banco as ações de [inicio, fim) (só as da academia atual,
+    se houver: a partição do mês, com as das outras, fica)
+    """
+    conexao = db.session.connection()
+    particoes = particionamento.listar_particoes(conexao, 'historico') if academias.academia_atual() is None else []
+    for particao in particoes:
+        if particao['inicio'] == inicio and particao['fim'] == fim:
+            particionamento.remover_particao(conexao, 'historico', particao['nome'])
+            db.session.commit()
+            break
+    
+    # Linhas fora de partições próprias (tabela comum ou partição DEFAULT)
+    while True:
+        ids = db.session.scalars(
+            db.select(Historico.id).where(
+                Historico.data_acao >= datetime.combine(inicio, time()),
+                Historico.data_acao < datetime.combine(fim, time())
+            ).limit(LOTE)
+        ).all()
+        if not ids:
+            break
+        
+        db.session.execute(db.delete(Historico.__table__).where(Historico.__table__.c.id.in_(ids)))
+        db.session.commit()
+
+def arquivar_historico(antes_de=None, diretorio=None, log=print):
+    """
+    Arquiva e remove, mês a mês, o histórico anterior a 'antes_de'
+    (padrão: limite da política de retenção), um arquivo por academia e
+    mês. Sem academia atual, atende o banco principal e os bancos próprios
+    (ACADEMIAS_BANCOS). Também garante as partições dos próximos meses
+    quando o histórico é particionado
+    """
+    antes_de = particionamento.inicio_periodo(antes_de or limite_retencao(), 'mes')
+    diretorio = diretorio or DIRETORIO_ARQUIVO
+    
+    particionamento.criar_particoes_futuras('historico', 'data_acao', 'mes')
+    
+    if academias.academia_atual() is not None:
+        return _arquivar_banco(antes_de, diretorio, log)
+    
+    resultado = {"success": True, "arquivos": [], "linhas": 0}
+    for banco in [None, *academias.BANCOS]:
+        with academias.academia(None, banco):
+            parcial = _arquivar_banco(antes_de, diretorio, log)
+        resultado['arquivos'] += parcial['arquivos']
+        resultado['linhas'] += parcial['linhas']
+    return resultado
+
+def _arquivar_banco(antes_de, diretorio, log):
+    """
+    Arquiva o histórico anterior a 'antes_de' do banco atual
+    """
+    mais_antiga = db.session.query(db.func.min(Historico.data_acao)).scalar()
+    db.session.commit()
+    
+    arquivos = []
+    total = 0
+    if mais_antiga is None:
+        return {"success": True, "arquivos": arquivos, "linhas": total}
+    
+    mes = particionamento.inicio_periodo(mais_antiga, 'mes')
+    while mes < antes_de:
+        seguinte = particionamento.proximo_periodo(mes, 'mes')
+        
+        gravados = _gravar_arquivos(mes, seguinte, diretorio)
+        _apagar_intervalo(mes, seguinte)
+        
+        for destino, linhas in gravados:
+            log(f"{mes.strftime('%Y-%m')}: {linhas} ações arquivadas em {destino}")
+            arquivos.append(destino)
+            total += linhas
+        
+        mes = seguinte
+    
+    return {"success": True, "arquivos": arquivos, "linhas": total}
@@ -0,0 +1,148 @@
+"""
+Sincronização - Alterações incrementais para o cache do frontend
+Cada cliente, pagamento e usuário criado ou alterado recebe uma nova
+posição na sequência de alterações (seq_alteracao) e cada exclusão
+definitiva deixa um registro em 'exclusoes' (ver CONTROLE DE ALTERAÇÕES
+em models.py). O frontend guarda a última posição recebida e pede só o
+que mudou depois dela: GET /api/sync?since=<seq>
+"""
+
+from database import db
+from models import Pagamento, Sequencia, Exclusao, ReservaSequencia, MODELOS_SINCRONIZADOS
+from replicas import somente_leitura
+from datetime import datetime, timedelta
+import models
+import auth
+
+# Registros por página
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 5000
+
+# ==================== CONSULTAS ====================
+
+def consulta_contadores():
+    """
+    Contadores da sequência: 'alteracoes' (última posição sem nenhuma
+    anterior por confirmar, ver consulta_alteracoes_confirmadas) e
+    'exclusoes_removidas_ate' (maior posição de exclusão já apagada por
+    limpar_exclusoes: quem sincronizou antes dela recomeça do zero)
+    """
+    return db.select(
+        models.consulta_alteracoes_confirmadas().scalar_subquery().label('alteracoes'),
+        db.select(Sequencia.valor).where(Sequencia.nome == 'exclusoes_removidas_ate')
+            .scalar_subquery().label('exclusoes_removidas_ate')
+    )
+
+def consultas_alteracoes(since, ate, limite, tabelas):
+    """
+    Monta uma consulta por tabela com os registros alterados entre 'since'
+    e 'ate', em ordem de alteração. Cada uma traz limite + 1 registros
+    para saber se há mais páginas
+    'ate' é a última posição confirmada, lida antes das consultas: as
+    tabelas são lidas uma de cada vez e uma transação confirmada no meio
+    da leitura poderia aparecer só em parte delas; com o limite, qualquer
+    posição devolvida é de uma transação já visível para todas
+    """
+    consultas = {}
+    for nome in tabelas:
+        modelo = MODELOS_SINCRONIZADOS[nome]
+        query = db.select(modelo).where(modelo.seq_alteracao > since, modelo.seq_alteracao <= ate)
+        if modelo is Pagamento:
+            query = query.join(Pagamento.cliente).options(db.contains_eager(Pagamento.cliente))
+        consultas[nome] = query.order_by(modelo.seq_alteracao).limit(limite + 1)
+    
+    # Com o cache vazio (since=0) não há o que excluir
+    if since > 0:
+        consultas['exclusoes'] = db.select(Exclusao)\
+            .where(Exclusao.seq_alteracao > since, Exclusao.seq_alteracao <= ate, Exclusao.tabela.in_(tabelas))\
+            .order_by(Exclusao.seq_alteracao)\
+            .limit(limite + 1)
+    
+    return consultas
+
+def _para_dict(nome, obj):
+    if nome == 'clientes':
+        return {**models.cliente_para_dict(obj), 'ativo': obj.ativo}
+    if nome == 'pagamentos':
+        return models.pagamento_para_dict(obj)
+    return auth.usuario_para_dict(obj)
+
+def pagina_alteracoes(resultados, since, ate, limite, tabelas, reiniciar=False):
+    """
+    Junta os resultados das consultas em uma página em ordem de alteração
+    Resultado: registros alterados por tabela, ids excluídos por tabela,
+    'seq' (enviar como since na próxima chamada), 'mais' (há outra página)
+    e 'reiniciar' (o cache local deve ser descartado antes de aplicar)
+    """
+    alteracoes = [
+        (obj.seq_alteracao, nome, obj)
+        for nome, objetos in resultados.items()
+        for obj in objetos
+    ]
+    alteracoes.sort(key=lambda item: item[0])
+    
+    pagina = {nome: [] for nome in tabelas}
+    pagina['exclusoes'] = {nome: [] for nome in tabelas}
+    for seq, nome, obj in alteracoes[:limite]:
+        if nome == 'exclusoes':
+            pagina['exclusoes'][obj.tabela].append(obj.registro_id)
+        else:
+            pagina[nome].append(_para_dict(nome, obj))
+    
+    pagina['mais'] = len(alteracoes) > limite
+    pagina['seq'] = alteracoes[limite - 1][0] if pagina['mais'] else max(since, ate)
+    pagina['reiniciar'] = reiniciar
+    return pagina
+
+def tabelas_do_usuario(usuario):
+    """
+    Tabelas que o usuário pode sincronizar (usuários apenas para admin)
+    """
+    tabelas = ['clientes', 'pagamentos']
+    if usuario.get('tipo') == 'admin':
+        tabelas.append('usuarios')
+    return tabelas
+
+# ==================== OPERAÇÕES ====================
+
+@somente_leitura
+def obter_alteracoes(since=0, limite=LIMITE_PADRAO, tabelas=('clientes', 'pagamentos')):
+    """
+    Obtém uma página das alterações feitas depois da posição 'since'
+    (0 = tudo). Para continuar, chame de novo com since = 'seq' devolvido
+    enquanto 'mais' for verdadeiro
+    """
+    contadores = db.session.execute(consulta_contadores()).one()
+    ate = contadores.alteracoes or 0
+    
+    reiniciar = 0 < since < (contadores.exclusoes_removidas_ate or 0)
+    if reiniciar:
+        since = 0
+    
+    resultados = {
+        nome: db.session.scalars(consulta).all()
+        for nome, consulta in consultas_alteracoes(since, ate, limite, tabelas).items()
+    }
+    
+    return pagina_alteracoes(resultados, since, ate, limite, tabelas, reiniciar)
+
+def limpar_exclusoes(dias=90):
+    """
+    Apaga os registros de exclusão com mais de 'dias' dias
+    Frontends que não sincronizam desde antes disso recebem 'reiniciar'
+    e baixam tudo de novo
+    """
+    limite = datetime.utcnow() - timedelta(days=dias)
+    antigas = Exclusao.data_exclusao < limite
+    
+    maior_seq = db.session.scalar(db.select(db.func.max(Exclusao.seq_alteracao)).where(antigas))
+    if maior_seq is None:
+        return 0
+    
+    removidas = db.session.execute(db.delete(Exclusao).where(antigas)).rowcount
+    contador = db.session.get(Sequencia, 'exclusoes_removidas_ate')
+    contador.valor = max(contador.valor, maior_seq)
+    # Reservas de transações abandonadas (já ignoradas pelos leitores)
+    db.session.execute(db.delete(ReservaSequencia).where(ReservaSequencia.data_reserva < limite))
+    db.session.commit()
+    return removidas
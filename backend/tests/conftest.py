@@ -0,0 +1,107 @@
+"""
+Configuração dos testes (pytest, a partir de backend/)
+O app é importado uma vez, com bancos SQLite em uma pasta temporária: o
+principal e um banco próprio ('propria', ver ACADEMIAS_BANCOS). Cada
+teste cria suas academias, então os dados de um não aparecem no outro
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+
+PASTA = tempfile.mkdtemp(prefix='flowfit-testes-')
+
+# A URL do banco só é lida do ambiente no Render (ver get_database_uri)
+os.environ['RENDER'] = '1'
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(PASTA, 'principal.db')}"
+os.environ['ACADEMIAS_BANCOS'] = f"propria=sqlite:///{os.path.join(PASTA, 'propria.db')}"
+os.environ.setdefault('EVENTOS_ARQUIVO', os.path.join(PASTA, 'eventos.jsonl'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import academias
+import models
+from database import db
+from models import ReservaSequencia, Sequencia
+from app import app as aplicacao
+
+SENHA = 'senha123'
+
+def nova_academia(http, banco=None):
+    """
+    Cadastra uma academia com um administrador e faz login nela
+    """
+    slug = f'academia-{uuid.uuid4().hex[:8]}'
+    email = f'admin@{slug}.com'
+    with aplicacao.app_context():
+        resultado = models.criar_academia(f'Academia {slug}', slug, banco, email, SENHA)
+    assert resultado['success'], resultado
+    
+    login = http.post('/api/auth/login', json={'email': email, 'senha': SENHA, 'academia': slug})
+    assert login.status_code == 200, login.json
+    return {
+        'id': resultado['id'],
+        'slug': slug,
+        'banco': banco,
+        'email': email,
+        'headers': {'Authorization': f"Bearer {login.json['token']}"}
+    }
+
+@pytest.fixture(scope='session')
+def app():
+    return aplicacao
+
+@pytest.fixture
+def http(app):
+    return app.test_client()
+
+@pytest.fixture
+def academia(http):
+    return nova_academia(http)
+
+@pytest.fixture
+def outra_academia(http):
+    return nova_academia(http)
+
+@pytest.fixture
+def academia_propria(http):
+    return nova_academia(http, 'propria')
+
+@pytest.fixture
+def contexto(app, academia):
+    """
+    Contexto de aplicação fixado na academia do teste (funções de models)
+    """
+    with app.app_context(), academias.academia(academia['id'], academia['banco']):
+        yield
+
+@pytest.fixture
+def reserva(app, contexto):
+    """
+    Simula uma transação em andamento: reserva a próxima posição da
+    sequência como reservar_sequencia faz fora do SQLite (contador
+    incrementado e reserva gravada, sem os dados confirmados)
+    """
+    contador = db.session.get(Sequencia, 'alteracoes')
+    contador.valor += 1
+    inicio = contador.valor
+    db.session.add(ReservaSequencia(inicio=inicio))
+    db.session.commit()
+    yield db.session.get(ReservaSequencia, inicio)
+    
+    db.session.execute(db.delete(ReservaSequencia).where(ReservaSequencia.inicio == inicio))
+    db.session.commit()
+
+def criar_cliente(http, academia, nome='Ana Souza', cpf=None):
+    resposta = http.post('/api/clientes', json={'nome': nome, 'cpf': cpf or uuid.uuid4().hex[:11]}, headers=academia['headers'])
+    assert resposta.json['success'], resposta.json
+    return resposta.json['id']
+
+def criar_pagamento(http, academia, cliente_id, valor, vencimento):
+    resposta = http.post('/api/pagamentos', json={
+        'cliente_id': cliente_id, 'valor': valor, 'vencimento': vencimento
+    }, headers=academia['headers'])
+    assert resposta.json['success'], resposta.json
+    return resposta.json['id']
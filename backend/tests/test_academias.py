@@ -0,0 +1,73 @@
+"""
+Separação por academia: cada academia só vê e altera os próprios dados,
+no banco principal ou no banco próprio dela
+"""
+
+from conftest import criar_cliente, criar_pagamento
+from database import db
+from models import Cliente, Pagamento
+import academias
+
+def test_dados_de_outra_academia_nao_aparecem(http, academia, outra_academia):
+    cliente_id = criar_cliente(http, academia)
+    pagamento_id = criar_pagamento(http, academia, cliente_id, 120, '2024-07-01')
+    outra = outra_academia['headers']
+    
+    assert http.get('/api/clientes', headers=outra).json == []
+    assert http.get('/api/pagamentos', headers=outra).json == []
+    assert http.get(f'/api/clientes/{cliente_id}', headers=outra).status_code == 404
+    assert http.get('/api/dashboard', headers=outra).json['valor_em_aberto'] == 0
+    
+    sync = http.get('/api/sync', headers=outra).json
+    assert (sync['clientes'], sync['pagamentos']) == ([], [])
+    
+    # E o que a academia vê continua lá
+    assert [p['id'] for p in http.get('/api/pagamentos', headers=academia['headers']).json] == [pagamento_id]
+
+def test_nao_altera_registros_de_outra_academia(app, http, academia, outra_academia):
+    cliente_id = criar_cliente(http, academia)
+    pagamento_id = criar_pagamento(http, academia, cliente_id, 75, '2024-07-15')
+    outra = outra_academia['headers']
+    
+    resposta = http.post('/api/pagamentos', json={
+        'cliente_id': cliente_id, 'valor': 10, 'vencimento': '2024-08-01'
+    }, headers=outra)
+    assert resposta.json == {'success': False, 'error': 'Cliente não encontrado'}
+    
+    http.post(f'/api/pagamentos/{pagamento_id}/pagar', json={'metodo_pagamento': 'pix'}, headers=outra)
+    http.delete(f'/api/pagamentos/{pagamento_id}', headers=outra)
+    http.delete(f'/api/clientes/{cliente_id}', headers=outra)
+    
+    with app.app_context(), academias.academia(academia['id']):
+        pagamento = db.session.get(Pagamento, pagamento_id)
+        assert pagamento.status == 'pendente'
+        assert db.session.get(Cliente, cliente_id).ativo
+
+def test_cpf_repetido_so_na_mesma_academia(http, academia, outra_academia):
+    criar_cliente(http, academia, cpf='12345678901')
+    criar_cliente(http, outra_academia, cpf='12345678901')
+    
+    repetido = http.post('/api/clientes', json={'nome': 'Outra', 'cpf': '12345678901'}, headers=academia['headers'])
+    assert repetido.json['success'] is False
+
+def test_email_de_usuario_unico_no_banco(http, academia, outra_academia):
+    # O login sem academia procura o email em todas as academias do banco
+    resposta = http.post('/api/usuarios', json={
+        'nome': 'Repetido', 'email': academia['email'], 'senha': 'x1234567'
+    }, headers=outra_academia['headers'])
+    assert resposta.json == {'success': False, 'error': 'Email já cadastrado'}
+
+def test_banco_proprio_guarda_os_dados_da_academia(app, http, academia_propria):
+    cliente_id = criar_cliente(http, academia_propria, 'Cliente do banco próprio')
+    criar_pagamento(http, academia_propria, cliente_id, 200, '2024-09-01')
+    
+    with app.app_context():
+        with academias.academia(academia_propria['id'], 'propria'):
+            assert db.session.get(Cliente, cliente_id).nome == 'Cliente do banco próprio'
+        # A mesma academia no banco principal não tem nada
+        with academias.academia(academia_propria['id']):
+            assert db.session.scalar(db.select(db.func.count(Cliente.id))) == 0
+    
+    # Sem o identificador da academia, o login procura só no banco principal
+    login = http.post('/api/auth/login', json={'email': academia_propria['email'], 'senha': 'senha123'})
+    assert login.status_code == 401
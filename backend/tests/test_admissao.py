@@ -0,0 +1,41 @@
+"""
+Controle de admissão: estatísticas e requisições em andamento por classe
+"""
+
+import admissao
+import threading
+
+def test_requisicao_em_andamento_conta_na_classe(app, http, academia, monkeypatch):
+    liberar, dentro = threading.Event(), threading.Event()
+    original = app.view_functions['get_clientes']
+    
+    def lenta():
+        dentro.set()
+        liberar.wait(5)
+        return original()
+    monkeypatch.setitem(app.view_functions, 'get_clientes', lenta)
+    
+    requisicao = threading.Thread(target=http.get, args=('/api/clientes',), kwargs={'headers': academia['headers']})
+    requisicao.start()
+    assert dentro.wait(5)
+    assert admissao.estado()['em_uso']['leitura'] == 1
+    
+    liberar.set()
+    requisicao.join()
+    assert admissao.estado()['em_uso']['leitura'] == 0
+
+def test_estatisticas_somam_todas_as_requisicoes(app, academia):
+    antes = admissao.estado()
+    
+    def consultar():
+        app.test_client().get('/api/clientes', headers=academia['headers'])
+    requisicoes = [threading.Thread(target=consultar) for _ in range(20)]
+    for requisicao in requisicoes:
+        requisicao.start()
+    for requisicao in requisicoes:
+        requisicao.join()
+    
+    depois = admissao.estado()
+    chaves = ('admitidas', 'limitadas', 'descartadas', 'sem_vaga')
+    assert sum(depois[chave] - antes[chave] for chave in chaves) == 20
+    assert depois['em_uso'] == {nome: 0 for nome in admissao.CLASSES}
@@ -0,0 +1,101 @@
+"""
+Caixa de saída (outbox): eventos gravados na transação da alteração e
+entregues em ordem de seq, pelo menos uma vez
+"""
+
+from caixa_saida import Destino, ErroEntrega
+from conftest import criar_cliente, criar_pagamento
+from database import db
+from models import Cliente, ConsumidorSaida
+import caixa_saida
+import pytest
+import uuid
+
+class DestinoMemoria(Destino):
+    """
+    Guarda os lotes entregues; com 'falhar', recusa as entregas
+    """
+    tipo = 'memoria'
+    
+    def __init__(self, consumidor, alvo=None):
+        super().__init__(consumidor, alvo)
+        self.lotes = []
+        self.falhar = False
+    
+    def entregar(self, eventos):
+        if self.falhar:
+            raise ErroEntrega("destino fora do ar")
+        self.lotes.append(eventos)
+    
+    @property
+    def eventos(self):
+        return [evento for lote in self.lotes for evento in lote]
+
+def entregar_tudo(destino):
+    while caixa_saida.retransmitir_lote(destino.consumidor, destino):
+        pass
+    return destino.eventos
+
+@pytest.fixture
+def destino(contexto):
+    """
+    Consumidor novo, já com os eventos anteriores ao teste entregues
+    (o administrador criado com a academia)
+    """
+    destino = DestinoMemoria(f'teste-{uuid.uuid4().hex[:8]}')
+    entregar_tudo(destino)
+    destino.lotes.clear()
+    return destino
+
+def test_eventos_na_ordem_das_alteracoes(http, academia, destino):
+    cliente_id = criar_cliente(http, academia)
+    pagamento_id = criar_pagamento(http, academia, cliente_id, 55, '2024-10-01')
+    http.post(f'/api/pagamentos/{pagamento_id}/pagar', json={'metodo_pagamento': 'pix'}, headers=academia['headers'])
+    http.delete(f'/api/pagamentos/{pagamento_id}', headers=academia['headers'])
+    
+    eventos = entregar_tudo(destino)
+    assert [(e['tipo'], e['registro_id']) for e in eventos] == [
+        ('cliente_criado', cliente_id),
+        ('pagamento_criado', pagamento_id),
+        ('pagamento_pago', pagamento_id),
+        ('pagamento_excluido', pagamento_id)
+    ]
+    assert [e['seq'] for e in eventos] == sorted({e['seq'] for e in eventos})
+    assert sorted(eventos[2]['campos']) == ['data_pagamento', 'metodo_pagamento', 'status']
+    assert {e['academia_id'] for e in eventos} == {academia['id']}
+
+def test_falha_na_entrega_nao_avanca_a_posicao(http, academia, destino):
+    consumidor = db.session.get(ConsumidorSaida, destino.consumidor)
+    posicao, entregues = consumidor.posicao, consumidor.entregues
+    criar_cliente(http, academia)
+    
+    destino.falhar = True
+    with pytest.raises(ErroEntrega):
+        caixa_saida.retransmitir_lote(destino.consumidor, destino)
+    db.session.refresh(consumidor)
+    assert (consumidor.posicao, consumidor.falhas_seguidas, consumidor.ultimo_erro) == (posicao, 1, 'destino fora do ar')
+    
+    # A próxima tentativa entrega o mesmo evento e zera as falhas
+    destino.falhar = False
+    assert [e['tipo'] for e in entregar_tudo(destino)] == ['cliente_criado']
+    db.session.refresh(consumidor)
+    assert (consumidor.falhas_seguidas, consumidor.entregues) == (0, entregues + 1)
+    assert consumidor.posicao == destino.eventos[-1]['seq']
+
+def test_alteracao_desfeita_nao_gera_evento(http, academia, destino):
+    db.session.add(Cliente(nome='Desfeito', cpf='00000000000'))
+    db.session.flush()
+    db.session.rollback()
+    
+    cliente_id = criar_cliente(http, academia)
+    assert [(e['tipo'], e['registro_id']) for e in entregar_tudo(destino)] == [('cliente_criado', cliente_id)]
+
+def test_evento_depois_de_reserva_pendente_espera(http, academia, reserva, destino):
+    cliente_id = criar_cliente(http, academia)
+    # Confirmado depois da reserva: só sai quando a reserva sair (a
+    # transação dela pode confirmar um evento de seq menor)
+    assert entregar_tudo(destino) == []
+    
+    db.session.delete(reserva)
+    db.session.commit()
+    assert [(e['tipo'], e['registro_id']) for e in entregar_tudo(destino)] == [('cliente_criado', cliente_id)]
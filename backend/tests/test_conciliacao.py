@@ -0,0 +1,143 @@
+"""
+Leitura dos extratos (CSV, OFX e CNAB 240) e baixa pela conciliação
+"""
+
+from conciliacao import LAYOUT_CNAB
+from conftest import criar_cliente, criar_pagamento
+from datetime import date
+import conciliacao
+import io
+import periodos
+import pytest
+
+def ler(conteudo, formato=None):
+    dados = conteudo.encode('utf-8') if isinstance(conteudo, str) else conteudo
+    formato, lancamentos = conciliacao.ler_extrato(io.BytesIO(dados), formato)
+    return formato, list(lancamentos)
+
+def linha_cnab(data, valor, tipo='C', historico='', documento=''):
+    """
+    Detalhe de extrato (registro 3, segmento E) com 240 posições
+    """
+    linha = list('00100013' + ' ' * 232)
+    for nome, texto in (
+        ('segmento', 'E'),
+        ('data', data),
+        ('valor', f'{valor:018d}'),
+        ('tipo', tipo),
+        ('historico', historico),
+        ('documento', documento)
+    ):
+        inicio, fim = LAYOUT_CNAB[nome]
+        linha[inicio - 1:fim] = texto.ljust(fim - inicio + 1)[:fim - inicio + 1]
+    return ''.join(linha)
+
+# ==================== CSV ====================
+
+def test_csv_com_ponto_e_virgula_e_valor_brasileiro():
+    formato, lancamentos = ler(
+        'Data;Valor;Pagador;Histórico\n'
+        '05/03/2024;1.234,56;Maria da Silva;PIX 123.456.789-09\n'
+        '\n'
+        '2024-03-06;R$ -50,00;Banco;Tarifa\n'
+    )
+    assert formato == 'csv'
+    assert [(l['data'], l['valor'], l['linha']) for l in lancamentos] == [
+        (date(2024, 3, 5), 1234.56, 2),
+        (date(2024, 3, 6), -50.0, 4)
+    ]
+    # CPF encontrado no histórico quando não há coluna de documento
+    assert lancamentos[0]['documento'] == '12345678909'
+    assert lancamentos[0]['nome'] == 'Maria da Silva'
+
+def test_csv_linhas_iguais_sao_lancamentos_diferentes():
+    _, lancamentos = ler('data,valor,nome\n2024-03-05,100.00,Ana\n2024-03-05,100.00,Ana\n')
+    assert len({l['identificador'] for l in lancamentos}) == 2
+    
+    # O mesmo arquivo lido de novo gera os mesmos identificadores
+    _, de_novo = ler('data,valor,nome\n2024-03-05,100.00,Ana\n2024-03-05,100.00,Ana\n')
+    assert [l['identificador'] for l in de_novo] == [l['identificador'] for l in lancamentos]
+
+def test_csv_sem_colunas_obrigatorias():
+    with pytest.raises(ValueError, match='colunas de data e valor'):
+        ler('nome,descricao\nAna,PIX\n')
+
+def test_csv_valor_invalido_informa_a_linha():
+    with pytest.raises(ValueError, match='Linha 3: valor inválido'):
+        ler('data,valor\n2024-03-05,10\n2024-03-06,dez reais\n')
+
+def test_csv_em_windows_1252():
+    _, lancamentos = ler('data;valor;nome\n05/03/2024;10,00;João Conceição\n'.encode('cp1252'))
+    assert lancamentos[0]['nome'] == 'João Conceição'
+
+# ==================== OFX ====================
+
+def test_ofx_sgml():
+    formato, lancamentos = ler(
+        'OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+        '<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20240305120000[-3:BRT]\n<TRNAMT>150.00\n'
+        '<FITID>ABC1\n<NAME>PEDRO ALVES\n<MEMO>PIX RECEBIDO\n</STMTTRN>\n'
+        '<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20240306\n<TRNAMT>-20.00\n<FITID>ABC2\n</STMTTRN>\n'
+        '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+    )
+    assert formato == 'ofx'
+    assert [(l['data'], l['valor'], l['nome'], l['descricao']) for l in lancamentos] == [
+        (date(2024, 3, 5), 150.0, 'PEDRO ALVES', 'PIX RECEBIDO'),
+        (date(2024, 3, 6), -20.0, '', '')
+    ]
+
+def test_ofx_xml_em_uma_linha():
+    _, lancamentos = ler(
+        '<?xml version="1.0"?><OFX><STMTTRN><DTPOSTED>20240307</DTPOSTED><TRNAMT>99.90</TRNAMT>'
+        '<FITID>X9</FITID><NAME>ANA</NAME></STMTTRN></OFX>'
+    )
+    assert [(l['data'], l['valor'], l['nome']) for l in lancamentos] == [(date(2024, 3, 7), 99.9, 'ANA')]
+
+def test_ofx_transacao_incompleta():
+    with pytest.raises(ValueError, match='sem TRNAMT ou DTPOSTED'):
+        ler('OFXHEADER:100\n<STMTTRN>\n<DTPOSTED>20240305\n</STMTTRN>\n')
+
+# ==================== CNAB 240 ====================
+
+def test_cnab_le_so_os_detalhes_do_segmento_e():
+    cabecalho = '00100000' + ' ' * 232
+    conteudo = '\r\n'.join([
+        cabecalho,
+        linha_cnab('05032024', 12550, historico='PIX MARIA SILVA', documento='CPF 12345678909'),
+        linha_cnab('06032024', 3000, tipo='D', historico='TARIFA'),
+        ''
+    ])
+    formato, lancamentos = ler(conteudo)
+    assert formato == 'cnab'
+    assert [(l['data'], l['valor']) for l in lancamentos] == [(date(2024, 3, 5), 125.5), (date(2024, 3, 6), -30.0)]
+    assert lancamentos[0]['nome'] == 'PIX MARIA SILVA'
+    assert lancamentos[0]['documento'] == '12345678909'
+
+def test_cnab_data_invalida():
+    with pytest.raises(ValueError, match='Linha 1'):
+        ler(linha_cnab('31022024', 100))
+
+# ==================== FORMATO E BAIXA ====================
+
+def test_formato_informado_invalido():
+    with pytest.raises(ValueError, match='Formato de extrato inválido'):
+        ler('data,valor\n', 'xls')
+
+def test_importar_baixa_pelo_cpf_uma_unica_vez(http, academia, contexto):
+    cliente_id = criar_cliente(http, academia, 'Carla Mendes', cpf='98765432100')
+    pagamento_id = criar_pagamento(http, academia, cliente_id, 89.9, periodos.hoje().isoformat())
+    extrato = f'data,valor,cpf,nome\n{periodos.hoje().isoformat()},89.90,987.654.321-00,CARLA MENDES\n'.encode()
+    
+    resultado = conciliacao.importar_extrato(io.BytesIO(extrato))
+    assert (resultado['success'], resultado['conciliados'], resultado['revisao']) == (True, 1, 0)
+    pagamento = http.get(f'/api/pagamentos?cliente_id={cliente_id}', headers=academia['headers']).json[0]
+    assert (pagamento['id'], pagamento['status']) == (pagamento_id, 'pago')
+    
+    de_novo = conciliacao.importar_extrato(io.BytesIO(extrato))
+    assert (de_novo['conciliados'], de_novo['repetidos']) == (0, 1)
+
+def test_pendencias_com_limite_menor_que_um(http, academia):
+    for limite in (0, -1):
+        resposta = http.get('/api/conciliacao/pendencias', query_string={'limite': limite}, headers=academia['headers'])
+        assert resposta.status_code == 400
+    assert http.get('/api/conciliacao/pendencias', query_string={'limite': 1}, headers=academia['headers']).status_code == 200
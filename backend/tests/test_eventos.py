@@ -0,0 +1,52 @@
+"""
+Contadores do dashboard no fluxo de eventos: compartilhados pelas
+conexões da academia e recalculados depois de alterações ou na virada do dia
+"""
+
+from datetime import timedelta
+from eventos import Assinante, Broker
+import eventos
+import periodos
+import pytest
+import threading
+
+@pytest.fixture
+def broker(monkeypatch):
+    """
+    Broker com a thread dos contadores e contadores que contam os cálculos
+    """
+    monkeypatch.setattr(eventos, 'INTERVALO_CONTADORES', 0)
+    monkeypatch.setattr(eventos, 'INTERVALO_VIRADA', 0.05)
+    broker = Broker()
+    broker.calculos = []
+    
+    def calcular(academia_id, banco):
+        broker.calculos.append((academia_id, periodos.hoje()))
+        return {'dia': periodos.hoje().isoformat()}
+    broker._calcular_contadores = calcular
+    threading.Thread(target=broker._recalcular_contadores, daemon=True).start()
+    return broker
+
+def proximo_evento(assinante):
+    return assinante.fila.get(timeout=2)
+
+def test_contadores_compartilhados_ate_uma_alteracao(broker):
+    assert broker.contadores(1) == broker.contadores(1)
+    assert len(broker.calculos) == 1
+    
+    assinante = broker.assinar(Assinante(1))
+    broker.contadores_desatualizados({1})
+    assert proximo_evento(assinante)['evento'] == 'contadores'
+    assert len(broker.calculos) == 2
+
+def test_virada_do_dia_recalcula_sem_alteracoes(broker, monkeypatch):
+    hoje = periodos.hoje()
+    assinante = broker.assinar(Assinante(1))
+    assert broker.contadores(1) == {'dia': hoje.isoformat()}
+    
+    amanha = hoje + timedelta(days=1)
+    monkeypatch.setattr(periodos, 'hoje', lambda: amanha)
+    # As conexões abertas recebem os contadores do novo dia...
+    assert proximo_evento(assinante)['dados'] == {'dia': amanha.isoformat()}
+    # ...e as novas não recebem os de ontem
+    assert broker.contadores(1) == {'dia': amanha.isoformat()}
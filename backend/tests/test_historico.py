@@ -0,0 +1,29 @@
+"""
+Histórico de ações (GET /api/historico): páginas por cursor e limite
+"""
+
+from conftest import criar_cliente
+
+def test_paginas_pelo_cursor(http, academia):
+    for i in range(3):
+        criar_cliente(http, academia, f'Cliente {i}')
+    
+    todas = http.get('/api/historico', query_string={'limite': 500}, headers=academia['headers']).json
+    assert len(todas) >= 3
+    
+    recebidas, cursor = [], None
+    while True:
+        parametros = {'limite': 2, **({'cursor': cursor} if cursor else {})}
+        resposta = http.get('/api/historico', query_string=parametros, headers=academia['headers'])
+        assert resposta.status_code == 200, resposta.json
+        recebidas += [acao['id'] for acao in resposta.json]
+        cursor = resposta.headers.get('X-Proximo-Cursor')
+        if not cursor:
+            break
+    
+    assert recebidas == [acao['id'] for acao in todas]
+
+def test_limite_menor_que_um_e_recusado(http, academia):
+    for limite in (0, -1):
+        resposta = http.get('/api/historico', query_string={'limite': limite}, headers=academia['headers'])
+        assert resposta.status_code == 400
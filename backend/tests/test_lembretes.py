@@ -0,0 +1,55 @@
+"""
+Lembretes de vencimento: um por cobrança, por dia e por canal, com as
+reservas de uma execução interrompida retomadas pela próxima
+"""
+
+from conftest import criar_pagamento
+from database import db
+from datetime import datetime, timedelta
+from models import LembreteEnviado
+import lembretes
+import periodos
+import pytest
+
+@pytest.fixture
+def cobranca(http, academia, contexto, tmp_path, monkeypatch):
+    """
+    Cobrança que vence hoje, de um cliente com e-mail
+    """
+    monkeypatch.setattr(lembretes, 'DIRETORIO_SAIDA', str(tmp_path))
+    resposta = http.post('/api/clientes', json={
+        'nome': 'Ana Souza', 'cpf': '11122233344', 'email': 'ana@exemplo.com'
+    }, headers=academia['headers'])
+    return criar_pagamento(http, academia, resposta.json['id'], 100, periodos.hoje().isoformat())
+
+def enviar():
+    return lembretes.enviar_lembretes(canais=['email'], modo='arquivo', log=lambda *_: None)
+
+def reservar(pagamento_id, status='enviando', minutos=0):
+    db.session.add(LembreteEnviado(
+        pagamento_id=pagamento_id, dia=periodos.hoje(), canal='email', status=status,
+        execucao='interrompida', data_reserva=datetime.utcnow() - timedelta(minutes=minutos)
+    ))
+    db.session.commit()
+
+def test_um_lembrete_por_dia(cobranca):
+    assert enviar()['enviados'] == 1
+    assert enviar()['enviados'] == 0
+
+def test_reserva_abandonada_e_retomada(cobranca):
+    reservar(cobranca, minutos=lembretes.RESERVA_EXPIRA + 1)
+    
+    resultado = enviar()
+    assert (resultado['enviados'], resultado['retomados']) == (1, 1)
+    lembrete = db.session.scalars(db.select(LembreteEnviado).where(LembreteEnviado.pagamento_id == cobranca)).one()
+    assert (lembrete.status, lembrete.execucao) == ('enviado', resultado['execucao'])
+    
+    assert enviar()['enviados'] == 0
+
+def test_reserva_recente_de_outra_execucao_e_respeitada(cobranca):
+    reservar(cobranca, minutos=1)
+    assert (enviar()['enviados'], enviar()['retomados']) == (0, 0)
+
+def test_lembrete_que_falhou_nao_repete_no_dia(cobranca):
+    reservar(cobranca, status='falhou', minutos=lembretes.RESERVA_EXPIRA + 1)
+    assert enviar()['enviados'] == 0
@@ -0,0 +1,25 @@
+"""
+Lote de leituras (POST /api/batch)
+"""
+
+from conftest import criar_cliente
+
+def test_lote_responde_na_ordem_pedida(http, academia):
+    cliente_id = criar_cliente(http, academia)
+    resposta = http.post('/api/batch', json={'requisicoes': [
+        {'url': f'/api/clientes/{cliente_id}', 'id': 'cliente'},
+        {'url': '/api/nada', 'id': 'inexistente'}
+    ]}, headers=academia['headers'])
+    assert resposta.status_code == 200
+    respostas = resposta.json['respostas']
+    assert [(r['id'], r['status']) for r in respostas] == [('cliente', 200), ('inexistente', 404)]
+    assert respostas[0]['corpo']['id'] == cliente_id
+
+def test_corpo_que_nao_e_objeto(http, academia):
+    for corpo in ([{'url': '/api/clientes'}], 'texto', None):
+        resposta = http.post('/api/batch', json=corpo, headers=academia['headers'])
+        assert resposta.status_code == 400
+        assert resposta.json == {'error': 'Informe a lista de requisições'}
+    
+    resposta = http.post('/api/batch', data='{', content_type='application/json', headers=academia['headers'])
+    assert resposta.status_code == 400
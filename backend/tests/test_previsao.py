@@ -0,0 +1,93 @@
+"""
+Previsão de recebimentos: taxas do dia montadas em segundo plano e
+cobranças atualizadas a cada pedido pela sequência de alterações
+"""
+
+from conftest import criar_cliente, criar_pagamento
+from datetime import timedelta
+import periodos
+import previsao
+import pytest
+import time
+
+def prever(http, academia, tentativas=50):
+    """
+    Previsão, esperando o modelo em preparo (503) por até 'tentativas' x 0,1 s
+    """
+    for _ in range(tentativas):
+        resposta = http.get('/api/relatorios/previsao', headers=academia['headers'])
+        if resposta.status_code != 503:
+            break
+        time.sleep(0.1)
+    assert resposta.status_code == 200, resposta.json
+    return resposta.json
+
+def dia(dias):
+    return (periodos.hoje() + timedelta(days=dias)).isoformat()
+
+@pytest.fixture
+def historico(http, academia):
+    """
+    Cliente que paga em dia há três meses, com a mensalidade atual pendente
+    """
+    cliente_id = criar_cliente(http, academia)
+    for dias in (-90, -60, -30):
+        pagamento_id = criar_pagamento(http, academia, cliente_id, 100, dia(dias))
+        http.post(f'/api/pagamentos/{pagamento_id}/pagar', json={'metodo_pagamento': 'pix'}, headers=academia['headers'])
+    criar_pagamento(http, academia, cliente_id, 100, dia(1))
+    return cliente_id
+
+def test_alteracoes_entram_sem_remontar_o_modelo(http, academia, historico):
+    antes = prever(http, academia)
+    assert antes['totais']['cobrancas_abertas'] > 0
+    
+    pagamento_id = criar_pagamento(http, academia, historico, 400, dia(3))
+    depois = prever(http, academia)
+    assert depois['modelo_gerado_em'] == antes['modelo_gerado_em']
+    assert depois['totais']['cobrancas_abertas'] > antes['totais']['cobrancas_abertas']
+    
+    # O mesmo resultado de um modelo montado do zero
+    previsao.limpar_cache()
+    assert prever(http, academia)['totais'] == depois['totais']
+    
+    http.delete(f'/api/pagamentos/{pagamento_id}', headers=academia['headers'])
+    assert prever(http, academia)['totais'] == antes['totais']
+
+def test_cliente_novo_usa_as_taxas_da_academia(http, academia, historico):
+    antes = prever(http, academia)
+    
+    novo = criar_cliente(http, academia, 'Cliente novo')
+    criar_pagamento(http, academia, novo, 100, dia(2))
+    depois = prever(http, academia)
+    assert depois['clientes'] == antes['clientes']
+    assert depois['totais']['cobrancas_abertas'] > antes['totais']['cobrancas_abertas']
+
+def test_sem_modelo_responde_503_e_monta_em_segundo_plano(http, academia, historico, monkeypatch):
+    previsao.limpar_cache()
+    monkeypatch.setattr(previsao, 'ESPERA_MODELO', 0)
+    montar = previsao.montar_modelo
+    
+    def montar_devagar(hoje):
+        time.sleep(0.2)
+        return montar(hoje)
+    monkeypatch.setattr(previsao, 'montar_modelo', montar_devagar)
+    
+    resposta = http.get('/api/relatorios/previsao', headers=academia['headers'])
+    assert resposta.status_code == 503
+    assert resposta.headers['Retry-After']
+    
+    assert prever(http, academia)['totais']['cobrancas_abertas'] > 0
+
+def test_novo_dia_usa_o_modelo_anterior_enquanto_monta(http, academia, historico, monkeypatch):
+    ontem = prever(http, academia)
+    hoje = periodos.hoje()
+    monkeypatch.setattr(periodos, 'hoje', lambda: hoje + timedelta(days=1))
+    
+    resposta = http.get('/api/relatorios/previsao', headers=academia['headers'])
+    assert resposta.status_code == 200
+    assert resposta.json['modelo_gerado_em'] == ontem['modelo_gerado_em']
+    
+    prazo = time.monotonic() + 5
+    while prever(http, academia)['modelo_gerado_em'] == ontem['modelo_gerado_em']:
+        assert time.monotonic() < prazo
+        time.sleep(0.05)
@@ -0,0 +1,45 @@
+"""
+Extratos em lote: zip retomado depois de uma execução interrompida
+"""
+
+from conftest import criar_cliente, criar_pagamento
+from periodos import Periodo
+import os
+import recibos
+import zipfile
+
+def gerar(destino, **opcoes):
+    return recibos.gerar_extratos(Periodo.ano(2031), str(destino), 'html', processos=1, log=lambda *_: None, **opcoes)
+
+def conteudo(destino):
+    with zipfile.ZipFile(destino) as arquivo_zip:
+        return {nome: arquivo_zip.read(nome) for nome in arquivo_zip.namelist()}
+
+def test_zip_sem_diretorio_central_e_recuperado(http, academia, contexto, tmp_path):
+    for i in range(4):
+        cliente_id = criar_cliente(http, academia, f'Cliente {i}')
+        criar_pagamento(http, academia, cliente_id, 100 + i, f'2031-0{i + 1}-10')
+    
+    completo = tmp_path / 'completo.zip'
+    assert gerar(completo)['gerados'] == 4
+    esperado = conteudo(completo)
+    
+    # Encerrado no meio da gravação do lote: duas entradas completas, a
+    # terceira pela metade e nenhum diretório central
+    destino = tmp_path / 'extratos.zip'
+    with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for nome in sorted(esperado)[:3]:
+            arquivo_zip.writestr(nome, esperado[nome])
+        corte = arquivo_zip.getinfo(sorted(esperado)[2]).header_offset + 40
+    with open(destino, 'r+b') as arquivo:
+        arquivo.truncate(corte)
+    # Progresso salvo antes do primeiro lote terminar
+    progresso = recibos._ler_progresso(f'{completo}.progresso.json')
+    recibos._gravar_progresso(f'{destino}.progresso.json', {
+        **progresso, 'gerados': 0, 'ultimo_cliente_id': 0, 'concluido': False
+    })
+    
+    resultado = gerar(destino)
+    assert (resultado['gerados'], resultado['concluido']) == (4, True)
+    assert conteudo(destino) == esperado
+    assert not os.path.exists(f'{destino}.danificado')
@@ -0,0 +1,97 @@
+"""
+Resumo financeiro dos clientes (saldo_aberto, qtd_pendentes...) mantido
+pelos eventos de flush a cada alteração de pagamento
+"""
+
+from conftest import criar_cliente, criar_pagamento
+from database import db
+from models import Cliente, Pagamento
+import models
+import periodos
+
+def resumo(http, academia, cliente_id):
+    clientes = http.get('/api/clientes', headers=academia['headers']).json
+    cliente = next(c for c in clientes if c['id'] == cliente_id)
+    return {campo: cliente[campo] for campo in models.CAMPOS_RESUMO}
+
+def test_resumo_acompanha_criacao_pagamento_e_cancelamento(http, academia):
+    cliente_id = criar_cliente(http, academia)
+    assert resumo(http, academia, cliente_id) == {
+        'saldo_aberto': 0, 'qtd_pendentes': 0, 'vencimento_mais_antigo': None, 'ultimo_pagamento': None
+    }
+    
+    antigo = criar_pagamento(http, academia, cliente_id, 100, '2024-01-10')
+    recente = criar_pagamento(http, academia, cliente_id, 50.5, '2024-02-10')
+    cancelado = criar_pagamento(http, academia, cliente_id, 30, '2023-12-10')
+    assert resumo(http, academia, cliente_id) == {
+        'saldo_aberto': 180.5, 'qtd_pendentes': 3, 'vencimento_mais_antigo': '2023-12-10', 'ultimo_pagamento': None
+    }
+    
+    http.post(f'/api/pagamentos/{antigo}/pagar', json={'metodo_pagamento': 'pix'}, headers=academia['headers'])
+    http.post(f'/api/pagamentos/{cancelado}/cancelar', headers=academia['headers'])
+    assert resumo(http, academia, cliente_id) == {
+        'saldo_aberto': 50.5,
+        'qtd_pendentes': 1,
+        'vencimento_mais_antigo': '2024-02-10',
+        'ultimo_pagamento': periodos.hoje().isoformat()
+    }
+    
+    http.delete(f'/api/pagamentos/{recente}', headers=academia['headers'])
+    assert resumo(http, academia, cliente_id)['saldo_aberto'] == 0
+    assert resumo(http, academia, cliente_id)['qtd_pendentes'] == 0
+
+def test_detalhe_do_cliente_com_contagens_de_pagamentos(http, academia):
+    cliente_id = criar_cliente(http, academia)
+    pago = criar_pagamento(http, academia, cliente_id, 70, '2024-01-10')
+    criar_pagamento(http, academia, cliente_id, 30, '2024-02-10')
+    http.post(f'/api/pagamentos/{pago}/pagar', json={'metodo_pagamento': 'pix'}, headers=academia['headers'])
+    
+    estatisticas = http.get(f'/api/clientes/{cliente_id}', headers=academia['headers']).json['estatisticas']
+    assert (estatisticas['total_pagamentos'], estatisticas['pagamentos_pagos'], estatisticas['pagamentos_pendentes']) == (2, 1, 1)
+    assert estatisticas['valor_pendente'] == 30
+    
+    sem_pagamentos = criar_cliente(http, academia, 'Bia')
+    estatisticas = http.get(f'/api/clientes/{sem_pagamentos}', headers=academia['headers']).json['estatisticas']
+    assert (estatisticas['total_pagamentos'], estatisticas['pagamentos_pagos']) == (0, 0)
+
+def test_pagamento_trocado_de_cliente_atualiza_os_dois(http, academia, contexto):
+    ana = criar_cliente(http, academia, 'Ana')
+    bia = criar_cliente(http, academia, 'Bia')
+    pagamento_id = criar_pagamento(http, academia, ana, 80, '2024-03-05')
+    
+    pagamento = db.session.get(Pagamento, pagamento_id)
+    pagamento.cliente_id = bia
+    db.session.commit()
+    
+    assert (db.session.get(Cliente, ana).saldo_aberto, db.session.get(Cliente, ana).qtd_pendentes) == (0, 0)
+    assert (db.session.get(Cliente, bia).saldo_aberto, db.session.get(Cliente, bia).qtd_pendentes) == (80, 1)
+
+def test_rollback_descarta_resumo_pendente(http, academia, contexto):
+    cliente_id = criar_cliente(http, academia)
+    criar_pagamento(http, academia, cliente_id, 40, '2024-04-01')
+    
+    db.session.add(Pagamento(cliente_id=cliente_id, valor=999, vencimento=periodos.hoje()))
+    db.session.flush()
+    assert db.session.get(Cliente, cliente_id).saldo_aberto == 1039
+    db.session.rollback()
+    
+    assert not db.session.info.get('resumo_pagamentos')
+    assert db.session.get(Cliente, cliente_id).saldo_aberto == 40
+    assert cliente_id not in models.verificar_resumo_clientes()['divergentes']
+
+def test_verificar_resumo_repara_divergencias(http, academia, contexto):
+    cliente_id = criar_cliente(http, academia)
+    criar_pagamento(http, academia, cliente_id, 60, '2024-05-01')
+    
+    # Alteração fora do ORM não passa pelos eventos de flush
+    clientes = Cliente.__table__
+    db.session.execute(clientes.update().where(clientes.c.id == cliente_id).values(saldo_aberto=1, qtd_pendentes=7))
+    db.session.commit()
+    
+    assert cliente_id in models.verificar_resumo_clientes()['divergentes']
+    assert cliente_id in models.verificar_resumo_clientes(reparar=True)['divergentes']
+    assert cliente_id not in models.verificar_resumo_clientes()['divergentes']
+    
+    cliente = db.session.get(Cliente, cliente_id)
+    db.session.refresh(cliente)
+    assert (cliente.saldo_aberto, cliente.qtd_pendentes) == (60, 1)
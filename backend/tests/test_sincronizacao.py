@@ -0,0 +1,79 @@
+"""
+Sincronização incremental (GET /api/sync): alterações e exclusões depois
+de uma posição da sequência, em páginas, sem passar de reservas pendentes
+"""
+
+from conftest import criar_cliente, criar_pagamento
+from database import db
+from datetime import datetime, timedelta
+import models
+
+def sincronizar(http, academia, since=0, limite=None):
+    parametros = {'since': since, **({'limite': limite} if limite else {})}
+    resposta = http.get('/api/sync', query_string=parametros, headers=academia['headers'])
+    assert resposta.status_code == 200, resposta.json
+    return resposta.json
+
+def ids(pagina, tabela):
+    return [registro['id'] for registro in pagina[tabela]]
+
+def test_alteracoes_e_exclusoes_depois_da_posicao(http, academia):
+    cliente_id = criar_cliente(http, academia)
+    pagamento_id = criar_pagamento(http, academia, cliente_id, 90, '2024-06-10')
+    
+    inicial = sincronizar(http, academia)
+    assert ids(inicial, 'clientes') == [cliente_id]
+    assert ids(inicial, 'pagamentos') == [pagamento_id]
+    assert not inicial['mais'] and not inicial['reiniciar']
+    
+    # Nada mudou: página vazia na mesma posição
+    vazia = sincronizar(http, academia, inicial['seq'])
+    assert (vazia['clientes'], vazia['pagamentos'], vazia['seq']) == ([], [], inicial['seq'])
+    
+    http.post(f'/api/pagamentos/{pagamento_id}/pagar', json={'metodo_pagamento': 'pix'}, headers=academia['headers'])
+    pago = sincronizar(http, academia, inicial['seq'])
+    assert [p['status'] for p in pago['pagamentos']] == ['pago']
+    # O resumo do cliente mudou junto
+    assert ids(pago, 'clientes') == [cliente_id]
+    assert pago['seq'] > inicial['seq']
+    
+    http.delete(f'/api/pagamentos/{pagamento_id}', headers=academia['headers'])
+    excluido = sincronizar(http, academia, pago['seq'])
+    assert excluido['exclusoes']['pagamentos'] == [pagamento_id]
+    assert excluido['pagamentos'] == []
+
+def test_paginas_em_ordem_de_alteracao(http, academia):
+    criados = [criar_cliente(http, academia, f'Cliente {i}') for i in range(5)]
+    
+    recebidos, since, paginas = [], 0, 0
+    while True:
+        pagina = sincronizar(http, academia, since, limite=2)
+        recebidos += ids(pagina, 'clientes')
+        since = pagina['seq']
+        paginas += 1
+        if not pagina['mais']:
+            break
+    
+    assert recebidos == criados
+    assert paginas == 3
+
+def test_reserva_pendente_segura_a_leitura(http, academia, reserva):
+    assert db.session.scalar(models.consulta_alteracoes_confirmadas()) == reserva.inicio - 1
+    
+    # Confirmada depois da reserva: só aparece quando a reserva sair
+    cliente_id = criar_cliente(http, academia)
+    pagina = sincronizar(http, academia, reserva.inicio - 1)
+    assert pagina['clientes'] == []
+    assert pagina['seq'] == reserva.inicio - 1
+    
+    db.session.delete(reserva)
+    db.session.commit()
+    pagina = sincronizar(http, academia, reserva.inicio - 1)
+    assert ids(pagina, 'clientes') == [cliente_id]
+
+def test_reserva_expirada_nao_segura_a_leitura(http, academia, reserva):
+    reserva.data_reserva = datetime.utcnow() - timedelta(seconds=models.EXPIRACAO_RESERVA + 1)
+    db.session.commit()
+    
+    cliente_id = criar_cliente(http, academia)
+    assert ids(sincronizar(http, academia, reserva.inicio - 1), 'clientes') == [cliente_id]
@@ -25,6 +25,7 @@ function obterToken() {
 function removerToken() {
     localStorage.removeItem('token');
     localStorage.removeItem('usuario');
+    localStorage.removeItem(CHAVE_CACHE);
 }
 
 /**
@@ -78,6 +79,9 @@ function verificarAutenticacao() {
         window.location.href = 'login.html';
         return false;
     }
+    
+    // Atualiza o cache local em segundo plano (ver sincronizar)
+    sincronizar();
     return true;
 }
 
@@ -107,24 +111,220 @@ async function fetchAuth(endpoint, options = {}) {
         headers['Authorization'] = `Bearer ${token}`;
     }
     
+    // Horário da última escrita: mantém as leituras seguintes no banco
+    // principal enquanto as réplicas ainda não receberam a alteração
+    const ultimaEscrita = sessionStorage.getItem('ultimaEscrita');
+    if (ultimaEscrita) {
+        headers['X-Ultima-Escrita'] = ultimaEscrita;
+    }
+    
     try {
         const response = await fetch(url, {
             ...options,
             headers
         });
         
+        // Servidor sobrecarregado (503) ou limite de requisições (429):
+        // leituras são repetidas uma vez após o tempo indicado em Retry-After
+        // options.leitura: POST que só lê (lote), tratado como GET
+        const metodo = options.leitura ? 'GET' : (options.method || 'GET').toUpperCase();
+        if ((response.status === 503 || response.status === 429) && metodo === 'GET' && !options.repetida) {
+            const segundos = Math.min(parseInt(response.headers.get('Retry-After'), 10) || 1, 10);
+            await new Promise(resolve => setTimeout(resolve, segundos * 1000));
+            return fetchAuth(endpoint, { ...options, repetida: true });
+        }
+        
         // Se receber 401 (não autorizado), faz logout
         if (response.status === 401) {
             logout();
             throw new Error('Sessão expirada');
         }
         
+        const escrita = response.headers.get('X-Ultima-Escrita');
+        if (escrita) {
+            sessionStorage.setItem('ultimaEscrita', escrita);
+        }
+        
+        // Após uma alteração, traz para o cache o que mudou
+        if (metodo !== 'GET' && response.ok) {
+            sincronizar();
+        }
+        
         return response;
     } catch (error) {
+        // Sem conexão: listas de clientes e pagamentos saem do cache local
+        const local = (options.method || 'GET').toUpperCase() === 'GET' ? respostaLocal(endpoint) : null;
+        if (local) {
+            console.warn('Sem conexão, usando dados locais:', endpoint);
+            return local;
+        }
         console.error('Erro na requisição:', error);
         throw error;
     }
 }
+
+/**
+ * Faz várias leituras em uma só requisição (POST /api/batch)
+ * Se o lote falhar (sem conexão, servidor antigo), cada leitura é feita
+ * separadamente, com o cache local como reserva
+ * @param {string[]} endpoints - Endpoints GET da API (como no fetchAuth)
+ * @returns {Promise<Response[]>} Uma resposta por endpoint, na mesma ordem
+ */
+async function fetchLote(endpoints) {
+    const caminhos = endpoints.map(endpoint => endpoint.replace(API_URL, ''));
+    let response = null;
+    
+    try {
+        response = await fetchAuth('/batch', {
+            method: 'POST',
+            leitura: true,
+            body: JSON.stringify({ requisicoes: caminhos.map(caminho => ({ url: `/api${caminho}` })) })
+        });
+    } catch (error) {
+        response = null;
+    }
+    
+    if (!response || !response.ok) {
+        return Promise.all(caminhos.map(caminho => fetchAuth(caminho)));
+    }
+    
+    const { respostas } = await response.json();
+    return respostas.map(item => new Response(JSON.stringify(item.corpo), {
+        status: item.status,
+        headers: { 'Content-Type': 'application/json' }
+    }));
+}
+
+// ==================== CACHE LOCAL (SINCRONIZAÇÃO) ====================
+
+const CHAVE_CACHE = 'cacheSync';
+let sincronizacaoEmAndamento = null;
+
+/**
+ * Obtém o cache local de clientes, pagamentos e usuários
+ * @returns {Object} {seq, clientes, pagamentos, usuarios} (registros por id)
+ */
+function obterCache() {
+    try {
+        const cache = JSON.parse(localStorage.getItem(CHAVE_CACHE));
+        if (cache) return cache;
+    } catch (e) {
+        // cache corrompido: recomeça do zero
+    }
+    return { seq: 0, clientes: {}, pagamentos: {}, usuarios: {} };
+}
+
+/**
+ * Traz da API apenas o que mudou desde a última sincronização
+ * (GET /api/sync?since=) e aplica no cache local
+ * @returns {Promise<Object>} Cache atualizado
+ */
+function sincronizar() {
+    // Chamadas simultâneas aguardam a mesma sincronização
+    if (!sincronizacaoEmAndamento) {
+        sincronizacaoEmAndamento = executarSincronizacao()
+            .catch(error => console.warn('Sincronização não concluída:', error.message))
+            .finally(() => { sincronizacaoEmAndamento = null; });
+    }
+    return sincronizacaoEmAndamento;
+}
+
+async function executarSincronizacao() {
+    let cache = obterCache();
+    let mais = true;
+    
+    while (mais) {
+        const response = await fetchAuth(`/sync?since=${cache.seq}`);
+        if (!response.ok) break;
+        const pagina = await response.json();
+        
+        if (pagina.reiniciar) {
+            cache = { seq: 0, clientes: {}, pagamentos: {}, usuarios: {} };
+        }
+        
+        ['clientes', 'pagamentos', 'usuarios'].forEach(tabela => {
+            (pagina[tabela] || []).forEach(registro => {
+                cache[tabela][registro.id] = registro;
+            });
+            ((pagina.exclusoes || {})[tabela] || []).forEach(id => {
+                delete cache[tabela][id];
+            });
+        });
+        
+        cache.seq = pagina.seq;
+        mais = pagina.mais;
+        
+        try {
+            localStorage.setItem(CHAVE_CACHE, JSON.stringify(cache));
+        } catch (e) {
+            // Sem espaço no navegador: segue sem cache local
+            localStorage.removeItem(CHAVE_CACHE);
+            break;
+        }
+    }
+    return cache;
+}
+
+/**
+ * Monta a resposta de uma listagem a partir do cache local
+ * (apenas GET /clientes e GET /pagamentos, com os mesmos filtros da API)
+ * @param {string} endpoint - Endpoint da API
+ * @returns {Response|null} Resposta ou null se não houver dados locais
+ */
+function respostaLocal(endpoint) {
+    const cache = obterCache();
+    if (!cache.seq) return null;
+    
+    const [caminho, query] = endpoint.replace(API_URL, '').split('?');
+    const params = new URLSearchParams(query);
+    let dados = null;
+    
+    if (caminho === '/clientes') {
+        const busca = (params.get('busca') || '').toLowerCase();
+        dados = Object.values(cache.clientes)
+            .filter(c => c.ativo)
+            .filter(c => !busca || c.nome.toLowerCase().includes(busca) || (c.cpf || '').includes(busca))
+            .sort((a, b) => params.get('ordenar') === 'saldo'
+                ? b.saldo_aberto - a.saldo_aberto || a.nome.localeCompare(b.nome)
+                : a.nome.localeCompare(b.nome));
+    } else if (caminho === '/pagamentos') {
+        const clienteId = params.get('cliente_id');
+        const status = params.get('status');
+        dados = Object.values(cache.pagamentos)
+            .filter(p => !clienteId || String(p.cliente_id) === clienteId)
+            .filter(p => !status || p.status === status)
+            .sort((a, b) => b.vencimento.localeCompare(a.vencimento));
+    }
+    
+    if (!dados) return null;
+    return new Response(JSON.stringify(dados), {
+        status: 200,
+        headers: { 'Content-Type': 'application/json', 'X-Cache-Local': '1' }
+    });
+}
+
+/**
+ * Assina o fluxo de eventos em tempo real da API (/api/eventos)
+ * @param {Object} handlers - Funções por evento: alteracao, contadores, recarregar
+ * @returns {EventSource|null} Conexão aberta (reconecta sozinha se cair)
+ */
+function assinarEventos(handlers = {}) {
+    const token = obterToken();
+    if (!token || typeof EventSource === 'undefined') return null;
+
+    // EventSource não permite cabeçalhos: o token vai na URL
+    const fonte = new EventSource(`${API_URL}/eventos?token=${encodeURIComponent(token)}`);
+
+    ['alteracao', 'contadores', 'recarregar'].forEach(nome => {
+        if (handlers[nome]) {
+            fonte.addEventListener(nome, evento => handlers[nome](JSON.parse(evento.data)));
+        }
+    });
+
+    window.addEventListener('beforeunload', () => fonte.close());
+    return fonte;
+}
+
 /**
  * Inicializa informações do usuário no header
  */